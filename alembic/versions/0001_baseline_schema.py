@@ -0,0 +1,163 @@
+"""baseline schema
+
+The tables as the app created them with Base.metadata.create_all before
+migrations existed. A database created that way should be stamped at this
+revision (`alembic stamp 0001`) and then upgraded.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 13:24:51.081236
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('daily_workload',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('phc_id', sa.String(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=True),
+    sa.Column('patient_count', sa.Integer(), nullable=True),
+    sa.Column('capacity', sa.Integer(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_daily_workload_date'), 'daily_workload', ['date'], unique=False)
+    op.create_index(op.f('ix_daily_workload_id'), 'daily_workload', ['id'], unique=False)
+    op.create_index(op.f('ix_daily_workload_phc_id'), 'daily_workload', ['phc_id'], unique=False)
+    op.create_table('inventory',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('phc_id', sa.String(), nullable=False),
+    sa.Column('phc_name', sa.String(), nullable=False),
+    sa.Column('item_name', sa.String(), nullable=False),
+    sa.Column('item_type', sa.String(), nullable=True),
+    sa.Column('current_stock', sa.Integer(), nullable=True),
+    sa.Column('unit', sa.String(), nullable=True),
+    sa.Column('daily_consumption_rate', sa.Float(), nullable=True),
+    sa.Column('last_updated', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_inventory_id'), 'inventory', ['id'], unique=False)
+    op.create_index(op.f('ix_inventory_phc_id'), 'inventory', ['phc_id'], unique=False)
+    op.create_table('issues',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('phc_id', sa.String(), nullable=False),
+    sa.Column('lga_id', sa.String(), nullable=False),
+    sa.Column('phc_name', sa.String(), nullable=True),
+    sa.Column('category', sa.String(), nullable=False),
+    sa.Column('priority', sa.String(), nullable=True),
+    sa.Column('description', sa.String(), nullable=False),
+    sa.Column('status', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_issues_id'), 'issues', ['id'], unique=False)
+    op.create_index(op.f('ix_issues_lga_id'), 'issues', ['lga_id'], unique=False)
+    op.create_index(op.f('ix_issues_phc_id'), 'issues', ['phc_id'], unique=False)
+    op.create_table('monthly_reports',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('phc_id', sa.String(), nullable=False),
+    sa.Column('lga_id', sa.String(), nullable=False),
+    sa.Column('phc_name', sa.String(), nullable=True),
+    sa.Column('month', sa.String(), nullable=False),
+    sa.Column('content', sa.String(), nullable=False),
+    sa.Column('status', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_monthly_reports_id'), 'monthly_reports', ['id'], unique=False)
+    op.create_index(op.f('ix_monthly_reports_lga_id'), 'monthly_reports', ['lga_id'], unique=False)
+    op.create_index(op.f('ix_monthly_reports_phc_id'), 'monthly_reports', ['phc_id'], unique=False)
+    op.create_table('patients',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('age', sa.Integer(), nullable=False),
+    sa.Column('sex', postgresql.ENUM('Male', 'Female', name='sex_enum'), nullable=False),
+    sa.Column('symptoms', sa.ARRAY(sa.String()), nullable=False),
+    sa.Column('visit_type', postgresql.ENUM('Emergency', 'Acute', 'Routine', 'FollowUp', name='visit_type_enum'), nullable=False),
+    sa.Column('vitals', sa.Text(), nullable=True),
+    sa.Column('medical_history', sa.ARRAY(sa.String()), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_patients_id'), 'patients', ['id'], unique=False)
+    op.create_index(op.f('ix_patients_name'), 'patients', ['name'], unique=False)
+    op.create_table('restock_requests',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('item_name', sa.String(), nullable=False),
+    sa.Column('quantity_needed', sa.Integer(), nullable=False),
+    sa.Column('phc_id', sa.String(), nullable=False),
+    sa.Column('phc_name', sa.String(), nullable=False),
+    sa.Column('lga_id', sa.String(), nullable=False),
+    sa.Column('requested_by', sa.String(), nullable=False),
+    sa.Column('request_date', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('status', sa.String(), nullable=True),
+    sa.Column('comments', sa.String(), nullable=True),
+    sa.Column('processed_by', sa.String(), nullable=True),
+    sa.Column('processed_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('priority_level', sa.String(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_restock_requests_id'), 'restock_requests', ['id'], unique=False)
+    op.create_index(op.f('ix_restock_requests_lga_id'), 'restock_requests', ['lga_id'], unique=False)
+    op.create_index(op.f('ix_restock_requests_phc_id'), 'restock_requests', ['phc_id'], unique=False)
+    op.create_table('users',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('full_name', sa.String(), nullable=False),
+    sa.Column('email', sa.String(), nullable=False),
+    sa.Column('password_hash', sa.String(), nullable=False),
+    sa.Column('role', sa.String(), nullable=False),
+    sa.Column('phc_id', sa.String(), nullable=True),
+    sa.Column('phc_name', sa.String(), nullable=True),
+    sa.Column('lga_id', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_users_email'), 'users', ['email'], unique=True)
+    op.create_index(op.f('ix_users_id'), 'users', ['id'], unique=False)
+    op.create_index(op.f('ix_users_lga_id'), 'users', ['lga_id'], unique=False)
+    op.create_index(op.f('ix_users_phc_id'), 'users', ['phc_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_users_phc_id'), table_name='users')
+    op.drop_index(op.f('ix_users_lga_id'), table_name='users')
+    op.drop_index(op.f('ix_users_id'), table_name='users')
+    op.drop_index(op.f('ix_users_email'), table_name='users')
+    op.drop_table('users')
+    op.drop_index(op.f('ix_restock_requests_phc_id'), table_name='restock_requests')
+    op.drop_index(op.f('ix_restock_requests_lga_id'), table_name='restock_requests')
+    op.drop_index(op.f('ix_restock_requests_id'), table_name='restock_requests')
+    op.drop_table('restock_requests')
+    op.drop_index(op.f('ix_patients_name'), table_name='patients')
+    op.drop_index(op.f('ix_patients_id'), table_name='patients')
+    op.drop_table('patients')
+    op.drop_index(op.f('ix_monthly_reports_phc_id'), table_name='monthly_reports')
+    op.drop_index(op.f('ix_monthly_reports_lga_id'), table_name='monthly_reports')
+    op.drop_index(op.f('ix_monthly_reports_id'), table_name='monthly_reports')
+    op.drop_table('monthly_reports')
+    op.drop_index(op.f('ix_issues_phc_id'), table_name='issues')
+    op.drop_index(op.f('ix_issues_lga_id'), table_name='issues')
+    op.drop_index(op.f('ix_issues_id'), table_name='issues')
+    op.drop_table('issues')
+    op.drop_index(op.f('ix_inventory_phc_id'), table_name='inventory')
+    op.drop_index(op.f('ix_inventory_id'), table_name='inventory')
+    op.drop_table('inventory')
+    op.drop_index(op.f('ix_daily_workload_phc_id'), table_name='daily_workload')
+    op.drop_index(op.f('ix_daily_workload_id'), table_name='daily_workload')
+    op.drop_index(op.f('ix_daily_workload_date'), table_name='daily_workload')
+    op.drop_table('daily_workload')
+    postgresql.ENUM(name='visit_type_enum').drop(op.get_bind(), checkfirst=True)
+    postgresql.ENUM(name='sex_enum').drop(op.get_bind(), checkfirst=True)
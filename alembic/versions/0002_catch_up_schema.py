@@ -0,0 +1,307 @@
+"""catch up with the schema the app grew while create_all managed it
+
+New tables: phc_monthly_stats, report_job_runs, scope_versions,
+workload_forecasts, facilities, queue_snapshots, queue_rollups and
+job_watermarks. Existing tables gain daily_workload.overload_streak, the
+(phc_id, date) and (phc_id, month) unique constraints on daily_workload and
+monthly_reports, and the partial unique index that allows one open
+staffing issue per facility.
+
+create_all used to add missing tables (but never columns or constraints) at
+every start, so a database stamped at 0001 may already have some of these
+tables. Every step checks first. Duplicates that would block a constraint
+are resolved the way the app resolves them now: the newest row wins (for
+monthly reports, a submitted one beats any draft), and older open staffing
+issues are resolved. Facilities are backfilled from the PHC accounts, as
+`python registry.py backfill` does, and phc_monthly_stats from the raw
+tables, as `python rollups.py rebuild` does. The rollup backfill only fills
+an empty table, so one the app was already maintaining is kept.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 13:24:55.686697
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, Sequence[str], None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+STAFFING_OPEN = "category = 'Staffing Shortage' AND status IN ('Open', 'In Progress')"
+
+# rollups.rebuild as one statement: per facility-month counts from the raw
+# tables, into an empty phc_monthly_stats only
+ROLLUP_BACKFILL = """
+INSERT INTO phc_monthly_stats (
+    phc_id, lga_id, month, restock_requests, restock_pending, restock_approved, restock_declined,
+    restock_cancelled, restock_delivered, issues_logged, issues_open, issues_open_high,
+    workload_days, patients_seen, overload_days
+)
+WITH restock AS (
+    SELECT phc_id, max(lga_id) AS lga_id, to_char(request_date, 'YYYY-MM') AS month,
+           count(*) AS requests,
+           count(*) FILTER (WHERE status = 'pending') AS pending,
+           count(*) FILTER (WHERE status = 'approved') AS approved,
+           count(*) FILTER (WHERE status = 'declined') AS declined,
+           count(*) FILTER (WHERE status = 'cancelled') AS cancelled,
+           count(*) FILTER (WHERE status = 'delivered') AS delivered
+    FROM restock_requests
+    WHERE request_date IS NOT NULL
+    GROUP BY phc_id, to_char(request_date, 'YYYY-MM')
+), issue AS (
+    SELECT phc_id, max(lga_id) AS lga_id, to_char(created_at, 'YYYY-MM') AS month,
+           count(*) AS logged,
+           count(*) FILTER (WHERE status IN ('Open', 'In Progress')) AS open,
+           count(*) FILTER (WHERE status IN ('Open', 'In Progress') AND priority = 'High') AS open_high
+    FROM issues
+    WHERE created_at IS NOT NULL
+    GROUP BY phc_id, to_char(created_at, 'YYYY-MM')
+), workload AS (
+    -- daily_workload has no lga_id; facilities was backfilled above
+    SELECT w.phc_id, max(f.lga_id) AS lga_id, to_char(w.date, 'YYYY-MM') AS month,
+           count(*) AS days,
+           coalesce(sum(w.patient_count), 0) AS patients,
+           count(*) FILTER (WHERE w.patient_count > w.capacity) AS overload
+    FROM daily_workload w JOIN facilities f ON f.phc_id = w.phc_id
+    GROUP BY w.phc_id, to_char(w.date, 'YYYY-MM')
+), facility_months AS (
+    SELECT phc_id, month FROM restock
+    UNION SELECT phc_id, month FROM issue
+    UNION SELECT phc_id, month FROM workload
+)
+SELECT phc_id, coalesce(r.lga_id, i.lga_id, w.lga_id), month,
+       coalesce(r.requests, 0), coalesce(r.pending, 0), coalesce(r.approved, 0), coalesce(r.declined, 0),
+       coalesce(r.cancelled, 0), coalesce(r.delivered, 0),
+       coalesce(i.logged, 0), coalesce(i.open, 0), coalesce(i.open_high, 0),
+       coalesce(w.days, 0), coalesce(w.patients, 0), coalesce(w.overload, 0)
+FROM facility_months
+LEFT JOIN restock r USING (phc_id, month)
+LEFT JOIN issue i USING (phc_id, month)
+LEFT JOIN workload w USING (phc_id, month)
+WHERE NOT EXISTS (SELECT 1 FROM phc_monthly_stats)
+ON CONFLICT (phc_id, month) DO NOTHING
+"""
+
+
+def _inspector():
+    return sa.inspect(op.get_bind())
+
+
+def _has_table(name: str) -> bool:
+    return _inspector().has_table(name)
+
+
+def _has_column(table: str, column: str) -> bool:
+    return any(c["name"] == column for c in _inspector().get_columns(table))
+
+
+def _has_unique(table: str, name: str) -> bool:
+    return any(c["name"] == name for c in _inspector().get_unique_constraints(table))
+
+
+def _has_index(table: str, name: str) -> bool:
+    return any(i["name"] == name for i in _inspector().get_indexes(table))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if not _has_table('facilities'):
+        op.create_table('facilities',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('phc_id', sa.String(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('lga_id', sa.String(), nullable=False),
+        sa.Column('capacity', sa.Integer(), server_default='50', nullable=False),
+        sa.Column('staff_count', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(op.f('ix_facilities_id'), 'facilities', ['id'], unique=False)
+        op.create_index(op.f('ix_facilities_lga_id'), 'facilities', ['lga_id'], unique=False)
+        op.create_index(op.f('ix_facilities_phc_id'), 'facilities', ['phc_id'], unique=True)
+    op.execute("""
+        INSERT INTO facilities (phc_id, name, lga_id, capacity)
+        SELECT phc_id, coalesce(max(phc_name), max(full_name)), max(lga_id), 50
+        FROM users
+        WHERE role = 'phc' AND phc_id IS NOT NULL AND lga_id IS NOT NULL
+        GROUP BY phc_id
+        ON CONFLICT (phc_id) DO NOTHING
+    """)
+
+    if not _has_table('job_watermarks'):
+        op.create_table('job_watermarks',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('value', sa.BigInteger(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('name')
+        )
+
+    if not _has_table('phc_monthly_stats'):
+        op.create_table('phc_monthly_stats',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('phc_id', sa.String(), nullable=False),
+        sa.Column('lga_id', sa.String(), nullable=False),
+        sa.Column('month', sa.String(), nullable=False),
+        sa.Column('restock_requests', sa.Integer(), nullable=False),
+        sa.Column('restock_pending', sa.Integer(), nullable=False),
+        sa.Column('restock_approved', sa.Integer(), nullable=False),
+        sa.Column('restock_declined', sa.Integer(), nullable=False),
+        sa.Column('restock_cancelled', sa.Integer(), nullable=False),
+        sa.Column('restock_delivered', sa.Integer(), nullable=False),
+        sa.Column('issues_logged', sa.Integer(), nullable=False),
+        sa.Column('issues_open', sa.Integer(), nullable=False),
+        sa.Column('issues_open_high', sa.Integer(), nullable=False),
+        sa.Column('workload_days', sa.Integer(), nullable=False),
+        sa.Column('patients_seen', sa.Integer(), nullable=False),
+        sa.Column('overload_days', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('phc_id', 'month', name='uq_phc_monthly_stats_phc_month')
+        )
+        op.create_index(op.f('ix_phc_monthly_stats_id'), 'phc_monthly_stats', ['id'], unique=False)
+        op.create_index(op.f('ix_phc_monthly_stats_lga_id'), 'phc_monthly_stats', ['lga_id'], unique=False)
+        op.create_index(op.f('ix_phc_monthly_stats_phc_id'), 'phc_monthly_stats', ['phc_id'], unique=False)
+
+    if not _has_table('queue_rollups'):
+        op.create_table('queue_rollups',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('phc_id', sa.String(), nullable=False),
+        sa.Column('resolution', sa.String(), nullable=False),
+        sa.Column('bucket_start', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('samples', sa.Integer(), nullable=False),
+        sa.Column('queue_sum', sa.BigInteger(), nullable=False),
+        sa.Column('queue_max', sa.Integer(), nullable=False),
+        sa.Column('wait_sum', sa.Float(), nullable=False),
+        sa.Column('wait_max', sa.Float(), nullable=False),
+        sa.Column('completed_visits', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('phc_id', 'resolution', 'bucket_start', name='uq_queue_rollups_phc_res_bucket')
+        )
+
+    if not _has_table('queue_snapshots'):
+        op.create_table('queue_snapshots',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('phc_id', sa.String(), nullable=False),
+        sa.Column('recorded_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('current_queue_count', sa.Integer(), nullable=False),
+        sa.Column('avg_wait_time', sa.Float(), nullable=False),
+        sa.Column('completed_visits_today', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_queue_snapshots_phc_recorded', 'queue_snapshots', ['phc_id', 'recorded_at'], unique=False)
+        op.create_index(op.f('ix_queue_snapshots_recorded_at'), 'queue_snapshots', ['recorded_at'], unique=False)
+
+    if not _has_table('report_job_runs'):
+        op.create_table('report_job_runs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('month', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=True),
+        sa.Column('total_facilities', sa.Integer(), nullable=True),
+        sa.Column('processed', sa.Integer(), nullable=True),
+        sa.Column('created', sa.Integer(), nullable=True),
+        sa.Column('failed', sa.Integer(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('started_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('duration_seconds', sa.Float(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(op.f('ix_report_job_runs_id'), 'report_job_runs', ['id'], unique=False)
+        op.create_index(op.f('ix_report_job_runs_month'), 'report_job_runs', ['month'], unique=False)
+
+    if not _has_table('scope_versions'):
+        op.create_table('scope_versions',
+        sa.Column('scope', sa.String(), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('scope')
+        )
+
+    if not _has_table('workload_forecasts'):
+        op.create_table('workload_forecasts',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('phc_id', sa.String(), nullable=False),
+        sa.Column('lga_id', sa.String(), nullable=False),
+        sa.Column('phc_name', sa.String(), nullable=True),
+        sa.Column('target_date', sa.Date(), nullable=False),
+        sa.Column('forecast_load', sa.Integer(), nullable=False),
+        sa.Column('forecast_lower', sa.Integer(), nullable=True),
+        sa.Column('forecast_upper', sa.Integer(), nullable=True),
+        sa.Column('capacity', sa.Integer(), nullable=True),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('generated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('phc_id', 'target_date', name='uq_workload_forecasts_phc_date')
+        )
+        op.create_index(op.f('ix_workload_forecasts_id'), 'workload_forecasts', ['id'], unique=False)
+        op.create_index(op.f('ix_workload_forecasts_lga_id'), 'workload_forecasts', ['lga_id'], unique=False)
+        op.create_index(op.f('ix_workload_forecasts_phc_id'), 'workload_forecasts', ['phc_id'], unique=False)
+    else:
+        # The prediction interval columns were added after the table
+        for column in ('forecast_lower', 'forecast_upper'):
+            if not _has_column('workload_forecasts', column):
+                op.add_column('workload_forecasts', sa.Column(column, sa.Integer(), nullable=True))
+
+    # ---------- existing tables ----------
+    if not _has_column('daily_workload', 'overload_streak'):
+        op.add_column('daily_workload', sa.Column('overload_streak', sa.Integer(), server_default='0', nullable=False))
+
+    if not _has_unique('daily_workload', 'uq_daily_workload_phc_date'):
+        op.execute("""
+            DELETE FROM daily_workload d
+            USING daily_workload newer
+            WHERE newer.phc_id = d.phc_id AND newer.date = d.date AND newer.id > d.id
+        """)
+        op.create_unique_constraint('uq_daily_workload_phc_date', 'daily_workload', ['phc_id', 'date'])
+
+    if not _has_unique('monthly_reports', 'uq_monthly_reports_phc_month'):
+        op.execute("""
+            DELETE FROM monthly_reports r
+            USING monthly_reports better
+            WHERE better.phc_id = r.phc_id AND better.month = r.month
+              AND (coalesce(better.status = 'Submitted', false), better.id)
+                  > (coalesce(r.status = 'Submitted', false), r.id)
+        """)
+        op.create_unique_constraint('uq_monthly_reports_phc_month', 'monthly_reports', ['phc_id', 'month'])
+
+    if not _has_index('issues', 'uq_issues_open_staffing_shortage'):
+        op.execute("""
+            UPDATE issues i SET status = 'Resolved'
+            WHERE i.category = 'Staffing Shortage' AND i.status IN ('Open', 'In Progress')
+              AND EXISTS (
+                SELECT 1 FROM issues newer
+                WHERE newer.phc_id = i.phc_id AND newer.id > i.id
+                  AND newer.category = 'Staffing Shortage' AND newer.status IN ('Open', 'In Progress')
+              )
+        """)
+        op.create_index('uq_issues_open_staffing_shortage', 'issues', ['phc_id'], unique=True,
+                        postgresql_where=sa.text(STAFFING_OPEN))
+
+    # ---------- backfill ----------
+    # Past months' LGA summaries are read from phc_monthly_stats, so fill it now
+    # rather than leave them at zero until someone runs the rebuild
+    op.execute(ROLLUP_BACKFILL)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_issues_open_staffing_shortage', table_name='issues')
+    op.drop_constraint('uq_monthly_reports_phc_month', 'monthly_reports', type_='unique')
+    op.drop_constraint('uq_daily_workload_phc_date', 'daily_workload', type_='unique')
+    op.drop_column('daily_workload', 'overload_streak')
+    op.drop_table('workload_forecasts')
+    op.drop_table('scope_versions')
+    op.drop_table('report_job_runs')
+    op.drop_table('queue_snapshots')
+    op.drop_table('queue_rollups')
+    op.drop_table('phc_monthly_stats')
+    op.drop_table('job_watermarks')
+    op.drop_table('facilities')
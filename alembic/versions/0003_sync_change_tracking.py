@@ -0,0 +1,113 @@
+"""change tracking for delta sync
+
+inventory, restock_requests, issues and monthly_reports get a change_xid
+column: the 64-bit id of the transaction that last inserted or changed the
+row, set by a BEFORE INSERT OR UPDATE trigger so no write path can forget
+it. Deleting a row writes a sync_tombstones row carrying its ids and the
+deleting transaction's id. sync.py pages through both by (change_xid, id).
+
+Existing rows keep change_xid 0. Clients start with a full sync, which
+includes them, so nothing needs backfilling and adding the column does not
+rewrite the tables.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 16:02:11.418305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, Sequence[str], None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TRACKED = ('inventory', 'restock_requests', 'issues', 'monthly_reports')
+
+STAMP_FUNCTION = """
+CREATE OR REPLACE FUNCTION sync_stamp_change() RETURNS trigger AS $$
+BEGIN
+    NEW.change_xid := pg_current_xact_id()::text::bigint;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+# inventory rows have no lga_id; the tombstone takes it from the facility
+TOMBSTONE_FUNCTION = """
+CREATE OR REPLACE FUNCTION sync_record_tombstone() RETURNS trigger AS $$
+DECLARE
+    row_lga text;
+BEGIN
+    IF TG_TABLE_NAME = 'inventory' THEN
+        SELECT lga_id INTO row_lga FROM facilities WHERE phc_id = OLD.phc_id;
+    ELSE
+        row_lga := to_jsonb(OLD) ->> 'lga_id';
+    END IF;
+    INSERT INTO sync_tombstones (table_name, row_id, phc_id, lga_id, change_xid)
+    VALUES (TG_TABLE_NAME, OLD.id, OLD.phc_id, row_lga, pg_current_xact_id()::text::bigint);
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('sync_tombstones',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('table_name', sa.String(), nullable=False),
+    sa.Column('row_id', sa.Integer(), nullable=False),
+    sa.Column('phc_id', sa.String(), nullable=False),
+    sa.Column('lga_id', sa.String(), nullable=True),
+    sa.Column('change_xid', sa.BigInteger(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_sync_tombstones_phc_change', 'sync_tombstones', ['phc_id', 'change_xid'], unique=False)
+    op.create_index('ix_sync_tombstones_lga_change', 'sync_tombstones', ['lga_id', 'change_xid'], unique=False)
+    op.create_index(op.f('ix_sync_tombstones_deleted_at'), 'sync_tombstones', ['deleted_at'], unique=False)
+
+    op.execute(STAMP_FUNCTION)
+    op.execute(TOMBSTONE_FUNCTION)
+    for table in TRACKED:
+        op.add_column(table, sa.Column('change_xid', sa.BigInteger(), server_default='0', nullable=False))
+        op.create_index(f'ix_{table}_phc_change', table, ['phc_id', 'change_xid'], unique=False)
+        if table != 'inventory':
+            op.create_index(f'ix_{table}_lga_change', table, ['lga_id', 'change_xid'], unique=False)
+        # An UPDATE that changes nothing does not make clients download the row again
+        op.execute(f"""
+            CREATE TRIGGER {table}_sync_stamp_insert BEFORE INSERT ON {table}
+            FOR EACH ROW EXECUTE FUNCTION sync_stamp_change()
+        """)
+        op.execute(f"""
+            CREATE TRIGGER {table}_sync_stamp_update BEFORE UPDATE ON {table}
+            FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE FUNCTION sync_stamp_change()
+        """)
+        op.execute(f"""
+            CREATE TRIGGER {table}_sync_tombstone AFTER DELETE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION sync_record_tombstone()
+        """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in TRACKED:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_sync_tombstone ON {table}")
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_sync_stamp_update ON {table}")
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_sync_stamp_insert ON {table}")
+        if table != 'inventory':
+            op.drop_index(f'ix_{table}_lga_change', table_name=table)
+        op.drop_index(f'ix_{table}_phc_change', table_name=table)
+        op.drop_column(table, 'change_xid')
+    op.execute("DROP FUNCTION IF EXISTS sync_record_tombstone()")
+    op.execute("DROP FUNCTION IF EXISTS sync_stamp_change()")
+    op.drop_index(op.f('ix_sync_tombstones_deleted_at'), table_name='sync_tombstones')
+    op.drop_index('ix_sync_tombstones_lga_change', table_name='sync_tombstones')
+    op.drop_index('ix_sync_tombstones_phc_change', table_name='sync_tombstones')
+    op.drop_table('sync_tombstones')
@@ -0,0 +1,314 @@
+"""list-partition restock_requests, issues and monthly_reports by lga_id
+
+Each table becomes a parent partitioned by LIST (lga_id). It gets one
+partition per LGA found in facilities or in the table, plus a DEFAULT
+partition for LGAs that have no partition yet. partitions.py attaches
+partitions for new LGAs. The primary key becomes (lga_id, id), since a
+unique constraint on a partitioned table must include the partition key. For
+the same reason the two unique rules now lead with lga_id:
+uq_monthly_reports_lga_phc_month and uq_issues_open_staffing_shortage.
+ix_<table>_lga_id is dropped, because within an LGA's partition every row
+has the same lga_id.
+
+The data moves online, one table at a time:
+1. Create <table>_partitioned with its partitions and indexes. Add an AFTER
+   trigger on the old table that mirrors every insert, update and delete
+   into it.
+2. Copy the old rows in id-ordered batches of COPY_BATCH, each in its own
+   transaction. Each batch reads with FOR SHARE, so a row deleted or
+   updated during the copy cannot be written back in an old version.
+3. Swap in one short transaction. Take ACCESS EXCLUSIVE on the old table,
+   check the row counts match, hand the id sequence to the new table, drop
+   the old table and rename the new one. If the lock is not granted within
+   SWAP_LOCK_TIMEOUT the swap is retried.
+
+change_xid values are copied as they are. The delta-sync stamp and
+tombstone triggers (0003) are created on the new parent only at the swap,
+so the copy does not restamp rows and clients do not download everything
+again. The tombstone function now takes the table name as a trigger
+argument: in a partitioned table, TG_TABLE_NAME is the partition's name.
+
+This must run online (not with --sql). Downgrade copies the rows back into
+plain tables in a single transaction.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 19:41:52.207114
+
+"""
+import time
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, Sequence[str], None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PARTITIONED = ('restock_requests', 'issues', 'monthly_reports')
+COPY_BATCH = 5000
+SWAP_LOCK_TIMEOUT = '5s'
+SWAP_ATTEMPTS = 10
+
+STAFFING_OPEN = "category = 'Staffing Shortage' AND status IN ('Open', 'In Progress')"
+
+# (name, columns, unique, where) on the partitioned parents
+INDEXES = {
+    'restock_requests': [
+        ('ix_restock_requests_id', ['id'], False, None),
+        ('ix_restock_requests_phc_id', ['phc_id'], False, None),
+        ('ix_restock_requests_phc_change', ['phc_id', 'change_xid'], False, None),
+        ('ix_restock_requests_lga_change', ['lga_id', 'change_xid'], False, None),
+    ],
+    'issues': [
+        ('ix_issues_id', ['id'], False, None),
+        ('ix_issues_phc_id', ['phc_id'], False, None),
+        ('ix_issues_phc_change', ['phc_id', 'change_xid'], False, None),
+        ('ix_issues_lga_change', ['lga_id', 'change_xid'], False, None),
+        ('uq_issues_open_staffing_shortage', ['lga_id', 'phc_id'], True, STAFFING_OPEN),
+    ],
+    'monthly_reports': [
+        ('ix_monthly_reports_id', ['id'], False, None),
+        ('ix_monthly_reports_phc_id', ['phc_id'], False, None),
+        ('ix_monthly_reports_phc_change', ['phc_id', 'change_xid'], False, None),
+        ('ix_monthly_reports_lga_change', ['lga_id', 'change_xid'], False, None),
+    ],
+}
+# (name, columns) unique constraints on the partitioned parents
+CONSTRAINTS = {
+    'monthly_reports': [('uq_monthly_reports_lga_phc_month', ['lga_id', 'phc_id', 'month'])],
+}
+
+# Creates `base`_p_<lga> for one LGA and attaches it, moving the LGA's rows
+# out of the default partition. Returns NULL if the LGA already has one.
+# partitions.py calls this for LGAs that sign up later.
+ATTACH_FUNCTION = """
+CREATE OR REPLACE FUNCTION attach_lga_partition(parent regclass, lga text, base text DEFAULT NULL)
+RETURNS text AS $$
+DECLARE
+    schema_name text;
+    part text;
+    bound text := format('FOR VALUES IN (%L)', lga);
+    default_part regclass;
+BEGIN
+    SELECT n.nspname, coalesce(base, c.relname) INTO schema_name, base
+    FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE c.oid = parent;
+    IF EXISTS (
+        SELECT 1 FROM pg_inherits i JOIN pg_class p ON p.oid = i.inhrelid
+        WHERE i.inhparent = parent AND pg_get_expr(p.relpartbound, p.oid) = bound
+    ) THEN
+        RETURN NULL;
+    END IF;
+    part := format('%s_p_%s_%s', base, left(regexp_replace(lower(lga), '[^a-z0-9]+', '_', 'g'), 30),
+                   left(md5(lga), 6));
+    SELECT i.inhrelid::regclass INTO default_part
+    FROM pg_inherits i JOIN pg_class p ON p.oid = i.inhrelid
+    WHERE i.inhparent = parent AND pg_get_expr(p.relpartbound, p.oid) = 'DEFAULT';
+
+    -- Built standalone, with a CHECK matching the bound so ATTACH need not scan it
+    EXECUTE format('CREATE TABLE %I.%I (LIKE %s INCLUDING DEFAULTS)', schema_name, part, parent);
+    EXECUTE format('ALTER TABLE %I.%I ADD CONSTRAINT %I CHECK (lga_id IS NOT NULL AND lga_id = %L)',
+                   schema_name, part, part || '_bound', lga);
+    IF default_part IS NOT NULL THEN
+        -- Rows written before the partition existed. Writes to the default
+        -- partition wait while they move; attached LGAs are not affected.
+        EXECUTE format('LOCK TABLE %s IN SHARE ROW EXCLUSIVE MODE', default_part);
+        PERFORM set_config('app.moving_rows', 'on', true);
+        EXECUTE format('WITH moved AS (DELETE FROM %s WHERE lga_id = %L RETURNING *) '
+                       'INSERT INTO %I.%I SELECT * FROM moved', default_part, lga, schema_name, part);
+        PERFORM set_config('app.moving_rows', 'off', true);
+    END IF;
+    -- Builds the parent's indexes and clones its triggers onto the partition
+    EXECUTE format('ALTER TABLE %s ATTACH PARTITION %I.%I %s', parent, schema_name, part, bound);
+    EXECUTE format('ALTER TABLE %I.%I DROP CONSTRAINT %I', schema_name, part, part || '_bound');
+    RETURN part;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+# As in 0003, but the table name comes from the trigger's argument when it has one
+TOMBSTONE_FUNCTION = """
+CREATE OR REPLACE FUNCTION sync_record_tombstone() RETURNS trigger AS $$
+DECLARE
+    source_table text := coalesce(TG_ARGV[0], TG_TABLE_NAME);
+    row_lga text;
+BEGIN
+    -- attach_lga_partition moving rows out of the default partition is not a delete
+    IF current_setting('app.moving_rows', true) = 'on' THEN
+        RETURN OLD;
+    END IF;
+    IF source_table = 'inventory' THEN
+        SELECT lga_id INTO row_lga FROM facilities WHERE phc_id = OLD.phc_id;
+    ELSE
+        row_lga := to_jsonb(OLD) ->> 'lga_id';
+    END IF;
+    INSERT INTO sync_tombstones (table_name, row_id, phc_id, lga_id, change_xid)
+    VALUES (source_table, OLD.id, OLD.phc_id, row_lga, pg_current_xact_id()::text::bigint);
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+TOMBSTONE_FUNCTION_0003 = """
+CREATE OR REPLACE FUNCTION sync_record_tombstone() RETURNS trigger AS $$
+DECLARE
+    row_lga text;
+BEGIN
+    IF TG_TABLE_NAME = 'inventory' THEN
+        SELECT lga_id INTO row_lga FROM facilities WHERE phc_id = OLD.phc_id;
+    ELSE
+        row_lga := to_jsonb(OLD) ->> 'lga_id';
+    END IF;
+    INSERT INTO sync_tombstones (table_name, row_id, phc_id, lga_id, change_xid)
+    VALUES (TG_TABLE_NAME, OLD.id, OLD.phc_id, row_lga, pg_current_xact_id()::text::bigint);
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+def _sync_triggers(table: str, tombstone_arg: str = '') -> list:
+    return [
+        f"CREATE TRIGGER {table}_sync_stamp_insert BEFORE INSERT ON {table} "
+        f"FOR EACH ROW EXECUTE FUNCTION sync_stamp_change()",
+        f"CREATE TRIGGER {table}_sync_stamp_update BEFORE UPDATE ON {table} "
+        f"FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE FUNCTION sync_stamp_change()",
+        f"CREATE TRIGGER {table}_sync_tombstone AFTER DELETE ON {table} "
+        f"FOR EACH ROW EXECUTE FUNCTION sync_record_tombstone({tombstone_arg})",
+    ]
+
+
+def _index_sql(name: str, table: str, columns: list, unique: bool, where: str) -> str:
+    sql = f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON {table} ({', '.join(columns)})"
+    return f"{sql} WHERE {where}" if where else sql
+
+
+def _prepare(table: str, columns: list):
+    """Step 1: the partitioned copy, its partitions and indexes, and the mirror trigger."""
+    new = f'{table}_partitioned'
+    op.execute(f"CREATE TABLE {new} (LIKE {table} INCLUDING DEFAULTS) PARTITION BY LIST (lga_id)")
+    op.execute(f"ALTER TABLE {new} ADD CONSTRAINT {new}_pkey PRIMARY KEY (lga_id, id)")
+    for name, cols, unique, where in INDEXES[table]:
+        op.execute(_index_sql(f'{name}_new', new, cols, unique, where))
+    for name, cols in CONSTRAINTS.get(table, []):
+        op.execute(f"ALTER TABLE {new} ADD CONSTRAINT {name}_new UNIQUE ({', '.join(cols)})")
+    op.execute(f"CREATE TABLE {table}_default PARTITION OF {new} DEFAULT")
+    op.execute(f"""
+        SELECT attach_lga_partition('{new}', lga_id, '{table}')
+        FROM (SELECT lga_id FROM facilities UNION SELECT DISTINCT lga_id FROM {table}) lgas
+        ORDER BY lga_id
+    """)
+
+    assignments = ', '.join(f'{c} = EXCLUDED.{c}' for c in columns if c not in ('lga_id', 'id'))
+    op.execute(f"""
+        CREATE FUNCTION {table}_partition_mirror() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' OR OLD.lga_id IS DISTINCT FROM NEW.lga_id THEN
+                DELETE FROM {new} WHERE lga_id = OLD.lga_id AND id = OLD.id;
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                INSERT INTO {new} VALUES (NEW.*)
+                ON CONFLICT (lga_id, id) DO UPDATE SET {assignments};
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    # Waits for in-flight writers, so every write after this is mirrored
+    op.execute(f"""
+        CREATE TRIGGER {table}_partition_mirror AFTER INSERT OR UPDATE OR DELETE ON {table}
+        FOR EACH ROW EXECUTE FUNCTION {table}_partition_mirror()
+    """)
+
+
+def _copy(bind, table: str):
+    """Step 2: batches of old rows, each committed on its own (autocommit)."""
+    new = f'{table}_partitioned'
+    last_id = bind.execute(sa.text(f"SELECT max(id) FROM {table}")).scalar() or 0
+    copied = 0
+    for low in range(0, last_id, COPY_BATCH):
+        copied += bind.execute(sa.text(f"""
+            INSERT INTO {new}
+            SELECT * FROM (SELECT * FROM {table} WHERE id > :low AND id <= :high FOR SHARE) batch
+            ON CONFLICT DO NOTHING
+        """), {"low": low, "high": low + COPY_BATCH}).rowcount
+    print(f"{table}: copied {copied} rows into {new}")
+
+
+def _swap(bind, table: str):
+    """Step 3: replace the old table in one short transaction."""
+    new = f'{table}_partitioned'
+    renames = [f"ALTER INDEX {name}_new RENAME TO {name};" for name, *_ in INDEXES[table]]
+    renames += [f"ALTER TABLE {table} RENAME CONSTRAINT {name}_new TO {name};"
+                for name, _ in CONSTRAINTS.get(table, [])]
+    triggers = ''.join(f"{sql};\n" for sql in _sync_triggers(table, f"'{table}'"))
+    swap = f"""
+        DO $$
+        BEGIN
+            SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}';
+            LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE;
+            IF (SELECT count(*) FROM {table}) <> (SELECT count(*) FROM {new}) THEN
+                RAISE EXCEPTION '{table}: partitioned copy does not match, not swapping';
+            END IF;
+            ALTER SEQUENCE {table}_id_seq OWNED BY {new}.id;
+            DROP TABLE {table};
+            DROP FUNCTION {table}_partition_mirror();
+            ALTER TABLE {new} RENAME TO {table};
+            ALTER TABLE {table} RENAME CONSTRAINT {new}_pkey TO {table}_pkey;
+            {' '.join(renames)}
+            {triggers}
+        END $$
+    """
+    for attempt in range(1, SWAP_ATTEMPTS + 1):
+        try:
+            bind.execute(sa.text(swap))
+            break
+        except sa.exc.OperationalError as e:
+            if "lock timeout" not in str(e) or attempt == SWAP_ATTEMPTS:
+                raise
+            print(f"{table}: lock not granted for the swap, retrying ({attempt}/{SWAP_ATTEMPTS})")
+            time.sleep(attempt)
+    bind.execute(sa.text(f"ANALYZE {table}"))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    op.execute(ATTACH_FUNCTION)
+    op.execute(TOMBSTONE_FUNCTION)
+    for table in PARTITIONED:
+        columns = [c['name'] for c in sa.inspect(bind).get_columns(table)]
+        _prepare(table, columns)
+
+    with op.get_context().autocommit_block():
+        for table in PARTITIONED:
+            _copy(bind, table)
+            _swap(bind, table)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in PARTITIONED:
+        flat = f'{table}_flat'
+        op.execute(f"CREATE TABLE {flat} (LIKE {table} INCLUDING DEFAULTS)")
+        op.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+        op.execute(f"INSERT INTO {flat} SELECT * FROM {table}")
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {flat}.id")
+        op.execute(f"DROP TABLE {table}")
+        op.execute(f"ALTER TABLE {flat} RENAME TO {table}")
+        op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id)")
+        for name, columns, unique, where in INDEXES[table]:
+            if name == 'uq_issues_open_staffing_shortage':
+                columns = ['phc_id']
+            op.execute(_index_sql(name, table, columns, unique, where))
+        op.create_index(op.f(f'ix_{table}_lga_id'), table, ['lga_id'], unique=False)
+        for sql in _sync_triggers(table):
+            op.execute(sql)
+    op.create_unique_constraint('uq_monthly_reports_phc_month', 'monthly_reports', ['phc_id', 'month'])
+    op.execute(TOMBSTONE_FUNCTION_0003)
+    op.execute("DROP FUNCTION IF EXISTS attach_lga_partition(regclass, text, text)")
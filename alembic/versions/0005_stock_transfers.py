@@ -0,0 +1,46 @@
+"""stock transfers between facilities
+
+New table stock_transfers: one row per stock moved from one facility of an
+LGA to another (transfers.py). The inventory rows of both facilities change
+in the same transaction as the insert, so the table is the audit trail for
+those movements. It is small and not partitioned.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19 21:40:12.507933
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, Sequence[str], None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('stock_transfers',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('lga_id', sa.String(), nullable=False),
+    sa.Column('item_name', sa.String(), nullable=False),
+    sa.Column('from_phc_id', sa.String(), nullable=False),
+    sa.Column('to_phc_id', sa.String(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('restock_request_id', sa.Integer(), nullable=True),
+    sa.Column('created_by', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_stock_transfers_lga_created', 'stock_transfers', ['lga_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_stock_transfers_lga_created', table_name='stock_transfers')
+    op.drop_table('stock_transfers')
@@ -0,0 +1,71 @@
+"""audit log
+
+New table audit_log: one row per recorded change, written by audit.py,
+either in the request's transaction or in batches from its buffer. It is
+range-partitioned by month on `at`, so the primary key is (at, id):
+- this month's partition and the next three are created here;
+- audit.run_partition_maintenance creates later ones daily;
+- a DEFAULT partition catches anything outside them.
+Old months are removed by dropping their partition. id comes from a
+sequence, because identity columns are not allowed on partitioned tables
+before Postgres 17.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-20 01:02:37.190446
+
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008'
+down_revision: Union[str, Sequence[str], None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONTHS = 4
+
+
+def _month(day, offset):
+    months = day.year * 12 + day.month - 1 + offset
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE SEQUENCE audit_log_id_seq")
+    op.create_table('audit_log',
+    sa.Column('at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('id', sa.BigInteger(), server_default=sa.text("nextval('audit_log_id_seq')"), nullable=False),
+    sa.Column('action', sa.String(), nullable=False),
+    sa.Column('entity', sa.String(), nullable=False),
+    sa.Column('entity_id', sa.String(), nullable=False),
+    sa.Column('lga_id', sa.String(), nullable=True),
+    sa.Column('phc_id', sa.String(), nullable=True),
+    sa.Column('actor', sa.String(), nullable=False),
+    sa.Column('actor_role', sa.String(), nullable=True),
+    sa.Column('changes', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.PrimaryKeyConstraint('at', 'id'),
+    postgresql_partition_by='RANGE (at)'
+    )
+    op.execute("ALTER SEQUENCE audit_log_id_seq OWNED BY audit_log.id")
+    op.create_index('ix_audit_log_entity', 'audit_log', ['entity', 'entity_id', 'at'], unique=False)
+    op.create_index('ix_audit_log_lga_at', 'audit_log', ['lga_id', 'at'], unique=False)
+    op.execute("CREATE TABLE audit_log_default PARTITION OF audit_log DEFAULT")
+    today = date.today()
+    for offset in range(MONTHS):
+        start, end = _month(today, offset), _month(today, offset + 1)
+        op.execute(f"CREATE TABLE audit_log_{start:%Y_%m} PARTITION OF audit_log "
+                   f"FOR VALUES FROM ('{start}') TO ('{end}')")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Dropping the parent drops every partition and the owned sequence
+    op.drop_table('audit_log')
@@ -0,0 +1,51 @@
+"""automated issues
+
+New column issues.automated: true for the Staffing Shortage alerts that
+overload.py opens. uq_issues_open_staffing_shortage was a partial unique
+index over every open Staffing Shortage issue, so a PHC could not report
+one by hand while an alert was open (or re-open an old one) without an
+IntegrityError. It now covers automated rows only. Existing open alerts are
+recognised by overload.py's fixed description.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-20 09:41:17.502318
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0009'
+down_revision: Union[str, Sequence[str], None] = '0008'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+STAFFING_OPEN = "category = 'Staffing Shortage' AND status IN ('Open', 'In Progress')"
+AUTOMATED_STAFFING_OPEN = f"automated AND {STAFFING_OPEN}"
+AUTOMATED_DESCRIPTION = 'AUTOMATED ALERT: %'
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('issues', sa.Column('automated', sa.Boolean(), server_default='false', nullable=False))
+    op.execute(sa.text(
+        "UPDATE issues SET automated = true WHERE category = 'Staffing Shortage' AND description LIKE :prefix"
+    ).bindparams(prefix=AUTOMATED_DESCRIPTION))
+    op.drop_index('uq_issues_open_staffing_shortage', table_name='issues',
+                  postgresql_where=sa.text(STAFFING_OPEN))
+    op.create_index('uq_issues_open_staffing_shortage', 'issues', ['lga_id', 'phc_id'], unique=True,
+                    postgresql_where=sa.text(AUTOMATED_STAFFING_OPEN))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # The wider index fails if a facility now has more than one open Staffing Shortage issue
+    op.drop_index('uq_issues_open_staffing_shortage', table_name='issues',
+                  postgresql_where=sa.text(AUTOMATED_STAFFING_OPEN))
+    op.create_index('uq_issues_open_staffing_shortage', 'issues', ['lga_id', 'phc_id'], unique=True,
+                    postgresql_where=sa.text(STAFFING_OPEN))
+    op.drop_column('issues', 'automated')
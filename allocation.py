@@ -0,0 +1,310 @@
+"""
+Fair allocation of scarce central supply across an LGA's pending restock requests.
+
+When the central store has less of an item than the facilities asked for,
+LGA staff used to approve requests one at a time, first come first served.
+Whoever asked first got stock, and facilities closest to a stock-out often
+got nothing. This module splits each item's available quantity instead. It
+maximises the minimum days of cover across the facilities asking for it:
+
+    days of cover = (current stock + allocated) / daily consumption
+
+This is water-filling. Each item has a cover level L, raised until its
+supply runs out. A facility gets clip(L * weight * rate - stock, 0,
+requested):
+- facilities already above the level get nothing;
+- the rest are topped up to it;
+- nobody gets more than they asked for.
+The weight comes from the request's priority (PRIORITY_WEIGHTS). A High
+request is filled to 1.5 x L days.
+
+Everything is solved at once in NumPy:
+- One query returns the pending requests with their facility's stock and
+  consumption rate.
+- Every item's level is found by bisection, with all items stepping
+  together. np.bincount sums the allocations per item at each step.
+- Rounding to whole units hands each item's leftover units to the largest
+  remainders.
+500 facilities x 300 items (150,000 requests) solve in well under a second;
+see benchmarks/allocation.py.
+
+Only requests from facilities registered to the LGA are considered.
+Requests are grouped per facility and item, so two pending requests for
+the same item share the facility's stock. Within a group the oldest request
+is filled first. If inventory has no consumption rate for the item, the
+facility is assumed to have sized its request for TARGET_DAYS of use, as
+auto-restock does.
+
+POST /inventory/restock-requests/allocate returns the plan. With
+apply=true it also approves the requests in the same transaction:
+- a fully covered request is approved as it is;
+- a partly covered one is approved for the allocated quantity, and its
+  comments keep what was asked for;
+- a request that gets nothing stays pending.
+"""
+import time
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+import invalidation
+import push
+import rollups
+import versions
+
+PRIORITY_WEIGHTS = {"High": 1.5, "Medium": 1.0, "Low": 0.75}
+TARGET_DAYS = 14            # what auto-restock sizes requests for
+BISECTION_STEPS = 60        # halves the bracket each step; 60 is below float resolution
+NOTIFY_IDS = 400            # request ids per push event, well inside the NOTIFY payload limit
+
+# Requests and stock come back as one row of arrays, facilities and items as
+# integer codes; NumPy joins them on (facility, item) and sorts the requests.
+# That is cheaper than joining and sorting 150,000 rows on strings in Postgres
+# and building a Python tuple per row.
+_LOAD = """
+WITH facility AS MATERIALIZED (
+    SELECT phc_id, CAST(row_number() OVER (ORDER BY phc_id) - 1 AS integer) AS k
+    FROM facilities WHERE lga_id = :lga_id
+), wanted AS MATERIALIZED (
+    SELECT name, CAST(k - 1 AS integer) AS k FROM unnest(CAST(:items AS text[])) WITH ORDINALITY AS w(name, k)
+), pending AS (
+    SELECT r.id, f.k AS phc, w.k AS item, r.quantity_needed, coalesce(p.weight, 1.0) AS weight,
+           CAST(extract(epoch FROM r.request_date) AS float8) AS requested_at
+    FROM restock_requests r
+    JOIN facility f ON f.phc_id = r.phc_id
+    JOIN wanted w ON w.name = r.item_name
+    LEFT JOIN unnest(CAST(:levels AS text[]), CAST(:weights AS float8[])) AS p(level, weight)
+           ON p.level = r.priority_level
+    WHERE r.lga_id = :lga_id AND r.status = 'pending'
+    {lock}
+), stock AS (
+    SELECT array_agg(f.k) AS stock_phc, array_agg(w.k) AS stock_item, array_agg(i.current_stock) AS stock,
+           array_agg(i.daily_consumption_rate) AS rate
+    FROM inventory i
+    JOIN facility f ON f.phc_id = i.phc_id
+    JOIN wanted w ON w.name = i.item_name
+)
+SELECT (SELECT array_agg(phc_id ORDER BY k) FROM facility) AS facilities, requests.*, stock.*
+FROM (SELECT array_agg(id) AS id, array_agg(phc) AS phc, array_agg(item) AS item,
+             array_agg(quantity_needed) AS quantity, array_agg(weight) AS weight,
+             array_agg(requested_at) AS requested_at
+      FROM pending) requests, stock
+"""
+
+# One statement for every approval; unnest pairs each id with its quantity. The
+# approved rows come back grouped per facility and month for the bookkeeping.
+_APPROVE = """
+WITH approved AS (
+    UPDATE restock_requests r
+    SET status = 'approved',
+        quantity_needed = a.quantity,
+        comments = CASE WHEN a.quantity < r.quantity_needed
+                        THEN format('Allocated %s of %s requested; central supply is short',
+                                    a.quantity, r.quantity_needed)
+                        ELSE r.comments END,
+        processed_by = :operator,
+        processed_at = :now
+    FROM unnest(CAST(:ids AS integer[]), CAST(:quantities AS integer[])) AS a(id, quantity)
+    WHERE r.lga_id = :lga_id AND r.id = a.id AND r.status = 'pending'
+    RETURNING r.id, r.phc_id, r.request_date
+)
+SELECT phc_id, to_char(request_date, 'YYYY-MM') AS month, array_agg(id ORDER BY id) AS ids
+FROM approved GROUP BY 1, 2 ORDER BY 1, 2
+"""
+
+
+# ---------------- DEMAND ----------------
+@dataclass
+class Demand:
+    """Pending requests, sorted by (item, facility, request date)."""
+    items: list              # item names; item code k is items[k]
+    facilities: list         # the LGA's phc_ids; facility code k is facilities[k]
+    supply: np.ndarray       # (items,) units available
+    request_ids: np.ndarray  # (requests,)
+    item: np.ndarray         # (requests,) item code
+    phc: np.ndarray          # (requests,) facility code
+    requested: np.ndarray    # (requests,) quantity_needed
+    weight: np.ndarray       # (requests,) priority weight
+    stock: np.ndarray        # (requests,) facility's current stock of the item
+    rate: np.ndarray         # (requests,) facility's daily consumption, 0 if unknown
+
+
+def load_demand(db: Session, lga_id: str, supply: dict, lock: bool = False) -> Demand:
+    """Every pending request for the supplied items, with stock and consumption, in one query."""
+    items = sorted(supply)
+    row = db.execute(text(_LOAD.format(lock="FOR UPDATE OF r" if lock else "")), {
+        "lga_id": lga_id, "items": items,
+        "levels": list(PRIORITY_WEIGHTS), "weights": list(PRIORITY_WEIGHTS.values()),
+    }).one()
+    facilities = row.facilities or []
+    array = lambda values, dtype: np.array(values or [], dtype=dtype)
+
+    # Stock and the highest consumption rate per (facility, item) cell
+    cells = len(facilities) * len(items)
+    cell = array(row.stock_phc, np.int64) * len(items) + array(row.stock_item, np.int64)
+    stock = np.bincount(cell, array(row.stock, np.float64), minlength=cells)
+    rate = np.zeros(cells)
+    np.maximum.at(rate, cell, np.nan_to_num(array(row.rate, np.float64)))
+
+    request_ids, phc, item = array(row.id, np.int64), array(row.phc, np.int64), array(row.item, np.int64)
+    order = np.lexsort((request_ids, array(row.requested_at, np.float64), phc, item))
+    phc, item = phc[order], item[order]
+    cell = phc * len(items) + item
+    return Demand(
+        items=items,
+        facilities=facilities,
+        supply=np.array([supply[name] for name in items], dtype=np.int64),
+        request_ids=request_ids[order],
+        item=item,
+        phc=phc,
+        requested=array(row.quantity, np.int64)[order],
+        weight=array(row.weight, np.float64)[order],
+        stock=np.maximum(stock[cell], 0.0),
+        rate=rate[cell],
+    )
+
+
+# ---------------- SOLVER ----------------
+@dataclass
+class Plan:
+    demand: Demand
+    allocated: np.ndarray    # (requests,) units granted
+    days_before: np.ndarray  # (requests,) facility's cover for the item before
+    days_after: np.ndarray   # (requests,) and after the allocation
+    level: np.ndarray        # (items,) cover level in days; inf where supply covers every request
+    solve_ms: float
+
+
+def _starts(*keys) -> np.ndarray:
+    """Index of the first row of each run of equal keys (rows are sorted by them)."""
+    n = len(keys[0])
+    change = np.zeros(n, dtype=bool)
+    change[:1] = True
+    for key in keys:
+        change[1:] |= key[1:] != key[:-1]
+    return np.flatnonzero(change)
+
+
+def solve(demand: Demand) -> Plan:
+    started = time.perf_counter()
+    n_items = len(demand.items)
+    n = len(demand.request_ids)
+    if n == 0:
+        empty = np.zeros(0)
+        return Plan(demand, np.zeros(0, dtype=np.int64), empty, empty, np.full(n_items, np.inf), 0.0)
+
+    # One group per (facility, item): they share the facility's stock
+    starts = _starts(demand.item, demand.phc)
+    group = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, n)))
+    item = demand.item[starts]
+    stock = demand.stock[starts]
+    requested = np.add.reduceat(demand.requested, starts).astype(np.float64)
+    weight = np.maximum.reduceat(demand.weight, starts)
+    rate = demand.rate[starts]
+    rate = np.where(rate > 0, rate, requested / TARGET_DAYS)
+    rate = np.maximum(rate, 1e-9)
+    slope = weight * rate                   # units needed per day of level
+
+    supply = demand.supply.astype(np.float64)
+    total = np.bincount(item, requested, minlength=n_items)
+    short = total > supply
+
+    # Bisection on every item's level at once; hi is where every group is full
+    lo = np.zeros(n_items)
+    hi = np.zeros(n_items)
+    np.maximum.at(hi, item, (stock + requested) / slope)
+    for _ in range(BISECTION_STEPS):
+        mid = (lo + hi) / 2
+        given = np.bincount(item, np.clip(mid[item] * slope - stock, 0, requested), minlength=n_items)
+        over = given > supply
+        hi = np.where(over, mid, hi)
+        lo = np.where(over, lo, mid)
+    exact = np.where(short[item], np.clip(lo[item] * slope - stock, 0, requested), requested)
+
+    # Whole units: floor, then each item's leftover to the largest remainders
+    units = np.floor(exact + 1e-9)
+    leftover = np.maximum(supply - np.bincount(item, units, minlength=n_items), 0)
+    remainder = np.where(units < requested, exact - units, -1.0)
+    order = np.lexsort((-remainder, item))
+    first = np.searchsorted(item[order], item[order])       # start of each item's run in `order`
+    rank = np.arange(len(order)) - first
+    bonus = np.zeros(len(units))
+    bonus[order] = (rank < leftover[item[order]]) & (remainder[order] > 0)
+    units += bonus
+
+    # Split each group's units over its requests, oldest first
+    before = np.cumsum(demand.requested) - demand.requested
+    before -= before[starts][group]
+    allocated = np.clip(units[group] - before, 0, demand.requested).astype(np.int64)
+
+    days_before = (stock / rate)[group]
+    days_after = ((stock + units) / rate)[group]
+    level = np.where(short, lo, np.inf)
+    return Plan(demand, allocated, days_before, days_after, level, (time.perf_counter() - started) * 1000)
+
+
+# ---------------- RESULTS ----------------
+def summary(plan: Plan) -> list:
+    """Per item: supply, what was asked and granted, and the lowest cover before and after."""
+    d = plan.demand
+    n_items = len(d.items)
+    requested = np.bincount(d.item, d.requested, minlength=n_items)
+    allocated = np.bincount(d.item, plan.allocated, minlength=n_items)
+    min_before = np.full(n_items, np.inf)
+    min_after = np.full(n_items, np.inf)
+    np.minimum.at(min_before, d.item, plan.days_before)
+    np.minimum.at(min_after, d.item, plan.days_after)
+    finite = lambda a: [round(float(v), 1) if np.isfinite(v) else None for v in a]
+    return [
+        {"item_name": name, "available": int(d.supply[k]), "requested": int(requested[k]),
+         "allocated": int(allocated[k]), "level_days": level, "min_days_before": before, "min_days_after": after}
+        for k, (name, level, before, after) in enumerate(zip(d.items, finite(plan.level), finite(min_before),
+                                                              finite(min_after)))
+    ]
+
+
+def lines(plan: Plan) -> list:
+    d = plan.demand
+    names = [d.items[k] for k in d.item.tolist()]
+    phc_ids = [d.facilities[k] for k in d.phc.tolist()]
+    columns = zip(d.request_ids.tolist(), phc_ids, names, d.requested.tolist(),
+                  plan.allocated.tolist(), np.round(plan.days_before, 1).tolist(),
+                  np.round(plan.days_after, 1).tolist())
+    return [
+        {"id": rid, "phc_id": phc, "item_name": name, "quantity_needed": asked, "allocated": granted,
+         "days_before": before, "days_after": after}
+        for rid, phc, name, asked, granted, before, after in columns
+    ]
+
+
+# ---------------- APPLY ----------------
+def apply(db: Session, plan: Plan, lga_id: str, operator: str) -> int:
+    """Approve what the plan grants, in the caller's transaction. Returns how many were approved."""
+    d = plan.demand
+    granted = plan.allocated > 0
+    if not granted.any():
+        return 0
+    approved = db.execute(text(_APPROVE), {
+        "ids": d.request_ids[granted].tolist(), "quantities": plan.allocated[granted].tolist(),
+        "operator": operator, "now": datetime.utcnow(), "lga_id": lga_id,
+    }).all()
+
+    # The same bookkeeping update_restock_request does per request, batched
+    rollups.bump_many(db, [
+        {"phc_id": phc_id, "lga_id": lga_id, "month": month,
+         "restock_pending": -len(ids), "restock_approved": len(ids)}
+        for phc_id, month, ids in approved
+    ])
+    by_phc = {}
+    for phc_id, _, ids in approved:
+        by_phc.setdefault(phc_id, []).extend(ids)
+    versions.bump(db, *(scope for phc_id in by_phc for scope in versions.restock_scopes(phc_id, lga_id)))
+    invalidation.publish(db, "lga_summary", lga_id)
+    push.publish_many(db, [
+        ("restock.allocated", phc_id, lga_id, {"ids": ids[i:i + NOTIFY_IDS], "status": "approved"})
+        for phc_id, ids in by_phc.items() for i in range(0, len(ids), NOTIFY_IDS)
+    ])
+    return sum(len(ids) for ids in by_phc.values())
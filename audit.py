@@ -0,0 +1,280 @@
+"""
+Append-only audit log of who changed what.
+
+The restock, issue, report and facility rows only keep their latest state.
+processed_by is overwritten by each decision, and cancelling a request
+replaces its comments, so it was not possible to say who approved,
+cancelled, received or edited a request, or what it said before. Each such
+write now records an event:
+
+    before = audit.snapshot(req, "status", "comments")
+    req.status = "cancelled"
+    ...
+    audit.record(db, payload, "restock.cancelled", req, changes=audit.diff(before, req))
+    db.commit()
+
+An event holds:
+- when it happened and the action;
+- the entity (table name and id) and its LGA and facility;
+- the actor's operator name and role, from the JWT;
+- the changed fields as {field: [old, new]}, or other details.
+
+Cost: record() only appends to a list on the session (session.info). Nothing
+is written until the session commits:
+- Critical events (critical=True: decisions and stock movements, i.e.
+  approve/decline, receive, transfer, allocate) are inserted by a
+  before_commit hook in the request's own transaction, one multi-row INSERT
+  for all of them. They commit or roll back with the change they describe,
+  and a crash cannot lose one.
+- Other events go to this worker's buffer after the commit. A rolled-back
+  transaction's events are discarded. The background flusher (buffers.py)
+  writes the buffer every AUDIT_FLUSH_SECONDS, sooner once FLUSH_BATCH are
+  waiting, with the same one-statement multi-row INSERT. A worker killed
+  outright loses at most that interval's non-critical events.
+- Memory is bounded by MAX_BUFFERED events. When the buffer is full, the
+  committing request writes its events itself, in a short transaction of
+  their own: slower, but nothing is dropped. Only if that write fails as
+  well are events dropped. The oldest go first, and they are counted in
+  audit_events_total{path="dropped"}.
+
+Storage: audit_log is range-partitioned by month on `at` (migration 0008),
+with partitions named audit_log_YYYY_MM and a DEFAULT partition as a
+backstop. A daily job creates the next MONTHS_AHEAD months' partitions. If
+AUDIT_RETENTION_MONTHS is set, it also drops partitions older than that,
+which is how old events are deleted: a DROP, not a DELETE. Queries should
+bound `at` so they read only the months they need.
+
+Set AUDIT_ENABLED=0 to stop recording (for measurements, see
+benchmarks/audit.py).
+"""
+import json
+import os
+import threading
+from datetime import date, datetime, timezone
+
+from sqlalchemy import event, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from buffers import PeriodicFlusher
+from database import SessionLocal, advisory_lock, engine
+import metrics
+
+ENABLED = os.getenv("AUDIT_ENABLED", "1") != "0"
+FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_SECONDS", "1"))
+FLUSH_BATCH = 1000
+MAX_BUFFERED = int(os.getenv("AUDIT_MAX_BUFFERED", "50000"))
+MONTHS_AHEAD = 3
+RETENTION_MONTHS = int(os.getenv("AUDIT_RETENTION_MONTHS", "0"))      # 0 keeps every month
+PARTITION_LOCK = "audit.partitions"
+
+_CRITICAL = "audit_critical"        # session.info keys
+_BUFFERED = "audit_buffered"
+
+_INSERT = text("""
+INSERT INTO audit_log (at, action, entity, entity_id, lga_id, phc_id, actor, actor_role, changes)
+SELECT * FROM unnest(
+    CAST(:at AS timestamptz[]), CAST(:action AS text[]), CAST(:entity AS text[]), CAST(:entity_id AS text[]),
+    CAST(:lga_id AS text[]), CAST(:phc_id AS text[]), CAST(:actor AS text[]), CAST(:actor_role AS text[]),
+    CAST(:changes AS jsonb[])
+)
+""")
+_COLUMNS = ("at", "action", "entity", "entity_id", "lga_id", "phc_id", "actor", "actor_role", "changes")
+
+
+# ---------------- RECORD ----------------
+def snapshot(row, *fields) -> dict:
+    """The current values of `fields`, to diff() against after the change."""
+    return {field: getattr(row, field) for field in fields}
+
+
+def diff(before: dict, row) -> dict:
+    """{field: [old, new]} for the snapshotted fields that changed."""
+    return {field: [old, getattr(row, field)] for field, old in before.items() if getattr(row, field) != old}
+
+
+def record(db: Session, payload: dict, action: str, row=None, changes: dict = None, critical: bool = False,
+           entity: str = None, entity_id=None, lga_id: str = None, phc_id: str = None):
+    """
+    Record that the caller (JWT `payload`, or None for the system) did
+    `action` to `row`, or to `entity`/`entity_id` when there is no row.
+    Written when `db` commits; dropped if it rolls back.
+    """
+    if not ENABLED:
+        return
+    payload = payload or {}
+    values = (
+        datetime.now(timezone.utc),
+        action,
+        entity or row.__tablename__,
+        str(entity_id if entity_id is not None else row.id),
+        lga_id or getattr(row, "lga_id", None),
+        phc_id or getattr(row, "phc_id", None),
+        payload.get("operator_name") or payload.get("name") or "system",
+        payload.get("role"),
+        json.dumps(changes or {}, default=str, separators=(",", ":")),
+    )
+    db.info.setdefault(_CRITICAL if critical else _BUFFERED, []).append(values)
+
+
+def write(conn, events: list):
+    """Insert event tuples with one statement on `conn` (a session or connection)."""
+    conn.execute(_INSERT, {column: list(values) for column, values in zip(_COLUMNS, zip(*events))})
+
+
+@event.listens_for(Session, "before_commit")
+def _write_critical(session):
+    events = session.info.pop(_CRITICAL, None)
+    if events:
+        write(session, events)
+        metrics.AUDIT_EVENTS.labels("transaction").inc(len(events))
+
+
+@event.listens_for(Session, "after_commit")
+def _buffer_committed(session):
+    events = session.info.pop(_BUFFERED, None)
+    if events:
+        buffer.add(events)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session):
+    session.info.pop(_CRITICAL, None)
+    session.info.pop(_BUFFERED, None)
+
+
+# ---------------- BUFFER ----------------
+def write_batch(events: list):
+    with engine.begin() as conn:
+        write(conn, events)
+
+
+class AuditBuffer(PeriodicFlusher):
+    """Committed non-critical events waiting to be written, at most `max_buffered`."""
+    name = "audit"
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL, writer=write_batch,
+                 max_buffered: int = MAX_BUFFERED):
+        super().__init__(flush_interval)
+        self.writer = writer
+        self.max_buffered = max_buffered
+        self._events = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def add(self, events: list):
+        with self._lock:
+            room = len(self._events) + len(events) <= self.max_buffered
+            if room:
+                self._events.extend(events)
+                waiting = len(self._events)
+        if not room:
+            # Full: the flusher is behind or the database is down; write these ourselves
+            self.wake()
+            try:
+                self.writer(events)
+                metrics.AUDIT_EVENTS.labels("direct").inc(len(events))
+            except Exception as e:
+                print(f"Audit buffer full and direct write failed: {e}")
+                self._requeue(events)
+            return
+        metrics.AUDIT_EVENTS.labels("buffered").inc(len(events))
+        if waiting >= FLUSH_BATCH:
+            self.wake()
+
+    def _requeue(self, events: list):
+        with self._lock:
+            self._events = events + self._events
+            overflow = len(self._events) - self.max_buffered
+            if overflow > 0:
+                del self._events[:overflow]
+                metrics.AUDIT_EVENTS.labels("dropped").inc(overflow)
+                print(f"Audit buffer full: dropped the {overflow} oldest events")
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._events)
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                batch, self._events = self._events, []
+            if not batch:
+                return 0
+            try:
+                self.writer(batch)
+            except Exception:
+                self._requeue(batch)
+                raise
+            metrics.AUDIT_EVENTS.labels("flushed").inc(len(batch))
+            return len(batch)
+
+
+buffer = AuditBuffer()
+
+
+# ---------------- PARTITIONS ----------------
+def _month(day: date, offset: int) -> date:
+    months = day.year * 12 + day.month - 1 + offset
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"audit_log_{month:%Y_%m}"
+
+
+def ensure_partitions(db: Session, today: date = None, months_ahead: int = MONTHS_AHEAD) -> list:
+    """Create this month's and the next `months_ahead` months' partitions. Returns those created."""
+    today = today or datetime.now(timezone.utc).date()
+    existing = set(db.execute(text("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'audit_log'::regclass
+    """)).scalars())
+    created = []
+    for offset in range(months_ahead + 1):
+        start, end = _month(today, offset), _month(today, offset + 1)
+        name = partition_name(start)
+        if name in existing:
+            continue
+        db.execute(text(f"CREATE TABLE {name} PARTITION OF audit_log FOR VALUES FROM ('{start}') TO ('{end}')"))
+        db.commit()
+        created.append(name)
+    return created
+
+
+def drop_expired(db: Session, today: date = None, retention_months: int = RETENTION_MONTHS) -> list:
+    """Drop monthly partitions that end before the retention window. Returns those dropped."""
+    if retention_months <= 0:
+        return []
+    cutoff = partition_name(_month(today or datetime.now(timezone.utc).date(), -retention_months))
+    names = db.execute(text("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'audit_log'::regclass AND c.relname ~ '^audit_log_[0-9]{4}_[0-9]{2}$'
+        ORDER BY c.relname
+    """)).scalars().all()
+    dropped = []
+    for name in names:
+        if name >= cutoff:
+            break
+        db.execute(text(f"DROP TABLE {name}"))
+        db.commit()
+        dropped.append(name)
+    return dropped
+
+
+def run_partition_maintenance():
+    """Scheduler entry point: one run per deployment."""
+    with advisory_lock(PARTITION_LOCK) as locked:
+        if not locked:
+            return
+        db = SessionLocal()
+        try:
+            created, dropped = ensure_partitions(db), drop_expired(db)
+            if created or dropped:
+                print(f"Audit log partitions: created {', '.join(created) or 'none'}, "
+                      f"dropped {', '.join(dropped) or 'none'}")
+        except DBAPIError as e:
+            db.rollback()
+            print(f"Audit log partition maintenance failed: {e.orig}")
+        finally:
+            db.close()
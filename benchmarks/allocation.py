@@ -0,0 +1,264 @@
+"""
+Benchmark: fair allocation of short supply across 500 facilities x 300 items.
+
+Seeds one throwaway LGA into the database named by DATABASE_URL:
+- 500 facilities, each with inventory for 300 items. A fifth of the rows
+  are stocked out; the rest hold 0-20 days of stock.
+- One pending request per facility and item, sized for 14 days. 5% of the
+  pairs have a second, later request.
+- Supply per item of 30-90% of what was requested.
+It then:
+- times allocation.load_demand and allocation.solve separately, and the
+  whole POST /inventory/restock-requests/allocate round trip;
+- checks the plan: every item's supply fully used but never exceeded, no
+  request over-filled, and the water-filling condition. Every facility
+  left short of its request sits at the item's cover level, within one
+  unit, and every facility that got nothing was already at or above it;
+- compares the worst-off facilities with first-come-first-served approval
+  of the same supply;
+- applies the plan through the endpoint and checks the approved rows and
+  the phc_monthly_stats counters.
+Everything it created is deleted afterwards.
+
+    DATABASE_URL=postgresql://localhost/medisense_bench python benchmarks/allocation.py
+"""
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+if "DATABASE_URL" not in os.environ:
+    sys.exit("Set DATABASE_URL to a migrated scratch database before running benchmarks.")
+
+import numpy as np
+from sqlalchemy import text
+
+from database import SessionLocal
+from jwt_handler import create_access_token
+import allocation
+import rollups
+
+LGA_ID = "bench-lga-allocation"
+MONTH = "2025-10"
+FACILITIES = 500
+ITEMS = 300
+SECOND_REQUESTS = 0.05
+RUNS = 5
+
+
+def item_name(k):
+    return f"Bench item {k:03d}"
+
+
+def seed(db):
+    rng = np.random.default_rng(7)
+    db.execute(text("""
+        INSERT INTO facilities (phc_id, name, lga_id)
+        SELECT format('%s-phc-%s', CAST(:lga AS text), lpad(n::text, 3, '0')), format('Bench PHC %s', n), :lga
+        FROM generate_series(0, :facilities - 1) n
+    """), {"lga": LGA_ID, "facilities": FACILITIES})
+
+    n = FACILITIES * ITEMS
+    phc = np.repeat(np.arange(FACILITIES), ITEMS)
+    item = np.tile(np.arange(ITEMS), FACILITIES)
+    rate = rng.uniform(0.5, 20, n).round(2)
+    days = np.where(rng.random(n) < 0.2, 0, rng.uniform(0, 20, n))
+    stock = np.floor(days * rate).astype(int)
+    need = np.maximum(np.ceil(14 * rate).astype(int), 1)
+    db.execute(text("""
+        INSERT INTO inventory (phc_id, phc_name, item_name, current_stock, daily_consumption_rate, unit, item_type)
+        SELECT format('%s-phc-%s', CAST(:lga AS text), lpad(p::text, 3, '0')), format('Bench PHC %s', p),
+               format('Bench item %s', lpad(i::text, 3, '0')), s, r, 'units', 'drug'
+        FROM unnest(CAST(:phc AS int[]), CAST(:item AS int[]), CAST(:stock AS int[]), CAST(:rate AS float8[]))
+             AS t(p, i, s, r)
+    """), {"lga": LGA_ID, "phc": phc.tolist(), "item": item.tolist(), "stock": stock.tolist(),
+           "rate": rate.tolist()})
+
+    extra = rng.random(n) < SECOND_REQUESTS
+    req_phc = np.concatenate([phc, phc[extra]])
+    req_item = np.concatenate([item, item[extra]])
+    req_qty = np.concatenate([need, np.maximum(need[extra] // 2, 1)])
+    minute = np.concatenate([rng.integers(0, 40000, n), rng.integers(40000, 43000, extra.sum())])
+    priority = rng.choice(np.array(["High", "Medium", "Low", ""], dtype=object), len(req_phc),
+                          p=[0.15, 0.5, 0.2, 0.15])
+    db.execute(text("""
+        INSERT INTO restock_requests (item_name, quantity_needed, phc_id, phc_name, lga_id, requested_by,
+                                      request_date, status, priority_level)
+        SELECT format('Bench item %s', lpad(i::text, 3, '0')), q,
+               format('%s-phc-%s', CAST(:lga AS text), lpad(p::text, 3, '0')), format('Bench PHC %s', p),
+               :lga, 'bench', CAST(:start AS timestamptz) + m * interval '1 minute', 'pending', nullif(pr, '')
+        FROM unnest(CAST(:phc AS int[]), CAST(:item AS int[]), CAST(:qty AS int[]), CAST(:minute AS int[]),
+                    CAST(:priority AS text[])) AS t(p, i, q, m, pr)
+    """), {"lga": LGA_ID, "start": f"{MONTH}-01T00:00:00Z", "phc": req_phc.tolist(), "item": req_item.tolist(),
+           "qty": req_qty.tolist(), "minute": minute.tolist(), "priority": priority.tolist()})
+    zeros = [col for col in rollups.COUNTER_COLUMNS if col not in ("restock_requests", "restock_pending")]
+    db.execute(text(f"""
+        INSERT INTO phc_monthly_stats (phc_id, lga_id, month, restock_requests, restock_pending, {", ".join(zeros)})
+        SELECT phc_id, lga_id, :month, count(*), count(*), {", ".join("0" for _ in zeros)} FROM restock_requests
+        WHERE lga_id = :lga GROUP BY phc_id, lga_id
+    """), {"lga": LGA_ID, "month": MONTH})
+    db.commit()
+    db.execute(text("ANALYZE inventory"))
+    db.execute(text("ANALYZE restock_requests"))
+    db.commit()
+
+    totals = np.bincount(req_item, req_qty, minlength=ITEMS)
+    share = rng.uniform(0.3, 0.9, ITEMS)
+    return {item_name(k): int(totals[k] * share[k]) for k in range(ITEMS)}, len(req_phc)
+
+
+def cleanup(db):
+    like = f"{LGA_ID}-phc-%"
+    db.execute(text("DELETE FROM inventory WHERE phc_id LIKE :like"), {"like": like})
+    for table in ("restock_requests", "phc_monthly_stats", "facilities", "sync_tombstones"):
+        db.execute(text(f"DELETE FROM {table} WHERE lga_id = :lga"), {"lga": LGA_ID})
+    db.execute(text("DELETE FROM scope_versions WHERE scope LIKE :like"), {"like": f"%{LGA_ID}%"})
+    db.commit()
+
+
+def report(label, samples):
+    print(f"{label:<44} median {statistics.median(samples) * 1000:8.1f} ms   max {max(samples) * 1000:8.1f} ms")
+
+
+# ---------------- CHECKS ----------------
+def groups(demand):
+    """Per (facility, item) group: first row, item, stock, requested, weight, rate, as solve() builds them."""
+    starts = allocation._starts(demand.item, demand.phc)
+    requested = np.add.reduceat(demand.requested, starts).astype(float)
+    rate = demand.rate[starts]
+    rate = np.where(rate > 0, rate, requested / allocation.TARGET_DAYS)
+    return (starts, demand.item[starts], demand.stock[starts], requested,
+            np.maximum.reduceat(demand.weight, starts), rate)
+
+
+def check(plan) -> bool:
+    d = plan.demand
+    ok = True
+    per_item = np.bincount(d.item, plan.allocated, minlength=len(d.items))
+    asked = np.bincount(d.item, d.requested, minlength=len(d.items))
+    expected = np.minimum(d.supply, asked)
+    if (per_item > d.supply).any() or (per_item != expected).any():
+        print(f"  FAIL supply: {int((per_item != expected).sum())} items not allocated exactly min(supply, asked)")
+        ok = False
+    if (plan.allocated > d.requested).any() or (plan.allocated < 0).any():
+        print("  FAIL a request got more than it asked for")
+        ok = False
+
+    starts, item, stock, requested, weight, rate = groups(d)
+    units = np.add.reduceat(plan.allocated, starts)
+    slope = weight * rate
+    cover = (stock + units) / slope
+    level = plan.level[item]
+    unit = 1 / slope + 1e-6
+    short = np.isfinite(level)
+    topped = short & (units > 0) & (units < requested)
+    skipped = short & (units == 0)
+    bad_topped = np.abs(cover[topped] - level[topped]) > unit[topped]
+    bad_skipped = stock[skipped] / slope[skipped] < level[skipped] - unit[skipped]
+    print(f"  water-filling: {int(topped.sum()):,} partly filled at the level, "
+          f"{int(skipped.sum()):,} skipped above it; violations {int(bad_topped.sum())} + {int(bad_skipped.sum())}")
+    return ok and not bad_topped.any() and not bad_skipped.any()
+
+
+def first_come(demand, order_key):
+    """Allocation if the LGA approved each item's requests in request order until supply ran out."""
+    order = np.lexsort((order_key, demand.item))
+    qty = demand.requested[order]
+    item = demand.item[order]
+    before = np.cumsum(qty) - qty
+    first = np.searchsorted(item, item)
+    before -= (np.cumsum(qty) - qty)[first]
+    granted = np.zeros(len(qty), dtype=np.int64)
+    granted[order] = np.clip(demand.supply[item] - before, 0, qty)
+    return granted
+
+
+def worst_off(demand, allocated):
+    """Minimum cover per short item and facilities left at zero days, per (facility, item) group."""
+    starts, item, stock, requested, _, rate = groups(demand)
+    cover = (stock + np.add.reduceat(allocated, starts)) / rate
+    n_items = len(demand.items)
+    short = np.bincount(demand.item, demand.requested, minlength=n_items) > demand.supply
+    lowest = np.full(n_items, np.inf)
+    np.minimum.at(lowest, item, cover)
+    at_zero = int(((cover < 1e-9) & short[item]).sum())
+    return float(np.median(lowest[short])), float(lowest[short].min()), at_zero
+
+
+# ---------------- MAIN ----------------
+def main():
+    db = SessionLocal()
+    cleanup(db)
+    print(f"Seeding {FACILITIES} facilities x {ITEMS} items...")
+    supply, requests = seed(db)
+    try:
+        load, solve = [], []
+        for _ in range(RUNS):
+            start = time.perf_counter()
+            demand = allocation.load_demand(db, LGA_ID, supply)
+            load.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            plan = allocation.solve(demand)
+            solve.append(time.perf_counter() - start)
+            db.rollback()
+        assert len(demand.request_ids) == requests
+
+        from fastapi.testclient import TestClient
+        from main import app
+        client = TestClient(app)
+        headers = {"Authorization": "Bearer " + create_access_token(
+            {"user_id": 1, "role": "lga", "operator_name": "bench", "name": "Bench LGA", "phc_id": None,
+             "lga_id": LGA_ID})}
+        endpoint = []
+        for _ in range(RUNS):
+            start = time.perf_counter()
+            response = client.post("/inventory/restock-requests/allocate", json={"supply": supply}, headers=headers)
+            endpoint.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.text
+
+        print(f"Allocation, {FACILITIES} facilities x {ITEMS} items, {requests:,} pending requests, {RUNS} runs")
+        report("load_demand (one query)", load)
+        report("solve (NumPy)", solve)
+        report("POST /allocate (plan only, 150k lines)", endpoint)
+
+        print("Plan checks")
+        ok = check(plan)
+
+        dates = db.execute(text("SELECT id, request_date FROM restock_requests WHERE lga_id = :lga"),
+                           {"lga": LGA_ID}).all()
+        by_id = {rid: when.timestamp() for rid, when in dates}
+        fcfs = first_come(demand, np.array([by_id[rid] for rid in demand.request_ids.tolist()]))
+        print("Short items, days of cover of the worst-off facility (median item / worst item), "
+              "facility-items left at 0 days")
+        for label, allocated in (("first come, first served", fcfs), ("water-filling", plan.allocated)):
+            median, worst, zero = worst_off(demand, allocated)
+            print(f"  {label:<28} {median:6.1f} / {worst:5.1f} days   {zero:,} at zero")
+
+        start = time.perf_counter()
+        response = client.post("/inventory/restock-requests/allocate", json={"supply": supply, "apply": True},
+                               headers=headers)
+        applied = time.perf_counter() - start
+        assert response.status_code == 200, response.text
+        body = response.json()
+        granted = int((plan.allocated > 0).sum())
+        approved, partial, units = db.execute(text("""
+            SELECT count(*), count(*) FILTER (WHERE comments LIKE 'Allocated %'), coalesce(sum(quantity_needed), 0)
+            FROM restock_requests WHERE lga_id = :lga AND status = 'approved'
+        """), {"lga": LGA_ID}).one()
+        pending, counted = db.execute(text("""
+            SELECT sum(restock_pending), sum(restock_approved) FROM phc_monthly_stats WHERE lga_id = :lga
+        """), {"lga": LGA_ID}).one()
+        print(f"Apply: {applied * 1000:.0f} ms, {body['approved_requests']:,} approved ({partial:,} partial), "
+              f"{units:,} units; stats pending {pending:,} approved {counted:,}")
+        ok &= (approved == body["approved_requests"] == granted == counted
+               and units == int(plan.allocated.sum()) and pending == requests - granted)
+        print("PASS" if ok else "FAIL")
+    finally:
+        cleanup(db)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Benchmark: audit log overhead on the write endpoints (audit.py).
+
+Seeds one throwaway facility with pending restock requests into the
+database named by DATABASE_URL. Each write endpoint is timed ROUNDS times
+with auditing on and off, alternating in blocks of BLOCK requests so drift
+hits both sides alike:
+- restock create, cancel and issue create/update buffer their events;
+- approve writes its event in the request's transaction.
+It then checks:
+- every event reached audit_log once the buffer was flushed;
+- an approval's event is there straight after the response, with no flush;
+- a rolled-back transaction leaves no event.
+It times flushing FLUSH_EVENTS buffered events as one multi-row INSERT,
+against one INSERT per event in its own transaction, the cost a
+synchronous per-change insert would add. Last, it checks that a buffer
+whose writes fail stays within its bound.
+Everything it created is deleted afterwards.
+
+    DATABASE_URL=postgresql://localhost/medisense_bench python benchmarks/audit.py
+"""
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+if "DATABASE_URL" not in os.environ:
+    sys.exit("Set DATABASE_URL to a migrated scratch database before running benchmarks.")
+os.environ["SCHEDULER_ENABLED"] = "0"
+
+from sqlalchemy import text
+
+from database import SessionLocal, engine
+from jwt_handler import create_access_token
+from registry import registry
+import audit
+import versions
+
+LGA_ID = "bench-lga-audit"
+PHC_ID = f"{LGA_ID}-phc"
+ROUNDS = 200
+BLOCK = 20
+FLUSH_EVENTS = 50_000
+SINGLE_INSERTS = 2_000
+
+
+def seed(db):
+    db.execute(text("INSERT INTO facilities (phc_id, name, lga_id) VALUES (:phc, 'Bench PHC', :lga)"),
+               {"phc": PHC_ID, "lga": LGA_ID})
+    versions.bump(db, "facilities")
+    db.commit()
+    registry.invalidate()
+
+
+def cleanup(db):
+    db.execute(text("DELETE FROM audit_log WHERE lga_id = :lga"), {"lga": LGA_ID})
+    db.execute(text("DELETE FROM jobs WHERE payload->>'lga_id' = :lga"), {"lga": LGA_ID})
+    for table in ("restock_requests", "issues", "phc_monthly_stats", "facilities", "sync_tombstones"):
+        db.execute(text(f"DELETE FROM {table} WHERE lga_id = :lga"), {"lga": LGA_ID})
+    db.execute(text("DELETE FROM scope_versions WHERE scope LIKE :like"), {"like": f"%{LGA_ID}%"})
+    versions.bump(db, "facilities")
+    db.commit()
+    registry.invalidate()
+
+
+def events(db, **filters) -> int:
+    where = "".join(f" AND {column} = :{column}" for column in filters)
+    count = db.execute(text(f"SELECT count(*) FROM audit_log WHERE lga_id = :lga{where}"),
+                       {"lga": LGA_ID, **filters}).scalar()
+    db.rollback()
+    return count
+
+
+def fake_event(n: int) -> tuple:
+    return (datetime.now(timezone.utc), "bench.flush", "bench", str(n), LGA_ID, PHC_ID, "bench", "phc",
+            '{"status":["pending","approved"]}')
+
+
+def main():
+    db = SessionLocal()
+    cleanup(db)
+    seed(db)
+    ok = True
+    try:
+        from fastapi.testclient import TestClient
+        from main import app
+        client = TestClient(app)        # no startup: the buffer is flushed by hand below
+        claims = {"user_id": 1, "operator_name": "bench", "name": "Bench", "lga_id": LGA_ID}
+        phc = {"Authorization": "Bearer " + create_access_token({**claims, "role": "phc", "phc_id": PHC_ID})}
+        lga = {"Authorization": "Bearer " + create_access_token({**claims, "role": "lga", "phc_id": None})}
+
+        def create():
+            response = client.post("/inventory/restock-requests", headers=phc,
+                                   json={"item_name": "Bench item", "quantity_needed": 10})
+            assert response.status_code == 201, response.text
+            return response.json()["id"]
+
+        def create_issue():
+            response = client.post("/reports/issues", headers=phc,
+                                   json={"category": "Equipment", "priority": "Low", "description": "bench"})
+            assert response.status_code == 200, response.text
+            return response.json()["id"]
+
+        # Targets made up front, so each timed call does one write
+        pending = [create() for _ in range(4 * ROUNDS)]
+        issues = [create_issue() for _ in range(2 * ROUNDS)]
+        audit.buffer.flush()
+        endpoints = {
+            "POST restock-requests (buffered)": lambda: create(),
+            "PUT restock-requests/{id} (critical)": lambda: client.put(
+                f"/inventory/restock-requests/{pending.pop()}", headers=lga, json={"status": "approved"}),
+            "PUT .../{id}/cancel (buffered)": lambda: client.put(
+                f"/inventory/restock-requests/{pending.pop()}/cancel", headers=phc),
+            "POST reports/issues (buffered)": lambda: create_issue(),
+            "PUT reports/issues/{id} (buffered)": lambda: client.put(
+                f"/reports/issues/{issues.pop()}", headers=lga, params={"status": "Resolved"}),
+        }
+        before = events(db)
+        print(f"Median latency over {ROUNDS} requests each, audit off vs on")
+        for name, call in endpoints.items():
+            timings = {False: [], True: []}
+            for block in range(2 * ROUNDS // BLOCK):
+                audit.ENABLED = block % 2 == 1
+                for _ in range(BLOCK):
+                    start = time.perf_counter()
+                    call()
+                    timings[audit.ENABLED].append(time.perf_counter() - start)
+                audit.buffer.flush()
+            off, on = statistics.median(timings[False]) * 1000, statistics.median(timings[True]) * 1000
+            print(f"  {name:<40} off {off:6.2f} ms   on {on:6.2f} ms   {on - off:+6.2f} ms")
+        audit.ENABLED = True
+        audit.buffer.flush()
+        recorded = events(db) - before
+        print(f"Events recorded while on: {recorded} (expected {len(endpoints) * ROUNDS})")
+        ok &= recorded == len(endpoints) * ROUNDS
+
+        # Critical events are in the request's transaction; buffered ones wait for the flusher
+        request_id = create()
+        client.put(f"/inventory/restock-requests/{request_id}", headers=lga, json={"status": "approved"})
+        critical = events(db, entity_id=str(request_id), action="restock.approved")
+        waiting = events(db, entity_id=str(request_id), action="restock.created")
+        audit.buffer.flush()
+        flushed = events(db, entity_id=str(request_id), action="restock.created")
+        # A rolled-back transaction records nothing
+        audit.record(db, lga, "bench.rolled_back", entity="bench", entity_id=0, lga_id=LGA_ID, critical=True)
+        audit.record(db, lga, "bench.rolled_back", entity="bench", entity_id=0, lga_id=LGA_ID)
+        db.rollback()
+        audit.buffer.flush()
+        rolled_back = events(db, action="bench.rolled_back")
+        print(f"Approval event visible right after the response: {critical == 1}; create event before flush "
+              f"{waiting}, after {flushed}; rolled-back events written: {rolled_back}")
+        ok &= critical == 1 and waiting == 0 and flushed == 1 and rolled_back == 0
+
+        # Batched flush against one synchronous insert per change
+        batch = [fake_event(n) for n in range(FLUSH_EVENTS)]
+        start = time.perf_counter()
+        audit.write_batch(batch)
+        batched = time.perf_counter() - start
+        start = time.perf_counter()
+        for n in range(SINGLE_INSERTS):
+            audit.write_batch([fake_event(n)])
+        single = (time.perf_counter() - start) / SINGLE_INSERTS
+        print(f"Flush {FLUSH_EVENTS:,} events in one INSERT: {batched:.2f} s ({batched / FLUSH_EVENTS * 1e6:.1f} us "
+              f"per event); one INSERT and commit per event: {single * 1e6:.0f} us per event")
+
+        # Bounded memory when writes keep failing
+        def failing(events):
+            raise RuntimeError("database down")
+
+        bounded = audit.AuditBuffer(writer=failing, max_buffered=1000)
+        for n in range(30):
+            bounded.add([fake_event(n)] * 100)
+            try:
+                bounded.flush()
+            except RuntimeError:
+                pass
+        print(f"Buffer with failing writes after 3,000 events: {bounded.pending()} held (bound 1,000)")
+        ok &= bounded.pending() <= 1000
+        print("PASS" if ok else "FAIL")
+    finally:
+        audit.ENABLED = True
+        audit.buffer.flush()
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM audit_log WHERE action = 'bench.flush'"))
+        cleanup(db)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Multi-process cache coherence over the LISTEN/NOTIFY invalidation bus.
+
+Part 1, the bus itself: starts READERS processes that each keep a
+cache.named() cache of one scope_versions row and read through it in a
+tight loop. The parent bumps the row and publishes an invalidation in the
+same transaction ROUNDS times. After each commit returns, every reader must
+serve the new value within BOUND_MS. Every few rounds the parent also
+publishes and rolls back, and no reader may evict for those. Halfway
+through, the readers' LISTEN connections are killed with
+pg_terminate_backend; the listeners must reconnect and stay coherent.
+
+Part 2, the app: starts uvicorn with several workers and warms every
+worker's LGA summary cache. It then creates issues through the API; every
+GET /reports/lga-summary sent 50 ms after a write must already include it.
+Without the bus a worker would serve its cached summary for up to 5 minutes.
+
+    DATABASE_URL=postgresql://localhost/medisense_bench python benchmarks/cache_coherence.py
+"""
+import multiprocessing as mp
+import os
+import random
+import signal
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, ROOT)
+
+if "DATABASE_URL" not in os.environ:
+    sys.exit("Set DATABASE_URL to a scratch database before running benchmarks.")
+
+import httpx
+from sqlalchemy import text
+
+from database import SessionLocal
+from models import Facility, Issue, PhcMonthlyStats, ScopeVersion
+import invalidation
+import registry
+import versions
+from jwt_handler import create_access_token
+
+SCOPE = "bench:cache-coherence"
+READERS = 4
+ROUNDS = 200
+ROLLBACK_EVERY = 5
+BOUND_MS = 100
+
+LGA_ID = "bench-lga-coherence"
+PHC_ID = f"{LGA_ID}-phc-01"
+PORT = 8799
+WORKERS = 4
+WRITES = 10
+GETS_PER_CHECK = 64
+
+
+# ---------------- PART 1: BUS ----------------
+def read_version(db) -> int:
+    return db.query(ScopeVersion.version).filter(ScopeVersion.scope == SCOPE).scalar() or 0
+
+
+def reader(n, ready, stop, results):
+    import cache
+
+    coherence = cache.named("coherence", maxsize=16, ttl=3600)
+    invalidation.listener.start()
+    invalidation.listener.connected.wait(10)
+    loads = 0
+
+    def load():
+        nonlocal loads
+        loads += 1
+        db = SessionLocal()
+        try:
+            return read_version(db)
+        finally:
+            db.close()
+
+    seen = {}                               # version -> wall time it was first served
+    ready.set()
+    while not stop.is_set():
+        value = coherence.get_or_load(("version",), load)
+        if value not in seen:
+            seen[value] = time.time()
+        time.sleep(0.0005)
+    invalidation.listener.stop()
+    results.put((n, seen, loads))
+
+
+def terminate_listeners(db) -> int:
+    return db.execute(text(
+        "SELECT count(pg_terminate_backend(pid)) FROM pg_stat_activity "
+        "WHERE query = :q AND pid <> pg_backend_pid()"
+    ), {"q": f"LISTEN {invalidation.CHANNEL}"}).scalar()
+
+
+def bus_test() -> bool:
+    db = SessionLocal()
+    versions.bump(db, SCOPE)
+    db.commit()
+
+    ctx = mp.get_context("spawn")
+    stop, results = ctx.Event(), ctx.Queue()
+    readies = [ctx.Event() for _ in range(READERS)]
+    procs = [ctx.Process(target=reader, args=(n, readies[n], stop, results)) for n in range(READERS)]
+    for p in procs:
+        p.start()
+    for r in readies:
+        r.wait(30)
+
+    committed = {}                          # version -> wall time the commit returned
+    rollbacks = terminated = 0
+    for i in range(ROUNDS):
+        if i == ROUNDS // 2:
+            terminated = terminate_listeners(db)
+            db.commit()
+            time.sleep(2.5)                 # listeners back off 1s, reconnect and clear
+        versions.bump(db, SCOPE)
+        invalidation.publish(db, "coherence")
+        db.commit()
+        committed[read_version(db)] = time.time()
+        db.commit()
+        if i % ROLLBACK_EVERY == 0:
+            versions.bump(db, SCOPE)
+            invalidation.publish(db, "coherence")
+            db.rollback()
+            rollbacks += 1
+        time.sleep(random.uniform(0.01, 0.03))
+    time.sleep(0.5)
+    stop.set()
+    collected = [results.get(timeout=30) for _ in procs]
+    for p in procs:
+        p.join(timeout=10)
+
+    lags, late, missing, loads = [], 0, 0, []
+    for n, seen, reader_loads in sorted(collected):
+        loads.append(reader_loads)
+        for version, at in committed.items():
+            if version not in seen:
+                missing += 1
+                continue
+            lag = (seen[version] - at) * 1000
+            lags.append(lag)
+            late += lag > BOUND_MS
+
+    db.query(ScopeVersion).filter(ScopeVersion.scope == SCOPE).delete()
+    db.commit()
+    db.close()
+
+    lags.sort()
+    print(f"Bus: {READERS} reader processes, {ROUNDS} committed invalidations, {rollbacks} rolled back, "
+          f"{terminated} listener connections killed halfway")
+    print(f"  new value served after commit   p50 {statistics.median(lags):.1f} ms  "
+          f"p99 {lags[int(len(lags) * .99) - 1]:.1f} ms  max {lags[-1]:.1f} ms")
+    print(f"  served later than {BOUND_MS} ms        {late}")
+    print(f"  versions never served           {missing}")
+    # One load at start, one per committed invalidation, one for the clear after reconnecting
+    expected = ROUNDS + 1 + (1 if terminated else 0)
+    print(f"  DB loads per reader             {loads} (expected {expected}: rollbacks must not evict)")
+    return late == 0 and missing == 0 and all(n == expected for n in loads)
+
+
+# ---------------- PART 2: APP ----------------
+def token(role):
+    claims = {"user_id": 1, "role": role, "operator_name": "bench", "name": "Bench Coherence PHC",
+              "lga_id": LGA_ID, "phc_id": PHC_ID if role == "phc" else None}
+    return {"Authorization": "Bearer " + create_access_token(claims)}
+
+
+def cleanup(db):
+    db.query(Issue).filter(Issue.lga_id == LGA_ID).delete(synchronize_session=False)
+    db.query(PhcMonthlyStats).filter(PhcMonthlyStats.lga_id == LGA_ID).delete(synchronize_session=False)
+    db.query(Facility).filter(Facility.lga_id == LGA_ID).delete(synchronize_session=False)
+    db.query(ScopeVersion).filter(ScopeVersion.scope.like(f"issues:%:{LGA_ID}%")).delete(synchronize_session=False)
+    db.commit()
+
+
+def start_server():
+    env = dict(os.environ, SCHEDULER_ENABLED="0")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(PORT), "--workers", str(WORKERS),
+         "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    for _ in range(300):
+        try:
+            httpx.get(f"http://127.0.0.1:{PORT}/health/live", timeout=1)
+            return server
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    server.kill()
+    sys.exit("uvicorn did not start")
+
+
+def app_test() -> bool:
+    db = SessionLocal()
+    cleanup(db)
+    registry.register(db, PHC_ID, "Bench Coherence PHC", LGA_ID)
+    db.commit()
+
+    month = datetime.utcnow().strftime("%Y-%m")
+    base = f"http://127.0.0.1:{PORT}"
+    server = start_server()
+    stale = checks = 0
+    try:
+        with httpx.Client(base_url=base, timeout=30, limits=httpx.Limits(max_connections=32)) as client:
+            def logged(_):
+                # A new connection per request, so requests spread over the workers
+                r = httpx.get(f"{base}/reports/lga-summary", params={"month_str": month},
+                              headers=token("lga"), timeout=30)
+                return r.json()["totals"]["issues_logged"]
+
+            with ThreadPoolExecutor(16) as pool:
+                warm = set(pool.map(logged, range(GETS_PER_CHECK * 2)))
+                for expected in range(1, WRITES + 1):
+                    r = client.post("/reports/issues", headers=token("phc"),
+                                    json={"category": "Equipment", "priority": "Low", "description": "coherence"})
+                    r.raise_for_status()
+                    time.sleep(0.05)
+                    counts = list(pool.map(logged, range(GETS_PER_CHECK)))
+                    checks += len(counts)
+                    stale += sum(1 for c in counts if c < expected)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+        cleanup(db)
+        db.close()
+
+    print(f"App: {WORKERS} uvicorn workers, cache warmed with {sorted(warm)} issues logged, {WRITES} issues created")
+    print(f"  summaries 50 ms after a write   {checks} checked, {stale} stale")
+    return stale == 0
+
+
+def main():
+    ok = bus_test()
+    ok = app_test() and ok
+    print("PASS" if ok else "FAIL: a worker served stale data")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
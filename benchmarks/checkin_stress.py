@@ -0,0 +1,163 @@
+"""
+Stress test: no lost check-ins across worker processes.
+
+Starts the API under uvicorn with 4 worker processes and a short check-in
+flush interval, then fires POST /workload/check-in from many client threads
+for a handful of throwaway PHCs while the workers flush concurrently. The
+server is stopped with SIGTERM, which makes every worker flush what it still
+has buffered, and the daily_workload counts must then equal the number of
+check-ins the clients got a 202 for.
+
+It also fires concurrent POST /workload/submit calls for one new facility-day
+and checks they leave exactly one daily_workload row.
+
+    DATABASE_URL=postgresql://localhost/medisense_bench python benchmarks/checkin_stress.py
+"""
+import os
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, ROOT)
+
+if "DATABASE_URL" not in os.environ:
+    sys.exit("Set DATABASE_URL to a scratch database before running benchmarks.")
+
+import httpx
+from sqlalchemy import func, text
+
+from database import SessionLocal, Base, engine
+from models import DailyWorkload, Facility, Issue, PhcMonthlyStats, WorkloadForecast
+import registry
+import versions
+from jwt_handler import create_access_token
+
+LGA_ID = "bench-lga-checkin"
+PORT = 8797
+WORKERS = 4
+PHCS = 10
+CLIENT_THREADS = 32
+CHECKINS_PER_THREAD = 250
+SUBMIT_THREADS = 16
+FLUSH_SECONDS = "0.2"
+
+
+def phc_id(n):
+    return f"{LGA_ID}-phc-{n:02d}"
+
+
+def token(phc):
+    return "Bearer " + create_access_token({
+        "user_id": 1, "role": "phc", "operator_name": "bench", "name": "Bench",
+        "phc_id": phc, "lga_id": LGA_ID,
+    })
+
+
+def seed(db):
+    db.add(Facility(phc_id=f"{LGA_ID}-submit", name="Bench", lga_id=LGA_ID))
+    versions.bump(db, registry.SCOPE)
+    db.commit()
+
+
+def cleanup(db):
+    for model in (DailyWorkload, PhcMonthlyStats, Issue, WorkloadForecast, Facility):
+        db.query(model).filter(model.phc_id.like(f"{LGA_ID}-%")).delete(synchronize_session=False)
+    versions.bump(db, registry.SCOPE)
+    db.commit()
+
+
+def commits(db) -> int:
+    # Backends report their counters a moment after the fact; read a fresh snapshot
+    time.sleep(1.5)
+    db.execute(text("SELECT pg_stat_clear_snapshot()"))
+    return db.execute(text(
+        "SELECT xact_commit FROM pg_stat_database WHERE datname = current_database()"
+    )).scalar()
+
+
+def start_server():
+    env = dict(os.environ, CHECKIN_FLUSH_SECONDS=FLUSH_SECONDS, SCHEDULER_ENABLED="0")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(PORT), "--workers", str(WORKERS),
+         "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    for _ in range(200):
+        try:
+            httpx.get(f"http://127.0.0.1:{PORT}/", timeout=1)
+            return server
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    server.kill()
+    sys.exit("uvicorn did not start")
+
+
+def hammer(thread_no: int) -> int:
+    accepted = 0
+    with httpx.Client(base_url=f"http://127.0.0.1:{PORT}", timeout=10) as client:
+        for i in range(CHECKINS_PER_THREAD):
+            phc = phc_id((thread_no + i) % PHCS)
+            response = client.post("/workload/check-in", headers={"Authorization": token(phc)})
+            accepted += response.status_code == 202
+    return accepted
+
+
+def submit(n: int) -> int:
+    response = httpx.post(
+        f"http://127.0.0.1:{PORT}/workload/submit",
+        json={"patient_count": 40 + n},
+        headers={"Authorization": token(f"{LGA_ID}-submit")},
+        timeout=30,
+    )
+    return response.status_code
+
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    cleanup(db)
+    seed(db)
+    server = start_server()
+    try:
+        before = commits(db)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(CLIENT_THREADS) as pool:
+            accepted = sum(pool.map(hammer, range(CLIENT_THREADS)))
+        elapsed = time.perf_counter() - started
+
+        with ThreadPoolExecutor(SUBMIT_THREADS) as pool:
+            statuses = list(pool.map(submit, range(SUBMIT_THREADS)))
+    finally:
+        # SIGTERM runs the shutdown handlers, which flush each worker's buffer
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+
+    today = datetime.utcnow().date()
+    stored = db.query(func.coalesce(func.sum(DailyWorkload.patient_count), 0)).filter(
+        DailyWorkload.phc_id.like(f"{LGA_ID}-phc-%"), DailyWorkload.date == today
+    ).scalar()
+    rows = db.query(func.count(DailyWorkload.id)).filter(DailyWorkload.phc_id.like(f"{LGA_ID}-phc-%")).scalar()
+    submit_rows = db.query(func.count(DailyWorkload.id)).filter(DailyWorkload.phc_id == f"{LGA_ID}-submit").scalar()
+    transactions = commits(db) - before
+    db.commit()
+    cleanup(db)
+    db.close()
+
+    sent = CLIENT_THREADS * CHECKINS_PER_THREAD
+    print(f"{WORKERS} workers, {CLIENT_THREADS} client threads, {PHCS} PHCs, flush every {FLUSH_SECONDS}s")
+    print(f"  check-ins sent       {sent}  ({sent / elapsed:.0f}/s)")
+    print(f"  accepted (202)       {accepted}")
+    print(f"  stored in DB         {stored}  across {rows} facility-day rows")
+    print(f"  DB transactions      {transactions}  (check-ins plus {SUBMIT_THREADS} submits)")
+    print(f"  concurrent submits   {statuses.count(200)}/{SUBMIT_THREADS} ok, {submit_rows} row(s) for the day")
+    ok = stored == accepted and rows == PHCS and submit_rows == 1
+    print("PASS" if ok else "FAIL: lost or duplicated updates")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Benchmark: DB load from 500 dashboard clients polling list endpoints.
+
+Seeds one throwaway LGA (20 PHCs, 100 restock requests and 25 issues each)
+into the database named by DATABASE_URL. Then 500 clients, 100 LGA
+dashboards and 400 PHC screens, each poll GET /inventory/restock-requests and
+GET /reports/issues for several rounds, with one new restock request per
+round. It compares clients that never send validators (the old behaviour)
+with clients that send If-None-Match, and counts SQL statements, rows read
+and DB time per steady-state poll. Everything it created is deleted afterwards.
+
+    DATABASE_URL=postgresql://localhost/medisense_bench python benchmarks/conditional_get.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+if "DATABASE_URL" not in os.environ:
+    sys.exit("Set DATABASE_URL to a scratch database before running benchmarks.")
+
+from sqlalchemy import event, text
+
+from database import SessionLocal, Base, engine
+from models import Issue, RestockRequest, ScopeVersion
+from jwt_handler import create_access_token
+
+LGA_ID = "bench-lga-polling"
+PHCS = 20
+REQUESTS_PER_PHC = 100
+ISSUES_PER_PHC = 25
+LGA_CLIENTS = 100
+PHC_CLIENTS = 400
+ROUNDS = 4
+PATHS = ("/inventory/restock-requests", "/reports/issues")
+
+
+class SqlCounter:
+    def __init__(self):
+        self.statements = self.rows = 0
+        self.seconds = 0.0
+        event.listen(engine, "before_cursor_execute", self.before)
+        event.listen(engine, "after_cursor_execute", self.after)
+
+    def before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info["bench_start"] = time.perf_counter()
+
+    def after(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements += 1
+        self.seconds += time.perf_counter() - conn.info.pop("bench_start")
+        if cursor.description is not None and cursor.rowcount > 0:
+            self.rows += cursor.rowcount
+
+    def reset(self):
+        self.statements = self.rows = 0
+        self.seconds = 0.0
+
+
+def phc_id(n):
+    return f"{LGA_ID}-phc-{n:02d}"
+
+
+def token(role, phc=None):
+    return {"Authorization": "Bearer " + create_access_token({
+        "user_id": 1, "role": role, "operator_name": "bench", "name": "Bench",
+        "phc_id": phc, "lga_id": LGA_ID,
+    })}
+
+
+def seed(db):
+    for n in range(PHCS):
+        db.add_all(RestockRequest(item_name=f"Item {i}", quantity_needed=10, phc_id=phc_id(n), phc_name="Bench",
+                                  lga_id=LGA_ID, requested_by="bench", status="pending")
+                   for i in range(REQUESTS_PER_PHC))
+        db.add_all(Issue(phc_id=phc_id(n), lga_id=LGA_ID, phc_name="Bench", category="Power",
+                         priority="Medium", description="Generator down")
+                   for _ in range(ISSUES_PER_PHC))
+    db.commit()
+    db.execute(text("ANALYZE"))
+    db.commit()
+
+
+def cleanup(db):
+    db.query(RestockRequest).filter(RestockRequest.lga_id == LGA_ID).delete(synchronize_session=False)
+    db.query(Issue).filter(Issue.lga_id == LGA_ID).delete(synchronize_session=False)
+    db.query(ScopeVersion).filter(ScopeVersion.scope.like(f"%{LGA_ID}%")).delete(synchronize_session=False)
+    db.commit()
+
+
+def run(client, clients, conditional, counter):
+    """Round 0 warms every client up; the figures cover the steady-state rounds after it."""
+    etags = {}
+    polls = not_modified = 0
+    for round_no in range(ROUNDS):
+        if round_no:
+            # One facility raises a request between rounds
+            client.post("/inventory/restock-requests", json={"item_name": f"Round {round_no}", "quantity_needed": 5},
+                        headers=token("phc", phc_id(round_no % PHCS)))
+        if round_no == 1:
+            counter.reset()
+            start = time.perf_counter()
+        for n, headers in enumerate(clients):
+            for path in PATHS:
+                h = dict(headers)
+                if conditional and (n, path) in etags:
+                    h["If-None-Match"] = etags[(n, path)]
+                response = client.get(path, headers=h)
+                if round_no:
+                    polls += 1
+                    not_modified += response.status_code == 304
+                if response.status_code == 200:
+                    etags[(n, path)] = response.headers.get("etag")
+    elapsed = time.perf_counter() - start
+    return {
+        "polls": polls,
+        "not_modified": not_modified,
+        "statements_per_poll": counter.statements / polls,
+        "rows_per_poll": counter.rows / polls,
+        "db_ms_per_poll": counter.seconds * 1000 / polls,
+        "wall_ms_per_poll": elapsed * 1000 / polls,
+    }
+
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    cleanup(db)
+    seed(db)
+
+    from fastapi.testclient import TestClient
+    from main import app
+    client = TestClient(app)
+    clients = [token("lga") for _ in range(LGA_CLIENTS)] + \
+              [token("phc", phc_id(n % PHCS)) for n in range(PHC_CLIENTS)]
+    counter = SqlCounter()
+    try:
+        print(f"{len(clients)} polling clients x {len(PATHS)} endpoints x {ROUNDS} rounds "
+              f"({PHCS} PHCs, {PHCS * REQUESTS_PER_PHC} restock requests, {PHCS * ISSUES_PER_PHC} issues)")
+        print(f"{'mode':<16}{'polls':>8}{'304s':>8}{'stmts/poll':>12}{'rows/poll':>11}{'db ms/poll':>12}{'wall ms/poll':>14}")
+        for label, conditional in (("unconditional", False), ("If-None-Match", True)):
+            cleanup(db)
+            seed(db)
+            r = run(client, clients, conditional, counter)
+            print(f"{label:<16}{r['polls']:>8}{r['not_modified']:>8}{r['statements_per_poll']:>12.2f}"
+                  f"{r['rows_per_poll']:>11.1f}{r['db_ms_per_poll']:>12.3f}{r['wall_ms_per_poll']:>14.3f}")
+    finally:
+        cleanup(db)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
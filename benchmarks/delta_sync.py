@@ -0,0 +1,262 @@
+"""
+Benchmark: what a PHC tablet downloads on reconnect, full reload vs delta sync.
+
+Seeds one throwaway LGA (10 PHCs, each with 150 inventory items, 400 restock
+requests, 80 issues and 12 monthly reports) into the database named by
+DATABASE_URL. For one PHC and for the LGA it compares:
+
+- full reload: the list endpoints a client re-downloads today
+  (/inventory/restock-requests, /reports/issues, /reports/), plus
+- full sync: GET /sync/changes without a cursor, which also carries inventory;
+- delta sync: GET /sync/changes with the cursor from the previous sync, after a
+  typical time offline (stock counts, a few requests approved or raised, an
+  issue, a report edit and a deleted item).
+
+It reports bytes on the wire (gzip where the endpoint offers it) and the
+median server time of each. It also checks correctness. A replica built from
+the full sync plus the delta must equal a fresh full sync. A transaction that
+started before a sync round, and commits after it, must still be delivered
+by the next round. Everything it created is deleted afterwards.
+
+    DATABASE_URL=postgresql://localhost/medisense_bench python benchmarks/delta_sync.py
+"""
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+if "DATABASE_URL" not in os.environ:
+    sys.exit("Set DATABASE_URL to a migrated scratch database before running benchmarks.")
+
+import orjson
+from sqlalchemy import text
+
+from database import SessionLocal
+from models import (Facility, Inventory, Issue, MonthlyReport, PhcMonthlyStats, RestockRequest, ScopeVersion,
+                    SyncTombstone)
+from jwt_handler import create_access_token
+import registry
+
+LGA_ID = "bench-lga-sync"
+PHCS = 10
+ITEMS = 150
+REQUESTS = 400
+ISSUES = 80
+REPORTS = 12
+REPEATS = 30
+FULL_PATHS = ("/inventory/restock-requests", "/reports/issues", "/reports/")
+GZIP = {"Accept-Encoding": "gzip"}
+OFFLINE_ROWS = 20 + 5 + 2 + 1 + 1
+WORDS = ("patients", "stock", "delayed", "delivery", "generator", "fuel", "malaria", "vaccine", "cold", "chain",
+         "staff", "shortage", "referral", "outreach", "clinic", "ward", "supplies", "requested", "week", "rains")
+
+
+def phc_id(n):
+    return f"{LGA_ID}-phc-{n:02d}"
+
+
+def token(role, phc=None):
+    return {"Authorization": "Bearer " + create_access_token({
+        "user_id": 1, "role": role, "operator_name": "bench", "name": "Bench",
+        "phc_id": phc, "lga_id": LGA_ID,
+    })}
+
+
+def prose(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def seed(db):
+    # Varied text, so compression ratios are not flattered by identical rows
+    rng = random.Random(43)
+    for n in range(PHCS):
+        phc = phc_id(n)
+        registry.register(db, phc, f"Bench Sync PHC {n}", LGA_ID)
+        db.add_all(Inventory(phc_id=phc, phc_name="Bench", item_name=f"Item {i}", current_stock=rng.randint(0, 900),
+                             daily_consumption_rate=round(rng.uniform(0, 12), 2), unit="tablets") for i in range(ITEMS))
+        db.add_all(RestockRequest(item_name=f"Item {i % ITEMS}", quantity_needed=rng.randint(5, 500), phc_id=phc,
+                                  phc_name="Bench", lga_id=LGA_ID, requested_by=f"Nurse {rng.randint(1, 9)}",
+                                  status=("pending", "approved", "delivered")[i % 3])
+                   for i in range(REQUESTS))
+        db.add_all(Issue(phc_id=phc, lga_id=LGA_ID, phc_name="Bench", category="Equipment", priority="Medium",
+                         description=prose(rng, rng.randint(6, 30)), status="Resolved")
+                   for _ in range(ISSUES))
+        db.add_all(MonthlyReport(phc_id=phc, lga_id=LGA_ID, phc_name="Bench", month=f"2025-{m + 1:02d}",
+                                 content=prose(rng, rng.randint(150, 400)), status="Submitted")
+                   for m in range(REPORTS))
+    db.commit()
+    db.execute(text("ANALYZE"))
+    db.commit()
+
+
+def cleanup(db):
+    phcs = [phc_id(n) for n in range(PHCS)]
+    db.query(Inventory).filter(Inventory.phc_id.in_(phcs)).delete(synchronize_session=False)
+    for model in (RestockRequest, Issue, MonthlyReport, PhcMonthlyStats, Facility):
+        db.query(model).filter(model.lga_id == LGA_ID).delete(synchronize_session=False)
+    db.query(SyncTombstone).filter(SyncTombstone.phc_id.in_(phcs)).delete(synchronize_session=False)
+    db.query(ScopeVersion).filter(ScopeVersion.scope.like(f"%{LGA_ID}%")).delete(synchronize_session=False)
+    db.commit()
+
+
+def time_offline(db):
+    """A day offline for PHC 0: stock counts, approvals, new requests, an issue, a report edit, a delete."""
+    phc = phc_id(0)
+    items = db.query(Inventory).filter(Inventory.phc_id == phc).order_by(Inventory.id).limit(21).all()
+    for item in items[:20]:
+        item.current_stock -= 7
+    db.delete(items[20])
+    for request in db.query(RestockRequest).filter(RestockRequest.phc_id == phc,
+                                                   RestockRequest.status == "pending").limit(5):
+        request.status = "approved"
+        request.processed_by = "LGA Bench"
+    db.add_all(RestockRequest(item_name="Item 1", quantity_needed=30, phc_id=phc, phc_name="Bench", lga_id=LGA_ID,
+                              requested_by="Nurse Bench") for _ in range(2))
+    db.add(Issue(phc_id=phc, lga_id=LGA_ID, phc_name="Bench", category="Power", priority="High",
+                 description="Solar inverter fault"))
+    report = db.query(MonthlyReport).filter(MonthlyReport.phc_id == phc).order_by(MonthlyReport.id).first()
+    report.content += " Edited."
+    db.commit()
+
+
+# ---------------- CLIENT SIDE ----------------
+def sync_round(client, headers, cursor=None, limit=None):
+    """Every page of one round: (pages, wire bytes, final cursor)."""
+    pages, wire = [], 0
+    while True:
+        params = {"cursor": cursor} if cursor else {}
+        if limit:
+            params["limit"] = limit
+        response = client.get("/sync/changes", params=params, headers={**headers, **GZIP})
+        response.raise_for_status()
+        wire += response.num_bytes_downloaded
+        page = response.json()
+        pages.append(page)
+        cursor = page["cursor"]
+        if not page["more"]:
+            return pages, wire, cursor
+
+
+def apply(replica, pages):
+    for page in pages:
+        if page["reset"]:
+            replica.clear()
+        for name, table in page["tables"].items():
+            rows = replica.setdefault(name, {})
+            for values in zip(*table["values"]):
+                row = dict(zip(table["columns"], values))
+                rows[row["id"]] = row
+            for row_id in table["deleted"]:
+                rows.pop(row_id, None)
+    return replica
+
+
+def median_ms(call):
+    samples = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def full_reload(client, headers):
+    """(JSON bytes, wire bytes) of re-downloading every list."""
+    size = wire = 0
+    for path in FULL_PATHS:
+        response = client.get(path, headers={**headers, **GZIP})
+        response.raise_for_status()
+        size += len(response.content)
+        wire += response.num_bytes_downloaded
+    return size, wire
+
+
+# ---------------- CHECKS ----------------
+def out_of_order_check(client, headers) -> bool:
+    """A write whose transaction began before a round but committed after it reaches the next round."""
+    _, _, cursor = sync_round(client, headers)
+    slow = SessionLocal()
+    item = slow.query(Inventory).filter(Inventory.phc_id == phc_id(0)).order_by(Inventory.id).first()
+    item_id = item.id
+    item.current_stock = 4242
+    slow.flush()                                    # takes its transaction id now, commits later
+    fast = SessionLocal()
+    fast.add(Issue(phc_id=phc_id(0), lga_id=LGA_ID, phc_name="Bench", category="Power", priority="Low",
+                   description="later transaction, earlier commit"))
+    fast.commit()
+    fast.close()
+    pages, _, cursor = sync_round(client, headers, cursor)
+    early = apply({}, pages).get("inventory", {}).get(item_id, {}).get("current_stock")
+    slow.commit()
+    slow.close()
+    pages, _, _ = sync_round(client, headers, cursor)
+    late = apply({}, pages).get("inventory", {}).get(item_id, {}).get("current_stock")
+    return early != 4242 and late == 4242
+
+
+def main():
+    from fastapi.testclient import TestClient
+    from main import app
+
+    db = SessionLocal()
+    cleanup(db)
+    seed(db)
+    client = TestClient(app)
+    clients = {"PHC": token("phc", phc_id(0)), "LGA": token("lga")}
+    dump = lambda replica: orjson.dumps(replica, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    try:
+        ok = True
+        results = {}
+        for label, headers in clients.items():
+            pages, wire, cursor = sync_round(client, headers)
+            results[label] = {
+                "replica": apply({}, pages), "cursor": cursor,
+                "reload": full_reload(client, headers),
+                "reload_ms": median_ms(lambda: full_reload(client, headers)),
+                "full_sync": (len(pages), sum(len(orjson.dumps(p)) for p in pages), wire,
+                              median_ms(lambda: sync_round(client, headers))),
+            }
+
+        time_offline(db)
+
+        print(f"{PHCS} PHCs x ({ITEMS} items, {REQUESTS} restock requests, {ISSUES} issues, {REPORTS} reports); "
+              f"PHC 0 then changes {OFFLINE_ROWS} rows and deletes one")
+        print(f"{'client':<8}{'mode':<30}{'pages':>6}{'json bytes':>12}{'wire bytes':>12}{'server ms':>11}")
+        for label, headers in clients.items():
+            r = results[label]
+            delta_pages, delta_wire, _ = sync_round(client, headers, r["cursor"])
+            delta_ms = median_ms(lambda: sync_round(client, headers, r["cursor"]))
+            delta_rows = sum(len(t["values"][0]) if t["values"] else 0
+                             for p in delta_pages for t in p["tables"].values())
+            delta_json = sum(len(orjson.dumps(p)) for p in delta_pages)
+
+            apply(r["replica"], delta_pages)
+            consistent = dump(r["replica"]) == dump(apply({}, sync_round(client, headers)[0]))
+            ok = ok and consistent
+
+            reload_json, reload_wire = r["reload"]
+            full_pages, full_json, full_wire, full_ms = r["full_sync"]
+            print(f"{label:<8}{'full reload (list endpoints)':<30}{len(FULL_PATHS):>6}{reload_json:>12,}"
+                  f"{reload_wire:>12,}{r['reload_ms']:>11.1f}")
+            print(f"{'':<8}{'full sync (with inventory)':<30}{full_pages:>6}{full_json:>12,}{full_wire:>12,}{full_ms:>11.1f}")
+            print(f"{'':<8}{f'delta sync ({delta_rows} rows)':<30}{len(delta_pages):>6}{delta_json:>12,}"
+                  f"{delta_wire:>12,}{delta_ms:>11.1f}")
+            print(f"{'':<8}delta vs full reload: {reload_wire / delta_wire:,.0f}x fewer bytes, "
+                  f"{r['reload_ms'] / delta_ms:.1f}x less server time; "
+                  f"replica after delta == fresh full sync: {consistent}")
+
+        in_order = out_of_order_check(client, clients["PHC"])
+        print(f"out-of-order commit delivered in the next round: {in_order}")
+        ok = ok and in_order
+        print("PASS" if ok else "FAIL")
+    finally:
+        cleanup(db)
+        db.close()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Benchmark: Idempotency-Key handling on POST /inventory/restock-requests.
+
+Seeds one throwaway facility into the database named by DATABASE_URL, then:
+- times the POST without a key, with a new key (claim, run, store), and
+  retried with a used key (replay);
+- checks that every retry returned the first response byte-for-byte, that
+  each key created exactly one request, and that a key reused with another
+  body gets 422;
+- fires CONCURRENT copies of one request at once, ROUNDS times. Each round
+  must create one request, with every copy getting the same body;
+- inserts SWEEP_ROWS expired keys and times the sweeper deleting them.
+Everything it created is deleted afterwards.
+
+    DATABASE_URL=postgresql://localhost/medisense_bench python benchmarks/idempotency.py
+"""
+import os
+import statistics
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+if "DATABASE_URL" not in os.environ:
+    sys.exit("Set DATABASE_URL to a migrated scratch database before running benchmarks.")
+os.environ["SCHEDULER_ENABLED"] = "0"
+
+from sqlalchemy import text
+
+from database import SessionLocal
+from jwt_handler import create_access_token
+from registry import registry
+import idempotency
+import metrics
+import versions
+
+LGA_ID = "bench-lga-idempotency"
+PHC_ID = f"{LGA_ID}-phc"
+REQUESTS = 200
+RETRIES = 5
+CONCURRENT = 8
+ROUNDS = 20
+SWEEP_ROWS = 200_000
+PATH = "/inventory/restock-requests"
+
+
+def seed(db):
+    db.execute(text("INSERT INTO facilities (phc_id, name, lga_id) VALUES (:phc, 'Bench PHC', :lga)"),
+               {"phc": PHC_ID, "lga": LGA_ID})
+    versions.bump(db, "facilities")
+    db.commit()
+    registry.invalidate()
+
+
+def cleanup(db, since=None):
+    for table in ("restock_requests", "phc_monthly_stats", "facilities", "sync_tombstones"):
+        db.execute(text(f"DELETE FROM {table} WHERE lga_id = :lga"), {"lga": LGA_ID})
+    db.execute(text("DELETE FROM scope_versions WHERE scope LIKE :like"), {"like": f"%{LGA_ID}%"})
+    if since is not None:
+        db.execute(text("DELETE FROM idempotency_keys WHERE created_at >= :since"), {"since": since})
+    versions.bump(db, "facilities")
+    db.commit()
+    registry.invalidate()
+
+
+def requests_created(db) -> int:
+    count = db.execute(text("SELECT count(*) FROM restock_requests WHERE lga_id = :lga"), {"lga": LGA_ID}).scalar()
+    db.rollback()
+    return count
+
+
+def outcome(name: str) -> float:
+    return metrics.IDEMPOTENT_REQUESTS.labels(name)._value.get()
+
+
+def timed(call):
+    start = time.perf_counter()
+    response = call()
+    return response, time.perf_counter() - start
+
+
+def main():
+    db = SessionLocal()
+    cleanup(db)
+    since = db.execute(text("SELECT now()")).scalar()
+    db.rollback()
+    seed(db)
+    ok = True
+    try:
+        from fastapi.testclient import TestClient
+        from main import app
+        headers = {"Authorization": "Bearer " + create_access_token(
+            {"user_id": 1, "role": "phc", "operator_name": "bench", "name": "Bench PHC", "phc_id": PHC_ID,
+             "lga_id": LGA_ID})}
+        body = {"item_name": "Bench item", "quantity_needed": 10}
+
+        # One portal for the whole run, so concurrent calls share an event loop as under uvicorn
+        with TestClient(app) as client:
+            plain, fresh, replay = [], [], []
+            for _ in range(REQUESTS):
+                response, elapsed = timed(lambda: client.post(PATH, headers=headers, json=body))
+                assert response.status_code == 201, response.text
+                plain.append(elapsed)
+            before = requests_created(db)
+            identical = True
+            for _ in range(REQUESTS // RETRIES):
+                keyed = {**headers, "Idempotency-Key": str(uuid.uuid4())}
+                first, elapsed = timed(lambda: client.post(PATH, headers=keyed, json=body))
+                assert first.status_code == 201, first.text
+                fresh.append(elapsed)
+                for _ in range(RETRIES):
+                    again, elapsed = timed(lambda: client.post(PATH, headers=keyed, json=body))
+                    replay.append(elapsed)
+                    identical &= (again.status_code == first.status_code and again.content == first.content
+                                  and again.headers.get("idempotent-replayed") == "true")
+            created = requests_created(db) - before
+            mismatch = client.post(PATH, headers=keyed, json={**body, "quantity_needed": 11})
+
+            print(f"POST {PATH}, {REQUESTS} requests each")
+            print(f"  no key                        median {statistics.median(plain) * 1000:6.2f} ms")
+            print(f"  new key (claim, run, store)   median {statistics.median(fresh) * 1000:6.2f} ms")
+            print(f"  retry (replay)                median {statistics.median(replay) * 1000:6.2f} ms")
+            print(f"  {REQUESTS // RETRIES} keys x {RETRIES + 1} sends created {created} requests, "
+                  f"replays identical {identical}, reused key with another body -> {mismatch.status_code}")
+            ok &= identical and created == REQUESTS // RETRIES and mismatch.status_code == 422
+
+            # Concurrent duplicates: one runs, the others wait for it and replay
+            waited_before, replayed_before = outcome("waited"), outcome("replayed")
+            before = requests_created(db)
+            consistent = True
+            start = time.perf_counter()
+            for _ in range(ROUNDS):
+                keyed = {**headers, "Idempotency-Key": str(uuid.uuid4())}
+                barrier = threading.Barrier(CONCURRENT)
+                responses = [None] * CONCURRENT
+
+                def send(n):
+                    barrier.wait()
+                    responses[n] = client.post(PATH, headers=keyed, json=body)
+
+                threads = [threading.Thread(target=send, args=(n,)) for n in range(CONCURRENT)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                consistent &= all(r.status_code == 201 and r.content == responses[0].content for r in responses)
+            elapsed = time.perf_counter() - start
+            created = requests_created(db) - before
+            waited = outcome("waited") - waited_before
+            replayed = outcome("replayed") - replayed_before
+            print(f"Concurrent: {ROUNDS} rounds x {CONCURRENT} copies in {elapsed:.2f} s created {created} "
+                  f"requests; {waited:.0f} copies waited for the first, {replayed:.0f} replayed a finished one; "
+                  f"same body everywhere {consistent}")
+            ok &= created == ROUNDS and consistent
+
+        # Bulk expiry
+        db.execute(text("""
+            INSERT INTO idempotency_keys (key, fingerprint, status_code, headers, body, created_at, expires_at)
+            SELECT decode(md5('bench-sweep-' || n), 'hex'), decode(md5('fp'), 'hex'), 201,
+                   convert_to('content-type:application/json', 'UTF8'),
+                   convert_to(repeat('{"id": 1}', 40), 'UTF8'), now(), now() - interval '1 second'
+            FROM generate_series(1, :rows) n
+        """), {"rows": SWEEP_ROWS})
+        db.commit()
+        start = time.perf_counter()
+        swept = idempotency.sweep(db)
+        elapsed = time.perf_counter() - start
+        print(f"Sweep: {swept:,} expired keys in {elapsed:.2f} s ({swept / elapsed:,.0f} rows/s, "
+              f"chunks of {idempotency.SWEEP_CHUNK:,})")
+        ok &= swept >= SWEEP_ROWS
+        print("PASS" if ok else "FAIL")
+    finally:
+        cleanup(db, since)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Benchmark: the Postgres job queue (jobs.py).
+
+Runs against the database named by DATABASE_URL:
+- enqueues JOBS jobs whose handler inserts a row into a scratch table in
+  the job's transaction, runs WORKERS worker threads, and reports jobs/s.
+  Every job must have written exactly one row;
+- a job that fails twice must succeed on its third attempt, after backoff;
+  one that always fails must end "dead" after max_attempts;
+- SLOW_JOBS jobs of a type limited to concurrency=2 run on WORKERS threads.
+  No more than 2 may run at once;
+- seeds one throwaway facility with an approved restock request and times
+  POST .../receive (which now only enqueues) and the time until the job
+  has added the stock.
+Everything it created is deleted afterwards.
+
+    DATABASE_URL=postgresql://localhost/medisense_bench python benchmarks/jobs.py
+"""
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+if "DATABASE_URL" not in os.environ:
+    sys.exit("Set DATABASE_URL to a migrated scratch database before running benchmarks.")
+os.environ["SCHEDULER_ENABLED"] = "0"
+os.environ["JOB_WORKERS"] = "0"
+
+from sqlalchemy import text
+
+from database import SessionLocal
+from jwt_handler import create_access_token
+from registry import registry
+import jobs
+import versions
+
+LGA_ID = "bench-lga-jobs"
+PHC_ID = f"{LGA_ID}-phc"
+JOBS = 5000
+WORKERS = 4
+SLOW_JOBS = 12
+SLOW_SECONDS = 0.05
+RECEIPTS = 50
+
+_running = 0
+_peak = 0
+_lock = threading.Lock()
+_attempts = {}
+
+
+@jobs.handler("bench.write")
+def _write(db, payload):
+    db.execute(text("INSERT INTO bench_job_runs (id) VALUES (:id)"), {"id": payload["n"]})
+
+
+@jobs.handler("bench.flaky", max_attempts=5)
+def _flaky(db, payload):
+    _attempts[payload["n"]] = _attempts.get(payload["n"], 0) + 1
+    if _attempts[payload["n"]] < 3:
+        raise RuntimeError("transient failure")
+
+
+@jobs.handler("bench.broken", max_attempts=3)
+def _broken(db, payload):
+    raise RuntimeError("always fails")
+
+
+@jobs.handler("bench.slow", concurrency=2)
+def _slow(db, payload):
+    global _running, _peak
+    with _lock:
+        _running += 1
+        _peak = max(_peak, _running)
+    time.sleep(SLOW_SECONDS)
+    with _lock:
+        _running -= 1
+
+
+def seed(db):
+    db.execute(text("CREATE TABLE IF NOT EXISTS bench_job_runs (id integer NOT NULL)"))
+    db.execute(text("INSERT INTO facilities (phc_id, name, lga_id) VALUES (:phc, 'Bench PHC', :lga)"),
+               {"phc": PHC_ID, "lga": LGA_ID})
+    db.execute(text("""
+        INSERT INTO inventory (phc_id, phc_name, item_name, current_stock, daily_consumption_rate, unit, item_type)
+        VALUES (:phc, 'Bench PHC', 'Bench item', 0, 1, 'units', 'drug')
+    """), {"phc": PHC_ID})
+    versions.bump(db, "facilities")
+    db.commit()
+    registry.invalidate()
+
+
+def cleanup(db):
+    db.execute(text("DROP TABLE IF EXISTS bench_job_runs"))
+    db.execute(text("DELETE FROM jobs WHERE kind LIKE 'bench.%' OR payload->>'lga_id' = :lga"), {"lga": LGA_ID})
+    db.execute(text("DELETE FROM inventory WHERE phc_id = :phc"), {"phc": PHC_ID})
+    for table in ("restock_requests", "phc_monthly_stats", "facilities", "sync_tombstones"):
+        db.execute(text(f"DELETE FROM {table} WHERE lga_id = :lga"), {"lga": LGA_ID})
+    db.execute(text("DELETE FROM scope_versions WHERE scope LIKE :like"), {"like": f"%{LGA_ID}%"})
+    versions.bump(db, "facilities")
+    db.commit()
+    registry.invalidate()
+
+
+def wait_for(condition, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def scalar(db, sql, **params):
+    value = db.execute(text(sql), params).scalar()
+    db.rollback()
+    return value
+
+
+def main():
+    db = SessionLocal()
+    cleanup(db)
+    seed(db)
+    pool = jobs.WorkerPool(workers=WORKERS, poll_seconds=0.05)
+    ok = True
+    try:
+        # Throughput, exactly once
+        start = time.perf_counter()
+        for n in range(JOBS):
+            jobs.enqueue(db, "bench.write", {"n": n})
+        db.commit()
+        enqueued = time.perf_counter() - start
+        start = time.perf_counter()
+        pool.start()
+        done = wait_for(lambda: scalar(db, "SELECT count(*) FROM jobs WHERE kind = 'bench.write'") == 0, 300)
+        elapsed = time.perf_counter() - start
+        rows, distinct = db.execute(text("SELECT count(*), count(DISTINCT id) FROM bench_job_runs")).one()
+        db.rollback()
+        print(f"{JOBS:,} jobs: enqueue {enqueued:.2f} s in one transaction; {WORKERS} workers ran them in "
+              f"{elapsed:.2f} s ({JOBS / elapsed:,.0f} jobs/s); {rows:,} rows written, {distinct:,} distinct")
+        ok &= done and rows == distinct == JOBS
+
+        # Retries with backoff, and giving up
+        jobs.BACKOFF_BASE = 0.05
+        jobs.enqueue(db, "bench.flaky", {"n": 1})
+        jobs.enqueue(db, "bench.broken", {"n": 2})
+        db.commit()
+        flaky = wait_for(lambda: scalar(db, "SELECT count(*) FROM jobs WHERE kind = 'bench.flaky'") == 0, 30)
+        dead = wait_for(lambda: scalar(db, "SELECT status FROM jobs WHERE kind = 'bench.broken'") == "dead", 30)
+        attempts, error = db.execute(text("SELECT attempts, last_error FROM jobs WHERE kind = 'bench.broken'")).one()
+        db.rollback()
+        print(f"Flaky job done after {_attempts.get(1)} attempts: {flaky}; broken job dead after {attempts} "
+              f"attempts: {dead} ({error})")
+        ok &= flaky and _attempts.get(1) == 3 and dead and attempts == 3
+
+        # Per-type concurrency limit
+        start = time.perf_counter()
+        for n in range(SLOW_JOBS):
+            jobs.enqueue(db, "bench.slow", {"n": n})
+        db.commit()
+        wait_for(lambda: scalar(db, "SELECT count(*) FROM jobs WHERE kind = 'bench.slow'") == 0, 60)
+        elapsed = time.perf_counter() - start
+        print(f"{SLOW_JOBS} jobs limited to concurrency=2 on {WORKERS} workers: at most {_peak} at once, "
+              f"{elapsed:.2f} s (serial would be {SLOW_JOBS * SLOW_SECONDS:.2f} s)")
+        ok &= _peak == 2
+
+        # POST .../receive: respond, then the job adds the stock
+        from fastapi.testclient import TestClient
+        from main import app
+        client = TestClient(app)
+        headers = {"Authorization": "Bearer " + create_access_token(
+            {"user_id": 1, "role": "phc", "operator_name": "bench", "name": "Bench PHC", "phc_id": PHC_ID,
+             "lga_id": LGA_ID})}
+        ids = db.execute(text("""
+            INSERT INTO restock_requests (item_name, quantity_needed, phc_id, phc_name, lga_id, requested_by,
+                                          request_date, status)
+            SELECT 'Bench item', 10, :phc, 'Bench PHC', :lga, 'bench', now(), 'approved'
+            FROM generate_series(1, :n)
+            RETURNING id
+        """), {"phc": PHC_ID, "lga": LGA_ID, "n": RECEIPTS}).scalars().all()
+        db.commit()
+        responded, applied = [], []
+        for n, request_id in enumerate(ids, 1):
+            start = time.perf_counter()
+            response = client.post(f"/inventory/restock-requests/{request_id}/receive", headers=headers)
+            responded.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.text
+            wait_for(lambda: scalar(db, "SELECT current_stock FROM inventory WHERE phc_id = :p",
+                                    p=PHC_ID) == 10 * n, 10)
+            applied.append(time.perf_counter() - start)
+        again = client.post(f"/inventory/restock-requests/{ids[0]}/receive", headers=headers)
+        stock = scalar(db, "SELECT current_stock FROM inventory WHERE phc_id = :p", p=PHC_ID)
+        print(f"POST .../receive x {RECEIPTS}: response median {statistics.median(responded) * 1000:.1f} ms, "
+              f"stock added median {statistics.median(applied) * 1000:.1f} ms after the request; "
+              f"stock {stock} (expected {10 * RECEIPTS}), second receipt -> {again.status_code}")
+        ok &= stock == 10 * RECEIPTS and again.status_code == 400
+        print("PASS" if ok else "FAIL")
+    finally:
+        pool.stop()
+        cleanup(db)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
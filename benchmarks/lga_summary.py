@@ -0,0 +1,112 @@
+"""
+Benchmark: LGA consolidated report with 300 facilities.
+
+Seeds one throwaway LGA (300 PHC accounts, their phc_monthly_stats rows,
+40 inventory items each and a monthly report) into the database named by
+DATABASE_URL, times rollups.lga_summary cold and GET /reports/lga-summary
+warm from the cache, then deletes everything it created.
+
+    DATABASE_URL=postgresql://localhost/medisense_bench python benchmarks/lga_summary.py
+"""
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+if "DATABASE_URL" not in os.environ:
+    sys.exit("Set DATABASE_URL to a scratch database before running benchmarks.")
+
+from sqlalchemy import text
+
+from database import SessionLocal, Base, engine
+from models import Facility, Inventory, MonthlyReport, PhcMonthlyStats
+from jwt_handler import create_access_token
+import rollups
+
+LGA_ID = "bench-lga-summary"
+MONTH = "2025-10"
+FACILITIES = 300
+ITEMS_PER_FACILITY = 40
+RUNS = 50
+
+
+def seed(db):
+    rng = random.Random(42)
+    for n in range(FACILITIES):
+        phc_id = f"{LGA_ID}-phc-{n:03d}"
+        db.add(Facility(phc_id=phc_id, name=f"Bench PHC {n}", lga_id=LGA_ID))
+        db.add(PhcMonthlyStats(
+            phc_id=phc_id, lga_id=LGA_ID, month=MONTH,
+            restock_requests=rng.randint(0, 30), restock_pending=rng.randint(0, 10),
+            restock_approved=rng.randint(0, 10), restock_declined=rng.randint(0, 3),
+            restock_cancelled=0, restock_delivered=rng.randint(0, 10),
+            issues_logged=rng.randint(0, 8), issues_open=rng.randint(0, 4),
+            issues_open_high=rng.randint(0, 2), workload_days=rng.randint(15, 31),
+            patients_seen=rng.randint(300, 2500), overload_days=rng.randint(0, 10),
+        ))
+        db.add_all([
+            Inventory(phc_id=phc_id, phc_name=f"Bench PHC {n}", item_name=f"Item {i}",
+                      current_stock=rng.choice([0, 5, 40, 200]), daily_consumption_rate=rng.uniform(0.5, 10))
+            for i in range(ITEMS_PER_FACILITY)
+        ])
+        db.add(MonthlyReport(phc_id=phc_id, lga_id=LGA_ID, phc_name=f"Bench PHC {n}", month=MONTH,
+                             content="...", status=rng.choice(["Draft", "Submitted"])))
+    db.commit()
+    # Production tables have planner statistics; a freshly seeded one does not
+    db.execute(text("ANALYZE"))
+    db.commit()
+
+
+def cleanup(db):
+    like = f"{LGA_ID}-phc-%"
+    db.query(Inventory).filter(Inventory.phc_id.like(like)).delete(synchronize_session=False)
+    db.query(MonthlyReport).filter(MonthlyReport.lga_id == LGA_ID).delete(synchronize_session=False)
+    db.query(PhcMonthlyStats).filter(PhcMonthlyStats.lga_id == LGA_ID).delete(synchronize_session=False)
+    db.query(Facility).filter(Facility.lga_id == LGA_ID).delete(synchronize_session=False)
+    db.commit()
+
+
+def report(label, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{label:<40} median {statistics.median(samples) * 1000:8.2f} ms   p95 {p95 * 1000:8.2f} ms")
+
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    cleanup(db)
+    seed(db)
+    try:
+        cold = []
+        for _ in range(RUNS):
+            start = time.perf_counter()
+            summary = rollups.lga_summary(db, LGA_ID, MONTH)
+            cold.append(time.perf_counter() - start)
+        assert summary["facility_count"] == FACILITIES
+
+        from fastapi.testclient import TestClient
+        from main import app
+        client = TestClient(app)
+        headers = {"Authorization": "Bearer " + create_access_token(
+            {"user_id": 1, "role": "lga", "operator_name": "bench", "name": "Bench LGA", "phc_id": None, "lga_id": LGA_ID})}
+        warm = []
+        for _ in range(RUNS):
+            start = time.perf_counter()
+            response = client.get("/reports/lga-summary", params={"month_str": MONTH}, headers=headers)
+            warm.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.text
+
+        print(f"LGA summary, {FACILITIES} facilities x {ITEMS_PER_FACILITY} items, {RUNS} runs")
+        report("rollups.lga_summary (one query, uncached)", cold)
+        report("GET /reports/lga-summary (cached)", warm)
+    finally:
+        cleanup(db)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
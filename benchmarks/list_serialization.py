@@ -0,0 +1,132 @@
+"""
+Benchmark: cost per 1k rows of the large list endpoints, before and after
+listing.RowList.
+
+Seeds one throwaway LGA with 5000 restock requests, issues and submitted
+monthly reports. For each list it times, per 1000 rows:
+
+    before  ORM entities -> one Pydantic model per row (from_attributes)
+            -> stdlib json, i.e. what response_model + JSONResponse did
+    after   column tuples -> bulk TypedDict validation -> orjson
+
+split into fetch (query + row construction) and serialize, checks both
+produce the same JSON, and times the full endpoint through the app.
+Everything it created is deleted afterwards.
+
+    DATABASE_URL=postgresql://localhost/medisense_bench python benchmarks/list_serialization.py
+"""
+import json
+import os
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+if "DATABASE_URL" not in os.environ:
+    sys.exit("Set DATABASE_URL to a scratch database before running benchmarks.")
+
+from fastapi.testclient import TestClient
+from pydantic import TypeAdapter
+from sqlalchemy import text
+
+from database import SessionLocal, Base, engine
+from models import Issue, MonthlyReport, RestockRequest
+from jwt_handler import create_access_token
+from routers.inventory import restock_rows
+from routers.reports import issue_rows, report_rows
+from schemas import IssueRead, ReportRead, RestockRequestRead
+
+LGA_ID = "bench-lga-lists"
+ROWS = 5000
+REPEAT = 5
+
+LISTS = [
+    # name, path, ORM model, schema, RowList, filter, order
+    ("restock requests", "/inventory/restock-requests", RestockRequest, RestockRequestRead, restock_rows,
+     RestockRequest.lga_id == LGA_ID, RestockRequest.request_date.desc()),
+    ("issues", "/reports/issues", Issue, IssueRead, issue_rows,
+     Issue.lga_id == LGA_ID, Issue.created_at.desc()),
+    ("reports", "/reports/", MonthlyReport, ReportRead, report_rows,
+     (MonthlyReport.lga_id == LGA_ID) & (MonthlyReport.status == "Submitted"), MonthlyReport.created_at.desc()),
+]
+
+
+def seed(db):
+    phcs = [f"{LGA_ID}-phc-{n:03d}" for n in range(ROWS // 50)]
+    db.add_all(RestockRequest(item_name=f"Item {i}", quantity_needed=10 + i % 90, phc_id=phcs[i % len(phcs)],
+                              phc_name="Bench PHC", lga_id=LGA_ID, requested_by="bench", status="pending",
+                              comments=None if i % 3 else "Needed before the outreach week")
+               for i in range(ROWS))
+    db.add_all(Issue(phc_id=phcs[i % len(phcs)], lga_id=LGA_ID, phc_name="Bench PHC", category="Power",
+                     priority="Medium", description="Generator down since Tuesday; vaccines moved to the LGA store")
+               for i in range(ROWS))
+    db.add_all(MonthlyReport(phc_id=phcs[i % len(phcs)], lga_id=LGA_ID, phc_name="Bench PHC",
+                             month=f"{2000 + i // (12 * len(phcs))}-{i // len(phcs) % 12 + 1:02d}",
+                             content="Monthly summary. " * 40, status="Submitted")
+               for i in range(ROWS))
+    db.commit()
+    db.execute(text("ANALYZE"))
+
+
+def cleanup(db):
+    for model in (RestockRequest, Issue, MonthlyReport):
+        db.query(model).filter(model.lga_id == LGA_ID).delete(synchronize_session=False)
+    db.commit()
+
+
+def best(fn):
+    """Best of REPEAT runs, in ms per 1000 rows, and the last result."""
+    times = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - started)
+    return min(times) * 1000 / (ROWS / 1000), result
+
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    cleanup(db)
+    seed(db)
+    client = TestClient(__import__("main").app)
+    headers = {"Authorization": "Bearer " + create_access_token({
+        "user_id": 1, "role": "lga", "operator_name": "bench", "name": "Bench", "phc_id": None, "lga_id": LGA_ID,
+    })}
+    ok = True
+    try:
+        print(f"{ROWS} rows per list, ms per 1000 rows (best of {REPEAT})")
+        print(f"  {'':18}{'fetch':>16}{'serialize':>18}{'total':>18}{'endpoint':>10}")
+        for name, path, model, schema, rows, where, order in LISTS:
+            adapter = TypeAdapter(List[schema])
+
+            def fetch_before():
+                db.expunge_all()
+                return db.query(model).filter(where).order_by(order).all()
+
+            def fetch_after():
+                return rows.query(db).filter(where).order_by(order).all()
+
+            fetch_old, entities = best(fetch_before)
+            fetch_new, tuples = best(fetch_after)
+            serialize_old, body_old = best(lambda: json.dumps(
+                adapter.dump_python(adapter.validate_python(entities, from_attributes=True), mode="json"),
+                ensure_ascii=False, separators=(",", ":"),
+            ).encode())
+            serialize_new, body_new = best(lambda: rows.response(tuples).body)
+            endpoint, response = best(lambda: client.get(path, headers=headers))
+
+            same = json.loads(body_old) == json.loads(body_new) == response.json() and len(response.json()) == ROWS
+            ok = ok and same and response.status_code == 200 and "etag" in response.headers
+            print(f"  {name:18}{fetch_old:7.2f} -> {fetch_new:5.2f}{serialize_old:9.2f} -> {serialize_new:5.2f}"
+                  f"{fetch_old + serialize_old:9.2f} -> {fetch_new + serialize_new:5.2f}{endpoint:10.2f}"
+                  f"{'' if same else '  BODY MISMATCH'}")
+        print("PASS" if ok else "FAIL")
+    finally:
+        cleanup(db)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
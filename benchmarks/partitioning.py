@@ -0,0 +1,277 @@
+"""
+Benchmark: restock_requests, issues and monthly_reports with 500 LGAs, as
+single heaps (before migration 0004) and list-partitioned by lga_id (after).
+
+Builds both layouts side by side in two throwaway schemas, bench_heap and
+bench_part, in the database named by DATABASE_URL. The database must be
+migrated to 0004, which provides attach_lga_partition. Each layout holds the
+same rows: 500 LGAs x 10 PHCs, each PHC with RESTOCK restock requests,
+ISSUES issues and a year of monthly reports. bench_heap has the 0003
+indexes; bench_part has the indexes of the partitioned parents, and its
+partitions are attached the way partitions.py does it.
+
+For each query the app runs, it runs EXPLAIN (ANALYZE, BUFFERS) on both
+layouts and reports:
+- the partitions scanned;
+- the shared buffers touched;
+- the size of the indexes and tables the plan reads;
+- median planning and execution time.
+It also reports whole-index sizes and the cost of a single-row insert. Both
+schemas are dropped afterwards.
+
+    DATABASE_URL=postgresql://localhost/medisense_bench python benchmarks/partitioning.py
+"""
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+if "DATABASE_URL" not in os.environ:
+    sys.exit("Set DATABASE_URL to a migrated scratch database before running benchmarks.")
+
+from sqlalchemy import text
+
+from database import engine
+
+LGAS = 500
+PHCS = 10                  # per LGA
+RESTOCK = 80               # per PHC
+ISSUES = 20
+REPORTS = 12
+RUNS = 15
+INSERTS = 2000
+LAYOUTS = ("bench_heap", "bench_part")
+
+LGA = "bench-lga-250"
+PHC = "bench-lga-250-phc-03"
+
+# The 0003 indexes, as on the unpartitioned tables
+HEAP_INDEXES = {
+    "restock_requests": [
+        "PRIMARY KEY (id)",
+        "INDEX (id)", "INDEX (phc_id)", "INDEX (lga_id)",
+        "INDEX (phc_id, change_xid)", "INDEX (lga_id, change_xid)",
+    ],
+    "issues": [
+        "PRIMARY KEY (id)",
+        "INDEX (id)", "INDEX (phc_id)", "INDEX (lga_id)",
+        "INDEX (phc_id, change_xid)", "INDEX (lga_id, change_xid)",
+        "UNIQUE INDEX (phc_id) WHERE category = 'Staffing Shortage' AND status IN ('Open', 'In Progress')",
+    ],
+    "monthly_reports": [
+        "PRIMARY KEY (id)",
+        "INDEX (id)", "INDEX (phc_id)", "INDEX (lga_id)",
+        "INDEX (phc_id, change_xid)", "INDEX (lga_id, change_xid)",
+        "UNIQUE (phc_id, month)",
+    ],
+}
+
+QUERIES = [
+    ("PHC restock list", "restock_requests",
+     f"SELECT * FROM restock_requests WHERE lga_id = '{LGA}' AND phc_id = '{PHC}' ORDER BY request_date DESC"),
+    ("LGA pending restock", "restock_requests",
+     f"SELECT * FROM restock_requests WHERE lga_id = '{LGA}' AND status = 'pending' ORDER BY request_date DESC"),
+    ("LGA approves by id", "restock_requests",
+     f"SELECT * FROM restock_requests WHERE lga_id = '{LGA}' AND id = {{restock_id}}"),
+    ("LGA delta sync page", "restock_requests",
+     f"SELECT * FROM restock_requests WHERE lga_id = '{LGA}' AND change_xid >= {{since}} "
+     f"ORDER BY change_xid, id LIMIT 501"),
+    ("LGA issues list", "issues",
+     f"SELECT * FROM issues WHERE lga_id = '{LGA}' ORDER BY created_at DESC"),
+    ("PHC reports list", "monthly_reports",
+     f"SELECT * FROM monthly_reports WHERE lga_id = '{LGA}' AND phc_id = '{PHC}' ORDER BY month DESC"),
+    ("LGA submitted reports", "monthly_reports",
+     f"SELECT * FROM monthly_reports WHERE lga_id = '{LGA}' AND status = 'Submitted' ORDER BY created_at DESC"),
+    ("report by id, no lga_id", "monthly_reports",
+     "SELECT * FROM monthly_reports WHERE id = {report_id}"),
+]
+
+
+def lga(n):
+    return f"bench-lga-{n:03d}"
+
+
+# ---------------- SETUP ----------------
+def drop(conn):
+    # Partition by partition: one DROP SCHEMA would need a lock on every partition and index at once
+    partitions = conn.execute(text("""
+        SELECT n.nspname || '.' || c.relname FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname IN ('bench_heap', 'bench_part') AND c.relispartition AND c.relkind = 'r'
+    """)).scalars().all()
+    for name in partitions:
+        conn.execute(text(f"DROP TABLE {name}"))
+    for schema in LAYOUTS:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+
+
+def build(conn):
+    for schema in LAYOUTS:
+        conn.execute(text(f"CREATE SCHEMA {schema}"))
+
+    for table, indexes in HEAP_INDEXES.items():
+        conn.execute(text(f"CREATE TABLE bench_heap.{table} (LIKE public.{table})"))
+        for n, index in enumerate(indexes):
+            if index.startswith(("PRIMARY", "UNIQUE (")):
+                conn.execute(text(f"ALTER TABLE bench_heap.{table} ADD {index}"))
+            else:
+                kind, rest = index.split(" (", 1)
+                conn.execute(text(f"CREATE {kind} {table}_{n} ON bench_heap.{table} ({rest}"))
+
+        # The partitioned parent gets the same indexes as public's
+        conn.execute(text(f"CREATE TABLE bench_part.{table} (LIKE public.{table}) PARTITION BY LIST (lga_id)"))
+        for (indexdef,) in conn.execute(text(
+                "SELECT indexdef FROM pg_indexes WHERE schemaname = 'public' AND tablename = :t"), {"t": table}):
+            conn.execute(text(indexdef.replace(f" ON ONLY public.{table} ", f" ON bench_part.{table} ")))
+        conn.execute(text(f"CREATE TABLE bench_part.{table}_default PARTITION OF bench_part.{table} DEFAULT"))
+        for n in range(LGAS):
+            conn.execute(text("SELECT attach_lga_partition(CAST(:t AS regclass), :lga)"),
+                         {"t": f"bench_part.{table}", "lga": lga(n)})
+
+    # change_xid spread over a range as if written by many transactions
+    conn.execute(text(f"""
+        INSERT INTO bench_heap.restock_requests
+            (id, item_name, quantity_needed, phc_id, phc_name, lga_id, requested_by, request_date, status, change_xid)
+        SELECT g, 'Item ' || (g % 150), 1 + g % 500,
+               format('bench-lga-%s-phc-%s', lpad((g / {PHCS * RESTOCK} % {LGAS})::text, 3, '0'),
+                      lpad((g / {RESTOCK} % {PHCS})::text, 2, '0')),
+               'Bench PHC', format('bench-lga-%s', lpad((g / {PHCS * RESTOCK} % {LGAS})::text, 3, '0')),
+               'Nurse', now() - (g % 365) * interval '1 day',
+               (ARRAY['pending', 'approved', 'declined', 'delivered'])[1 + g % 4], (g::bigint * 7919) % 1000000
+        FROM generate_series(0, {LGAS * PHCS * RESTOCK - 1}) g
+    """))
+    conn.execute(text(f"""
+        INSERT INTO bench_heap.issues
+            (id, phc_id, lga_id, phc_name, category, priority, description, status, created_at, change_xid)
+        SELECT g,
+               format('bench-lga-%s-phc-%s', lpad((g / {PHCS * ISSUES} % {LGAS})::text, 3, '0'),
+                      lpad((g / {ISSUES} % {PHCS})::text, 2, '0')),
+               format('bench-lga-%s', lpad((g / {PHCS * ISSUES} % {LGAS})::text, 3, '0')), 'Bench PHC',
+               (ARRAY['Equipment', 'Power', 'Water', 'Drugs'])[1 + g % 4], 'Medium', 'Generator needs fuel',
+               (ARRAY['Open', 'In Progress', 'Resolved'])[1 + g % 3], now() - (g % 365) * interval '1 day',
+               (g::bigint * 7919) % 1000000
+        FROM generate_series(0, {LGAS * PHCS * ISSUES - 1}) g
+    """))
+    conn.execute(text(f"""
+        INSERT INTO bench_heap.monthly_reports (id, phc_id, lga_id, phc_name, month, content, status, created_at,
+                                                change_xid)
+        SELECT g,
+               format('bench-lga-%s-phc-%s', lpad((g / {PHCS * REPORTS} % {LGAS})::text, 3, '0'),
+                      lpad((g / {REPORTS} % {PHCS})::text, 2, '0')),
+               format('bench-lga-%s', lpad((g / {PHCS * REPORTS} % {LGAS})::text, 3, '0')), 'Bench PHC',
+               format('2025-%s', lpad((1 + g % {REPORTS})::text, 2, '0')), repeat('Operational overview. ', 40),
+               (ARRAY['Draft', 'Submitted'])[1 + (g % 3 > 0)::int], now() - (g % 365) * interval '1 day',
+               (g::bigint * 7919) % 1000000
+        FROM generate_series(0, {LGAS * PHCS * REPORTS - 1}) g
+    """))
+    # One LGA per statement, so each holds locks on one partition
+    for table in HEAP_INDEXES:
+        conn.execute(text(f"VACUUM ANALYZE bench_heap.{table}"))
+        for n in range(LGAS):
+            conn.execute(text(f"INSERT INTO bench_part.{table} SELECT * FROM bench_heap.{table} WHERE lga_id = :lga"),
+                         {"lga": lga(n)})
+    for (name,) in conn.execute(text("""
+            SELECT n.nspname || '.' || c.relname FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = 'bench_part' AND c.relispartition AND c.relkind = 'r'""")).all():
+        conn.execute(text(f"VACUUM ANALYZE {name}"))
+
+
+# ---------------- MEASURE ----------------
+def relation_sizes(conn, names) -> int:
+    if not names:
+        return 0
+    return conn.execute(text("SELECT sum(pg_relation_size(CAST(n AS regclass))) FROM unnest(CAST(:n AS text[])) n"),
+                        {"n": sorted(names)}).scalar()
+
+
+def walk(node):
+    yield node
+    for child in node.get("Plans", ()):
+        yield from walk(child)
+
+
+def explain(conn, schema, sql):
+    conn.execute(text(f"SET search_path = {schema}, public"))
+    plans = [conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}")).scalar()[0] for _ in range(RUNS)]
+    plan = plans[-1]
+    nodes = list(walk(plan["Plan"]))
+    tables = {f"{schema}.{n['Relation Name']}" for n in nodes if "Relation Name" in n}
+    indexes = {f"{schema}.{n['Index Name']}" for n in nodes if "Index Name" in n}
+    top = plan["Plan"]
+    return {
+        "partitions": len(tables),
+        "buffers": top.get("Shared Hit Blocks", 0) + top.get("Shared Read Blocks", 0),
+        "index_kb": relation_sizes(conn, indexes) / 1024,
+        "table_kb": relation_sizes(conn, tables) / 1024,
+        "plan_ms": statistics.median(p["Planning Time"] for p in plans),
+        "exec_ms": statistics.median(p["Execution Time"] for p in plans),
+    }
+
+
+def index_sizes(conn, schema, table) -> tuple:
+    """(bytes of all indexes, bytes of the largest single index or partition index)."""
+    return conn.execute(text("""
+        SELECT sum(pg_relation_size(i.indexrelid)), max(pg_relation_size(i.indexrelid))
+        FROM pg_index i JOIN pg_class c ON c.oid = i.indrelid JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = :schema AND (c.relname = :table OR c.relname LIKE :table || '\\_p\\_%'
+                                       OR c.relname = :table || '_default')
+    """), {"schema": schema, "table": table}).one()
+
+
+def insert_us(conn, schema) -> float:
+    conn.execute(text(f"SET search_path = {schema}, public"))
+    start = time.perf_counter()
+    for n in range(INSERTS):
+        conn.execute(text(
+            "INSERT INTO restock_requests (id, item_name, quantity_needed, phc_id, phc_name, lga_id, requested_by, "
+            "status, change_xid) VALUES (:id, 'Item 1', 5, :phc, 'Bench PHC', :lga, 'Nurse', 'pending', 0)"),
+            {"id": 10_000_000 + n, "phc": f"{lga(n % LGAS)}-phc-00", "lga": lga(n % LGAS)})
+    return (time.perf_counter() - start) / INSERTS * 1e6
+
+
+def main():
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        drop(conn)
+        try:
+            start = time.perf_counter()
+            build(conn)
+            print(f"{LGAS} LGAs x {PHCS} PHCs: {LGAS * PHCS * RESTOCK:,} restock requests, "
+                  f"{LGAS * PHCS * ISSUES:,} issues, {LGAS * PHCS * REPORTS:,} monthly reports "
+                  f"(built in {time.perf_counter() - start:.0f} s)")
+            params = {
+                "restock_id": conn.execute(text(
+                    f"SELECT max(id) FROM bench_heap.restock_requests WHERE lga_id = '{LGA}'")).scalar(),
+                "report_id": conn.execute(text(
+                    f"SELECT max(id) FROM bench_heap.monthly_reports WHERE lga_id = '{LGA}'")).scalar(),
+                "since": 995000,
+            }
+
+            print(f"\n{'query':<26}{'layout':<12}{'partitions':>11}{'buffers':>9}{'index KiB':>11}"
+                  f"{'table KiB':>11}{'plan ms':>9}{'exec ms':>9}")
+            for label, table, sql in QUERIES:
+                for schema in LAYOUTS:
+                    r = explain(conn, schema, sql.format(**params))
+                    layout = "heap" if schema == "bench_heap" else "partitioned"
+                    print(f"{label if schema == 'bench_heap' else '':<26}{layout:<12}{r['partitions']:>11}"
+                          f"{r['buffers']:>9,}{r['index_kb']:>11,.0f}{r['table_kb']:>11,.0f}"
+                          f"{r['plan_ms']:>9.2f}{r['exec_ms']:>9.2f}")
+
+            print(f"\n{'table':<20}{'layout':<13}{'all indexes MiB':>16}{'largest index KiB':>19}")
+            for table in HEAP_INDEXES:
+                for schema in LAYOUTS:
+                    total, largest = index_sizes(conn, schema, table)
+                    print(f"{table if schema == 'bench_heap' else '':<20}"
+                          f"{'heap' if schema == 'bench_heap' else 'partitioned':<13}"
+                          f"{total / 1024 / 1024:>16,.1f}{largest / 1024:>19,.0f}")
+
+            print(f"\nsingle-row insert into restock_requests ({INSERTS} rows, autocommit):")
+            for schema in LAYOUTS:
+                print(f"  {'heap' if schema == 'bench_heap' else 'partitioned':<12}{insert_us(conn, schema):8.0f} us")
+            conn.execute(text("RESET search_path"))
+        finally:
+            drop(conn)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Comparison report for the performance suite.
+
+Diffs a load-test result against benchmarks/perf/baseline.json, route by
+route: throughput and p50/p95/p99 with their change. A route whose p95 got
+worse by more than --threshold percent (and by more than --min-ms, so fast
+routes don't flap on noise) or that started returning errors is flagged as
+a regression, and the script exits 1.
+
+    python benchmarks/perf/compare.py                      # newest result vs baseline
+    python benchmarks/perf/compare.py results/20261019T140000.json --threshold 15
+
+Results are only comparable when the dataset, --users, --think and the
+machine match; the script warns when the recorded config differs.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE = os.path.join(HERE, "baseline.json")
+RESULTS_DIR = os.path.join(HERE, "results")
+CONFIG_KEYS = ("users", "think", "workers", "llm_latency_ms", "seed")
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def newest_result() -> str:
+    paths = sorted(glob.glob(os.path.join(RESULTS_DIR, "*.json")))
+    if not paths:
+        sys.exit("No results yet; run loadtest.py first.")
+    return paths[-1]
+
+
+def pct(old: float, new: float) -> str:
+    if not old:
+        return "    new" if new else "     --"
+    return f"{(new - old) / old * 100:+6.1f}%"
+
+
+def config_warnings(base: dict, current: dict) -> list:
+    warnings = []
+    b, c = base.get("meta", {}), current.get("meta", {})
+    for key in CONFIG_KEYS:
+        if b.get("config", {}).get(key) != c.get("config", {}).get(key):
+            warnings.append(f"{key}: {b.get('config', {}).get(key)} -> {c.get('config', {}).get(key)}")
+    if b.get("dataset") != c.get("dataset"):
+        warnings.append("dataset counts differ")
+    if b.get("machine", {}).get("cpus") != c.get("machine", {}).get("cpus"):
+        warnings.append(f"cpus: {b.get('machine', {}).get('cpus')} -> {c.get('machine', {}).get('cpus')}")
+    return warnings
+
+
+def compare(base: dict, current: dict, threshold: float, min_ms: float) -> list:
+    regressions = []
+    print(f"{'route':48}{'rps':>8}{'Δ':>8}{'p50':>9}{'Δ':>8}{'p95':>9}{'Δ':>8}{'p99':>9}{'Δ':>8}  (ms)")
+    rows = list(current["routes"].items()) + [("TOTAL", current["total"])]
+    for name, r in rows:
+        b = base["total"] if name == "TOTAL" else base["routes"].get(name)
+        if b is None:
+            print(f"{name:48}{r['rps']:>8.1f}{'new':>8}{r['p50_ms']:>9.1f}{'':>8}{r['p95_ms']:>9.1f}"
+                  f"{'':>8}{r['p99_ms']:>9.1f}")
+            continue
+        print(f"{name:48}{r['rps']:>8.1f}{pct(b['rps'], r['rps']):>8}"
+              f"{r['p50_ms']:>9.1f}{pct(b['p50_ms'], r['p50_ms']):>8}"
+              f"{r['p95_ms']:>9.1f}{pct(b['p95_ms'], r['p95_ms']):>8}"
+              f"{r['p99_ms']:>9.1f}{pct(b['p99_ms'], r['p99_ms']):>8}")
+
+        slower = r["p95_ms"] - b["p95_ms"]
+        if b["p95_ms"] and slower > min_ms and slower / b["p95_ms"] * 100 > threshold:
+            regressions.append(f"{name}: p95 {b['p95_ms']:.1f} -> {r['p95_ms']:.1f} ms")
+        if r["errors"] and not b["errors"]:
+            regressions.append(f"{name}: {r['errors']} errors (baseline had none)")
+
+    for name in base["routes"]:
+        if name not in current["routes"]:
+            print(f"{name:48}{'missing from this run':>30}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare a load-test result with the stored baseline.")
+    parser.add_argument("result", nargs="?", help="result file (default: newest in results/)")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--threshold", type=float, default=10, help="p95 regression threshold, percent")
+    parser.add_argument("--min-ms", type=float, default=5, help="ignore p95 changes smaller than this")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.baseline):
+        sys.exit("No baseline; run loadtest.py --save-baseline first.")
+    base, path = load(args.baseline), args.result or newest_result()
+    current = load(path)
+    print(f"baseline {base['meta'].get('commit') or '?'} ({base['meta']['started_at']})  vs  "
+          f"{os.path.basename(path)} {current['meta'].get('commit') or '?'} ({current['meta']['started_at']})\n")
+
+    for warning in config_warnings(base, current):
+        print(f"Warning: runs are not like for like ({warning})")
+    regressions = compare(base, current, args.threshold, args.min_ms)
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:g}% p95:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("\nNo regressions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+"""
+Synthetic dataset for the performance suite.
+
+Populates the database named by DATABASE_URL with N LGAs x M PHCs x K
+inventory items, plus `--years` of restock requests, issues, daily workload
+and monthly reports, and a pool of patients. The data is skewed the way the
+real deployment is:
+
+- facility activity is log-normal, so a few busy PHCs produce most of the
+  traffic;
+- item demand is Zipf-like;
+- workload has a weekday profile, a rainy-season (malaria) peak, a slow
+  upward trend and noise;
+- older restock requests and issues are closed, recent ones still open.
+
+Every generated row is tagged with the "perf-" prefix (PHC and LGA ids, user
+e-mails @perf.example.org, patient names "Perf ..."), so --reset removes exactly
+what a previous run created. Rows are written with COPY; the monthly
+rollups, registry version and forecasts are rebuilt afterwards. The same
+--seed always gives the same dataset. The schema is brought to the newest
+migration first (`alembic upgrade head`).
+
+    DATABASE_URL=postgresql://localhost/medisense_perf python benchmarks/perf/generate.py --reset
+    DATABASE_URL=... python benchmarks/perf/generate.py --lgas 10 --phcs 50 --items 40 --years 3
+"""
+import argparse
+import io
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+
+ROOT = os.path.join(os.path.dirname(__file__), "..", "..")
+sys.path.insert(0, ROOT)
+
+if "DATABASE_URL" not in os.environ:
+    sys.exit("Set DATABASE_URL to a scratch database before running the perf suite.")
+
+import numpy as np
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import text
+
+from database import SessionLocal, engine
+from models import (DailyWorkload, Facility, Inventory, Issue, MonthlyReport, Patient, PhcMonthlyStats,
+    QueueRollup, QueueSnapshot, RestockRequest, User, WorkloadForecast)
+import forecasting
+import registry
+import rollups
+import versions
+
+PREFIX = "perf"
+PASSWORD = "perf-password"
+EMAIL_DOMAIN = "perf.example.org"    # EmailStr rejects special-use TLDs such as .test
+
+ITEMS = [
+    ("Paracetamol 500mg", "drug", "tablets"), ("Amoxicillin 250mg", "drug", "capsules"),
+    ("Artemether-Lumefantrine", "drug", "packs"), ("ORS sachets", "drug", "sachets"),
+    ("Zinc 20mg", "drug", "tablets"), ("Metronidazole 200mg", "drug", "tablets"),
+    ("Ferrous sulphate", "drug", "tablets"), ("Folic acid", "drug", "tablets"),
+    ("Cotrimoxazole", "drug", "tablets"), ("Ibuprofen 400mg", "drug", "tablets"),
+    ("Malaria RDT kits", "consumable", "kits"), ("Syringes 5ml", "consumable", "pieces"),
+    ("Gloves (medium)", "consumable", "pairs"), ("Gauze rolls", "consumable", "rolls"),
+    ("Cotton wool", "consumable", "packs"), ("IV fluids (Ringer's)", "drug", "bags"),
+    ("Oxytocin", "drug", "ampoules"), ("Magnesium sulphate", "drug", "ampoules"),
+    ("BCG vaccine", "vaccine", "vials"), ("Measles vaccine", "vaccine", "vials"),
+    ("Pentavalent vaccine", "vaccine", "vials"), ("OPV", "vaccine", "vials"),
+    ("Tetanus toxoid", "vaccine", "vials"), ("Vitamin A capsules", "drug", "capsules"),
+    ("Albendazole", "drug", "tablets"), ("Chlorhexidine gel", "drug", "tubes"),
+    ("Misoprostol", "drug", "tablets"), ("Insulin", "drug", "vials"),
+    ("Amlodipine 5mg", "drug", "tablets"), ("Metformin 500mg", "drug", "tablets"),
+]
+ISSUE_CATEGORIES = ["Power", "Water", "Equipment", "Drug Stockout", "Staffing Shortage", "Security", "Building"]
+ISSUE_TEXT = [
+    "Generator down since Tuesday; vaccines moved to the LGA store",
+    "Borehole pump failed, water fetched from the market",
+    "Delivery couch broken, patients examined on benches",
+    "Ran out of RDT kits two days before the scheduled delivery",
+    "Only one nurse on night duty for the whole week",
+    "Roof leaks over the pharmacy store during rain",
+]
+SYMPTOMS = ["fever", "cough", "headache", "diarrhoea", "vomiting", "body pain", "rash", "abdominal pain",
+            "difficulty breathing", "weakness", "chills", "sore throat"]
+HISTORY = ["hypertension", "diabetes", "asthma", "sickle cell", "HIV", "previous malaria"]
+FIRST_NAMES = ["Chioma", "Aisha", "Tunde", "Ngozi", "Emeka", "Fatima", "Bola", "Ibrahim", "Kemi", "Musa",
+               "Zainab", "Olu", "Amaka", "Yusuf", "Funke", "Sani"]
+LAST_NAMES = ["Okafor", "Bello", "Adeyemi", "Eze", "Abubakar", "Ogunleye", "Nwosu", "Musa", "Balogun", "Okeke"]
+
+
+# ---------------- HELPERS ----------------
+def _copy_value(value) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, (list, tuple)):
+        return "{" + ",".join('"' + str(v).replace('"', '\\"') + '"' for v in value) + "}"
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+
+def copy_rows(table: str, columns: tuple, rows) -> int:
+    """COPY an iterable of tuples into `table`, in batches."""
+    raw = engine.raw_connection()
+    written = 0
+    try:
+        cursor = raw.cursor()
+        batch = io.StringIO()
+        for row in rows:
+            batch.write("\t".join(map(_copy_value, row)) + "\n")
+            written += 1
+            if written % 100_000 == 0:
+                batch.seek(0)
+                cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", batch)
+                batch = io.StringIO()
+        batch.seek(0)
+        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", batch)
+        raw.commit()
+    finally:
+        raw.close()
+    return written
+
+
+def lga_id(n: int) -> str:
+    return f"{PREFIX}-lga-{n:02d}"
+
+
+def phc_id(lga: int, n: int) -> str:
+    return f"{PREFIX}-lga-{lga:02d}-phc-{n:03d}"
+
+
+def reset(db):
+    like = f"{PREFIX}-%"
+    for model in (RestockRequest, Issue, MonthlyReport, PhcMonthlyStats):
+        db.query(model).filter(model.lga_id.like(like)).delete(synchronize_session=False)
+    for model in (DailyWorkload, Inventory, WorkloadForecast, QueueSnapshot, QueueRollup, Facility):
+        db.query(model).filter(model.phc_id.like(like)).delete(synchronize_session=False)
+    db.query(User).filter(User.email.like(f"%@{EMAIL_DOMAIN}")).delete(synchronize_session=False)
+    db.query(Patient).filter(Patient.name.like("Perf %")).delete(synchronize_session=False)
+    versions.bump(db, registry.SCOPE)
+    db.commit()
+    registry.registry.invalidate()
+
+
+# ---------------- GENERATORS ----------------
+class Dataset:
+    def __init__(self, lgas: int, phcs: int, items: int, years: float, patients: int, seed: int):
+        self.rng = np.random.default_rng(seed)
+        self.today = date.today()
+        self.start = self.today - timedelta(days=int(365 * years))
+        self.days = (self.today - self.start).days
+        self.items = [ITEMS[i % len(ITEMS)] if i < len(ITEMS) else (f"Item {i}", "drug", "units")
+                      for i in range(items)]
+        self.patients = patients
+        self.facilities = []        # (phc_id, name, lga_id, capacity, staff, activity)
+        for lga in range(1, lgas + 1):
+            for n in range(1, phcs + 1):
+                activity = float(self.rng.lognormal(0, 0.6))
+                capacity = int(np.clip(self.rng.normal(60, 20), 20, 150))
+                self.facilities.append((phc_id(lga, n), f"Perf PHC {lga:02d}-{n:03d}", lga_id(lga),
+                                        capacity, int(max(2, capacity // 12)), activity))
+        self.lgas = [lga_id(lga) for lga in range(1, lgas + 1)]
+        # Zipf-like demand over items
+        ranks = np.arange(1, items + 1)
+        self.item_weights = (1 / ranks ** 0.9) / (1 / ranks ** 0.9).sum()
+
+    def months(self):
+        month = self.start.replace(day=1)
+        while month <= self.today:
+            yield month
+            month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+    def users(self, password_hash: str):
+        now = datetime.utcnow()
+        for lga in self.lgas:
+            yield (f"{lga} office", f"{lga}@{EMAIL_DOMAIN}", password_hash, "lga", None, None, lga, now)
+        for phc, name, lga, *_ in self.facilities:
+            yield (name, f"{phc}@{EMAIL_DOMAIN}", password_hash, "phc", phc, name, lga, now)
+
+    def facility_rows(self):
+        now = datetime.now(timezone.utc)
+        for phc, name, lga, capacity, staff, _ in self.facilities:
+            yield (phc, name, lga, capacity, staff, now, now)
+
+    def inventory(self):
+        for phc, name, _, _, _, activity in self.facilities:
+            for (item, kind, unit), weight in zip(self.items, self.item_weights):
+                rate = round(float(weight * 120 * activity * self.rng.uniform(0.6, 1.4)), 2)
+                # about one item in six is within five days of running out
+                days_left = self.rng.uniform(0.5, 5) if self.rng.random() < 0.16 else self.rng.uniform(6, 60)
+                yield (phc, name, item, kind, int(rate * days_left), unit, rate)
+
+    def restock_requests(self):
+        rng, now = self.rng, datetime.now(timezone.utc)
+        names = [item for item, _, _ in self.items]
+        for phc, name, lga, _, _, activity in self.facilities:
+            for month in self.months():
+                for _ in range(rng.poisson(4 * activity)):
+                    day = min(int(rng.integers(0, 28)), (self.today - month).days)
+                    at = datetime(month.year, month.month, 1, tzinfo=timezone.utc) + timedelta(
+                        days=day, seconds=int(rng.integers(8 * 3600, 17 * 3600)))
+                    if at > now:
+                        continue
+                    age = (now - at).days
+                    if age < 7:
+                        status = "pending"
+                    else:
+                        status = rng.choice(["approved", "declined", "cancelled", "delivered"], p=[.3, .1, .05, .55])
+                    processed = at + timedelta(days=int(rng.integers(1, 6))) if status != "pending" else None
+                    yield (str(rng.choice(names, p=self.item_weights)), int(rng.integers(10, 500)), phc, name, lga,
+                           "Perf operator", at, status, None, "LGA pharmacist" if processed else None, processed,
+                           str(rng.choice(["High", "Medium", "Low"], p=[.2, .5, .3])))
+
+    def issues(self):
+        rng, now = self.rng, datetime.utcnow()
+        for phc, name, lga, _, _, activity in self.facilities:
+            for month in self.months():
+                for _ in range(rng.poisson(0.8 * activity)):
+                    at = datetime(month.year, month.month, 1) + timedelta(
+                        days=int(rng.integers(0, 28)), seconds=int(rng.integers(0, 86400)))
+                    if at > now:
+                        continue
+                    category = str(rng.choice(ISSUE_CATEGORIES))
+                    if (now - at).days > 30:
+                        status = "Resolved"
+                    else:
+                        status = str(rng.choice(["Open", "In Progress", "Resolved"], p=[.5, .3, .2]))
+                    if category == "Staffing Shortage" and status != "Resolved":
+                        status = "Resolved"     # open staffing alerts are unique per facility (overload.py)
+                    yield (phc, lga, name, category, str(rng.choice(["High", "Medium", "Low"], p=[.25, .5, .25])),
+                           str(rng.choice(ISSUE_TEXT)), status, at)
+
+    def workload(self):
+        """One row per facility per day: weekday profile x rainy season x trend x noise."""
+        rng = self.rng
+        dates = [self.start + timedelta(days=d) for d in range(self.days)]
+        weekday = np.array([1.15, 1.05, 1.0, 1.0, 0.95, 0.6, 0.35])[[d.weekday() for d in dates]]
+        doy = np.array([d.timetuple().tm_yday for d in dates])
+        season = 1 + 0.25 * np.exp(-((doy - 240) / 45.0) ** 2)       # malaria peak around late August
+        trend = 1 + 0.08 * np.arange(self.days) / 365
+        for phc, _, _, capacity, _, activity in self.facilities:
+            mean = capacity * 0.75 * activity ** 0.5 * weekday * season * trend
+            counts = rng.poisson(np.maximum(mean, 1))
+            streak = 0
+            for d, count in zip(dates, counts):
+                streak = streak + 1 if count > capacity else 0
+                yield (phc, d, int(count), capacity, streak)
+
+    def monthly_reports(self):
+        this_month = self.today.replace(day=1)
+        for phc, name, lga, *_ in self.facilities:
+            for month in self.months():
+                if month >= this_month:
+                    continue
+                key = month.strftime("%Y-%m")
+                yield (phc, lga, name, key,
+                       f"Monthly report for {name}, {key}. Stock was adequate for most items; "
+                       f"restock requests and issues are summarised in the attached figures.",
+                       "Submitted", datetime(month.year, month.month, 1) + timedelta(days=32))
+
+    def patient_rows(self):
+        rng = self.rng
+        now = datetime.now(timezone.utc)
+        for _ in range(self.patients):
+            symptoms = list(rng.choice(SYMPTOMS, size=int(rng.integers(1, 4)), replace=False))
+            history = list(rng.choice(HISTORY, size=int(rng.integers(0, 2)), replace=False))
+            at = now - timedelta(seconds=int(rng.integers(0, self.days * 86400)))
+            yield (f"Perf {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", int(rng.integers(1, 90)),
+                   str(rng.choice(["Male", "Female"])), symptoms,
+                   str(rng.choice(["Emergency", "Acute", "Routine", "FollowUp"], p=[.05, .35, .45, .15])),
+                   '{"temp": %.1f, "pulse": %d}' % (rng.normal(37.4, 0.8), rng.integers(60, 120)),
+                   history or None, at, at)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the perf-suite dataset.")
+    parser.add_argument("--lgas", type=int, default=5)
+    parser.add_argument("--phcs", type=int, default=20, help="PHCs per LGA")
+    parser.add_argument("--items", type=int, default=30, help="inventory items per PHC")
+    parser.add_argument("--years", type=float, default=2)
+    parser.add_argument("--patients", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=40)
+    parser.add_argument("--reset", action="store_true", help="delete an existing perf dataset first")
+    args = parser.parse_args()
+
+    command.upgrade(Config(os.path.join(ROOT, "alembic.ini")), "head")
+    db = SessionLocal()
+    started = time.perf_counter()
+    try:
+        existing = db.query(Facility).filter(Facility.phc_id.like(f"{PREFIX}-%")).count()
+        if existing and not args.reset:
+            sys.exit(f"{existing} perf facilities already exist; pass --reset to regenerate.")
+        if args.reset:
+            reset(db)
+
+        data = Dataset(args.lgas, args.phcs, args.items, args.years, args.patients, args.seed)
+        password_hash = __import__("routers.auth", fromlist=["hash_password"]).hash_password(PASSWORD)
+        counts = {
+            "users": copy_rows("users", ("full_name", "email", "password_hash", "role", "phc_id", "phc_name",
+                                         "lga_id", "created_at"), data.users(password_hash)),
+            "facilities": copy_rows("facilities", ("phc_id", "name", "lga_id", "capacity", "staff_count",
+                                                   "created_at", "updated_at"), data.facility_rows()),
+            "inventory": copy_rows("inventory", ("phc_id", "phc_name", "item_name", "item_type", "current_stock",
+                                                 "unit", "daily_consumption_rate"), data.inventory()),
+            "restock_requests": copy_rows("restock_requests", (
+                "item_name", "quantity_needed", "phc_id", "phc_name", "lga_id", "requested_by", "request_date",
+                "status", "comments", "processed_by", "processed_at", "priority_level"), data.restock_requests()),
+            "issues": copy_rows("issues", ("phc_id", "lga_id", "phc_name", "category", "priority", "description",
+                                           "status", "created_at"), data.issues()),
+            "daily_workload": copy_rows("daily_workload", ("phc_id", "date", "patient_count", "capacity",
+                                                           "overload_streak"), data.workload()),
+            "monthly_reports": copy_rows("monthly_reports", ("phc_id", "lga_id", "phc_name", "month", "content",
+                                                             "status", "created_at"), data.monthly_reports()),
+            "patients": copy_rows("patients", ("name", "age", "sex", "symptoms", "visit_type", "vitals",
+                                               "medical_history", "created_at", "updated_at"), data.patient_rows()),
+        }
+        generated = time.perf_counter() - started
+
+        versions.bump(db, registry.SCOPE)
+        db.commit()
+        registry.registry.invalidate()
+        stats_rows = rollups.rebuild(db)
+        forecasting.run_forecasts(db, phc_ids=[f[0] for f in data.facilities])
+        db.commit()
+        db.execute(text("ANALYZE"))
+        db.commit()
+
+        print(f"{args.lgas} LGAs x {args.phcs} PHCs x {args.items} items, {args.years:g} years (seed {args.seed})")
+        for table, n in counts.items():
+            print(f"  {table:18} {n:>10,}")
+        print(f"  phc_monthly_stats  {stats_rows:>10,}")
+        print(f"generated in {generated:.1f}s, rollups/forecasts/ANALYZE in {time.perf_counter() - started - generated:.1f}s")
+        print(f"Log in as <phc_id>@{EMAIL_DOMAIN} or <lga_id>@{EMAIL_DOMAIN} with password {PASSWORD!r}.")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,427 @@
+"""
+Load driver for the performance suite.
+
+Replays a realistic mix of calls against the app, using the dataset from
+generate.py:
+
+- PHC users register and triage patients, check patients in, send queue
+  snapshots, raise restock requests and issues, and poll their lists.
+- LGA users poll restock requests, issues and reports with If-None-Match,
+  approve pending requests, and read the LGA summary, forecasts, queue
+  history and facility list.
+- A few of each log in with a password, so bcrypt is part of the mix.
+
+Virtual users are asyncio tasks with exponential think time. Gemini is
+replaced by llm.FakeGeminiClient (LLM=fake), which answers after
+FAKE_LLM_LATENCY_MS, so triage and narrative streaming run their real code
+paths.
+
+Unless --base-url is given, the driver starts uvicorn itself with --workers
+workers and stops it at the end. Requests made during --warmup are not
+counted. Results (throughput and p50/p95/p99 per route) are printed and
+written to benchmarks/perf/results/<timestamp>.json; --save-baseline also
+writes benchmarks/perf/baseline.json, which compare.py diffs against.
+
+    DATABASE_URL=postgresql://localhost/medisense_perf python benchmarks/perf/loadtest.py --users 40 --duration 60
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import signal
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..", "..")
+sys.path.insert(0, ROOT)
+
+if "DATABASE_URL" not in os.environ:
+    sys.exit("Set DATABASE_URL to a scratch database before running the perf suite.")
+
+import httpx
+import numpy as np
+from sqlalchemy import func
+
+from database import SessionLocal
+from models import Facility, Issue, Patient, RestockRequest, User, DailyWorkload
+from jwt_handler import create_access_token
+from generate import PREFIX, PASSWORD, EMAIL_DOMAIN
+
+RESULTS_DIR = os.path.join(HERE, "results")
+BASELINE = os.path.join(HERE, "baseline.json")
+PORT = 8797
+LGA_SHARE = 0.2
+
+
+# ---------------- DATASET ----------------
+class World:
+    """Facilities, accounts and patient ids of the perf dataset."""
+
+    def __init__(self):
+        db = SessionLocal()
+        try:
+            users = {email: uid for uid, email in db.query(User.id, User.email).filter(
+                User.email.like(f"%@{EMAIL_DOMAIN}"))}
+            self.facilities = [(f.phc_id, f.name, f.lga_id) for f in db.query(Facility).filter(
+                Facility.phc_id.like(f"{PREFIX}-%")).order_by(Facility.phc_id)]
+            if not self.facilities:
+                sys.exit("No perf dataset found; run benchmarks/perf/generate.py first.")
+            self.lgas = sorted({lga for _, _, lga in self.facilities})
+            self.user_ids = users
+            self.patient_ids = [pid for (pid,) in db.query(Patient.id).filter(
+                Patient.name.like("Perf %")).order_by(Patient.id.desc()).limit(5000)]
+            self.counts = {
+                "facilities": len(self.facilities),
+                "lgas": len(self.lgas),
+                "restock_requests": db.query(func.count(RestockRequest.id)).filter(
+                    RestockRequest.lga_id.like(f"{PREFIX}-%")).scalar(),
+                "issues": db.query(func.count(Issue.id)).filter(Issue.lga_id.like(f"{PREFIX}-%")).scalar(),
+                "daily_workload": db.query(func.count(DailyWorkload.id)).filter(
+                    DailyWorkload.phc_id.like(f"{PREFIX}-%")).scalar(),
+                "patients": db.query(func.count(Patient.id)).filter(Patient.name.like("Perf %")).scalar(),
+            }
+        finally:
+            db.close()
+
+
+class VirtualUser:
+    def __init__(self, n: int, world: World, rng: random.Random):
+        self.rng = rng
+        self.world = world
+        if n % round(1 / LGA_SHARE) == 0:
+            self.role = "lga"
+            self.lga_id = world.lgas[(n // round(1 / LGA_SHARE)) % len(world.lgas)]
+            self.phc_id, self.name = None, f"{self.lga_id} office"
+            self.email = f"{self.lga_id}@{EMAIL_DOMAIN}"
+        else:
+            self.role = "phc"
+            self.phc_id, self.name, self.lga_id = world.facilities[rng.randrange(len(world.facilities))]
+            self.email = f"{self.phc_id}@{EMAIL_DOMAIN}"
+        token = create_access_token({
+            "user_id": world.user_ids.get(self.email, 1), "role": self.role, "operator_name": "Perf operator",
+            "name": self.name, "phc_id": self.phc_id, "lga_id": self.lga_id,
+        })
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.etags = {}             # path -> (etag, last body)
+        self.pending_ids = []
+
+
+# ---------------- ACTIONS ----------------
+# Each returns the HTTP status; names are the route templates used in /metrics
+async def conditional_get(client, user, path, params=None):
+    key = path + "?" + "&".join(f"{k}={v}" for k, v in sorted((params or {}).items()))
+    headers = dict(user.headers)
+    if key in user.etags:
+        headers["If-None-Match"] = user.etags[key][0]
+    r = await client.get(path, params=params, headers=headers)
+    if r.status_code == 200:
+        body = r.json()
+        if "etag" in r.headers:
+            user.etags[key] = (r.headers["etag"], body)
+        return r.status_code, body
+    if r.status_code == 304:
+        return r.status_code, user.etags[key][1]
+    return r.status_code, None
+
+
+async def restock_list(client, user):
+    status, body = await conditional_get(client, user, "/inventory/restock-requests")
+    if body and user.role == "lga":
+        user.pending_ids = [r["id"] for r in body if r["status"] == "pending"][:200]
+    return status
+
+
+async def approve(client, user):
+    if not user.pending_ids:
+        return await restock_list(client, user)
+    request_id = user.pending_ids.pop(user.rng.randrange(len(user.pending_ids)))
+    r = await client.put(f"/inventory/restock-requests/{request_id}", headers=user.headers,
+                         json={"status": user.rng.choice(["approved", "approved", "declined"]), "comments": "perf"})
+    return r.status_code
+
+
+async def issues_list(client, user):
+    return (await conditional_get(client, user, "/reports/issues"))[0]
+
+
+async def reports_list(client, user):
+    return (await conditional_get(client, user, "/reports/"))[0]
+
+
+async def low_stock(client, user):
+    return (await client.get("/inventory/low-stock", headers=user.headers)).status_code
+
+
+async def create_restock(client, user):
+    item = user.rng.choice(["Paracetamol 500mg", "Malaria RDT kits", "ORS sachets", "Gloves (medium)"])
+    r = await client.post("/inventory/restock-requests", headers=user.headers,
+                          json={"item_name": item, "quantity_needed": user.rng.randint(10, 400)})
+    return r.status_code
+
+
+async def auto_restock(client, user):
+    return (await client.post("/inventory/auto-restock-check", headers=user.headers)).status_code
+
+
+async def create_issue(client, user):
+    r = await client.post("/reports/issues", headers=user.headers, json={
+        "category": user.rng.choice(["Power", "Water", "Equipment"]), "priority": "Medium",
+        "description": "Reported during the perf run"})
+    return r.status_code
+
+
+async def narrative(client, user):
+    async with client.stream("POST", "/reports/generate/stream", headers=user.headers,
+                             json={"month_str": date.today().strftime("%Y-%m")}) as r:
+        async for _ in r.aiter_bytes():
+            pass
+        return r.status_code
+
+
+async def check_in(client, user):
+    return (await client.post("/workload/check-in", headers=user.headers)).status_code
+
+
+async def queue_snapshot(client, user):
+    r = await client.post("/workload/queue", headers=user.headers, json={
+        "current_queue_count": user.rng.randint(0, 40), "avg_wait_time": round(user.rng.uniform(5, 90), 1),
+        "completed_visits_today": user.rng.randint(0, 120)})
+    return r.status_code
+
+
+async def submit_workload(client, user):
+    r = await client.post("/workload/submit", headers=user.headers,
+                          json={"patient_count": user.rng.randint(20, 120)})
+    return r.status_code
+
+
+async def forecast(client, user):
+    return (await client.get("/workload/forecast", headers=user.headers)).status_code
+
+
+async def register_patient(client, user):
+    rng = user.rng
+    r = await client.post("/patients/", json={
+        "name": f"Perf Walk-in {rng.randint(1, 10**6)}", "age": rng.randint(1, 85),
+        "sex": rng.choice(["Male", "Female"]), "symptoms": rng.sample(["fever", "cough", "headache", "rash"], 2),
+        # "Follow-up" is left out: the visit_type column stores enum names, so the API
+        # currently 500s on it ("FollowUp" in the database vs "Follow-up" in the schema)
+        "visit_type": rng.choice(["Acute", "Routine", "Emergency"]), "vitals": '{"temp": 37.8}'})
+    return r.status_code
+
+
+async def triage(client, user):
+    patient_id = user.rng.choice(user.world.patient_ids)
+    return (await client.post(f"/patients/triage/{patient_id}")).status_code
+
+
+async def login(client, user):
+    r = await client.post("/auth/login", json={"email": user.email, "password": PASSWORD,
+                                               "operator_name": "Perf operator"})
+    return r.status_code
+
+
+async def lga_summary(client, user):
+    month = (date.today().replace(day=1) - timedelta(days=1)).strftime("%Y-%m")
+    r = await client.get("/reports/lga-summary", params={"month_str": month}, headers=user.headers)
+    return r.status_code
+
+
+async def lga_forecast(client, user):
+    return (await client.get("/workload/forecast/lga", headers=user.headers)).status_code
+
+
+async def queue_history(client, user):
+    return (await client.get("/workload/queue", params={"resolution": "15m"}, headers=user.headers)).status_code
+
+
+async def facilities(client, user):
+    return (await client.get("/facilities", headers=user.headers)).status_code
+
+
+PHC_MIX = [
+    ("GET /inventory/low-stock", 8, low_stock),
+    ("GET /inventory/restock-requests", 10, restock_list),
+    ("POST /inventory/restock-requests", 3, create_restock),
+    ("POST /inventory/auto-restock-check", 1, auto_restock),
+    ("GET /reports/issues", 6, issues_list),
+    ("POST /reports/issues", 1, create_issue),
+    ("GET /reports/", 3, reports_list),
+    ("POST /reports/generate/stream", 0.3, narrative),
+    ("POST /workload/check-in", 20, check_in),
+    ("POST /workload/queue", 10, queue_snapshot),
+    ("POST /workload/submit", 1, submit_workload),
+    ("GET /workload/forecast", 5, forecast),
+    ("POST /patients/", 8, register_patient),
+    ("POST /patients/triage/{patient_id}", 2, triage),
+    ("POST /auth/login", 0.5, login),
+]
+LGA_MIX = [
+    ("GET /inventory/restock-requests", 10, restock_list),
+    ("PUT /inventory/restock-requests/{request_id}", 2, approve),
+    ("GET /reports/issues", 6, issues_list),
+    ("GET /reports/", 3, reports_list),
+    ("GET /reports/lga-summary", 4, lga_summary),
+    ("GET /workload/forecast/lga", 4, lga_forecast),
+    ("GET /workload/queue", 2, queue_history),
+    ("GET /facilities", 2, facilities),
+    ("POST /auth/login", 0.5, login),
+]
+
+
+# ---------------- DRIVER ----------------
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.recording = False
+
+    def record(self, name: str, seconds: float, status: int):
+        if not self.recording:
+            return
+        self.latencies[name].append(seconds)
+        self.statuses[name][status] += 1
+        if status == 0 or status >= 400:
+            self.errors[name] += 1
+
+    def summary(self, seconds: float) -> dict:
+        routes = {}
+        for name in sorted(self.latencies):
+            ms = np.array(self.latencies[name]) * 1000
+            routes[name] = {
+                "count": len(ms),
+                "errors": self.errors[name],
+                "rps": round(len(ms) / seconds, 2),
+                "mean_ms": round(float(ms.mean()), 2),
+                "p50_ms": round(float(np.percentile(ms, 50)), 2),
+                "p95_ms": round(float(np.percentile(ms, 95)), 2),
+                "p99_ms": round(float(np.percentile(ms, 99)), 2),
+                "statuses": {str(k): v for k, v in sorted(self.statuses[name].items())},
+            }
+        every = np.concatenate([np.array(v) for v in self.latencies.values()]) * 1000
+        total = {
+            "count": int(every.size),
+            "errors": sum(self.errors.values()),
+            "rps": round(every.size / seconds, 2),
+            "p50_ms": round(float(np.percentile(every, 50)), 2),
+            "p95_ms": round(float(np.percentile(every, 95)), 2),
+            "p99_ms": round(float(np.percentile(every, 99)), 2),
+        }
+        return {"total": total, "routes": routes}
+
+
+async def run_user(client, user: VirtualUser, recorder: Recorder, deadline: float, think: float):
+    mix = LGA_MIX if user.role == "lga" else PHC_MIX
+    names = [name for name, _, _ in mix]
+    weights = [weight for _, weight, _ in mix]
+    actions = {name: action for name, _, action in mix}
+    await asyncio.sleep(user.rng.uniform(0, think))           # stagger the start
+    while time.monotonic() < deadline:
+        name = user.rng.choices(names, weights)[0]
+        started = time.perf_counter()
+        try:
+            status = await actions[name](client, user)
+        except httpx.HTTPError:
+            status = 0
+        recorder.record(name, time.perf_counter() - started, status)
+        await asyncio.sleep(user.rng.expovariate(1 / think) if think > 0 else 0)
+
+
+async def drive(base_url: str, world: World, args) -> dict:
+    recorder = Recorder()
+    users = [VirtualUser(n, world, random.Random(args.seed * 1000 + n)) for n in range(args.users)]
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        deadline = time.monotonic() + args.warmup + args.duration
+        tasks = [asyncio.create_task(run_user(client, u, recorder, deadline, args.think)) for u in users]
+        await asyncio.sleep(args.warmup)
+        recorder.recording = True
+        measured_from = time.monotonic()
+        await asyncio.gather(*tasks)
+        measured = time.monotonic() - measured_from
+    return recorder.summary(measured)
+
+
+def start_server(args):
+    env = dict(os.environ, SCHEDULER_ENABLED="0", LLM="fake", FAKE_LLM_LATENCY_MS=str(args.llm_latency_ms))
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(PORT), "--workers", str(args.workers),
+         "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    for _ in range(300):
+        try:
+            httpx.get(f"http://127.0.0.1:{PORT}/", timeout=1)
+            return server
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    server.kill()
+    sys.exit("uvicorn did not start")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def print_summary(result: dict):
+    print(f"{'route':48}{'count':>7}{'err':>5}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}  (ms)")
+    for name, r in result["routes"].items():
+        print(f"{name:48}{r['count']:>7}{r['errors']:>5}{r['rps']:>8.1f}"
+              f"{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}")
+    t = result["total"]
+    print(f"{'TOTAL':48}{t['count']:>7}{t['errors']:>5}{t['rps']:>8.1f}"
+          f"{t['p50_ms']:>9.1f}{t['p95_ms']:>9.1f}{t['p99_ms']:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a realistic call mix and record latency per route.")
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--duration", type=float, default=60, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=10)
+    parser.add_argument("--think", type=float, default=0.5, help="mean think time between a user's calls (s)")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers to start")
+    parser.add_argument("--llm-latency-ms", type=float, default=800)
+    parser.add_argument("--base-url", help="drive an already running server instead of starting one")
+    parser.add_argument("--seed", type=int, default=40)
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    world = World()
+    server = None if args.base_url else start_server(args)
+    try:
+        result = asyncio.run(drive(args.base_url or f"http://127.0.0.1:{PORT}", world, args))
+    finally:
+        if server:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+
+    result["meta"] = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("save_baseline",)},
+        "dataset": world.counts,
+        "machine": {"python": platform.python_version(), "cpus": os.cpu_count(), "platform": platform.platform()},
+    }
+    print_summary(result)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%dT%H%M%S") + ".json")
+    for target in [path] + ([BASELINE] if args.save_baseline else []):
+        with open(target, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"wrote {os.path.relpath(target, ROOT)}")
+
+
+if __name__ == "__main__":
+    main()
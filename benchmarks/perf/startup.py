@@ -0,0 +1,134 @@
+"""
+Cold-start benchmark: how long a fresh process takes to serve.
+
+For each run it starts uvicorn in a new interpreter and polls every 10 ms,
+recording the time from process start to
+- the first 200 from GET /               (import, app setup, startup hooks)
+- the first 200 from GET /health/ready   (the database answers and the
+                                          schema is at the newest migration)
+and, separately, how long `import main` takes in a fresh interpreter.
+Medians over --runs are printed next to the last entry in
+startup_history.jsonl; --record appends this run there, so the numbers are
+tracked from commit to commit. Exits 1 if time to first 200 got worse than
+the last entry by more than --threshold percent.
+
+    DATABASE_URL=postgresql://localhost/medisense_perf python benchmarks/perf/startup.py --runs 7 --record
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..", "..")
+HISTORY = os.path.join(HERE, "startup_history.jsonl")
+PORT = 8798
+POLL_SECONDS = 0.01
+METRICS = ("import_s", "first_200_s", "ready_s")
+
+if "DATABASE_URL" not in os.environ:
+    sys.exit("Set DATABASE_URL to a migrated scratch database before running the perf suite.")
+
+import httpx
+
+
+def time_import() -> float:
+    out = subprocess.run(
+        [sys.executable, "-c", "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def wait_for(client: httpx.Client, path: str, started: float, server, timeout: float = 60) -> float:
+    while time.perf_counter() - started < timeout:
+        if server.poll() is not None:
+            sys.exit(f"uvicorn exited with {server.returncode} before {path} answered")
+        try:
+            if client.get(path).status_code == 200:
+                return time.perf_counter() - started
+        except httpx.HTTPError:
+            pass
+        time.sleep(POLL_SECONDS)
+    sys.exit(f"{path} did not return 200 within {timeout:.0f}s")
+
+
+def time_startup() -> tuple:
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(PORT), "--log-level", "warning"],
+        cwd=ROOT, stdout=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{PORT}", timeout=5) as client:
+            first = wait_for(client, "/", started, server)
+            ready = wait_for(client, "/health/ready", started, server)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    return first, ready
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def last_entry() -> dict:
+    if not os.path.exists(HISTORY):
+        return None
+    with open(HISTORY) as f:
+        lines = [line for line in f if line.strip()]
+    return json.loads(lines[-1]) if lines else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure time from process start to the first 200.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=20, help="regression threshold, percent")
+    parser.add_argument("--record", action="store_true", help="append the result to startup_history.jsonl")
+    args = parser.parse_args()
+
+    samples = {name: [] for name in METRICS}
+    for i in range(args.runs):
+        samples["import_s"].append(time_import())
+        first, ready = time_startup()
+        samples["first_200_s"].append(first)
+        samples["ready_s"].append(ready)
+        print(f"run {i + 1}: import {samples['import_s'][-1]:.3f}s, first 200 {first:.3f}s, ready {ready:.3f}s")
+
+    entry = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "runs": args.runs,
+        **{name: round(statistics.median(values), 3) for name, values in samples.items()},
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+    }
+    previous = last_entry()
+    print(f"\n{'median':14}{'this run':>10}{'last':>10}")
+    for name in METRICS:
+        last = f"{previous[name]:.3f}" if previous else "--"
+        print(f"{name:14}{entry[name]:>10.3f}{last:>10}")
+
+    if args.record:
+        with open(HISTORY, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+        print(f"recorded in {os.path.relpath(HISTORY, ROOT)}")
+
+    if previous and entry["first_200_s"] > previous["first_200_s"] * (1 + args.threshold / 100):
+        print(f"\nRegression: first 200 {previous['first_200_s']:.3f}s -> {entry['first_200_s']:.3f}s "
+              f"(over {args.threshold:g}%; last recorded at {previous['commit'] or '?'})")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+Benchmark: live dashboard events over SSE instead of polling.
+
+Part 1, the hub in-process: SUBSCRIBERS subscribers spread over LGA and
+facility topics. It measures the cost of fanning one event out, and the
+memory per idle subscriber. It then checks backpressure: a subscriber that
+never reads is dropped once its queue is full, the others are unaffected,
+and the dropped stream ends with "resync".
+
+Part 2, the app: starts uvicorn with WORKERS workers and opens CLIENTS SSE
+streams, 1 in 10 of them LGA dashboards and the rest facility screens.
+- Idle: counts the transactions Postgres runs in an idle 10 s window, next
+  to what polling the same clients every 30 s would cost.
+- Latency: publishes events in committed transactions and measures commit
+  to arrival at every subscribed client.
+- Rollback: an event in a rolled-back transaction must reach no one.
+- Coverage: drives the real endpoints (restock create, approve, issue
+  create and update, report submit, and a workload submission that opens
+  the automated staffing alert). Every event must reach its PHC's and its
+  LGA's clients.
+Everything it created is deleted afterwards.
+
+    DATABASE_URL=postgresql://localhost/medisense_bench python benchmarks/push_fanout.py
+"""
+import asyncio
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, ROOT)
+
+if "DATABASE_URL" not in os.environ:
+    sys.exit("Set DATABASE_URL to a migrated scratch database before running benchmarks.")
+
+import httpx
+from sqlalchemy import text
+
+from database import SessionLocal
+from models import (DailyWorkload, Facility, Inventory, Issue, MonthlyReport, PhcMonthlyStats, RestockRequest,
+                    ScopeVersion, WorkloadForecast)
+from jwt_handler import create_access_token
+import push
+import registry
+
+SUBSCRIBERS = 5000
+TOPIC_LGAS = 50
+HUB_EVENTS = 2000
+HUB_QUEUE = 32                                  # small, so the slow subscriber overflows within the run
+
+LGA_ID = "bench-lga-push"
+PHCS = 20
+PORT = 8796
+WORKERS = 2
+CLIENTS = 1000
+LATENCY_EVENTS = 40
+POLL_SECONDS = 30
+
+
+def phc_id(n):
+    return f"{LGA_ID}-phc-{n:02d}"
+
+
+def token(role, phc=None):
+    return create_access_token({"user_id": 1, "role": role, "operator_name": "bench", "name": "Bench",
+                                "phc_id": phc, "lga_id": LGA_ID})
+
+
+# ---------------- PART 1: HUB ----------------
+async def hub_test() -> bool:
+    hub = push.Hub(queue_size=HUB_QUEUE)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    subscribers = []
+    for n in range(SUBSCRIBERS):
+        lga = f"lga-{n % TOPIC_LGAS}"
+        topics = push.topics_for(lga_id=lga) if n % 10 == 0 else push.topics_for(phc_id=f"{lga}-phc-{n % 97}")
+        subscribers.append(hub.subscribe(topics))
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    per_subscriber = sum(s.size_diff for s in after.compare_to(before, "filename")) / SUBSCRIBERS
+
+    data = push.frame("restock.updated", {"phc_id": "lga-0-phc-0", "id": 1, "status": "approved"})
+    lga_wide = push.topics_for(lga_id="lga-7")
+    started = time.perf_counter()
+    delivered = 0
+    for i in range(HUB_EVENTS):
+        delivered += hub.dispatch(push.topics_for(f"lga-{i % TOPIC_LGAS}-phc-{i % 97}", f"lga-{i % TOPIC_LGAS}"), data)
+        if i % 100 == 0:
+            delivered += hub.dispatch(lga_wide, data)
+        if i % 50 == 0:
+            for s in subscribers:                   # everyone except subscriber 0 keeps up
+                if s is not subscribers[0]:
+                    while not s.queue.empty():
+                        s.queue.get_nowait()
+    elapsed = time.perf_counter() - started
+
+    # Subscriber 0 (LGA lga-0 dashboard) never read: dropped once its queue filled
+    slow = subscribers[0]
+    frames = []
+
+    async def drain():
+        async for chunk in push.stream(slow, b""):
+            frames.append(chunk)
+    try:
+        await asyncio.wait_for(drain(), 5)
+    except asyncio.TimeoutError:
+        frames.append(b"")
+    others_alive = sum(1 for s in subscribers[1:] if not s.dropped)
+    print(f"Hub: {SUBSCRIBERS} subscribers over {TOPIC_LGAS} LGAs, {HUB_EVENTS} events "
+          f"({delivered} frames queued)")
+    print(f"  fan-out cost                    {elapsed / HUB_EVENTS * 1e6:.1f} us per event, "
+          f"{elapsed / max(delivered, 1) * 1e9:.0f} ns per frame queued")
+    print(f"  memory per idle subscriber      {per_subscriber:.0f} B")
+    print(f"  slow subscriber (queue {HUB_QUEUE})    dropped={slow.dropped}, "
+          f"stream ended with resync={frames[-1] == push.RESYNC}")
+    print(f"  other subscribers still live    {others_alive}/{SUBSCRIBERS - 1}")
+    return slow.dropped and frames[-1] == push.RESYNC and others_alive == SUBSCRIBERS - 1
+
+
+# ---------------- PART 2: APP ----------------
+def cleanup(db):
+    phcs = [phc_id(n) for n in range(PHCS)]
+    db.query(Inventory).filter(Inventory.phc_id.in_(phcs)).delete(synchronize_session=False)
+    db.query(DailyWorkload).filter(DailyWorkload.phc_id.in_(phcs)).delete(synchronize_session=False)
+    for model in (RestockRequest, Issue, MonthlyReport, PhcMonthlyStats, WorkloadForecast, Facility):
+        db.query(model).filter(model.lga_id == LGA_ID).delete(synchronize_session=False)
+    db.query(ScopeVersion).filter(ScopeVersion.scope.like(f"%{LGA_ID}%")).delete(synchronize_session=False)
+    db.execute(text("DELETE FROM sync_tombstones WHERE lga_id = :l"), {"l": LGA_ID})
+    db.commit()
+
+
+def seed(db):
+    for n in range(PHCS):
+        registry.register(db, phc_id(n), f"Bench Push PHC {n}", LGA_ID)
+    # PHC 0 was over capacity the last two days: today's submission opens a staffing alert
+    today = datetime.utcnow().date()
+    for days_ago, streak in ((2, 1), (1, 2)):
+        db.add(DailyWorkload(phc_id=phc_id(0), date=today - timedelta(days=days_ago), patient_count=90,
+                             capacity=50, overload_streak=streak))
+    db.add(MonthlyReport(phc_id=phc_id(1), lga_id=LGA_ID, phc_name="Bench", month="2025-09", content="Draft"))
+    db.commit()
+
+
+def start_server():
+    env = dict(os.environ, SCHEDULER_ENABLED="0")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(PORT), "--workers", str(WORKERS),
+         "--log-level", "warning", "--backlog", "4096"],
+        cwd=ROOT, env=env,
+    )
+    for _ in range(300):
+        try:
+            httpx.get(f"http://127.0.0.1:{PORT}/health/live", timeout=1)
+            return server
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    server.kill()
+    sys.exit("uvicorn did not start")
+
+
+class Client:
+    def __init__(self, n):
+        self.lga = n % 10 == 0
+        self.phc = None if self.lga else phc_id((n - n // 10) % PHCS)      # every PHC gets screens
+        self.token = token("lga") if self.lga else token("phc", self.phc)
+        self.events = []                            # (received_at, event, data)
+        self.ready = asyncio.Event()
+
+    async def run(self, http):
+        async with http.stream("GET", "/events/stream", params={"access_token": self.token}) as response:
+            event = None
+            async for line in response.aiter_lines():
+                if line.startswith("event: "):
+                    event = line[7:]
+                elif line.startswith("data: "):
+                    if event == "ready":
+                        self.ready.set()
+                    else:
+                        self.events.append((time.time(), event, json.loads(line[6:])))
+
+
+def transactions(db) -> int:
+    return db.execute(text("SELECT xact_commit + xact_rollback FROM pg_stat_database "
+                           "WHERE datname = current_database()")).scalar()
+
+
+async def app_test() -> bool:
+    db = SessionLocal()
+    cleanup(db)
+    seed(db)
+    server = start_server()
+    ok = True
+    try:
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=0)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PORT}", timeout=None, limits=limits) as http:
+            clients = [Client(n) for n in range(CLIENTS)]
+            tasks = [asyncio.create_task(c.run(http)) for c in clients]
+            started = time.perf_counter()
+            await asyncio.wait_for(asyncio.gather(*(c.ready.wait() for c in clients)), 120)
+            connect_s = time.perf_counter() - started
+
+            # Idle: nothing should touch the database
+            await asyncio.sleep(1)
+            idle_before = transactions(db)
+            db.commit()
+            await asyncio.sleep(10)
+            idle_tx = transactions(db) - idle_before - 1
+            db.commit()
+
+            # Latency: commit -> arrival, per client
+            committed = {}
+            for i in range(LATENCY_EVENTS):
+                phc = phc_id(i % PHCS)
+                push.publish(db, "bench.tick", phc, LGA_ID, id=i)
+                db.commit()
+                committed[i] = time.time()
+                await asyncio.sleep(0.05)
+            push.publish(db, "bench.tick", phc_id(0), LGA_ID, id=-1)
+            db.rollback()
+
+            # Coverage: the real write paths
+            api = httpx.Client(base_url=f"http://127.0.0.1:{PORT}", timeout=30)
+            phc_headers = {"Authorization": "Bearer " + token("phc", phc_id(0))}
+            lga_headers = {"Authorization": "Bearer " + token("lga")}
+            created = api.post("/inventory/restock-requests", headers=phc_headers,
+                               json={"item_name": "Amoxicillin", "quantity_needed": 40}).json()
+            api.put(f"/inventory/restock-requests/{created['id']}", headers=lga_headers,
+                    json={"status": "approved"}).raise_for_status()
+            issue = api.post("/reports/issues", headers=phc_headers,
+                             json={"category": "Power", "priority": "High", "description": "Inverter"}).json()
+            api.put(f"/reports/issues/{issue['id']}", headers=lga_headers,
+                    params={"status": "In Progress"}).raise_for_status()
+            report_id = db.query(MonthlyReport.id).filter(MonthlyReport.phc_id == phc_id(1)).scalar()
+            api.post(f"/reports/{report_id}/submit", headers=phc_headers).raise_for_status()
+            api.post("/workload/submit", headers=phc_headers, json={"patient_count": 95}).raise_for_status()
+            api.close()
+            await asyncio.sleep(1.5)
+
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+        cleanup(db)
+        db.close()
+
+    lags, missing, leaked = [], 0, 0
+    for c in clients:
+        ticks = {d["id"]: at for at, event, d in c.events if event == "bench.tick"}
+        leaked += -1 in ticks
+        for i, at in committed.items():
+            if c.lga or phc_id(i % PHCS) == c.phc:
+                if i in ticks:
+                    lags.append(max(0.0, ticks[i] - at) * 1000)
+                else:
+                    missing += 1
+    lags.sort()
+
+    expected = ["restock.created", "restock.updated", "issue.created", "issue.updated", "report.submitted",
+                "issue.created"]
+    coverage_ok = True
+    for c in clients:
+        seen = [e for _, e, d in c.events if e != "bench.tick"]
+        if c.lga:
+            want = expected
+        elif c.phc == phc_id(0):
+            want = [e for e in expected if e != "report.submitted"]
+        elif c.phc == phc_id(1):
+            want = ["report.submitted"]
+        else:
+            want = []
+        coverage_ok = coverage_ok and sorted(seen) == sorted(want)
+    staffing = any(d.get("automated") for c in clients for _, e, d in c.events if e == "issue.created")
+
+    polling = CLIENTS * 2 / POLL_SECONDS
+    print(f"App: {WORKERS} workers, {CLIENTS} SSE clients ({CLIENTS // 10} LGA dashboards) connected "
+          f"in {connect_s:.1f}s")
+    print(f"  idle 10 s                       {idle_tx} DB transactions "
+          f"(polling two lists every {POLL_SECONDS}s: ~{polling * 10:.0f})")
+    print(f"  commit -> client                p50 {statistics.median(lags):.1f} ms  "
+          f"p99 {lags[int(len(lags) * .99) - 1]:.1f} ms  max {lags[-1]:.1f} ms  ({len(lags)} deliveries)")
+    print(f"  deliveries missing              {missing}")
+    print(f"  rolled-back event delivered to  {leaked} clients")
+    print(f"  write paths reached the right clients: {coverage_ok} (staffing alert pushed: {staffing})")
+    return ok and missing == 0 and leaked == 0 and coverage_ok and staffing
+
+
+async def main():
+    ok = await hub_test()
+    ok = await app_test() and ok
+    print("PASS" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,165 @@
+"""
+Benchmark: queue telemetry ingest throughput on one worker.
+
+1. Buffer + COPY alone: 200k snapshots for 2000 facilities pushed through
+   telemetry.SnapshotBuffer, timed to the last committed row.
+2. Over HTTP against one uvicorn worker: client threads post single
+   snapshots to POST /workload/queue, then 60-snapshot batches to
+   POST /workload/queue/batch. The server is stopped with SIGTERM, which
+   flushes its buffer, and the stored row count must match what was accepted.
+3. Downsampling everything ingested into 15-minute and daily rollups.
+
+Everything it created is deleted afterwards.
+
+    DATABASE_URL=postgresql://localhost/medisense_bench python benchmarks/queue_ingest.py
+"""
+import os
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, ROOT)
+
+if "DATABASE_URL" not in os.environ:
+    sys.exit("Set DATABASE_URL to a scratch database before running benchmarks.")
+
+import httpx
+from sqlalchemy import func
+
+from database import SessionLocal, Base, engine
+from models import JobWatermark, QueueRollup, QueueSnapshot
+from jwt_handler import create_access_token
+import telemetry
+
+PREFIX = "bench-queue"
+PORT = 8798
+FACILITIES = 2000
+DIRECT_POINTS = 200_000
+CLIENT_THREADS = 16
+SINGLE_SECONDS = 10
+BATCH_SIZE = 60
+BATCH_SECONDS = 10
+
+
+def phc_id(n):
+    return f"{PREFIX}-phc-{n:04d}"
+
+
+def token(phc):
+    return {"Authorization": "Bearer " + create_access_token({
+        "user_id": 1, "role": "phc", "operator_name": "bench", "name": "Bench",
+        "phc_id": phc, "lga_id": f"{PREFIX}-lga",
+    })}
+
+
+def cleanup(db):
+    like = f"{PREFIX}-%"
+    db.query(QueueSnapshot).filter(QueueSnapshot.phc_id.like(like)).delete(synchronize_session=False)
+    db.query(QueueRollup).filter(QueueRollup.phc_id.like(like)).delete(synchronize_session=False)
+    db.commit()
+
+
+def stored(db) -> int:
+    return db.query(func.count(QueueSnapshot.id)).filter(QueueSnapshot.phc_id.like(f"{PREFIX}-%")).scalar()
+
+
+def direct_copy():
+    buffer = telemetry.SnapshotBuffer()
+    start = datetime.now(timezone.utc) - timedelta(hours=12)
+    rows = [
+        (phc_id(i % FACILITIES), start + timedelta(minutes=i // FACILITIES), i % 40, (i % 90) / 2.0, i // FACILITIES)
+        for i in range(DIRECT_POINTS)
+    ]
+    began = time.perf_counter()
+    for i in range(0, len(rows), telemetry.MAX_BATCH):
+        buffer.add(rows[i:i + telemetry.MAX_BATCH])
+        buffer.flush()
+    return DIRECT_POINTS / (time.perf_counter() - began)
+
+
+def start_server():
+    env = dict(os.environ, SCHEDULER_ENABLED="0")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(PORT), "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    for _ in range(200):
+        try:
+            httpx.get(f"http://127.0.0.1:{PORT}/", timeout=1)
+            return server
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    server.kill()
+    sys.exit("uvicorn did not start")
+
+
+def post_for(seconds: float, thread_no: int, batch: int) -> int:
+    """Post snapshots (one per request, or `batch` per request) until time is up; returns accepted count."""
+    headers = token(phc_id(thread_no))
+    deadline = time.perf_counter() + seconds
+    accepted = 0
+    with httpx.Client(base_url=f"http://127.0.0.1:{PORT}", timeout=10) as client:
+        while time.perf_counter() < deadline:
+            snapshot = {"current_queue_count": 12, "avg_wait_time": 18.5, "completed_visits_today": 40}
+            if batch == 1:
+                response = client.post("/workload/queue", json=snapshot, headers=headers)
+            else:
+                response = client.post("/workload/queue/batch", json=[snapshot] * batch, headers=headers)
+            if response.status_code == 202:
+                accepted += response.json()["accepted"]
+    return accepted
+
+
+def over_http(seconds: float, batch: int) -> int:
+    with ThreadPoolExecutor(CLIENT_THREADS) as pool:
+        return sum(pool.map(lambda n: post_for(seconds, n, batch), range(CLIENT_THREADS)))
+
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    cleanup(db)
+    try:
+        copy_rate = direct_copy()
+        direct_rows = stored(db)
+        db.commit()
+
+        server = start_server()
+        try:
+            single = over_http(SINGLE_SECONDS, 1)
+            batched = over_http(BATCH_SECONDS, BATCH_SIZE)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+        http_rows = stored(db) - direct_rows
+        db.commit()
+
+        # Downsample only what this run wrote
+        db.merge(JobWatermark(name=telemetry.WATERMARK, value=0))
+        db.commit()
+        began = time.perf_counter()
+        result = telemetry.downsample(db)
+        downsample_seconds = time.perf_counter() - began
+        buckets = db.query(QueueRollup.resolution, func.count(QueueRollup.id)).filter(
+            QueueRollup.phc_id.like(f"{PREFIX}-%")
+        ).group_by(QueueRollup.resolution).all()
+
+        print(f"{FACILITIES} facilities, one uvicorn worker, {CLIENT_THREADS} client threads")
+        print(f"  buffer + COPY                    {copy_rate:>10,.0f} points/s  ({direct_rows:,} rows)")
+        print(f"  HTTP, 1 snapshot per request     {single / SINGLE_SECONDS:>10,.0f} points/s")
+        print(f"  HTTP, {BATCH_SIZE} snapshots per request   {batched / BATCH_SECONDS:>10,.0f} points/s")
+        print(f"  accepted over HTTP {single + batched:,}, stored {http_rows:,}")
+        print(f"  downsample {result['new_points']:,} points -> {dict(buckets)} in {downsample_seconds:.2f}s")
+        ok = http_rows == single + batched
+        print("PASS" if ok else "FAIL: accepted snapshots missing from queue_snapshots")
+    finally:
+        cleanup(db)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
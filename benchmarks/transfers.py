@@ -0,0 +1,261 @@
+"""
+Benchmark: transfer suggestions from the surplus index.
+
+Seeds one throwaway LGA into the database named by DATABASE_URL:
+- 500 facilities with inventory for 300 items, holding 0-120 days of stock;
+- 2,000 pending restock requests.
+It then:
+- times loading the LGA into the index (once per worker per INDEX_TTL);
+- times a warm donor lookup, against the query it replaces: the LGA's
+  inventory for the item, filtered to facilities over the reserve, best
+  first;
+- times GET /inventory/transfer-suggestions for all pending requests;
+- runs POST /inventory/transfers for one request. It checks both inventory
+  rows, the request, the stock_transfers row, and that the index reflects
+  the new stock straight after the commit;
+- runs TRANSFER_THREADS threads moving stock back and forth between the
+  same two facilities in opposite directions. There must be no deadlocks
+  and no units lost.
+Everything it created is deleted afterwards.
+
+    DATABASE_URL=postgresql://localhost/medisense_bench python benchmarks/transfers.py
+"""
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+if "DATABASE_URL" not in os.environ:
+    sys.exit("Set DATABASE_URL to a migrated scratch database before running benchmarks.")
+
+import numpy as np
+from sqlalchemy import text
+
+from database import SessionLocal
+from jwt_handler import create_access_token
+from registry import registry
+import transfers
+import versions
+
+LGA_ID = "bench-lga-transfers"
+FACILITIES = 500
+ITEMS = 300
+REQUESTS = 2000
+LOOKUPS = 20000
+SCAN_LOOKUPS = 200
+TRANSFER_THREADS = 4
+TRANSFERS_PER_THREAD = 25
+
+_SCAN = """
+SELECT i.phc_id, sum(i.current_stock) AS stock, max(i.daily_consumption_rate) AS rate
+FROM inventory i JOIN facilities f ON f.phc_id = i.phc_id
+WHERE f.lga_id = :lga AND i.item_name = :item AND i.phc_id <> :phc
+GROUP BY i.phc_id
+HAVING max(i.daily_consumption_rate) > 0 AND sum(i.current_stock) > :reserve * max(i.daily_consumption_rate)
+ORDER BY sum(i.current_stock) / max(i.daily_consumption_rate) DESC
+LIMIT :limit
+"""
+
+
+def phc(n):
+    return f"{LGA_ID}-phc-{n:03d}"
+
+
+def item_name(k):
+    return f"Bench item {k:03d}"
+
+
+def seed(db):
+    rng = np.random.default_rng(11)
+    db.execute(text("""
+        INSERT INTO facilities (phc_id, name, lga_id)
+        SELECT format('%s-phc-%s', CAST(:lga AS text), lpad(n::text, 3, '0')), format('Bench PHC %s', n), :lga
+        FROM generate_series(0, :facilities - 1) n
+    """), {"lga": LGA_ID, "facilities": FACILITIES})
+    n = FACILITIES * ITEMS
+    rate = rng.uniform(0.5, 20, n).round(2)
+    stock = np.floor(rng.uniform(0, 120, n) * rate).astype(int)
+    db.execute(text("""
+        INSERT INTO inventory (phc_id, phc_name, item_name, current_stock, daily_consumption_rate, unit, item_type)
+        SELECT format('%s-phc-%s', CAST(:lga AS text), lpad(p::text, 3, '0')), format('Bench PHC %s', p),
+               format('Bench item %s', lpad(i::text, 3, '0')), s, r, 'units', 'drug'
+        FROM unnest(CAST(:phc AS int[]), CAST(:item AS int[]), CAST(:stock AS int[]), CAST(:rate AS float8[]))
+             AS t(p, i, s, r)
+    """), {"lga": LGA_ID, "phc": np.repeat(np.arange(FACILITIES), ITEMS).tolist(),
+           "item": np.tile(np.arange(ITEMS), FACILITIES).tolist(), "stock": stock.tolist(), "rate": rate.tolist()})
+    picks = rng.choice(n, REQUESTS, replace=False)
+    db.execute(text("""
+        INSERT INTO restock_requests (item_name, quantity_needed, phc_id, phc_name, lga_id, requested_by,
+                                      request_date, status)
+        SELECT format('Bench item %s', lpad((c % :items)::text, 3, '0')), q,
+               format('%s-phc-%s', CAST(:lga AS text), lpad((c / :items)::text, 3, '0')),
+               format('Bench PHC %s', c / :items), :lga, 'bench', now() - c * interval '1 second', 'pending'
+        FROM unnest(CAST(:cells AS int[]), CAST(:qty AS int[])) AS t(c, q)
+    """), {"lga": LGA_ID, "items": ITEMS, "cells": picks.tolist(),
+           "qty": np.maximum(np.ceil(14 * rate[picks]), 1).astype(int).tolist()})
+    versions.bump(db, "facilities")
+    db.commit()
+    db.execute(text("ANALYZE inventory"))
+    db.commit()
+    registry.invalidate()
+
+
+def cleanup(db):
+    db.execute(text("DELETE FROM inventory WHERE phc_id LIKE :like"), {"like": f"{LGA_ID}-phc-%"})
+    for table in ("restock_requests", "stock_transfers", "phc_monthly_stats", "facilities", "sync_tombstones"):
+        db.execute(text(f"DELETE FROM {table} WHERE lga_id = :lga"), {"lga": LGA_ID})
+    db.execute(text("DELETE FROM scope_versions WHERE scope LIKE :like"), {"like": f"%{LGA_ID}%"})
+    versions.bump(db, "facilities")
+    db.commit()
+    registry.invalidate()
+    transfers.index.invalidate()
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def stock_of(db, phc_id, item):
+    return db.execute(text("SELECT current_stock FROM inventory WHERE phc_id = :p AND item_name = :i"),
+                      {"p": phc_id, "i": item}).scalar()
+
+
+def main():
+    db = SessionLocal()
+    cleanup(db)
+    print(f"Seeding {FACILITIES} facilities x {ITEMS} items, {REQUESTS} pending requests...")
+    seed(db)
+    ok = True
+    try:
+        rng = np.random.default_rng(3)
+        start = time.perf_counter()
+        transfers.index.donors(db, LGA_ID, item_name(0))
+        cold = time.perf_counter() - start
+        donors = sum(len(d) for d in transfers.index._lgas[LGA_ID].items.values())
+
+        asks = [(phc(int(p)), item_name(int(i))) for p, i in zip(rng.integers(0, FACILITIES, LOOKUPS),
+                                                                   rng.integers(0, ITEMS, LOOKUPS))]
+        warm = []
+        for phc_id, item in asks:
+            start = time.perf_counter()
+            transfers.index.donors(db, LGA_ID, item, exclude=phc_id)
+            warm.append(time.perf_counter() - start)
+        scan = []
+        for phc_id, item in asks[:SCAN_LOOKUPS]:
+            start = time.perf_counter()
+            db.execute(text(_SCAN), {"lga": LGA_ID, "item": item, "phc": phc_id,
+                                     "reserve": transfers.RESERVE_DAYS, "limit": transfers.MAX_SUGGESTIONS}).all()
+            scan.append(time.perf_counter() - start)
+        db.rollback()
+        # Same donors either way
+        phc_id, item = asks[0]
+        by_scan = [row.phc_id for row in db.execute(text(_SCAN), {
+            "lga": LGA_ID, "item": item, "phc": phc_id, "reserve": transfers.RESERVE_DAYS,
+            "limit": transfers.MAX_SUGGESTIONS})]
+        by_index = [d.phc_id for d in transfers.index.donors(db, LGA_ID, item, exclude=phc_id)]
+        ok &= by_scan == by_index
+
+        print(f"Surplus index, {FACILITIES} facilities x {ITEMS} items ({donors:,} donor entries)")
+        print(f"  load LGA into the index           {cold * 1000:8.1f} ms")
+        print("  donor lookup, index (warm)        median {:6.1f} us   p99 {:6.1f} us".format(
+            *(v * 1e6 for v in percentiles(warm))))
+        print("  donor lookup, inventory query     median {:6.1f} us   p99 {:6.1f} us".format(
+            *(v * 1e6 for v in percentiles(scan))))
+        print(f"  index and query agree             {by_scan == by_index}")
+
+        from fastapi.testclient import TestClient
+        from main import app
+        client = TestClient(app)
+        headers = {"Authorization": "Bearer " + create_access_token(
+            {"user_id": 1, "role": "lga", "operator_name": "bench", "name": "Bench LGA", "phc_id": None,
+             "lga_id": LGA_ID})}
+        timings = []
+        for _ in range(5):
+            start = time.perf_counter()
+            response = client.get("/inventory/transfer-suggestions", headers=headers)
+            timings.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.text
+        suggestions = response.json()
+        print(f"GET /inventory/transfer-suggestions: {len(suggestions):,} of {REQUESTS:,} pending requests "
+              f"have donors, median {statistics.median(timings) * 1000:.1f} ms")
+
+        # Execute the first suggestion against its request
+        first = suggestions[0]
+        donor = first["donors"][0]
+        item = first["item_name"]
+        before = stock_of(db, donor["phc_id"], item), stock_of(db, first["phc_id"], item)
+        db.rollback()
+        response = client.post("/inventory/transfers", headers=headers, json={
+            "item_name": item, "from_phc_id": donor["phc_id"], "to_phc_id": first["phc_id"],
+            "quantity": donor["quantity"], "restock_request_id": first["request_id"]})
+        assert response.status_code == 201, response.text
+        after = stock_of(db, donor["phc_id"], item), stock_of(db, first["phc_id"], item)
+        status, needed = db.execute(text("SELECT status, quantity_needed FROM restock_requests "
+                                         "WHERE lga_id = :lga AND id = :id"),
+                                    {"lga": LGA_ID, "id": first["request_id"]}).one()
+        # The index must already match the inventory, without waiting for the TTL
+        refreshed = [(d.phc_id, d.available) for d in transfers.index.donors(db, LGA_ID, item,
+                                                                             exclude=first["phc_id"])]
+        by_scan = [(row.phc_id, int(row.stock - transfers.RESERVE_DAYS * row.rate)) for row in db.execute(
+            text(_SCAN), {"lga": LGA_ID, "item": item, "phc": first["phc_id"], "reserve": transfers.RESERVE_DAYS,
+                          "limit": transfers.MAX_SUGGESTIONS})]
+        db.rollback()
+        moved = donor["quantity"]
+        checks = (after == (before[0] - moved, before[1] + moved),
+                  status == ("delivered" if moved >= first["quantity_needed"] else "pending"),
+                  refreshed == by_scan)
+        print(f"POST /inventory/transfers: {moved} units {before} -> {after}, request {status} ({needed}), "
+              f"index updated {checks[2]}")
+        ok &= all(checks)
+
+        # Opposite directions at once: the phc_id lock order must prevent deadlocks
+        a, b = phc(0), phc(1)
+        item = item_name(0)
+        db.execute(text("UPDATE inventory SET current_stock = 10000 WHERE phc_id IN (:a, :b) AND item_name = :i"),
+                   {"a": a, "b": b, "i": item})
+        db.commit()
+        errors = []
+
+        def mover(source, target):
+            session = SessionLocal()
+            try:
+                for _ in range(TRANSFERS_PER_THREAD):
+                    try:
+                        transfers.execute(session, LGA_ID, item, source, target, 7, "bench")
+                        session.commit()
+                    except Exception as e:
+                        session.rollback()
+                        errors.append(repr(e)[:120])
+            finally:
+                session.close()
+
+        threads = [threading.Thread(target=mover, args=(a, b) if n % 2 == 0 else (b, a))
+                   for n in range(TRANSFER_THREADS)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        total = stock_of(db, a, item) + stock_of(db, b, item)
+        count = db.execute(text("SELECT count(*) FROM stock_transfers WHERE lga_id = :lga AND item_name = :i"),
+                           {"lga": LGA_ID, "i": item}).scalar()
+        db.rollback()
+        runs = TRANSFER_THREADS * TRANSFERS_PER_THREAD
+        print(f"Opposite transfers: {count} of {runs} in {elapsed * 1000:.0f} ms, {len(errors)} errors, "
+              f"units {total:,} (expected 20,000)")
+        for error in errors[:3]:
+            print(f"  {error}")
+        ok &= not errors and total == 20000 and count == runs
+        print("PASS" if ok else "FAIL")
+    finally:
+        cleanup(db)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
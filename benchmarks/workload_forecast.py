@@ -0,0 +1,108 @@
+"""
+Benchmark: end-to-end workload forecasting for 1,000 facilities x 2 years.
+
+Loads synthetic history (forecasting.synthetic_history) for a throwaway LGA
+into the database named by DATABASE_URL with COPY, then times
+forecasting.run_forecasts end to end (one history query, vectorised fit,
+bulk upsert of 7-day forecasts) and reports the backtest MAE on the same
+data. Everything it created is deleted afterwards.
+
+    DATABASE_URL=postgresql://localhost/medisense_bench python benchmarks/workload_forecast.py
+"""
+import io
+import os
+import sys
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+if "DATABASE_URL" not in os.environ:
+    sys.exit("Set DATABASE_URL to a scratch database before running benchmarks.")
+
+import numpy as np
+from sqlalchemy import text
+
+from database import SessionLocal, Base, engine
+from models import DailyWorkload, Facility, WorkloadForecast
+import forecasting
+import registry
+import versions
+
+LGA_ID = "bench-lga-forecast"
+FACILITIES = 1000
+DAYS = 730
+
+
+def phc_id(n):
+    return f"{LGA_ID}-phc-{n:04d}"
+
+
+def seed(db, counts, start):
+    db.add_all(Facility(phc_id=phc_id(n), name=f"Bench PHC {n}", lga_id=LGA_ID) for n in range(FACILITIES))
+    versions.bump(db, registry.SCOPE)
+    db.commit()
+    registry.registry.invalidate()
+
+    buffer = io.StringIO()
+    for n in range(FACILITIES):
+        for d in np.flatnonzero(~np.isnan(counts[n])):
+            buffer.write(f"{phc_id(n)}\t{start + timedelta(days=int(d))}\t{int(counts[n, d])}\t50\n")
+    buffer.seek(0)
+    raw = engine.raw_connection()
+    try:
+        raw.cursor().copy_expert(
+            "COPY daily_workload (phc_id, date, patient_count, capacity) FROM STDIN", buffer)
+        raw.commit()
+    finally:
+        raw.close()
+    db.execute(text("ANALYZE daily_workload"))
+    db.commit()
+
+
+def cleanup(db):
+    like = f"{LGA_ID}-phc-%"
+    db.query(DailyWorkload).filter(DailyWorkload.phc_id.like(like)).delete(synchronize_session=False)
+    db.query(WorkloadForecast).filter(WorkloadForecast.lga_id == LGA_ID).delete(synchronize_session=False)
+    db.query(Facility).filter(Facility.lga_id == LGA_ID).delete(synchronize_session=False)
+    versions.bump(db, registry.SCOPE)
+    db.commit()
+    registry.registry.invalidate()
+
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    counts, start = forecasting.synthetic_history(FACILITIES, DAYS)
+    end = start + timedelta(days=DAYS - 1)
+    db = SessionLocal()
+    cleanup(db)
+    seed(db, counts, start)
+    try:
+        t0 = time.perf_counter()
+        history = forecasting.load_history(db, end)
+        t1 = time.perf_counter()
+        model = forecasting.fit(history.counts, history.start)
+        forecasting.predict(model)
+        t2 = time.perf_counter()
+        db.rollback()
+
+        t3 = time.perf_counter()
+        tomorrow = forecasting.run_forecasts(db, today=end)
+        db.commit()
+        t4 = time.perf_counter()
+
+        result = forecasting.backtest(counts, start)
+        mae, old_mae = result["mae_per_facility"], result["old_mae_per_facility"]
+        print(f"{len(tomorrow)} facilities x {DAYS} days ({int((~np.isnan(counts)).sum())} workload rows)")
+        print(f"  history query + matrix   {t1 - t0:7.3f}s")
+        print(f"  vectorised fit + predict {t2 - t1:7.3f}s")
+        print(f"  run_forecasts end to end {t4 - t3:7.3f}s  ({len(tomorrow) * forecasting.HORIZON_DAYS} forecast rows upserted)")
+        print(f"  backtest MAE per facility: median {np.nanmedian(mae):.2f}, p90 {np.nanpercentile(mae, 90):.2f} "
+              f"(old 3-day +10% rule: median {np.nanmedian(old_mae):.2f}, p90 {np.nanpercentile(old_mae, 90):.2f})")
+    finally:
+        cleanup(db)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
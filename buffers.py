@@ -0,0 +1,68 @@
+"""
+Background flushing for in-process write buffers (check-ins, queue telemetry).
+
+A subclass buffers writes in memory and implements flush() and pending();
+PeriodicFlusher calls flush() from a daemon thread every `flush_interval`
+seconds, sooner if the subclass calls wake() because a batch is full, and
+once more on stop(), which the app calls on shutdown.
+"""
+import threading
+import time
+from abc import ABC, abstractmethod
+
+
+class PeriodicFlusher(ABC):
+    name = "buffer"
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    @abstractmethod
+    def flush(self) -> int:
+        """Write everything buffered; returns how many entries were written."""
+
+    @abstractmethod
+    def pending(self) -> int:
+        """Entries buffered and not yet written."""
+
+    def wake(self):
+        """Flush now rather than at the end of the interval."""
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"{self.name} flush failed, will retry: {e}")
+                self._stop.wait(self.flush_interval)   # no tight retry loop while the database is down
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"{self.name}-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self, retries: int = 3):
+        """Stop the background thread and write whatever is still buffered."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        for attempt in range(retries):
+            try:
+                self.flush()
+                return
+            except Exception as e:
+                print(f"Final {self.name} flush failed (attempt {attempt + 1}): {e}")
+                time.sleep(0.5)
+        print(f"Dropping {self.pending()} buffered {self.name} entries after {retries} failed flushes.")
@@ -0,0 +1,141 @@
+"""
+Small in-process caches shared by the routers.
+
+Caches are created with named() so the invalidation bus (invalidation.py)
+can find them by name and /metrics can report them: hits and misses, and
+entries evicted for size, expiry or invalidation.
+
+Keys are tuples whose leading elements are strings, e.g.
+("lga-ikorodu", "2025-10"), so invalidate("lga-ikorodu") drops every month
+cached for that LGA. Use get_or_load() rather than get() + set(): it does not
+store a value that was loaded while an invalidation arrived, so a read that
+raced a write cannot put stale data back after the write evicted it.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+_caches = {}                                # name -> TTLCache
+_caches_lock = threading.Lock()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire `ttl` seconds after they are set."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0, name: str = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self.generation = 0                 # bumped by every invalidation, see get_or_load()
+        self._data = OrderedDict()          # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(("hits", "misses", "expired", "evicted", "invalidated"), 0)
+        label = name or "unnamed"
+        self._hits = metrics.CACHE_LOOKUPS.labels(label, "hit")
+        self._misses = metrics.CACHE_LOOKUPS.labels(label, "miss")
+        self._evictions = {reason: metrics.CACHE_EVICTIONS.labels(label, reason)
+                           for reason in ("expired", "evicted", "invalidated")}
+
+    def _count(self, stat: str, n: int = 1):
+        # Caller holds self._lock
+        if not n:
+            return
+        self._stats[stat] += n
+        if stat == "hits":
+            self._hits.inc(n)
+        elif stat == "misses":
+            self._misses.inc(n)
+        else:
+            self._evictions[stat].inc(n)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._count("misses")
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self._count("expired")
+                self._count("misses")
+                return default
+            self._data.move_to_end(key)
+            self._count("hits")
+            return value
+
+    def set(self, key, value, generation: int = None):
+        """Store a value; with `generation`, only if nothing was invalidated since it was read."""
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._count("evicted")
+
+    def get_or_load(self, key, load):
+        """The cached value, or load() stored and returned. None results are not cached."""
+        value = self.get(key)
+        if value is None:
+            generation = self.generation
+            value = load()
+            if value is not None:
+                self.set(key, value, generation)
+        return value
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return entry[1] if entry else None
+
+    def invalidate(self, *prefix: str) -> int:
+        """Drop every key starting with `prefix` (all keys if none). Returns how many were dropped."""
+        with self._lock:
+            self.generation += 1
+            if not prefix:
+                dropped = len(self._data)
+                self._data.clear()
+            else:
+                n = len(prefix)
+                stale = [key for key in self._data
+                         if (key[:n] if isinstance(key, tuple) else (key,)) == prefix]
+                for key in stale:
+                    del self._data[key]
+                dropped = len(stale)
+            self._count("invalidated", dropped)
+            return dropped
+
+    def clear(self):
+        self.invalidate()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                "name": self.name, "size": len(self._data), "maxsize": self.maxsize, "ttl": self.ttl,
+                **self._stats, "hit_ratio": round(self._stats["hits"] / lookups, 4) if lookups else None,
+            }
+
+    def __len__(self):
+        return len(self._data)
+
+
+def named(name: str, maxsize: int = 1024, ttl: float = 60.0) -> TTLCache:
+    """Create a cache registered under `name` (one per name per process)."""
+    with _caches_lock:
+        if name in _caches:
+            raise ValueError(f"A cache named {name!r} already exists")
+        _caches[name] = TTLCache(maxsize=maxsize, ttl=ttl, name=name)
+        return _caches[name]
+
+
+def get_cache(name: str):
+    return _caches.get(name)
+
+
+def all_stats() -> list:
+    return [c.stats() for c in list(_caches.values())]
@@ -0,0 +1,117 @@
+"""
+Buffered patient check-ins.
+
+POST /workload/check-in is called once per arriving patient, so a busy clinic
+would otherwise cost one transaction per arrival. Each worker process counts
+arrivals in memory and a background thread writes them every FLUSH_INTERVAL
+seconds as one multi-row upsert:
+
+    patient_count = daily_workload.patient_count + <arrivals since last flush>
+
+The increment happens in Postgres against the (phc_id, date) unique
+constraint, so any number of worker processes can flush concurrently without
+losing counts. A failed flush puts its arrivals back in the buffer, and the
+buffer is flushed once more on shutdown. Arrivals still in memory if a worker
+is killed outright (SIGKILL, OOM) are lost; that is the price of batching.
+
+Check-ins add to the day's total; POST /workload/submit overwrites it.
+"""
+import os
+import threading
+from datetime import date
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+
+from buffers import PeriodicFlusher
+from database import SessionLocal
+from models import DailyWorkload
+import invalidation
+import overload
+import rollups
+from registry import registry
+
+FLUSH_INTERVAL = float(os.getenv("CHECKIN_FLUSH_SECONDS", "2"))
+
+
+def write_increments(batch: dict):
+    """Add {(phc_id, lga_id, day): arrivals} to daily_workload in one transaction."""
+    # Sorted so concurrent flushes from several workers lock rows in the same order
+    keys = sorted(batch)
+    db = SessionLocal()
+    try:
+        rows = []
+        for phc_id, lga_id, day in keys:
+            count, capacity = batch[(phc_id, lga_id, day)], registry.capacity(db, phc_id)
+            rows.append({
+                "phc_id": phc_id,
+                "date": day,
+                "patient_count": count,
+                "capacity": capacity,
+                "overload_streak": overload.streak_values(phc_id, day, count, capacity),
+            })
+        stmt = insert(DailyWorkload).values(rows)
+        new_count = func.coalesce(DailyWorkload.patient_count, 0) + stmt.excluded.patient_count
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_daily_workload_phc_date",
+            set_={
+                "patient_count": new_count,
+                "overload_streak": overload.streak_on_conflict(new_count),
+            },
+        ).returning(DailyWorkload.phc_id, DailyWorkload.overload_streak)
+        streaks = db.execute(stmt).all()
+        for phc_id, lga_id, day in keys:
+            rollups.workload_changed(db, phc_id, lga_id, day)
+        for lga_id in sorted({lga_id for _, lga_id, _ in keys}):
+            invalidation.publish(db, "lga_summary", lga_id)
+        # A check-in that tips a facility into its third overloaded day raises the alert now
+        overload.open_staffing_issues(db, [phc_id for phc_id, streak in streaks if streak >= overload.STREAK_DAYS])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+class CheckinBuffer(PeriodicFlusher):
+    """Per-process arrival counts, written to the database in batches."""
+    name = "check-in"
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL, writer=write_increments):
+        super().__init__(flush_interval)
+        self.writer = writer
+        self._pending = {}                  # (phc_id, lga_id, day) -> arrivals not yet written
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock() # one flush at a time per process
+
+    def add(self, phc_id: str, lga_id: str, day: date, count: int = 1) -> int:
+        """Record arrivals; returns how many are waiting to be written for that facility-day."""
+        key = (phc_id, lga_id, day)
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + count
+            return self._pending[key]
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(self._pending.values())
+
+    def flush(self) -> int:
+        """Write everything buffered so far. Returns the number of arrivals written."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            try:
+                self.writer(batch)
+            except Exception:
+                # Put the arrivals back so the next flush retries them
+                with self._lock:
+                    for key, count in batch.items():
+                        self._pending[key] = self._pending.get(key, 0) + count
+                raise
+            return sum(batch.values())
+
+
+buffer = CheckinBuffer()
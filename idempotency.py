@@ -0,0 +1,364 @@
+"""
+Idempotency keys for mutating requests.
+
+Clients on unstable networks retry POST /inventory/restock-requests, POST
+/reports/issues, POST /workload/submit, .../receive and the rest when a
+response is lost. Each retry ran the whole handler again and could create
+a second row. Now a client sends an `Idempotency-Key` header (any unique
+string, e.g. a UUID made when the user pressed the button) on a POST, PUT,
+PATCH or DELETE. The first request with that key runs. Retries get its
+response back, status, headers and body byte-for-byte, with an extra
+`Idempotent-Replayed: true` header. Requests without the header are
+untouched.
+
+Keys are scoped to the caller (a hash of the Authorization header), the
+method and the path. The same key on another endpoint, or from another
+user, is a different key. Reusing a key with a different body or query is
+a client bug and gets 422.
+
+Storage: one row per key in idempotency_keys, kept compact:
+- the primary key is 16 bytes of SHA-256 over caller, method, path and key;
+- the request fingerprint is 16 more bytes;
+- the response is its status, its raw headers and its body, as bytea.
+  Postgres compresses bodies over ~2 kB (TOAST), so there is no compression
+  here.
+Rows expire after IDEMPOTENCY_TTL_HOURS. run_sweeper() deletes expired
+rows in chunks every 15 minutes (scheduler.py). Until then, an expired key
+is treated as unused.
+
+Claiming: the first request inserts the row with no status ("in flight")
+and commits, before the handler runs. A row expired or in flight for
+longer than IN_FLIGHT_TIMEOUT (its worker died) is taken over by the same
+statement. Every other request with the key finds the row and either:
+- replays the stored response;
+- or, while it is in flight, waits for it. Completion sends a NOTIFY on
+  CHANNEL, received over the LISTEN connection every worker already holds
+  (invalidation.listen), and the waiter replays. Waiters also re-check
+  every POLL_SECONDS, so a lost notification costs a little latency, not a
+  hang. After WAIT_SECONDS they get 409 with Retry-After.
+
+What is stored: responses below 500. A 5xx, an exception, or a body over
+MAX_STORED_BYTES releases the key (the row is deleted), so the next retry
+runs the handler again. Waiters on a released key compete to claim it.
+
+The handler commits its own transaction before the response is stored. A
+worker that dies in between leaves the key in flight, and a retry after
+IN_FLIGHT_TIMEOUT runs again. That window is milliseconds wide, against
+the whole request before.
+
+/auth/ is excluded: its responses are access tokens, which should not be
+kept in a table for a day.
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from datetime import timedelta
+
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+
+import invalidation
+import metrics
+from database import engine
+from models import IdempotencyKey
+
+HEADER = b"idempotency-key"
+REPLAYED_HEADER = (b"idempotent-replayed", b"true")
+METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+EXCLUDED_PREFIXES = ("/auth/",)
+CHANNEL = "idempotency_done"
+MAX_KEY_LENGTH = 255
+MAX_REQUEST_BYTES = 1024 * 1024
+MAX_STORED_BYTES = 1024 * 1024
+TTL = timedelta(hours=float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24")))
+IN_FLIGHT_TIMEOUT = timedelta(minutes=5)     # longer than any request; a claim older than this was abandoned
+WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+POLL_SECONDS = 0.5
+SWEEP_CHUNK = 10_000
+SWEEP_LOCK = "idempotency.sweep"
+
+# Inserts the in-flight row, or takes over an expired or abandoned one.
+# Returns a row only if this request now owns the key.
+_CLAIM = """
+INSERT INTO idempotency_keys (key, fingerprint, created_at, expires_at)
+VALUES (:key, :fingerprint, now(), now() + :ttl)
+ON CONFLICT (key) DO UPDATE
+SET fingerprint = EXCLUDED.fingerprint, status_code = NULL, headers = NULL, body = NULL,
+    created_at = now(), expires_at = EXCLUDED.expires_at
+WHERE idempotency_keys.expires_at <= now()
+   OR (idempotency_keys.status_code IS NULL AND idempotency_keys.created_at < now() - :in_flight)
+RETURNING true
+"""
+
+_FIND = """
+SELECT fingerprint, status_code, headers, body FROM idempotency_keys
+WHERE key = :key AND expires_at > now()
+"""
+
+_STORE = """
+WITH stored AS (
+    UPDATE idempotency_keys SET status_code = :status, headers = :headers, body = :body
+    WHERE key = :key AND fingerprint = :fingerprint AND status_code IS NULL
+    RETURNING key
+)
+SELECT pg_notify(:channel, :hex) FROM stored
+"""
+
+_RELEASE = """
+WITH released AS (
+    DELETE FROM idempotency_keys
+    WHERE key = :key AND fingerprint = :fingerprint AND status_code IS NULL
+    RETURNING key
+)
+SELECT pg_notify(:channel, :hex) FROM released
+"""
+
+
+# ---------------- KEYS ----------------
+def _hash(*parts: bytes) -> bytes:
+    return hashlib.sha256(b"\0".join(parts)).digest()[:16]
+
+
+def _header(scope, name: bytes) -> bytes:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value
+    return None
+
+
+def _encode_headers(headers) -> bytes:
+    return b"\n".join(name + b":" + value for name, value in headers)
+
+
+def _decode_headers(raw: bytes) -> list:
+    return [tuple(line.split(b":", 1)) for line in raw.split(b"\n")] if raw else []
+
+
+# ---------------- STORE (run in the threadpool) ----------------
+def _claim(key: bytes, fingerprint: bytes):
+    """True if this request owns the key, else the stored row (None if it just vanished)."""
+    with engine.begin() as conn:
+        params = {"key": key, "fingerprint": fingerprint, "ttl": TTL, "in_flight": IN_FLIGHT_TIMEOUT}
+        if conn.execute(text(_CLAIM), params).scalar():
+            return True
+        return conn.execute(text(_FIND), {"key": key}).first()
+
+
+def _store(key: bytes, fingerprint: bytes, status: int, headers, body: bytes):
+    with engine.begin() as conn:
+        conn.execute(text(_STORE), {"key": key, "fingerprint": fingerprint, "status": status,
+                                    "headers": _encode_headers(headers), "body": body,
+                                    "channel": CHANNEL, "hex": key.hex()})
+
+
+def _release(key: bytes, fingerprint: bytes):
+    with engine.begin() as conn:
+        conn.execute(text(_RELEASE), {"key": key, "fingerprint": fingerprint, "channel": CHANNEL,
+                                      "hex": key.hex()})
+
+
+# ---------------- WAITERS ----------------
+class Waiters:
+    """Requests in this worker waiting for a key held by another request."""
+
+    def __init__(self):
+        self._waiting = {}                  # key -> set of (loop, asyncio.Event)
+        self._lock = threading.Lock()
+
+    def add(self, key: bytes):
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._waiting.setdefault(key, set()).add(waiter)
+        return waiter
+
+    def discard(self, key: bytes, waiter):
+        with self._lock:
+            waiting = self._waiting.get(key)
+            if waiting is not None:
+                waiting.discard(waiter)
+                if not waiting:
+                    del self._waiting[key]
+
+    def wake(self, key: bytes = None):
+        """Wake the waiters for `key`, or all of them. Safe from any thread."""
+        with self._lock:
+            if key is None:
+                woken = [w for waiting in self._waiting.values() for w in waiting]
+            else:
+                woken = list(self._waiting.get(key, ()))
+        for loop, event in woken:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(event.set)
+
+    def __len__(self):
+        return sum(len(waiting) for waiting in self._waiting.values())
+
+
+waiters = Waiters()
+
+
+def _on_notify(payload: str):
+    try:
+        key = bytes.fromhex(payload)
+    except ValueError:
+        print(f"Ignoring malformed idempotency notification: {payload[:200]}")
+        return
+    waiters.wake(key)
+
+
+# Notifications sent while the connection was down are lost; everyone re-checks
+invalidation.listen(CHANNEL, _on_notify, waiters.wake)
+
+
+# ---------------- MIDDLEWARE ----------------
+async def _error(scope, receive, send, status: int, detail: str, headers: dict = None):
+    await JSONResponse({"detail": detail}, status_code=status, headers=headers)(scope, receive, send)
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in METHODS or scope["path"].startswith(EXCLUDED_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+        client_key = _header(scope, HEADER)
+        if client_key is None:
+            await self.app(scope, receive, send)
+            return
+        if not client_key or len(client_key) > MAX_KEY_LENGTH:
+            await _error(scope, receive, send, 400, f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters")
+            return
+
+        # The fingerprint needs the whole body; the app is handed it back below
+        chunks, size, more = [], 0, True
+        while more:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            more = message.get("more_body", False)
+            if size > MAX_REQUEST_BYTES:
+                await _error(scope, receive, send, 413, "Request body too large for an idempotent request")
+                return
+        body = b"".join(chunks)
+
+        method, path = scope["method"].encode(), scope["path"].encode()
+        key = _hash(_header(scope, b"authorization") or b"", method, path, client_key)
+        fingerprint = _hash(scope.get("query_string", b""), body)
+        await self._handle(scope, receive, send, key, fingerprint, body)
+
+    async def _handle(self, scope, receive, send, key: bytes, fingerprint: bytes, body: bytes):
+        deadline = time.monotonic() + WAIT_SECONDS
+        waited = False
+        while True:
+            # Registered before looking, so a completion in between still wakes us
+            waiter = waiters.add(key)
+            try:
+                row = await run_in_threadpool(_claim, key, fingerprint)
+                if row is True:
+                    await self._execute(scope, receive, send, key, fingerprint, body)
+                    return
+                if row is not None and bytes(row.fingerprint) != fingerprint:
+                    metrics.IDEMPOTENT_REQUESTS.labels("mismatch").inc()
+                    await _error(scope, receive, send, 422,
+                                 "Idempotency-Key was already used with a different request")
+                    return
+                if row is not None and row.status_code is not None:
+                    metrics.IDEMPOTENT_REQUESTS.labels("waited" if waited else "replayed").inc()
+                    await self._replay(send, row)
+                    return
+                if row is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        metrics.IDEMPOTENT_REQUESTS.labels("in_flight").inc()
+                        await _error(scope, receive, send, 409,
+                                     "A request with this Idempotency-Key is still in progress",
+                                     headers={"Retry-After": "1"})
+                        return
+                    waited = True
+                    try:
+                        await asyncio.wait_for(waiter[1].wait(), timeout=min(POLL_SECONDS, remaining))
+                    except asyncio.TimeoutError:
+                        pass
+                # row is None: released or expired since the claim; claim again
+            finally:
+                waiters.discard(key, waiter)
+
+    async def _execute(self, scope, receive, send, key: bytes, fingerprint: bytes, body: bytes):
+        status, headers, chunks = None, [], []
+        size, sent_body = 0, False
+
+        async def receive_body():
+            nonlocal sent_body
+            if not sent_body:
+                sent_body = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        async def capture(message):
+            nonlocal status, headers, size
+            if message["type"] == "http.response.start":
+                status, headers = message["status"], list(message.get("headers", []))
+            elif message["type"] == "http.response.body" and size <= MAX_STORED_BYTES:
+                chunk = message.get("body", b"")
+                size += len(chunk)
+                chunks.append(chunk)
+            await send(message)
+
+        completed = False
+        try:
+            await self.app(scope, receive_body, capture)
+            completed = True
+        finally:
+            keep = completed and status is not None and status < 500 and size <= MAX_STORED_BYTES
+            try:
+                if keep:
+                    await run_in_threadpool(_store, key, fingerprint, status, headers, b"".join(chunks))
+                else:
+                    await run_in_threadpool(_release, key, fingerprint)
+            except Exception as e:
+                # Left in flight: retries wait, then take it over after IN_FLIGHT_TIMEOUT
+                print(f"Could not {'store' if keep else 'release'} idempotency key {key.hex()}: {e}")
+            waiters.wake(key)
+            metrics.IDEMPOTENT_REQUESTS.labels("executed" if keep else "released").inc()
+
+    async def _replay(self, send, row):
+        await send({"type": "http.response.start", "status": row.status_code,
+                    "headers": [*_decode_headers(bytes(row.headers)), REPLAYED_HEADER]})
+        await send({"type": "http.response.body", "body": bytes(row.body or b"")})
+
+
+# ---------------- SWEEP ----------------
+def sweep(db: Session, chunk: int = SWEEP_CHUNK) -> int:
+    """Delete expired keys, `chunk` rows per transaction."""
+    swept = 0
+    while True:
+        doomed = select(IdempotencyKey.key).where(IdempotencyKey.expires_at <= func.now()).limit(chunk)
+        deleted = db.query(IdempotencyKey).filter(IdempotencyKey.key.in_(doomed)).delete(synchronize_session=False)
+        db.commit()
+        swept += deleted
+        if deleted < chunk:
+            return swept
+
+
+def run_sweeper():
+    """Scheduler entry point: one sweeper per deployment."""
+    from database import SessionLocal, advisory_lock
+
+    with advisory_lock(SWEEP_LOCK) as locked:
+        if not locked:
+            return
+        db = SessionLocal()
+        try:
+            swept = sweep(db)
+            if swept:
+                print(f"Swept {swept} expired idempotency keys")
+        finally:
+            db.close()
@@ -0,0 +1,208 @@
+"""
+Cross-worker cache invalidation over Postgres LISTEN/NOTIFY.
+
+Each worker keeps its own in-process caches (cache.py, registry.py), so a
+write handled by one worker leaves the others serving stale entries until
+their TTL runs out. Writers call
+
+    invalidation.publish(db, "lga_summary", lga_id)
+
+in the transaction that makes the change. That sends a NOTIFY on
+CHANNEL and, once the Session commits, evicts the matching keys in this
+worker. Postgres delivers a NOTIFY only if its transaction commits, so a
+rolled-back write evicts nothing anywhere.
+
+Every worker runs an InvalidationListener: a daemon thread holding one
+dedicated connection that LISTENs on CHANNEL and applies each event from
+other workers, typically within a few milliseconds. If that connection
+drops, events sent in the meantime are lost, so after reconnecting the
+listener clears every cache it knows about. The TTLs stay as a backstop.
+
+An event names a target and a key prefix of strings. The target is a
+cache.named() cache, or a handler registered with subscribe(), as the
+facility registry does. Only Postgres is needed; there is no broker.
+
+Other modules can share the listener's connection with listen(channel,
+handler), so each worker holds one LISTEN connection however many channels
+it follows. push.py uses it to fan dashboard events out to every worker.
+"""
+import json
+import os
+import select
+import threading
+import time
+import uuid
+
+from sqlalchemy import event, func, select as sql_select
+from sqlalchemy.orm import Session
+
+import cache
+import metrics
+
+CHANNEL = "cache_invalidation"
+POLL_SECONDS = 1.0
+HEARTBEAT_SECONDS = 30.0                            # an idle connection is checked this often
+MAX_BACKOFF_SECONDS = 30.0
+ORIGIN = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"    # this process; its own events are applied on commit
+
+_handlers = {}                                      # target -> callable(*prefix)
+_channels = {}                                      # other channel -> (callable(payload), callable() on reconnect)
+
+
+def subscribe(target: str, handler):
+    """Call handler(*prefix) for events on `target` that is not a named cache."""
+    _handlers[target] = handler
+
+
+def listen(channel: str, handler, on_reconnect=None):
+    """
+    Also LISTEN on `channel` and call handler(payload) for each notification.
+    on_reconnect() runs after the connection is re-established, since
+    notifications sent while it was down are lost. Register before start().
+    """
+    _channels[channel] = (handler, on_reconnect)
+
+
+def apply(target: str, prefix: tuple = ()):
+    handler = _handlers.get(target)
+    if handler is not None:
+        handler(*prefix)
+        return
+    named = cache.get_cache(target)
+    if named is not None:
+        named.invalidate(*prefix)
+
+
+def apply_everywhere():
+    """Drop every cache and notify every handler (after events may have been missed)."""
+    for target in list(_handlers):
+        apply(target)
+    for stats in cache.all_stats():
+        if stats["name"] not in _handlers:
+            apply(stats["name"])
+
+
+# ---------------- PUBLISH ----------------
+def publish(db: Session, target: str, *prefix):
+    """Evict `target` entries starting with `prefix` in every worker, once `db` commits."""
+    prefix = tuple(str(part) for part in prefix)
+    payload = json.dumps({"origin": ORIGIN, "target": target, "prefix": prefix, "at": time.time()})
+    db.execute(sql_select(func.pg_notify(CHANNEL, payload)))
+    db.info.setdefault("pending_invalidations", []).append((target, prefix))
+    metrics.INVALIDATION_EVENTS.labels("published").inc()
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_local(session):
+    for target, prefix in session.info.pop("pending_invalidations", ()):
+        apply(target, prefix)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_local(session, transaction):
+    # Runs after after_commit; anything still pending was rolled back. Savepoints
+    # ending do not count, their events belong to the outer transaction.
+    if transaction.parent is None:
+        session.info.pop("pending_invalidations", None)
+
+
+# ---------------- LISTEN ----------------
+class InvalidationListener:
+    """Daemon thread applying other workers' invalidation events."""
+
+    def __init__(self, channel: str = CHANNEL):
+        self.channel = channel
+        self.connected = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _connect(self):
+        from database import engine
+
+        # A connection of its own, outside the pool, in autocommit so
+        # notifications are delivered as they arrive
+        pooled = engine.raw_connection()
+        conn = pooled.driver_connection
+        pooled.detach()
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            for channel in (self.channel, *_channels):
+                cursor.execute(f"LISTEN {channel}")
+        return conn
+
+    def _handle(self, payload: str):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            print(f"Ignoring malformed cache invalidation: {payload[:200]}")
+            return
+        if message.get("origin") == ORIGIN:
+            return
+        apply(message["target"], tuple(message.get("prefix") or ()))
+        metrics.INVALIDATION_EVENTS.labels("received").inc()
+        if message.get("at"):
+            metrics.INVALIDATION_LAG.observe(max(0.0, time.time() - message["at"]))
+
+    def _run(self):
+        backoff = 1.0
+        reconnecting = False
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = self._connect()
+                # Anything cached while no connection was listening may be stale
+                apply_everywhere()
+                if reconnecting:
+                    print("Cache invalidation listener reconnected; cleared local caches.")
+                    for _, on_reconnect in list(_channels.values()):
+                        if on_reconnect is not None:
+                            on_reconnect()
+                backoff = 1.0
+                self.connected.set()
+                last_seen = time.monotonic()
+                while not self._stop.is_set():
+                    readable, _, _ = select.select([conn], [], [], POLL_SECONDS)
+                    if not readable:
+                        if time.monotonic() - last_seen > HEARTBEAT_SECONDS:
+                            # A half-open TCP connection never becomes readable; this raises instead
+                            with conn.cursor() as cursor:
+                                cursor.execute("SELECT 1")
+                            last_seen = time.monotonic()
+                        continue
+                    last_seen = time.monotonic()
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        if notify.channel == self.channel:
+                            self._handle(notify.payload)
+                        elif notify.channel in _channels:
+                            _channels[notify.channel][0](notify.payload)
+            except Exception as e:
+                self.connected.clear()
+                reconnecting = True
+                print(f"Cache invalidation listener failed, reconnecting in {backoff:.0f}s: {e}")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF_SECONDS)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="cache-invalidation-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=POLL_SECONDS * 2)
+            self._thread = None
+        self.connected.clear()
+
+
+listener = InvalidationListener()
@@ -0,0 +1,254 @@
+"""
+Durable background jobs on Postgres.
+
+Handlers used to do their secondary work before responding:
+- POST /workload/submit opened the staffing alert;
+- .../receive added the delivered stock to the inventory.
+Now they enqueue a job in the same transaction as their primary write and
+return:
+
+    jobs.enqueue(db, "overload.open_staffing_issues", {"phc_ids": [phc_id]})
+    db.commit()
+
+The job exists only if the write commits, and it is never lost once it has.
+Jobs are rows in the jobs table. A module registers what runs them:
+
+    @jobs.handler("overload.open_staffing_issues", concurrency=2)
+    def _open_staffing_issues(db, payload): ...
+
+Workers: JOB_WORKERS threads per app process (default 2; 0 turns them
+off). Or run `python workers.py` alongside the app with JOB_WORKERS=0 there.
+A worker:
+- claims the oldest due job with SELECT ... FOR UPDATE SKIP LOCKED, so
+  workers in any number of processes never take the same job and never
+  wait on each other;
+- runs the handler in the same transaction, then deletes the job and
+  commits. The handler's writes and the job's completion commit together,
+  so a job's effects are applied once. A worker that dies mid-job rolls
+  back and releases the row for another worker.
+
+Failures: the handler's work is rolled back to a savepoint, with the job
+row still locked. The job is retried after 5 s, 10 s, 20 s ... (at most
+MAX_BACKOFF, with jitter). After max_attempts it is marked "dead" and kept
+for DEAD_RETENTION_DAYS for inspection.
+
+Per-type concurrency: a job of a type with `concurrency=n` also needs one
+of n transaction-level advisory locks ("job:<kind>", slot 0..n-1), taken by
+the claiming statement. The limit holds across all processes. When every
+slot is busy, the worker leaves that type alone until its next idle wait.
+
+Wake-up: enqueue() sends a NOTIFY on CHANNEL when it commits. Workers
+receive it over the LISTEN connection every worker already holds
+(invalidation.listen), and also poll every POLL_SECONDS, so a lost
+notification only delays a job.
+
+Metrics: jobs_total{kind, outcome}, job_duration_seconds and
+job_queue_lag_seconds (due to started).
+"""
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import Session
+
+import invalidation
+import metrics
+from database import SessionLocal
+from models import Job
+
+CHANNEL = "jobs_enqueued"
+WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 5.0
+MAX_BACKOFF = 3600.0
+DEAD_RETENTION_DAYS = 14
+PRUNE_LOCK = "jobs.prune_dead"
+
+# The oldest due job of a type this process can run and whose type is not
+# saturated, locked; and a free concurrency slot for its type (null if none)
+_CLAIM = """
+WITH job AS (
+    SELECT id, kind, payload, attempts, max_attempts, run_at
+    FROM jobs
+    WHERE status = 'queued' AND run_at <= now()
+      AND kind = ANY(:kinds) AND NOT (kind = ANY(:saturated))
+    ORDER BY run_at, id
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED
+)
+SELECT job.*, (
+    SELECT s FROM generate_series(0, l.concurrency - 1) s
+    WHERE pg_try_advisory_xact_lock(hashtext('job:' || job.kind), s)
+    LIMIT 1
+) AS slot
+FROM job JOIN unnest(CAST(:kinds AS text[]), CAST(:limits AS int[])) AS l(kind, concurrency) ON l.kind = job.kind
+"""
+
+
+@dataclass(frozen=True)
+class Handler:
+    kind: str
+    run: callable               # run(db, payload); must not commit
+    concurrency: int
+    max_attempts: int
+
+
+_handlers = {}                  # kind -> Handler
+
+
+def handler(kind: str, concurrency: int = 4, max_attempts: int = MAX_ATTEMPTS):
+    """Register the decorated run(db, payload) for jobs of `kind`."""
+    def register(run):
+        _handlers[kind] = Handler(kind, run, concurrency, max_attempts)
+        return run
+    return register
+
+
+# ---------------- ENQUEUE ----------------
+def enqueue(db: Session, kind: str, payload: dict, delay: float = 0.0):
+    """Add a job in the caller's transaction; workers see it once that commits."""
+    if kind not in _handlers:
+        raise ValueError(f"No job handler registered for '{kind}'")
+    run_at = func.now() + timedelta(seconds=delay) if delay else func.now()
+    db.execute(Job.__table__.insert().values(
+        kind=kind, payload=payload, max_attempts=_handlers[kind].max_attempts, run_at=run_at))
+    db.execute(select(func.pg_notify(CHANNEL, kind)))
+    metrics.JOBS.labels(kind, "enqueued").inc()
+
+
+# ---------------- WORKER ----------------
+def backoff(attempts: int) -> float:
+    """Seconds before retry number `attempts`: doubling from BACKOFF_BASE, with jitter."""
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), MAX_BACKOFF)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def run_one(db: Session, saturated: set) -> bool:
+    """Claim and run one due job. False if there was nothing this worker could take."""
+    kinds = list(_handlers)
+    row = db.execute(text(_CLAIM), {
+        "kinds": kinds, "limits": [_handlers[k].concurrency for k in kinds], "saturated": list(saturated),
+    }).first()
+    if row is None:
+        db.rollback()
+        return False
+    if row.slot is None:
+        # Every slot for this type is taken; try other types, and this one after the next wait
+        db.rollback()
+        saturated.add(row.kind)
+        return True
+
+    job = _handlers[row.kind]
+    started = time.perf_counter()
+    metrics.JOB_LAG.labels(row.kind).observe(
+        max(0.0, (datetime.now(timezone.utc) - row.run_at).total_seconds()))
+    savepoint = db.begin_nested()
+    try:
+        job.run(db, row.payload)
+        savepoint.commit()
+    except Exception as e:
+        savepoint.rollback()
+        attempts = row.attempts + 1
+        dead = attempts >= row.max_attempts
+        db.execute(text("""
+            UPDATE jobs SET attempts = :attempts, last_error = :error,
+                            status = CASE WHEN :dead THEN 'dead' ELSE status END,
+                            run_at = now() + make_interval(secs => :delay)
+            WHERE id = :id
+        """), {"id": row.id, "attempts": attempts, "error": f"{type(e).__name__}: {e}"[:2000], "dead": dead,
+               "delay": 0.0 if dead else backoff(attempts)})
+        db.commit()
+        metrics.JOBS.labels(row.kind, "dead" if dead else "retried").inc()
+        print(f"Job {row.id} ({row.kind}) failed, attempt {attempts} of {row.max_attempts}"
+              f"{'; giving up' if dead else ''}: {e}")
+        return True
+    db.execute(text("DELETE FROM jobs WHERE id = :id"), {"id": row.id})
+    db.commit()
+    metrics.JOBS.labels(row.kind, "done").inc()
+    metrics.JOB_SECONDS.labels(row.kind).observe(time.perf_counter() - started)
+    return True
+
+
+class WorkerPool:
+    """Threads running jobs until stop()."""
+
+    def __init__(self, workers: int = WORKERS, poll_seconds: float = POLL_SECONDS):
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._threads = []
+
+    def wake(self, *_):
+        self._wake.set()
+
+    def _run(self):
+        saturated = set()
+        db = SessionLocal()
+        try:
+            while not self._stop.is_set():
+                try:
+                    if run_one(db, saturated):
+                        continue
+                except Exception as e:
+                    # Database unreachable or the session broken: back off, then start clean
+                    db.rollback()
+                    print(f"Job worker failed, retrying in {self.poll_seconds:.0f}s: {e}")
+                    self._stop.wait(self.poll_seconds)
+                    continue
+                saturated.clear()
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+        finally:
+            db.close()
+
+    def start(self):
+        if self._threads or self.workers <= 0:
+            return
+        self._stop.clear()
+        self._threads = [threading.Thread(target=self._run, name=f"job-worker-{n}", daemon=True)
+                         for n in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Let running jobs finish (up to `timeout`); unstarted ones stay queued."""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+
+
+pool = WorkerPool()
+invalidation.listen(CHANNEL, pool.wake, pool.wake)
+
+
+# ---------------- DEAD JOBS ----------------
+def prune_dead(db: Session, retention_days: int = DEAD_RETENTION_DAYS) -> int:
+    """Delete jobs that gave up more than `retention_days` ago (run_at is when they died)."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    deleted = db.query(Job).filter(Job.status == "dead", Job.run_at < cutoff).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+def run_dead_job_pruner():
+    """Scheduler entry point: one pruner per deployment."""
+    from database import advisory_lock
+
+    with advisory_lock(PRUNE_LOCK) as locked:
+        if not locked:
+            return
+        db = SessionLocal()
+        try:
+            deleted = prune_dead(db)
+            if deleted:
+                print(f"Pruned {deleted} dead jobs older than {DEAD_RETENTION_DAYS} days")
+        finally:
+            db.close()
@@ -1,9 +1,20 @@
-from fastapi import FastAPI
-from routers import patients, inventory, auth, reports, workload
-from database import Base, engine
+import os
+from fastapi import FastAPI, Response
+from fastapi.responses import JSONResponse
+from routers import patients, inventory, auth, reports, workload, facilities, sync, events
+from database import engine
 from models import User, Inventory, RestockRequest
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 from fastapi.middleware.cors import CORSMiddleware
+from scheduler import start_scheduler, shutdown_scheduler
+import checkins
+import telemetry
+import metrics
+import invalidation
+import idempotency
+import jobs
+import audit
 
 origins = [
     "http://localhost:3000",
@@ -11,10 +22,8 @@ origins = [
 ]
 
 
-
-
-# Create all tables in the database (if they don't exist)
-Base.metadata.create_all(bind=engine)
+# The schema is managed by alembic (`alembic upgrade head` before deploying),
+# not at import, so a cold start needs no database round trips.
 
 app = FastAPI(
     title="Hack Health API",
@@ -22,6 +31,10 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Innermost, so a replayed response still gets fresh CORS headers and is
+# counted in the metrics (see idempotency.py)
+app.add_middleware(idempotency.IdempotencyMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,       # Allows the origins listed above
@@ -30,12 +43,38 @@ app.add_middleware(
     allow_headers=["*"],         # Allows all headers
 )
 
+# Outermost, so latency covers CORS and every router (see metrics.py)
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Include your patient router
 app.include_router(auth.router)
 app.include_router(patients.router) # Here
 app.include_router(inventory.router)
 app.include_router(reports.router)
 app.include_router(workload.router)
+app.include_router(facilities.router)
+app.include_router(sync.router)
+app.include_router(events.router)
+
+
+@app.on_event("startup")
+def on_startup():
+    invalidation.listener.start()
+    start_scheduler()
+    checkins.buffer.start()
+    telemetry.buffer.start()
+    jobs.pool.start()
+    audit.buffer.start()
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    jobs.pool.stop()
+    audit.buffer.stop()
+    checkins.buffer.stop()
+    telemetry.buffer.stop()
+    shutdown_scheduler()
+    invalidation.listener.stop()
 
 
 
@@ -43,3 +82,52 @@ app.include_router(workload.router)
 @app.get("/")
 def root():
     return {"message": "Welcome, Build and Show The World!"}
+
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
+# ---------------- HEALTH ----------------
+# /health/live answers as soon as the app can serve; /health/ready also
+# needs the database to answer and its schema to be at the newest migration.
+READY_TIMEOUT_MS = 2000
+_schema_head = None
+
+
+def _migration_head() -> str:
+    global _schema_head
+    if _schema_head is None:
+        from alembic.config import Config
+        from alembic.script import ScriptDirectory
+        config = Config(os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini"))
+        _schema_head = ScriptDirectory.from_config(config).get_current_head()
+    return _schema_head
+
+
+@app.get("/health/live", include_in_schema=False)
+def liveness():
+    return {"status": "ok"}
+
+
+@app.get("/health/ready", include_in_schema=False)
+def readiness():
+    try:
+        with engine.connect() as conn:
+            conn.execute(text(f"SET LOCAL statement_timeout = {READY_TIMEOUT_MS}"))
+            migrated = conn.execute(text("SELECT to_regclass('alembic_version') IS NOT NULL")).scalar()
+            revision = conn.execute(text("SELECT version_num FROM alembic_version")).scalar() if migrated else None
+            conn.rollback()
+    except Exception as e:
+        print(f"Readiness check failed: {e}")
+        return JSONResponse(status_code=503, content={"status": "unavailable", "database": "unreachable"})
+
+    head = _migration_head()
+    if revision != head:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "unavailable", "database": "ok", "schema": revision, "expected_schema": head},
+        )
+    return {"status": "ok", "database": "ok", "schema": revision}
@@ -0,0 +1,223 @@
+"""
+Prometheus metrics: per-route latency, SQL statements and DB time per
+request, connection pool wait, Gemini call latency and failures, and
+in-process cache hits, evictions and invalidation lag, live event
+streams (push.py), background jobs (jobs.py) and the audit log (audit.py).
+
+MetricsMiddleware (pure ASGI) times each request and puts a RequestStats in
+a context variable; SQLAlchemy cursor events and TimedQueuePool add to it.
+Sync endpoints run in the threadpool with a copy of the context, so they
+see the same object. Routes are labelled by their template
+("/reports/{report_id}"), never the raw path.
+
+A request that runs more than SQL_STATEMENT_WARN statements (default 50)
+logs a warning, so N+1 loops show up before they are slow.
+
+GET /metrics serves the text format. With several workers, set
+PROMETHEUS_MULTIPROC_DIR to an empty directory and the endpoint aggregates
+across them.
+"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+SQL_STATEMENT_WARN = int(os.getenv("SQL_STATEMENT_WARN", "50"))
+STATEMENT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+FAST_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5)
+LLM_BUCKETS = (.25, .5, 1, 2, 4, 8, 15, 30, 60, 120)
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Request latency, until the response body is sent.",
+    ["method", "route", "status"],
+)
+REQUEST_STATEMENTS = Histogram(
+    "http_request_sql_statements", "SQL statements run per request.",
+    ["method", "route"], buckets=STATEMENT_BUCKETS,
+)
+REQUEST_DB_SECONDS = Histogram(
+    "http_request_db_seconds", "Time per request spent executing SQL.",
+    ["method", "route"], buckets=FAST_BUCKETS,
+)
+REQUEST_POOL_WAIT = Histogram(
+    "http_request_pool_wait_seconds", "Time per request spent waiting for a pooled connection.",
+    ["method", "route"], buckets=FAST_BUCKETS,
+)
+STATEMENT_WARNINGS = Counter(
+    "http_request_statement_warnings_total", "Requests that ran more than SQL_STATEMENT_WARN statements.",
+    ["method", "route"],
+)
+POOL_WAIT = Histogram(
+    "db_pool_wait_seconds", "Time to get a connection from the pool (requests and background jobs).",
+    buckets=FAST_BUCKETS,
+)
+LLM_SECONDS = Histogram(
+    "llm_request_duration_seconds", "Gemini call latency (whole stream for streaming calls).",
+    ["operation"], buckets=LLM_BUCKETS,
+)
+LLM_FAILURES = Counter("llm_request_failures_total", "Gemini calls that raised.", ["operation"])
+CACHE_LOOKUPS = Counter("cache_lookups_total", "In-process cache lookups.", ["cache", "result"])
+CACHE_EVICTIONS = Counter(
+    "cache_evictions_total", "Entries dropped from in-process caches (expired, evicted for size, invalidated).",
+    ["cache", "reason"],
+)
+INVALIDATION_EVENTS = Counter(
+    "cache_invalidation_events_total", "Cache invalidation events published and received over NOTIFY.",
+    ["direction"],
+)
+INVALIDATION_LAG = Histogram(
+    "cache_invalidation_lag_seconds", "From publishing an invalidation to another worker applying it.",
+    buckets=FAST_BUCKETS,
+)
+PUSH_SUBSCRIBERS = Gauge(
+    "push_subscribers", "Open event streams.", multiprocess_mode="livesum",
+)
+PUSH_EVENTS = Counter(
+    "push_events_total", "Dashboard events published, received by a worker, and queued for its subscribers.",
+    ["stage"],
+)
+PUSH_DROPPED = Counter("push_dropped_subscribers_total", "Event streams ended because the client fell behind.")
+PUSH_LAG = Histogram(
+    "push_event_lag_seconds", "From publishing an event to a worker queueing it for its subscribers.",
+    buckets=FAST_BUCKETS,
+)
+
+IDEMPOTENT_REQUESTS = Counter(
+    "idempotent_requests_total",
+    "Requests with an Idempotency-Key: executed, released (not stored), replayed, waited then replayed, "
+    "in_flight (gave up waiting) and mismatch (key reused with another body).",
+    ["outcome"],
+)
+JOBS = Counter(
+    "jobs_total", "Background jobs enqueued, done, retried after a failure, and dead (out of attempts).",
+    ["kind", "outcome"],
+)
+JOB_SECONDS = Histogram("job_duration_seconds", "Time to run a background job that succeeded.", ["kind"])
+JOB_LAG = Histogram(
+    "job_queue_lag_seconds", "From a background job becoming due to a worker starting it.", ["kind"],
+    buckets=FAST_BUCKETS,
+)
+AUDIT_EVENTS = Counter(
+    "audit_events_total",
+    "Audit events written in the request's transaction, buffered, flushed, written directly because the "
+    "buffer was full, and dropped.",
+    ["path"],
+)
+
+@dataclass
+class RequestStats:
+    statements: int = 0
+    db_seconds: float = 0.0
+    pool_wait: float = 0.0
+
+
+_current = ContextVar("request_stats", default=None)
+
+
+# ---------------- SQLALCHEMY HOOKS ----------------
+# Registered on the Engine class, so they cover every engine the app creates
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    started = conn.info.get("query_started")
+    if stats is not None and started:
+        stats.statements += 1
+        stats.db_seconds += time.perf_counter() - started.pop()
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    started = context.connection.info.get("query_started") if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited (including opening a new connection)."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            POOL_WAIT.observe(waited)
+            stats = _current.get()
+            if stats is not None:
+                stats.pool_wait += waited
+
+
+# ---------------- GEMINI ----------------
+@contextmanager
+def track_llm(operation: str):
+    """Time a Gemini call and count it as failed if it raises."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        LLM_FAILURES.labels(operation).inc()
+        raise
+    finally:
+        LLM_SECONDS.labels(operation).observe(time.perf_counter() - started)
+
+
+# ---------------- MIDDLEWARE ----------------
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _current.reset(token)
+            elapsed = time.perf_counter() - started
+            route = getattr(scope.get("route"), "path", "unmatched")
+            method = scope["method"]
+            REQUEST_SECONDS.labels(method, route, str(status)).observe(elapsed)
+            REQUEST_STATEMENTS.labels(method, route).observe(stats.statements)
+            REQUEST_DB_SECONDS.labels(method, route).observe(stats.db_seconds)
+            REQUEST_POOL_WAIT.labels(method, route).observe(stats.pool_wait)
+            if stats.statements > SQL_STATEMENT_WARN:
+                STATEMENT_WARNINGS.labels(method, route).inc()
+                print(
+                    f"Warning: {method} {route} ran {stats.statements} SQL statements "
+                    f"(limit {SQL_STATEMENT_WARN}, {stats.db_seconds * 1000:.1f} ms in the database)"
+                )
+
+
+def render() -> tuple:
+    """(body, content type) for GET /metrics."""
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
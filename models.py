@@ -1,7 +1,7 @@
-from sqlalchemy import Column, Integer, String, Text, ARRAY, DateTime, Float, ForeignKey, Boolean, Date
+from sqlalchemy import Column, Integer, String, Text, ARRAY, DateTime, Float, ForeignKey, Boolean, Date, UniqueConstraint, BigInteger, Index, text, LargeBinary, SmallInteger
 from sqlalchemy.sql import func
 from sqlalchemy.orm import declarative_base, relationship
-from sqlalchemy.dialects.postgresql import ENUM
+from sqlalchemy.dialects.postgresql import ENUM, JSONB
 from datetime import datetime, date
 import enum
 from database import Base
@@ -44,9 +44,28 @@ class User(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     
 
+# ---------------- FACILITIES ----------------
+# One row per PHC, registered at signup. Routers read it through the
+# in-process cache in registry.py rather than trusting names and LGAs in the JWT.
+class Facility(Base):
+    __tablename__ = "facilities"
+
+    id = Column(Integer, primary_key=True, index=True)
+    phc_id = Column(String, unique=True, nullable=False, index=True)
+    name = Column(String, nullable=False)
+    lga_id = Column(String, nullable=False, index=True)
+    capacity = Column(Integer, nullable=False, default=50, server_default="50")  # patients per day
+    staff_count = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
 # ---------------- INVENTORY ----------------
 class Inventory(Base):
     __tablename__ = "inventory"
+    __table_args__ = (
+        Index("ix_inventory_phc_change", "phc_id", "change_xid"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     phc_id = Column(String, nullable=False, index=True)        # "phc-007"
     phc_name = Column(String, nullable=False)
@@ -56,16 +75,24 @@ class Inventory(Base):
     unit = Column(String, default="units")
     daily_consumption_rate = Column(Float, default=0.0)
     last_updated = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    change_xid = Column(BigInteger, nullable=False, server_default="0")   # set by trigger, see sync.py
 
 
+# restock_requests, issues and monthly_reports are list-partitioned by lga_id
+# (migration 0004, partitions.py), so their primary keys are (lga_id, id).
+# Filter on lga_id wherever possible; it confines a query to one partition.
 class RestockRequest(Base):
     __tablename__ = "restock_requests"
-    id = Column(Integer, primary_key=True, index=True)
+    __table_args__ = (
+        Index("ix_restock_requests_phc_change", "phc_id", "change_xid"),
+        Index("ix_restock_requests_lga_change", "lga_id", "change_xid"),
+    )
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     item_name = Column(String, nullable=False)
     quantity_needed = Column(Integer, nullable=False)
     phc_id = Column(String, nullable=False, index=True)
     phc_name = Column(String, nullable=False)
-    lga_id = Column(String, nullable=False, index=True)
+    lga_id = Column(String, primary_key=True)             # partition key, see partitions.py
     requested_by = Column(String, nullable=False)          # operator_name → real person today
     request_date = Column(DateTime(timezone=True), server_default=func.now())
     status = Column(String, default="pending")            # pending, approved, declined
@@ -73,6 +100,28 @@ class RestockRequest(Base):
     processed_by = Column(String, nullable=True)
     processed_at = Column(DateTime(timezone=True), nullable=True)
     priority_level = Column(String, nullable=True)
+    change_xid = Column(BigInteger, nullable=False, server_default="0")   # set by trigger, see sync.py
+
+
+
+# ---------------- STOCK TRANSFERS ----------------
+# One row per stock moved between two facilities of an LGA. Both inventory
+# rows change in the same transaction (see transfers.py).
+class StockTransfer(Base):
+    __tablename__ = "stock_transfers"
+    __table_args__ = (
+        Index("ix_stock_transfers_lga_created", "lga_id", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    lga_id = Column(String, nullable=False)
+    item_name = Column(String, nullable=False)
+    from_phc_id = Column(String, nullable=False)
+    to_phc_id = Column(String, nullable=False)
+    quantity = Column(Integer, nullable=False)
+    restock_request_id = Column(Integer, nullable=True)   # the request it covered, if any
+    created_by = Column(String, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
 
 
@@ -99,38 +148,261 @@ class Patient(Base):
 # In models.py - Add lga_id to these tables
 class Issue(Base):
     __tablename__ = "issues"
-    id = Column(Integer, primary_key=True, index=True)
+    __table_args__ = (
+        # At most one open automated staffing alert per facility (see overload.py)
+        Index(
+            "uq_issues_open_staffing_shortage", "lga_id", "phc_id", unique=True,
+            postgresql_where=text("automated AND category = 'Staffing Shortage' AND status IN ('Open', 'In Progress')"),
+        ),
+        Index("ix_issues_phc_change", "phc_id", "change_xid"),
+        Index("ix_issues_lga_change", "lga_id", "change_xid"),
+    )
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     phc_id = Column(String, nullable=False, index=True)
-    lga_id = Column(String, nullable=False, index=True) # <--- NEW
+    lga_id = Column(String, primary_key=True)          # partition key, see partitions.py
     phc_name = Column(String, nullable=True)           # <--- Useful for Admin UI
     category = Column(String, nullable=False)
     priority = Column(String, default="Medium")
     description = Column(String, nullable=False)
     status = Column(String, default="Open") # Open, In Progress, Resolved
+    automated = Column(Boolean, nullable=False, default=False, server_default="false")   # opened by overload.py
     created_at = Column(DateTime, default=datetime.utcnow)
+    change_xid = Column(BigInteger, nullable=False, server_default="0")   # set by trigger, see sync.py
 
 class MonthlyReport(Base):
     __tablename__ = "monthly_reports"
-    id = Column(Integer, primary_key=True, index=True)
+    __table_args__ = (
+        UniqueConstraint("lga_id", "phc_id", "month", name="uq_monthly_reports_lga_phc_month"),
+        Index("ix_monthly_reports_phc_change", "phc_id", "change_xid"),
+        Index("ix_monthly_reports_lga_change", "lga_id", "change_xid"),
+    )
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     phc_id = Column(String, nullable=False, index=True)
-    lga_id = Column(String, nullable=False, index=True) # <--- NEW
+    lga_id = Column(String, primary_key=True)          # partition key, see partitions.py
     phc_name = Column(String, nullable=True)           # <--- NEW
     month = Column(String, nullable=False)
     content = Column(String, nullable=False) 
     status = Column(String, default="Draft")
     created_at = Column(DateTime, default=datetime.utcnow)
+    change_xid = Column(BigInteger, nullable=False, server_default="0")   # set by trigger, see sync.py
 
 
 
 class DailyWorkload(Base):
     __tablename__ = "daily_workload"
-    
+    __table_args__ = (
+        UniqueConstraint("phc_id", "date", name="uq_daily_workload_phc_date"),
+    )
+
     id = Column(Integer, primary_key=True, index=True)
     phc_id = Column(String, nullable=False, index=True)
     date = Column(Date, default=lambda: datetime.utcnow().date(), index=True)
     patient_count = Column(Integer, default=0)
     capacity = Column(Integer, default=50)
+    overload_streak = Column(Integer, nullable=False, default=0, server_default="0") # consecutive days over capacity ending on `date`
 
 
+class WorkloadForecast(Base):
+    __tablename__ = "workload_forecasts"
+    __table_args__ = (
+        UniqueConstraint("phc_id", "target_date", name="uq_workload_forecasts_phc_date"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    phc_id = Column(String, nullable=False, index=True)
+    lga_id = Column(String, nullable=False, index=True)
+    phc_name = Column(String, nullable=True)
+    target_date = Column(Date, nullable=False)
+    forecast_load = Column(Integer, nullable=False)
+    forecast_lower = Column(Integer, nullable=True)        # 80% prediction interval
+    forecast_upper = Column(Integer, nullable=True)
+    capacity = Column(Integer, default=50)
+    status = Column(String, nullable=False)                # "Optimal" or "Overwhelmed"
+    generated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+
+# ---------------- QUEUE TELEMETRY ----------------
+# Raw per-minute queue snapshots from each PHC, written in batches by
+# telemetry.py and expired once downsampled into queue_rollups.
+class QueueSnapshot(Base):
+    __tablename__ = "queue_snapshots"
+    __table_args__ = (
+        Index("ix_queue_snapshots_phc_recorded", "phc_id", "recorded_at"),
+    )
+
+    id = Column(BigInteger, primary_key=True)
+    phc_id = Column(String, nullable=False)
+    recorded_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    current_queue_count = Column(Integer, nullable=False)
+    avg_wait_time = Column(Float, nullable=False)          # minutes
+    completed_visits_today = Column(Integer, nullable=False)
+
+
+# 15-minute and daily aggregates of queue_snapshots. Sums are stored rather
+# than averages so a bucket can be rebuilt from its parts.
+class QueueRollup(Base):
+    __tablename__ = "queue_rollups"
+    __table_args__ = (
+        UniqueConstraint("phc_id", "resolution", "bucket_start", name="uq_queue_rollups_phc_res_bucket"),
+    )
+
+    id = Column(BigInteger, primary_key=True)
+    phc_id = Column(String, nullable=False)
+    resolution = Column(String, nullable=False)            # "15m" or "1d"
+    bucket_start = Column(DateTime(timezone=True), nullable=False)
+    samples = Column(Integer, nullable=False)
+    queue_sum = Column(BigInteger, nullable=False)
+    queue_max = Column(Integer, nullable=False)
+    wait_sum = Column(Float, nullable=False)
+    wait_max = Column(Float, nullable=False)
+    completed_visits = Column(Integer, nullable=False)     # highest cumulative count seen in the bucket
+
+
+# Progress markers for incremental background jobs
+class JobWatermark(Base):
+    __tablename__ = "job_watermarks"
+
+    name = Column(String, primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+# ---------------- MONTHLY ROLLUPS ----------------
+# One row per (phc_id, month), kept up to date by rollups.py in the same
+# transaction as the underlying write. Rebuild with `python rollups.py rebuild`.
+class PhcMonthlyStats(Base):
+    __tablename__ = "phc_monthly_stats"
+    __table_args__ = (
+        UniqueConstraint("phc_id", "month", name="uq_phc_monthly_stats_phc_month"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    phc_id = Column(String, nullable=False, index=True)
+    lga_id = Column(String, nullable=False, index=True)
+    month = Column(String, nullable=False)                 # "2025-10"
+
+    # Restock requests raised this month, and where they currently stand
+    restock_requests = Column(Integer, default=0, nullable=False)
+    restock_pending = Column(Integer, default=0, nullable=False)
+    restock_approved = Column(Integer, default=0, nullable=False)
+    restock_declined = Column(Integer, default=0, nullable=False)
+    restock_cancelled = Column(Integer, default=0, nullable=False)
+    restock_delivered = Column(Integer, default=0, nullable=False)
+
+    # Issues logged this month, and how many are still unresolved
+    issues_logged = Column(Integer, default=0, nullable=False)
+    issues_open = Column(Integer, default=0, nullable=False)
+    issues_open_high = Column(Integer, default=0, nullable=False)
+
+    # Daily workload submissions
+    workload_days = Column(Integer, default=0, nullable=False)
+    patients_seen = Column(Integer, default=0, nullable=False)
+    overload_days = Column(Integer, default=0, nullable=False)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+# ---------------- BACKGROUND JOB RUNS ----------------
+class ReportJobRun(Base):
+    __tablename__ = "report_job_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    month = Column(String, nullable=False, index=True)
+    status = Column(String, default="running")            # running, completed, failed
+    total_facilities = Column(Integer, default=0)
+    processed = Column(Integer, default=0)
+    created = Column(Integer, default=0)                   # drafts that did not exist yet
+    failed = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+    started_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    duration_seconds = Column(Float, nullable=True)
+
+
+# ---------------- LIST VERSIONS (conditional GET) ----------------
+# One counter per list scope, e.g. "issues:lga:lga-ikorodu", bumped in the same
+# transaction as any write that changes what that list returns (see versions.py).
+class ScopeVersion(Base):
+    __tablename__ = "scope_versions"
+
+    scope = Column(String, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+# ---------------- DELTA SYNC ----------------
+# One row per deleted inventory item, restock request, issue or report,
+# written by a trigger so offline clients can drop their copy (see sync.py).
+class SyncTombstone(Base):
+    __tablename__ = "sync_tombstones"
+    __table_args__ = (
+        Index("ix_sync_tombstones_phc_change", "phc_id", "change_xid"),
+        Index("ix_sync_tombstones_lga_change", "lga_id", "change_xid"),
+    )
+
+    id = Column(BigInteger, primary_key=True)
+    table_name = Column(String, nullable=False)
+    row_id = Column(Integer, nullable=False)
+    phc_id = Column(String, nullable=False)
+    lga_id = Column(String, nullable=True)
+    change_xid = Column(BigInteger, nullable=False)
+    deleted_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
+
+
+# ---------------- IDEMPOTENCY KEYS ----------------
+# The stored response for each Idempotency-Key a client sent (see idempotency.py)
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    key = Column(LargeBinary, primary_key=True)            # 16 bytes: caller, method, path and the client's key
+    fingerprint = Column(LargeBinary, nullable=False)      # 16 bytes: query string and body
+    status_code = Column(SmallInteger, nullable=True)      # null while the first request is in flight
+    headers = Column(LargeBinary, nullable=True)
+    body = Column(LargeBinary, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+
+# ---------------- BACKGROUND JOB QUEUE ----------------
+# Side effects enqueued by request handlers in their own transaction and run
+# by jobs.py workers; a row is deleted once its job succeeds.
+class Job(Base):
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # What the workers' claim query scans: due jobs, oldest first
+        Index("ix_jobs_due", "run_at", "id", postgresql_where=text("status = 'queued'")),
+    )
+
+    id = Column(BigInteger, primary_key=True)
+    kind = Column(String, nullable=False)
+    payload = Column(JSONB, nullable=False)
+    status = Column(String, nullable=False, server_default="queued")     # queued, dead
+    attempts = Column(Integer, nullable=False, server_default="0")
+    max_attempts = Column(Integer, nullable=False)
+    run_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
 
+# ---------------- AUDIT LOG ----------------
+# Append-only record of who changed what (see audit.py). Range-partitioned
+# by month on `at` (migration 0008), so the primary key includes it.
+class AuditEvent(Base):
+    __tablename__ = "audit_log"
+    __table_args__ = (
+        Index("ix_audit_log_entity", "entity", "entity_id", "at"),
+        Index("ix_audit_log_lga_at", "lga_id", "at"),
+        {"postgresql_partition_by": "RANGE (at)"},
+    )
+
+    at = Column(DateTime(timezone=True), primary_key=True)
+    id = Column(BigInteger, primary_key=True, server_default=text("nextval('audit_log_id_seq')"))
+    action = Column(String, nullable=False)             # e.g. restock.approved
+    entity = Column(String, nullable=False)             # table name, or e.g. "allocation"
+    entity_id = Column(String, nullable=False)
+    lga_id = Column(String, nullable=True)
+    phc_id = Column(String, nullable=True)
+    actor = Column(String, nullable=False)              # operator name from the JWT, or "system"
+    actor_role = Column(String, nullable=True)
+    changes = Column(JSONB, nullable=False)             # {field: [old, new]} or other details
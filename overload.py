@@ -0,0 +1,219 @@
+"""
+Staffing overload detection.
+
+Each daily_workload row carries overload_streak: how many consecutive
+calendar days, ending on that row's date, the facility was over capacity.
+It is computed inside the workload upsert from the previous day's row, so a
+missing day resets the streak and the submit path never re-reads history.
+
+A scheduled detector re-derives the same thing for every facility with one
+window-function query (gaps-and-islands over the raw rows) and opens the
+"Staffing Shortage" issues that are not already open. It catches facilities
+that went over capacity through check-ins, and acts as the repair path if a
+stored streak is ever stale.
+
+    python overload.py                 # all LGAs, as of today
+    python overload.py --lga lga-a --date 2025-10-14
+"""
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Integer, and_, case, func, literal, literal_column, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session, aliased
+
+from models import DailyWorkload, Facility, Issue
+import invalidation
+import jobs
+import push
+import rollups
+import versions
+
+STREAK_DAYS = 3             # consecutive overloaded days that raise an alert
+LOOKBACK_DAYS = 14          # history the detector scans
+DETECTOR_LOCK = "overload.detector"
+STAFFING_CATEGORY = "Staffing Shortage"
+STAFFING_DESCRIPTION = (
+    "AUTOMATED ALERT: This PHC has exceeded its patient "
+    "capacity for three consecutive days. Immediate staffing "
+    "support is required."
+)
+
+
+# ---------------- INCREMENTAL STREAK ----------------
+def streak_expr(phc_id, day, patient_count, capacity):
+    """
+    SQL for the overload_streak of a (phc_id, day) row holding `patient_count`:
+    yesterday's streak + 1 when over capacity, else 0.
+    """
+    prev = aliased(DailyWorkload)
+    previous = (
+        select(prev.overload_streak)
+        .where(prev.phc_id == phc_id, prev.date == day - 1)
+        .scalar_subquery()
+    )
+    return case(
+        (patient_count > capacity, func.coalesce(previous, 0) + 1),
+        else_=0,
+    )
+
+
+def streak_values(phc_id: str, day: date, patient_count: int, capacity: int):
+    """overload_streak for the VALUES clause of a daily_workload upsert."""
+    return streak_expr(literal(phc_id), literal(day), literal(patient_count), literal(capacity))
+
+
+def _existing(column):
+    # The row being updated in ON CONFLICT DO UPDATE. SQLAlchemy does not
+    # correlate subqueries there, so refer to the target table by name.
+    return literal_column(f"{DailyWorkload.__tablename__}.{column.name}", column.type)
+
+
+def streak_on_conflict(patient_count, capacity=DailyWorkload.capacity):
+    """overload_streak for ON CONFLICT DO UPDATE SET, given the row's new patient_count and capacity."""
+    return streak_expr(
+        _existing(DailyWorkload.phc_id), _existing(DailyWorkload.date), patient_count, capacity
+    )
+
+
+# ---------------- ISSUES ----------------
+def open_staffing_issues(db: Session, phc_ids) -> list:
+    """
+    Open an automated Staffing Shortage issue for each facility that does
+    not already have one open; issues PHCs report themselves do not count.
+    The partial unique index uq_issues_open_staffing_shortage
+    makes this safe against concurrent callers. Returns the phc_ids that got
+    a new issue; the caller commits.
+    """
+    phc_ids = sorted(set(phc_ids))
+    if not phc_ids:
+        return []
+
+    now = datetime.utcnow()
+    facilities = (
+        select(
+            Facility.phc_id, Facility.lga_id, Facility.name,
+            literal(STAFFING_CATEGORY), literal("High"), literal(STAFFING_DESCRIPTION),
+            literal("Open"), literal(True), literal(now),
+        )
+        .where(Facility.phc_id.in_(phc_ids))
+        .order_by(Facility.phc_id)
+    )
+    stmt = (
+        insert(Issue)
+        .from_select(
+            ["phc_id", "lga_id", "phc_name", "category", "priority", "description", "status", "automated",
+             "created_at"],
+            facilities,
+        )
+        .on_conflict_do_nothing(
+            index_elements=[Issue.lga_id, Issue.phc_id],
+            index_where=and_(Issue.automated, Issue.category == STAFFING_CATEGORY,
+                             Issue.status.in_(rollups.OPEN_ISSUE_STATUSES)),
+        )
+        .returning(Issue.id, Issue.phc_id, Issue.lga_id, Issue.priority, Issue.status, Issue.created_at)
+    )
+    created = db.execute(stmt).all()
+    for issue in created:
+        rollups.issue_created(db, issue)
+    versions.bump(db, *(scope for issue in created for scope in versions.issue_scopes(issue.phc_id, issue.lga_id)))
+    for lga_id in sorted({issue.lga_id for issue in created}):
+        invalidation.publish(db, "lga_summary", lga_id)
+    for issue in created:
+        push.publish(db, "issue.created", issue.phc_id, issue.lga_id, id=issue.id, category=STAFFING_CATEGORY,
+                     priority=issue.priority, status=issue.status, automated=True)
+    return [issue.phc_id for issue in created]
+
+
+@jobs.handler("overload.open_staffing_issues", concurrency=2)
+def _open_staffing_issues_job(db: Session, payload: dict):
+    # Enqueued by POST /workload/submit when a submission completes a streak
+    open_staffing_issues(db, payload["phc_ids"])
+
+
+# ---------------- LGA-WIDE DETECTOR ----------------
+def find_overloaded(db: Session, as_of: date = None, lga_id: str = None, streak_days: int = STREAK_DAYS) -> list:
+    """
+    Facilities whose current run of consecutive overloaded days is at least
+    `streak_days` long, in one query. "Current" means the run ends on `as_of`
+    or the day before, since today's figures may not be in yet.
+    Returns [(phc_id, streak_length, last_day)].
+    """
+    as_of = as_of or datetime.utcnow().date()
+    since = as_of - timedelta(days=LOOKBACK_DAYS - 1)
+
+    # Overloaded days only; consecutive dates share the same date - row_number,
+    # so a missing or under-capacity day starts a new island.
+    overloaded = (
+        select(
+            DailyWorkload.phc_id,
+            DailyWorkload.date,
+            (DailyWorkload.date - func.row_number().over(
+                partition_by=DailyWorkload.phc_id, order_by=DailyWorkload.date
+            ).cast(Integer)).label("island"),
+        )
+        .where(
+            DailyWorkload.date.between(since, as_of),
+            DailyWorkload.patient_count > DailyWorkload.capacity,
+        )
+    )
+    if lga_id:
+        overloaded = overloaded.where(DailyWorkload.phc_id.in_(
+            select(Facility.phc_id).where(Facility.lga_id == lga_id)
+        ))
+    overloaded = overloaded.subquery()
+
+    islands = (
+        select(
+            overloaded.c.phc_id,
+            func.count().label("streak"),
+            func.max(overloaded.c.date).label("last_day"),
+        )
+        .group_by(overloaded.c.phc_id, overloaded.c.island)
+        .having(func.count() >= streak_days)
+        .having(func.max(overloaded.c.date) >= as_of - timedelta(days=1))
+        .order_by(overloaded.c.phc_id)
+    )
+    return [tuple(row) for row in db.execute(islands)]
+
+
+def detect_overloads(db: Session, as_of: date = None, lga_id: str = None) -> dict:
+    """Find current overload streaks and open the missing Staffing Shortage issues."""
+    overloaded = find_overloaded(db, as_of, lga_id)
+    created = open_staffing_issues(db, [phc_id for phc_id, _, _ in overloaded])
+    return {"overloaded": len(overloaded), "issues_created": len(created)}
+
+
+def run_overload_detection():
+    """Scheduler entry point: scan every LGA once per deployment."""
+    from database import SessionLocal, advisory_lock
+
+    with advisory_lock(DETECTOR_LOCK) as locked:
+        if not locked:
+            return
+        db = SessionLocal()
+        try:
+            result = detect_overloads(db)
+            db.commit()
+            print(f"Overload detector: {result['overloaded']} facilities over capacity for "
+                  f"{STREAK_DAYS}+ days, {result['issues_created']} new staffing issues")
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Open Staffing Shortage issues for current overload streaks.")
+    parser.add_argument("--lga", help="Only this LGA (default: all)")
+    parser.add_argument("--date", type=date.fromisoformat, help="Detect as of this day (default: today)")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        for phc_id, streak, last_day in find_overloaded(db, args.date, args.lga):
+            print(f"{phc_id}: {streak} days over capacity up to {last_day}")
+        print(detect_overloads(db, args.date, args.lga))
+        db.commit()
+    finally:
+        db.close()
@@ -0,0 +1,164 @@
+"""
+LGA partitions for restock_requests, issues and monthly_reports.
+
+The three tables are list-partitioned by lga_id (migration 0004). Each LGA
+has its own partition, and a DEFAULT partition catches rows for LGAs that
+have none yet. A query that filters on lga_id reads one partition and its
+indexes, which stay small however many LGAs are onboarded, and the planner
+skips the rest. So every query on these tables should filter on lga_id,
+including lookups by id. A query without it plans against every partition
+and locks each one and its indexes: with 500 LGAs, about 25 ms of planning
+per query and thousands of lock-table slots. Jobs that do read every LGA,
+such as `rollups.py rebuild`, need max_locks_per_transaction raised above
+the default 64 once there are hundreds of LGAs.
+
+A new LGA's rows go to the default partition until its partition is
+attached. attach() does that per table with the database function
+attach_lga_partition (migration 0004):
+- create the partition as a plain table, with a CHECK on lga_id so that
+  ATTACH does not have to scan it;
+- move the LGA's rows out of the default partition. Writes to the default
+  partition wait while this runs; writes to attached LGAs do not;
+- ATTACH PARTITION. It builds the parent's indexes on the new partition and
+  clones its triggers. It only takes SHARE UPDATE EXCLUSIVE on the parent,
+  so reads and writes to other LGAs continue.
+
+Signup attaches a new LGA in the background (routers/auth.py). An hourly
+sweep attaches any LGA that has facilities or default-partition rows but no
+partition. By hand:
+
+    python partitions.py attach lga-ikeja lga-epe
+    python partitions.py sweep
+    python partitions.py list
+"""
+import threading
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, advisory_lock
+
+TABLES = ("restock_requests", "issues", "monthly_reports")
+LOCK_TIMEOUT = "5s"                 # give up rather than queue writers behind a long transaction
+SWEEP_LOCK = "partitions:sweep"
+
+_attached = set()                   # LGAs this worker has seen fully attached
+_attached_lock = threading.Lock()
+
+_BOUND = "pg_get_expr(c.relpartbound, c.oid)"
+_PARTITIONS = f"""
+    SELECT c.relname, {_BOUND} AS bound, pg_total_relation_size(c.oid) AS bytes,
+           greatest(c.reltuples, 0)::bigint AS rows
+    FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = CAST(:table AS regclass)
+    ORDER BY c.relname
+"""
+
+
+def missing(db: Session) -> list:
+    """(table, lga_id) for every LGA with facilities or default-partition rows but no partition."""
+    rows = []
+    for table in TABLES:
+        rows += db.execute(text(f"""
+            SELECT :table, lgas.lga_id
+            FROM (SELECT lga_id FROM facilities UNION SELECT DISTINCT lga_id FROM {table}_default) lgas
+            WHERE NOT EXISTS (
+                SELECT 1 FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = CAST(:table AS regclass) AND {_BOUND} = format('FOR VALUES IN (%L)', lgas.lga_id)
+            )
+            ORDER BY lgas.lga_id
+        """), {"table": table}).all()
+    return [tuple(row) for row in rows]
+
+
+def attach(db: Session, lga_id: str, tables=TABLES) -> list:
+    """Attach `lga_id`'s partition of each table that lacks one. Returns the partitions created."""
+    created = []
+    for table in tables:
+        # One transaction per table, so locks are held for one table at a time
+        db.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+        name = db.execute(text("SELECT attach_lga_partition(CAST(:table AS regclass), :lga)"),
+                          {"table": table, "lga": lga_id}).scalar()
+        db.commit()
+        if name:
+            created.append(name)
+    with _attached_lock:
+        _attached.add(lga_id)
+    return created
+
+
+def ensure_lga(lga_id: str):
+    """Background task after signup: attach the LGA's partitions unless this worker already has."""
+    if not lga_id or lga_id in _attached:
+        return
+    db = SessionLocal()
+    try:
+        created = attach(db, lga_id)
+        if created:
+            print(f"Attached partitions for new LGA {lga_id}: {', '.join(created)}")
+    except DBAPIError as e:
+        # The hourly sweep tries again
+        db.rollback()
+        print(f"Could not attach partitions for LGA {lga_id} yet: {e.orig}")
+    finally:
+        db.close()
+
+
+def sweep(db: Session) -> int:
+    """Attach every missing partition. Returns how many were created."""
+    created = 0
+    for table, lga_id in missing(db):
+        created += len(attach(db, lga_id, tables=(table,)))
+    return created
+
+
+def run_partition_sweep():
+    """Scheduler entry point: one sweep per deployment."""
+    with advisory_lock(SWEEP_LOCK) as locked:
+        if not locked:
+            return
+        db = SessionLocal()
+        try:
+            created = sweep(db)
+            if created:
+                print(f"Partition sweep attached {created} LGA partitions")
+        except DBAPIError as e:
+            db.rollback()
+            print(f"Partition sweep failed: {e.orig}")
+        finally:
+            db.close()
+
+
+def describe(db: Session, table: str) -> list:
+    """[(partition, bound, total bytes, estimated rows)] for one table."""
+    return [tuple(row) for row in db.execute(text(_PARTITIONS), {"table": table})]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manage the per-LGA partitions.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    attach_cmd = sub.add_parser("attach", help="Attach partitions for these LGAs.")
+    attach_cmd.add_argument("lga_ids", nargs="+")
+    sub.add_parser("sweep", help="Attach partitions for every LGA that lacks one.")
+    sub.add_parser("list", help="Show each table's partitions and their sizes.")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.command == "attach":
+            for lga_id in args.lga_ids:
+                created = attach(db, lga_id)
+                print(f"{lga_id}: {', '.join(created) if created else 'already attached'}")
+        elif args.command == "sweep":
+            print(f"Attached {sweep(db)} partitions.")
+        else:
+            for table in TABLES:
+                partitions = describe(db, table)
+                print(f"{table}: {len(partitions)} partitions")
+                for name, bound, size, rows in partitions:
+                    print(f"  {name:<60}{bound:<40}{rows:>10,} rows{size / 1024:>10,.0f} KiB")
+    finally:
+        db.close()
@@ -0,0 +1,214 @@
+"""
+Opt-in per-request profiling.
+
+Send `X-Profile: 1` with a request and, if profiling is allowed for it, the
+endpoint runs under cProfile and every SQL statement it issues is timed.
+The response gets a Server-Timing header (total and DB time) and an
+X-Profile-Id; the full report (slowest frames by cumulative time, slowest
+statements) is written to PROFILE_DIR/<id>.txt, keeping the newest
+PROFILE_KEEP reports.
+
+Profiling is allowed for LGA (admin) tokens, or for everyone when
+PROFILING_ENABLED=1 (local and staging). Without the header a request only
+pays for one header lookup and one context variable read.
+
+Routers opt in with APIRouter(route_class=ProfiledRoute). The route wraps
+the endpoint itself, so the profiler runs in whichever thread executes it:
+a threadpool thread for sync endpoints, the event loop for async ones. For
+async endpoints, other requests' coroutines that run while it awaits show up
+in the profile too. Only one request per process runs under cProfile at a
+time (since Python 3.12 a second profiler raises ValueError, whichever
+thread it is on); a profiled request that arrives meanwhile runs without it
+and its report has only the SQL statements. Dependencies' SQL is captured,
+their Python time is not; for streaming responses only the time to build
+the response is covered.
+"""
+import asyncio
+import cProfile
+import functools
+import io
+import os
+import pstats
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+
+from fastapi import Request
+from fastapi.routing import APIRoute
+from jose import jwt
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from jwt_handler import SECRET_KEY, ALGORITHM
+
+HEADER = "x-profile"
+ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+ADMIN_ROLES = ("lga",)
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/medisense-profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "200"))
+TOP_FRAMES = 30
+TOP_STATEMENTS = 15
+
+_session = ContextVar("profile_session", default=None)
+_profiler_lock = threading.Lock()    # held while a cProfile.Profile is enabled in this process
+
+
+class ProfileSession:
+    def __init__(self, method: str, path: str):
+        self.id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.profiler = None
+        self.statements = []         # (seconds, sql)
+        self.note = None
+
+    def run(self, fn, *args, **kwargs):
+        """Call a sync endpoint under the profiler (in the thread that runs it)."""
+        if not _profiler_lock.acquire(blocking=False):
+            self.note = "another request was being profiled; frames not captured, SQL only"
+            return fn(*args, **kwargs)
+        try:
+            self.profiler = cProfile.Profile()
+            return self.profiler.runcall(fn, *args, **kwargs)
+        finally:
+            _profiler_lock.release()
+
+    async def run_async(self, fn, *args, **kwargs):
+        if not _profiler_lock.acquire(blocking=False):
+            self.note = "another request was being profiled; frames not captured, SQL only"
+            return await fn(*args, **kwargs)
+        try:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                self.profiler.disable()
+        finally:
+            _profiler_lock.release()
+
+    def report(self, status) -> str:
+        total = time.perf_counter() - self.started
+        db = sum(seconds for seconds, _ in self.statements)
+        out = io.StringIO()
+        out.write(f"{self.method} {self.path} -> {status}\n")
+        out.write(f"total {total * 1000:.1f} ms, {len(self.statements)} SQL statements, "
+                  f"{db * 1000:.1f} ms in the database\n")
+        if self.note:
+            out.write(f"note: {self.note}\n")
+
+        out.write(f"\n---------- slowest SQL (top {TOP_STATEMENTS}) ----------\n")
+        for seconds, sql in sorted(self.statements, key=lambda s: -s[0])[:TOP_STATEMENTS]:
+            out.write(f"{seconds * 1000:9.2f} ms  {' '.join(sql.split())[:500]}\n")
+
+        if self.profiler is not None:
+            out.write(f"\n---------- slowest frames by cumulative time (top {TOP_FRAMES}) ----------\n")
+            stats = pstats.Stats(self.profiler, stream=out)
+            stats.sort_stats("cumulative").print_stats(TOP_FRAMES)
+        return out.getvalue()
+
+    def server_timing(self) -> str:
+        total = (time.perf_counter() - self.started) * 1000
+        db = sum(seconds for seconds, _ in self.statements) * 1000
+        return f'app;dur={total:.1f}, db;dur={db:.1f};desc="{len(self.statements)} statements"'
+
+    def save(self, status):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with open(os.path.join(PROFILE_DIR, f"{self.id}.txt"), "w") as f:
+            f.write(self.report(status))
+        # Ids start with a timestamp, so name order is age order
+        reports = sorted(name for name in os.listdir(PROFILE_DIR) if name.endswith(".txt"))
+        for name in reports[:-PROFILE_KEEP]:
+            try:
+                os.remove(os.path.join(PROFILE_DIR, name))
+            except FileNotFoundError:
+                pass
+
+
+# ---------------- SQL CAPTURE ----------------
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _session.get() is not None:
+        conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    session = _session.get()
+    started = conn.info.get("profile_started")
+    if session is not None and started:
+        session.statements.append((time.perf_counter() - started.pop(), statement))
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    started = context.connection.info.get("profile_started") if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+# ---------------- ROUTE ----------------
+def _allowed(request: Request) -> bool:
+    if ENABLED:
+        return True
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("role") in ADMIN_ROLES
+    except Exception:
+        return False
+
+
+def _profiled(endpoint):
+    """Wrap an endpoint so it runs under the request's ProfileSession, if there is one."""
+    if getattr(endpoint, "_profiled", False):
+        return endpoint
+
+    if asyncio.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            session = _session.get()
+            if session is None:
+                return await endpoint(*args, **kwargs)
+            return await session.run_async(endpoint, *args, **kwargs)
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            session = _session.get()
+            if session is None:
+                return endpoint(*args, **kwargs)
+            return session.run(endpoint, *args, **kwargs)
+
+    wrapper._profiled = True
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _profiled(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def profiled_handler(request: Request):
+            if not request.headers.get(HEADER) or not _allowed(request):
+                return await handler(request)
+
+            session = ProfileSession(request.method, request.url.path)
+            token = _session.set(session)
+            try:
+                response = await handler(request)
+            except Exception as e:
+                session.save(f"raised {type(e).__name__}")
+                raise
+            finally:
+                _session.reset(token)
+            response.headers["Server-Timing"] = session.server_timing()
+            session.save(response.status_code)
+            response.headers["X-Profile-Id"] = session.id
+            return response
+
+        return profiled_handler
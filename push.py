@@ -0,0 +1,233 @@
+"""
+Live events for dashboards, pushed over Server-Sent Events.
+
+LGA dashboards used to poll the restock and issue lists on a timer, and PHC
+screens polled for approvals. Most polls found nothing new and each still
+cost a query. Now a client keeps one GET /events/stream open
+(routers/events.py). Writers publish an event in the transaction that makes
+the change:
+
+    push.publish(db, "restock.updated", req.phc_id, req.lga_id, id=req.id, status=req.status)
+
+The event goes to the facility's topic ("phc:<phc_id>") and to its LGA's
+("lga:<lga_id>"). A connection subscribes to the one topic its JWT names.
+
+Fan-out:
+- publish() sends a NOTIFY on CHANNEL, so the event is delivered only if
+  the write commits.
+- Every worker receives it on the LISTEN connection it already holds for
+  cache invalidation (invalidation.listen).
+- The listener thread encodes the SSE frame once. It hands the frame to the
+  event loop, which puts the same bytes on the queue of every subscriber
+  to the event's topics. Per-client cost is a set lookup and a put_nowait.
+  No query runs per client.
+
+Backpressure:
+- Each subscriber has a bounded queue (PUSH_QUEUE_SIZE frames). A client
+  that cannot keep up fills it instead of growing the worker's memory.
+- A full queue is dropped, not blocked on. The client gets a "resync" event
+  and the stream ends. It reconnects and catches up from the list endpoints
+  or GET /sync/changes.
+- Clients also get "resync" after the worker's LISTEN connection drops,
+  since events sent while it was down are lost.
+
+Payloads carry ids and statuses, not whole rows, so they stay far below
+Postgres' 8000-byte NOTIFY limit.
+"""
+import asyncio
+import json
+import os
+import time
+
+from sqlalchemy import func, select as sql_select, text
+from sqlalchemy.orm import Session
+
+import invalidation
+import metrics
+
+CHANNEL = "app_events"
+QUEUE_SIZE = int(os.getenv("PUSH_QUEUE_SIZE", "256"))          # frames buffered per client
+MAX_SUBSCRIBERS = int(os.getenv("PUSH_MAX_SUBSCRIBERS", "10000"))  # per worker
+HEARTBEAT_SECONDS = 15.0
+
+
+def frame(event: str, data: dict) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+
+RESYNC = frame("resync", {"reason": "events were dropped; reload and reconnect"})
+HEARTBEAT = b": ping\n\n"
+
+
+def topics_for(phc_id: str = None, lga_id: str = None) -> list:
+    return [t for t in (phc_id and f"phc:{phc_id}", lga_id and f"lga:{lga_id}") if t]
+
+
+# ---------------- PUBLISH ----------------
+def publish(db: Session, event: str, phc_id: str, lga_id: str, **data):
+    """Push `event` to the facility's and its LGA's subscribers once `db` commits."""
+    payload = json.dumps({
+        "event": event, "topics": topics_for(phc_id, lga_id), "at": time.time(),
+        "data": {"phc_id": phc_id, **data},
+    }, default=str, separators=(",", ":"))
+    db.execute(sql_select(func.pg_notify(CHANNEL, payload)))
+    metrics.PUSH_EVENTS.labels("published").inc()
+
+
+def publish_many(db: Session, events: list):
+    """publish() for [(event, phc_id, lga_id, data)], sent as one statement."""
+    if not events:
+        return
+    now = time.time()
+    payloads = [json.dumps({
+        "event": event, "topics": topics_for(phc_id, lga_id), "at": now,
+        "data": {"phc_id": phc_id, **data},
+    }, default=str, separators=(",", ":")) for event, phc_id, lga_id, data in events]
+    db.execute(text("SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload"),
+               {"channel": CHANNEL, "payloads": payloads})
+    metrics.PUSH_EVENTS.labels("published").inc(len(payloads))
+
+
+# ---------------- HUB ----------------
+class Subscriber:
+    __slots__ = ("topics", "queue", "dropped")
+
+    def __init__(self, topics, maxsize: int):
+        self.topics = tuple(topics)
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = False
+
+
+class Hub:
+    """Per-worker registry of open streams by topic. Only touched on the event loop."""
+
+    def __init__(self, queue_size: int = QUEUE_SIZE, max_subscribers: int = MAX_SUBSCRIBERS):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.loop = None
+        self._topics = {}                   # topic -> set of Subscriber
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def subscribe(self, topics) -> Subscriber:
+        """A new subscriber, or None if the worker is at max_subscribers."""
+        if self._count >= self.max_subscribers:
+            return None
+        self.loop = asyncio.get_running_loop()
+        subscriber = Subscriber(topics, self.queue_size)
+        for topic in subscriber.topics:
+            self._topics.setdefault(topic, set()).add(subscriber)
+        self._count += 1
+        metrics.PUSH_SUBSCRIBERS.inc()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        removed = False
+        for topic in subscriber.topics:
+            members = self._topics.get(topic)
+            if members and subscriber in members:
+                members.discard(subscriber)
+                removed = True
+                if not members:
+                    del self._topics[topic]
+        if removed:
+            self._count -= 1
+            metrics.PUSH_SUBSCRIBERS.dec()
+
+    def _drop(self, subscriber: Subscriber):
+        # The stream sees the flag at its next frame and sends RESYNC instead
+        subscriber.dropped = True
+        self.unsubscribe(subscriber)
+        metrics.PUSH_DROPPED.inc()
+
+    def dispatch(self, topics, data: bytes) -> int:
+        """Queue one encoded frame for every subscriber to any of `topics`. Returns how many got it."""
+        delivered = 0
+        seen = set()
+        for topic in topics:
+            for subscriber in tuple(self._topics.get(topic, ())):
+                if subscriber in seen:
+                    continue
+                seen.add(subscriber)
+                try:
+                    subscriber.queue.put_nowait(data)
+                    delivered += 1
+                except asyncio.QueueFull:
+                    self._drop(subscriber)
+        metrics.PUSH_EVENTS.labels("queued").inc(delivered)
+        return delivered
+
+    def resync_all(self):
+        """Every stream restarts: events may have been missed."""
+        for members in list(self._topics.values()):
+            for subscriber in tuple(members):
+                self._drop(subscriber)
+                # Wake streams idling on an empty queue so they notice now
+                try:
+                    subscriber.queue.put_nowait(RESYNC)
+                except asyncio.QueueFull:
+                    pass
+
+    def dispatch_threadsafe(self, topics, data: bytes):
+        loop = self.loop
+        if loop is None or loop.is_closed() or not self._count:
+            return
+        loop.call_soon_threadsafe(self.dispatch, topics, data)
+
+
+hub = Hub()
+
+
+# ---------------- RECEIVE (listener thread) ----------------
+def _on_notify(payload: str):
+    try:
+        message = json.loads(payload)
+        data = frame(message["event"], message["data"])
+    except (ValueError, KeyError, TypeError):
+        print(f"Ignoring malformed push event: {payload[:200]}")
+        return
+    metrics.PUSH_EVENTS.labels("received").inc()
+    if message.get("at"):
+        metrics.PUSH_LAG.observe(max(0.0, time.time() - message["at"]))
+    hub.dispatch_threadsafe(message["topics"], data)
+
+
+def _on_reconnect():
+    loop = hub.loop
+    if loop is not None and not loop.is_closed():
+        loop.call_soon_threadsafe(hub.resync_all)
+
+
+invalidation.listen(CHANNEL, _on_notify, _on_reconnect)
+
+
+# ---------------- STREAM ----------------
+async def stream(subscriber: Subscriber, hello: bytes, expires_at: float = None):
+    """
+    SSE body for one subscriber: `hello`, then its frames, with a heartbeat
+    comment when idle so proxies keep the connection open. Ends with RESYNC
+    if the subscriber was dropped, or with "expired" when its token does.
+    Starlette cancels the generator when the client disconnects.
+    """
+    try:
+        yield hello
+        while True:
+            timeout = HEARTBEAT_SECONDS
+            if expires_at is not None:
+                timeout = min(timeout, expires_at - time.time())
+                if timeout <= 0:
+                    yield frame("expired", {"reason": "token expired; reconnect with a new one"})
+                    return
+            try:
+                data = await asyncio.wait_for(subscriber.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                yield HEARTBEAT
+                continue
+            if subscriber.dropped:
+                yield RESYNC
+                return
+            yield data
+    finally:
+        hub.unsubscribe(subscriber)
@@ -0,0 +1,194 @@
+"""
+Facility registry: per-PHC metadata (name, LGA, capacity, staffing) from the
+facilities table, cached in-process.
+
+The whole table is small and read on nearly every request, so each worker
+keeps a snapshot in memory. The snapshot carries the version of the
+"facilities" row in scope_versions; every write bumps that version in its
+own transaction. A worker re-reads the version (one primary-key lookup) at
+most every REFRESH_SECONDS and reloads the snapshot only when it changed.
+Writes also publish a "facilities" invalidation (invalidation.py), so every
+worker re-checks as soon as the write commits rather than within 5 seconds.
+
+Backfill from existing PHC accounts with:
+
+    python registry.py backfill
+"""
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import Facility, ScopeVersion, User
+import invalidation
+import versions
+
+SCOPE = "facilities"
+REFRESH_SECONDS = 5.0
+DEFAULT_CAPACITY = 50
+EDITABLE_FIELDS = ("name", "capacity", "staff_count")
+
+
+@dataclass(frozen=True)
+class FacilityInfo:
+    phc_id: str
+    name: str
+    lga_id: str
+    capacity: int
+    staff_count: Optional[int]
+
+
+class FacilityRegistry:
+    """Read-mostly snapshot of the facilities table, shared by all threads of a worker."""
+
+    def __init__(self, refresh_seconds: float = REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self.version = None
+        self._by_phc = {}                   # phc_id -> FacilityInfo
+        self._by_lga = {}                   # lga_id -> [FacilityInfo], sorted by phc_id
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _current_version(self, db: Session) -> int:
+        return db.query(ScopeVersion.version).filter(ScopeVersion.scope == SCOPE).scalar() or 0
+
+    def _refresh(self, db: Session):
+        if time.monotonic() - self._checked_at < self.refresh_seconds:
+            return
+        with self._lock:
+            if time.monotonic() - self._checked_at < self.refresh_seconds:
+                return
+            # The version is read before the rows, so a write committed in
+            # between only makes the next check reload again
+            version = self._current_version(db)
+            if version != self.version:
+                by_phc, by_lga = {}, {}
+                for f in db.query(Facility).order_by(Facility.phc_id):
+                    info = FacilityInfo(f.phc_id, f.name, f.lga_id, f.capacity, f.staff_count)
+                    by_phc[f.phc_id] = info
+                    by_lga.setdefault(f.lga_id, []).append(info)
+                self._by_phc, self._by_lga, self.version = by_phc, by_lga, version
+            self._checked_at = time.monotonic()
+
+    def get(self, db: Session, phc_id: str) -> Optional[FacilityInfo]:
+        self._refresh(db)
+        return self._by_phc.get(phc_id)
+
+    def in_lga(self, db: Session, lga_id: str) -> list:
+        self._refresh(db)
+        return list(self._by_lga.get(lga_id, ()))
+
+    def capacity(self, db: Session, phc_id: str) -> int:
+        info = self.get(db, phc_id)
+        return info.capacity if info else DEFAULT_CAPACITY
+
+    def for_token(self, db: Session, payload: dict) -> FacilityInfo:
+        """
+        The caller's facility. A PHC account created before the registry
+        (and not yet backfilled) is registered from the token's claims on
+        first use, so forecasts and staffing alerts cover it too.
+        """
+        info = self.get(db, payload["phc_id"])
+        if info:
+            return info
+        self.invalidate()                   # registered by another worker since our last check?
+        info = self.get(db, payload["phc_id"])
+        if info:
+            return info
+        # In a transaction of its own, so the caller's pending writes are not committed with it
+        session = SessionLocal()
+        try:
+            session.execute(insert(Facility).values(
+                phc_id=payload["phc_id"], name=payload.get("name") or payload["phc_id"], lga_id=payload["lga_id"],
+                capacity=DEFAULT_CAPACITY,
+            ).on_conflict_do_nothing(index_elements=[Facility.phc_id]))
+            versions.bump(session, SCOPE)
+            invalidation.publish(session, SCOPE)
+            invalidation.publish(session, "lga_summary", payload["lga_id"])
+            session.commit()
+        finally:
+            session.close()
+        self.invalidate()
+        return self.get(db, payload["phc_id"]) or FacilityInfo(
+            payload["phc_id"], payload.get("name"), payload["lga_id"], DEFAULT_CAPACITY, None)
+
+    def invalidate(self):
+        """Force the next read to re-check the version (call after committing a write)."""
+        with self._lock:
+            self._checked_at = 0.0
+
+
+registry = FacilityRegistry()
+invalidation.subscribe(SCOPE, lambda *prefix: registry.invalidate())
+
+
+# ---------------- WRITES ----------------
+# Both bump the registry version and publish the invalidation in the caller's
+# transaction; every worker re-checks once it commits.
+def register(db: Session, phc_id: str, name: str, lga_id: str):
+    """Create the facility for a new PHC account, or update its name and LGA."""
+    stmt = insert(Facility).values(phc_id=phc_id, name=name, lga_id=lga_id)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[Facility.phc_id],
+        set_={"name": stmt.excluded.name, "lga_id": stmt.excluded.lga_id, "updated_at": func.now()},
+    ))
+    versions.bump(db, SCOPE)
+    invalidation.publish(db, SCOPE)
+    invalidation.publish(db, "lga_summary", lga_id)
+
+
+def update(db: Session, phc_id: str, **fields) -> Optional[Facility]:
+    facility = db.query(Facility).filter(Facility.phc_id == phc_id).first()
+    if not facility:
+        return None
+    for field, value in fields.items():
+        if field in EDITABLE_FIELDS:
+            setattr(facility, field, value)
+    versions.bump(db, SCOPE)
+    invalidation.publish(db, SCOPE)
+    invalidation.publish(db, "lga_summary", facility.lga_id)
+    return facility
+
+
+def backfill(db: Session) -> int:
+    """Register every PHC account that has no facility row yet."""
+    accounts = (
+        db.query(User.phc_id, func.max(User.phc_name), func.max(User.full_name), func.max(User.lga_id))
+        .filter(User.role == "phc", User.phc_id.isnot(None), User.lga_id.isnot(None))
+        .group_by(User.phc_id)
+        .all()
+    )
+    rows = [
+        {"phc_id": phc_id, "name": phc_name or full_name, "lga_id": lga_id, "capacity": DEFAULT_CAPACITY}
+        for phc_id, phc_name, full_name, lga_id in accounts
+    ]
+    created = 0
+    if rows:
+        created = len(db.execute(
+            insert(Facility).values(rows).on_conflict_do_nothing(index_elements=[Facility.phc_id])
+            .returning(Facility.phc_id)
+        ).all())
+    versions.bump(db, SCOPE)
+    invalidation.publish(db, SCOPE)
+    invalidation.publish(db, "lga_summary")
+    db.commit()
+    return created
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Facility registry maintenance.")
+    parser.add_argument("command", choices=["backfill"])
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        print(f"Registered {backfill(db)} facilities from existing PHC accounts.")
+    finally:
+        db.close()
@@ -0,0 +1,270 @@
+"""
+Monthly report drafts.
+
+Drafts are normally pre-generated overnight on the 1st for the month that just
+ended (see scheduler.py), so POST /reports/generate only has to return the
+stored row. The (phc_id, month) unique constraint makes generation idempotent:
+re-running the job, or a PHC clicking generate while it runs, never creates a
+second draft.
+
+Run by hand with:
+
+    python report_drafts.py                  # previous month
+    python report_drafts.py --month 2025-10
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, advisory_lock
+from models import MonthlyReport, Inventory, PhcMonthlyStats, ReportJobRun, Facility
+import invalidation
+import rollups
+import versions
+
+CHUNK_SIZE = 50        # facilities per transaction
+MAX_WORKERS = 4        # chunks generated in parallel (each holds one pool connection)
+LOW_STOCK_LEVEL = 10   # items below this many units are flagged in the narrative
+JOB_LOCK = "report_drafts.pregenerate"
+
+
+def compose_narrative(month_str: str, restock_count: int, issue_count: int, low_stock: int) -> str:
+    return (
+        f"**Monthly Executive Summary - {month_str}**\n\n"
+        f"**Operational Overview:**\n"
+        f"The facility operated at standard capacity this month. We processed {restock_count} inventory restock requests to maintain supply levels. "
+        f"Currently, we have {low_stock} items flagged as low stock that require attention.\n\n"
+        f"**Infrastructure & Issues:**\n"
+        f"We logged {issue_count} facility issues this month. Key areas of concern include Water Supply and Power stability.\n\n"
+        f"**Recommendations:**\n"
+        f"We request the LGA to expedite the approval of pending drug orders to ensure continuous care."
+    )
+
+
+def narrative_prompt(month_str: str, phc_name: str, stats: dict, low_stock: int) -> str:
+    """Prompt for the LLM-written version of the executive summary."""
+    return f"""
+    You are the officer in charge of {phc_name or 'a Primary Health Centre'} in Nigeria, writing the
+    monthly executive summary for {month_str} that will be submitted to the Local Government Area (LGA).
+
+    FACILITY DATA FOR THE MONTH:
+    - Restock requests raised: {stats["restock_requests"]} (pending: {stats["restock_pending"]}, approved: {stats["restock_approved"]}, declined: {stats["restock_declined"]}, delivered: {stats["restock_delivered"]})
+    - Items currently below {LOW_STOCK_LEVEL} units: {low_stock}
+    - Facility issues logged: {stats["issues_logged"]} (still open: {stats["issues_open"]}, high priority: {stats["issues_open_high"]})
+    - Days with workload submitted: {stats["workload_days"]}, patients seen: {stats["patients_seen"]}, days over capacity: {stats["overload_days"]}
+
+    INSTRUCTIONS:
+    Write three short markdown sections: **Operational Overview:**, **Infrastructure & Issues:** and
+    **Recommendations:**. Use only the figures above, do not invent numbers, and keep it under 250 words.
+    """
+
+
+def save_narrative(report_id: int, lga_id: str, content: str) -> bool:
+    """Store a finished narrative on the report, unless it was submitted in the meantime."""
+    db = SessionLocal()
+    try:
+        phc_id = db.execute(
+            update(MonthlyReport)
+            .where(MonthlyReport.lga_id == lga_id, MonthlyReport.id == report_id, MonthlyReport.status != "Submitted")
+            .values(content=content)
+            .returning(MonthlyReport.phc_id)
+        ).scalar()
+        if phc_id:
+            versions.bump(db, *versions.report_scopes(phc_id))
+        db.commit()
+        return phc_id is not None
+    finally:
+        db.close()
+
+
+def low_stock_counts(db: Session, phc_ids) -> dict:
+    rows = (
+        db.query(Inventory.phc_id, func.count(Inventory.id))
+        .filter(Inventory.phc_id.in_(phc_ids), Inventory.current_stock < LOW_STOCK_LEVEL)
+        .group_by(Inventory.phc_id)
+    )
+    return dict(rows)
+
+
+def _insert_drafts(db: Session, rows: list) -> int:
+    """Insert drafts, skipping any (phc_id, month) that already has one. Returns how many were new."""
+    if not rows:
+        return 0
+    stmt = (
+        insert(MonthlyReport)
+        .values(rows)
+        .on_conflict_do_nothing(constraint="uq_monthly_reports_lga_phc_month")
+        .returning(MonthlyReport.phc_id)
+    )
+    created = db.execute(stmt).scalars().all()
+    versions.bump(db, *(scope for phc_id in created for scope in versions.report_scopes(phc_id)))
+    created_ids = set(created)
+    for lga_id in sorted({row["lga_id"] for row in rows if row["phc_id"] in created_ids}):
+        invalidation.publish(db, "lga_summary", lga_id)
+    return len(created)
+
+
+def get_or_create_draft(db: Session, phc_id: str, phc_name: str, lga_id: str, month_str: str) -> MonthlyReport:
+    """The facility's report for the month, generating the draft now if the job has not."""
+    query = db.query(MonthlyReport).filter(
+        MonthlyReport.lga_id == lga_id,
+        MonthlyReport.phc_id == phc_id,
+        MonthlyReport.month == month_str
+    )
+    existing = query.first()
+    if existing:
+        return existing
+
+    stats = rollups.get_monthly_stats(db, phc_id, month_str)
+    low_stock = low_stock_counts(db, [phc_id]).get(phc_id, 0)
+    _insert_drafts(db, [{
+        "phc_id": phc_id,
+        "phc_name": phc_name,
+        "lga_id": lga_id,
+        "month": month_str,
+        "content": compose_narrative(month_str, stats["restock_requests"], stats["issues_logged"], low_stock),
+        "status": "Draft",
+        "created_at": datetime.utcnow(),
+    }])
+    db.commit()
+    return query.first()
+
+
+# ---------------- BATCH PRE-GENERATION ----------------
+def previous_month(today=None) -> str:
+    first_of_month = (today or datetime.utcnow()).replace(day=1)
+    return (first_of_month - timedelta(days=1)).strftime("%Y-%m")
+
+
+def _generate_chunk(run_id: int, month_str: str, facilities: list) -> int:
+    db = SessionLocal()
+    try:
+        phc_ids = [f.phc_id for f in facilities]
+        stats = {
+            row.phc_id: row for row in db.query(PhcMonthlyStats).filter(
+                PhcMonthlyStats.phc_id.in_(phc_ids),
+                PhcMonthlyStats.month == month_str
+            )
+        }
+        low_stock = low_stock_counts(db, phc_ids)
+        now = datetime.utcnow()
+
+        rows = []
+        for f in facilities:
+            s = stats.get(f.phc_id)
+            rows.append({
+                "phc_id": f.phc_id,
+                "phc_name": f.phc_name,
+                "lga_id": f.lga_id,
+                "month": month_str,
+                "content": compose_narrative(
+                    month_str,
+                    s.restock_requests if s else 0,
+                    s.issues_logged if s else 0,
+                    low_stock.get(f.phc_id, 0),
+                ),
+                "status": "Draft",
+                "created_at": now,
+            })
+        created = _insert_drafts(db, rows)
+
+        # Progress is committed together with the chunk's drafts
+        db.execute(
+            update(ReportJobRun)
+            .where(ReportJobRun.id == run_id)
+            .values(processed=ReportJobRun.processed + len(facilities),
+                    created=ReportJobRun.created + created)
+        )
+        db.commit()
+        return created
+    except Exception:
+        db.rollback()
+        db.execute(
+            update(ReportJobRun)
+            .where(ReportJobRun.id == run_id)
+            .values(processed=ReportJobRun.processed + len(facilities),
+                    failed=ReportJobRun.failed + len(facilities))
+        )
+        db.commit()
+        raise
+    finally:
+        db.close()
+
+
+def pregenerate_drafts(month_str: str = None, chunk_size: int = CHUNK_SIZE, max_workers: int = MAX_WORKERS):
+    """
+    Generate missing drafts for every PHC, `chunk_size` facilities per transaction
+    and at most `max_workers` chunks at a time. Returns the ReportJobRun id, or
+    None if another worker is already running the job.
+    """
+    month_str = month_str or previous_month()
+
+    # Several app workers run the scheduler; only the one that gets the lock does the work
+    with advisory_lock(JOB_LOCK) as locked:
+        if not locked:
+            print(f"Report draft pre-generation for {month_str} is already running elsewhere; skipping.")
+            return None
+        return _run(month_str, chunk_size, max_workers)
+
+
+def _run(month_str: str, chunk_size: int, max_workers: int) -> int:
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        # Only facilities that do not have a report for the month yet
+        has_report = db.query(MonthlyReport.id).filter(
+            MonthlyReport.lga_id == Facility.lga_id,
+            MonthlyReport.phc_id == Facility.phc_id,
+            MonthlyReport.month == month_str
+        ).exists()
+        facilities = (
+            db.query(Facility.phc_id, Facility.name.label("phc_name"), Facility.lga_id)
+            .filter(~has_report)
+            .order_by(Facility.phc_id)
+            .all()
+        )
+
+        run = ReportJobRun(month=month_str, status="running", total_facilities=len(facilities))
+        db.add(run)
+        db.commit()
+        run_id = run.id
+
+        chunks = [facilities[i:i + chunk_size] for i in range(0, len(facilities), chunk_size)]
+        errors = []
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = [pool.submit(_generate_chunk, run_id, month_str, chunk) for chunk in chunks]
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append(str(e))
+                    print(f"Report draft chunk failed: {e}")
+
+        db.refresh(run)
+        run.status = "failed" if errors else "completed"
+        run.error = "\n".join(errors[:5]) or None
+        run.finished_at = datetime.utcnow()
+        run.duration_seconds = round(time.perf_counter() - started, 3)
+        db.commit()
+        print(
+            f"Report drafts for {month_str}: {run.created} created, {run.failed} failed, "
+            f"{run.total_facilities} facilities in {run.duration_seconds}s"
+        )
+        return run_id
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pre-generate monthly report drafts for every PHC.")
+    parser.add_argument("--month", help="Month to generate, e.g. 2025-10 (default: previous month)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    args = parser.parse_args()
+    pregenerate_drafts(args.month, chunk_size=args.chunk_size, max_workers=args.workers)
@@ -0,0 +1,334 @@
+"""
+Per-PHC monthly rollups (phc_monthly_stats).
+
+Every write to restock_requests, issues or daily_workload calls one of the
+helpers below on the same Session, so the rollup row is updated in the same
+transaction as the fact it describes. Monthly reports and LGA summaries read
+a single row per facility instead of re-counting the raw tables.
+
+Backfill or repair drift with:
+
+    python rollups.py rebuild              # every month
+    python rollups.py rebuild --month 2025-10
+"""
+from datetime import datetime, date
+
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from models import PhcMonthlyStats, RestockRequest, Issue, DailyWorkload, Facility, Inventory, MonthlyReport
+
+
+# RestockRequest.status -> counter column
+RESTOCK_STATUS_COLUMNS = {
+    "pending": "restock_pending",
+    "approved": "restock_approved",
+    "declined": "restock_declined",
+    "cancelled": "restock_cancelled",
+    "delivered": "restock_delivered",
+}
+
+# Issue statuses that still need attention
+OPEN_ISSUE_STATUSES = ("Open", "In Progress")
+
+COUNTER_COLUMNS = (
+    "restock_requests", *RESTOCK_STATUS_COLUMNS.values(),
+    "issues_logged", "issues_open", "issues_open_high",
+    "workload_days", "patients_seen", "overload_days",
+)
+
+
+def month_key(value) -> str:
+    """'2025-10' for a date/datetime (defaults to the current UTC month)."""
+    return (value or datetime.utcnow()).strftime("%Y-%m")
+
+
+def bump(db: Session, phc_id: str, lga_id: str, month: str, **deltas):
+    """Add the given deltas to a facility's row for the month, creating it if needed."""
+    deltas = {col: n for col, n in deltas.items() if n}
+    if not deltas:
+        return
+
+    stmt = insert(PhcMonthlyStats).values(phc_id=phc_id, lga_id=lga_id, month=month, **deltas)
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_phc_monthly_stats_phc_month",
+        set_={
+            **{col: getattr(PhcMonthlyStats, col) + stmt.excluded[col] for col in deltas},
+            "updated_at": func.now(),
+        },
+    )
+    db.execute(stmt)
+
+
+def bump_many(db: Session, rows: list):
+    """bump() for many (phc_id, month) rows in one statement. Each pair may appear only once."""
+    columns = sorted({col for row in rows for col in COUNTER_COLUMNS if row.get(col)})
+    if not columns:
+        return
+
+    stmt = insert(PhcMonthlyStats).values([
+        {"phc_id": row["phc_id"], "lga_id": row["lga_id"], "month": row["month"],
+         **{col: row.get(col, 0) for col in columns}}
+        for row in rows
+    ])
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_phc_monthly_stats_phc_month",
+        set_={
+            **{col: getattr(PhcMonthlyStats, col) + stmt.excluded[col] for col in columns},
+            "updated_at": func.now(),
+        },
+    )
+    db.execute(stmt)
+
+
+# ---------------- RESTOCK REQUESTS ----------------
+def restock_created(db: Session, req: RestockRequest):
+    deltas = {"restock_requests": 1}
+    status_col = RESTOCK_STATUS_COLUMNS.get(req.status)
+    if status_col:
+        deltas[status_col] = 1
+    bump(db, req.phc_id, req.lga_id, month_key(req.request_date), **deltas)
+
+
+def restock_status_changed(db: Session, req: RestockRequest, old_status: str):
+    if old_status == req.status:
+        return
+    deltas = {}
+    if old_status in RESTOCK_STATUS_COLUMNS:
+        deltas[RESTOCK_STATUS_COLUMNS[old_status]] = -1
+    if req.status in RESTOCK_STATUS_COLUMNS:
+        deltas[RESTOCK_STATUS_COLUMNS[req.status]] = 1
+    bump(db, req.phc_id, req.lga_id, month_key(req.request_date), **deltas)
+
+
+def restock_redated(db: Session, req: RestockRequest, old_request_date: datetime):
+    """Editing a request resets its request_date, which can move it to a new month."""
+    old_month, new_month = month_key(old_request_date), month_key(req.request_date)
+    if old_month == new_month:
+        return
+    status_col = RESTOCK_STATUS_COLUMNS.get(req.status)
+    moved = {"restock_requests": 1, **({status_col: 1} if status_col else {})}
+    bump(db, req.phc_id, req.lga_id, old_month, **{col: -n for col, n in moved.items()})
+    bump(db, req.phc_id, req.lga_id, new_month, **moved)
+
+
+# ---------------- ISSUES ----------------
+def _open_issue_deltas(issue: Issue, status: str, sign: int) -> dict:
+    if status not in OPEN_ISSUE_STATUSES:
+        return {}
+    deltas = {"issues_open": sign}
+    if issue.priority == "High":
+        deltas["issues_open_high"] = sign
+    return deltas
+
+
+def issue_created(db: Session, issue: Issue):
+    deltas = {"issues_logged": 1, **_open_issue_deltas(issue, issue.status or "Open", 1)}
+    bump(db, issue.phc_id, issue.lga_id, month_key(issue.created_at), **deltas)
+
+
+def issue_status_changed(db: Session, issue: Issue, old_status: str):
+    deltas = _open_issue_deltas(issue, old_status, -1)
+    for col, n in _open_issue_deltas(issue, issue.status, 1).items():
+        deltas[col] = deltas.get(col, 0) + n
+    bump(db, issue.phc_id, issue.lga_id, month_key(issue.created_at), **deltas)
+
+
+# ---------------- DAILY WORKLOAD ----------------
+def _workload_month_query(db: Session, month: str = None, phc_id: str = None):
+    month_col = func.to_char(DailyWorkload.date, "YYYY-MM")
+    query = db.query(
+        DailyWorkload.phc_id,
+        month_col.label("month"),
+        func.count(DailyWorkload.id).label("workload_days"),
+        func.coalesce(func.sum(DailyWorkload.patient_count), 0).label("patients_seen"),
+        func.count(DailyWorkload.id).filter(
+            DailyWorkload.patient_count > DailyWorkload.capacity
+        ).label("overload_days"),
+    )
+    if month:
+        query = query.filter(month_col == month)
+    if phc_id:
+        query = query.filter(DailyWorkload.phc_id == phc_id)
+    return query.group_by(DailyWorkload.phc_id, month_col)
+
+
+def workload_changed(db: Session, phc_id: str, lga_id: str, day: date):
+    """
+    Re-derive the workload counters for one facility-month. A month is at most
+    31 indexed rows, and unlike a delta this cannot drift when a day is resubmitted.
+    """
+    month = month_key(day)
+    row = _workload_month_query(db, month=month, phc_id=phc_id).first()
+    counters = {
+        "workload_days": row.workload_days if row else 0,
+        "patients_seen": row.patients_seen if row else 0,
+        "overload_days": row.overload_days if row else 0,
+    }
+    stmt = insert(PhcMonthlyStats).values(phc_id=phc_id, lga_id=lga_id, month=month, **counters)
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_phc_monthly_stats_phc_month",
+        set_={**{col: stmt.excluded[col] for col in counters}, "updated_at": func.now()},
+    )
+    db.execute(stmt)
+
+
+# ---------------- READS ----------------
+def get_monthly_stats(db: Session, phc_id: str, month: str) -> dict:
+    """The facility's counters for the month (all zero if nothing was recorded)."""
+    row = db.query(PhcMonthlyStats).filter(
+        PhcMonthlyStats.phc_id == phc_id,
+        PhcMonthlyStats.month == month
+    ).first()
+    return {col: getattr(row, col) if row else 0 for col in COUNTER_COLUMNS}
+
+
+# How much each signal contributes to a facility's risk score in the LGA summary
+RISK_WEIGHTS = {"stock_outs": 3, "issues_open_high": 2, "overload_days": 1}
+
+
+def lga_summary(db: Session, lga_id: str, month: str) -> dict:
+    """
+    Per-facility metrics for every PHC in the LGA plus LGA totals, in one query:
+    the facility's rollup row for the month, its current stock-outs and the
+    status of its monthly report. Facilities are ranked by risk score, highest first.
+    """
+    lga_phcs = (
+        db.query(Facility.phc_id)
+        .filter(Facility.lga_id == lga_id)
+        .scalar_subquery()
+    )
+    stock_outs = (
+        db.query(Inventory.phc_id, func.count(Inventory.id).label("stock_outs"))
+        .filter(Inventory.current_stock <= 0, Inventory.phc_id.in_(lga_phcs))
+        .group_by(Inventory.phc_id)
+        .subquery()
+    )
+    counters = [func.coalesce(getattr(PhcMonthlyStats, col), 0).label(col) for col in COUNTER_COLUMNS]
+    rows = (
+        db.query(
+            Facility.phc_id,
+            Facility.name.label("phc_name"),
+            *counters,
+            func.coalesce(stock_outs.c.stock_outs, 0).label("stock_outs"),
+            MonthlyReport.status.label("report_status"),
+        )
+        .outerjoin(PhcMonthlyStats, (PhcMonthlyStats.phc_id == Facility.phc_id) & (PhcMonthlyStats.month == month))
+        .outerjoin(stock_outs, stock_outs.c.phc_id == Facility.phc_id)
+        .outerjoin(MonthlyReport, (MonthlyReport.lga_id == lga_id) & (MonthlyReport.phc_id == Facility.phc_id)
+                   & (MonthlyReport.month == month))
+        .filter(Facility.lga_id == lga_id)
+        .all()
+    )
+
+    facilities = []
+    for row in rows:
+        facility = dict(row._mapping)
+        facility["risk_score"] = sum(facility[signal] * weight for signal, weight in RISK_WEIGHTS.items())
+        facilities.append(facility)
+
+    facilities.sort(key=lambda f: (-f["risk_score"], f["phc_id"]))
+    for rank, facility in enumerate(facilities, start=1):
+        facility["rank"] = rank
+
+    totals = {col: sum(f[col] for f in facilities) for col in (*COUNTER_COLUMNS, "stock_outs")}
+    totals["reports_submitted"] = sum(1 for f in facilities if f["report_status"] == "Submitted")
+
+    return {
+        "lga_id": lga_id,
+        "month": month,
+        "facility_count": len(facilities),
+        "totals": totals,
+        "facilities": facilities,
+    }
+
+
+# ---------------- BACKFILL / DRIFT REPAIR ----------------
+def rebuild(db: Session, month: str = None) -> int:
+    """
+    Recompute phc_monthly_stats from the raw tables (for one month, or all of them)
+    and replace the existing rows. Returns the number of rows written.
+    """
+    # Writers block on their bump() until the rebuilt rows are committed, so a
+    # fact committed mid-rebuild is counted exactly once
+    db.execute(text("LOCK TABLE phc_monthly_stats IN EXCLUSIVE MODE"))
+
+    rows = {}
+
+    def row_for(phc_id, lga_id, row_month):
+        key = (phc_id, row_month)
+        if key not in rows:
+            rows[key] = {"phc_id": phc_id, "lga_id": lga_id, "month": row_month,
+                         **{col: 0 for col in COUNTER_COLUMNS}}
+        return rows[key]
+
+    # 1. Restock requests by status
+    restock_month = func.to_char(RestockRequest.request_date, "YYYY-MM")
+    query = db.query(
+        RestockRequest.phc_id, RestockRequest.lga_id, restock_month,
+        RestockRequest.status, func.count(RestockRequest.id)
+    )
+    if month:
+        query = query.filter(restock_month == month)
+    for phc_id, lga_id, row_month, status, n in query.group_by(
+        RestockRequest.phc_id, RestockRequest.lga_id, restock_month, RestockRequest.status
+    ):
+        row = row_for(phc_id, lga_id, row_month)
+        row["restock_requests"] += n
+        if status in RESTOCK_STATUS_COLUMNS:
+            row[RESTOCK_STATUS_COLUMNS[status]] += n
+
+    # 2. Issues, open and open high-priority
+    issue_month = func.to_char(Issue.created_at, "YYYY-MM")
+    is_open = Issue.status.in_(OPEN_ISSUE_STATUSES)
+    query = db.query(
+        Issue.phc_id, Issue.lga_id, issue_month,
+        func.count(Issue.id),
+        func.count(Issue.id).filter(is_open),
+        func.count(Issue.id).filter(is_open, Issue.priority == "High"),
+    )
+    if month:
+        query = query.filter(issue_month == month)
+    for phc_id, lga_id, row_month, logged, open_, open_high in query.group_by(
+        Issue.phc_id, Issue.lga_id, issue_month
+    ):
+        row = row_for(phc_id, lga_id, row_month)
+        row.update(issues_logged=logged, issues_open=open_, issues_open_high=open_high)
+
+    # 3. Daily workload (daily_workload has no lga_id, so take it from the facility registry)
+    lga_by_phc = dict(db.query(Facility.phc_id, Facility.lga_id))
+    for w in _workload_month_query(db, month=month):
+        lga_id = lga_by_phc.get(w.phc_id)
+        if not lga_id:
+            continue
+        row = row_for(w.phc_id, lga_id, w.month)
+        row.update(workload_days=w.workload_days, patients_seen=w.patients_seen,
+                   overload_days=w.overload_days)
+
+    delete = db.query(PhcMonthlyStats)
+    if month:
+        delete = delete.filter(PhcMonthlyStats.month == month)
+    delete.delete(synchronize_session=False)
+    if rows:
+        db.execute(insert(PhcMonthlyStats), list(rows.values()))
+    db.commit()
+    return len(rows)
+
+
+if __name__ == "__main__":
+    import argparse
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Maintain the phc_monthly_stats rollup table.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild_cmd = sub.add_parser("rebuild", help="Recompute rollups from the raw tables.")
+    rebuild_cmd.add_argument("--month", help="Only rebuild this month, e.g. 2025-10")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        written = rebuild(db, month=args.month)
+        print(f"Rebuilt {written} phc_monthly_stats rows.")
+    finally:
+        db.close()
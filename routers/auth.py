@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from passlib.context import CryptContext
@@ -6,12 +6,15 @@ from passlib.context import CryptContext
 from database import get_db
 from models import User
 from schemas import UserSignup, UserLogin, TokenResponse
+import registry
+import partitions
 from jwt_handler import create_access_token
+from profiling import ProfiledRoute
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
-router = APIRouter(prefix="/auth", tags=["Auth"])
+router = APIRouter(prefix="/auth", tags=["Auth"], route_class=ProfiledRoute)
 
 def hash_password(password: str):
     return pwd_context.hash(password)
@@ -22,7 +25,7 @@ def verify_password(plain, hashed):
 
 
 @router.post("/signup", response_model=TokenResponse)
-def signup(user: UserSignup, db: Session = Depends(get_db)):
+def signup(user: UserSignup, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     if db.query(User).filter(User.email == user.email).first():
         raise HTTPException(400, "Email already exists")
     
@@ -41,7 +44,13 @@ def signup(user: UserSignup, db: Session = Depends(get_db)):
         phc_name  = user.name if user.role == "phc" else None,
         lga_id    = user.lga_id,
     )
-    db.add(new_user); db.commit(); db.refresh(new_user)
+    db.add(new_user)
+    if new_user.role == "phc" and new_user.lga_id:
+        registry.register(db, new_user.phc_id, user.name, new_user.lga_id)
+    db.commit(); db.refresh(new_user)
+    if new_user.lga_id:
+        # A first account for an LGA gets its own partitions (partitions.py)
+        background_tasks.add_task(partitions.ensure_lga, new_user.lga_id)
 
     access_token = create_access_token({
         "user_id": new_user.id,
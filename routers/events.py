@@ -0,0 +1,61 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from typing import Optional
+
+from jose import jwt
+from jwt_handler import SECRET_KEY, ALGORITHM
+import push
+from profiling import ProfiledRoute
+
+router = APIRouter(prefix="/events", tags=["Live Events"], route_class=ProfiledRoute)
+
+
+def get_stream_payload(request: Request, access_token: Optional[str] = None):
+    """
+    The JWT from the Authorization header or, for browsers' EventSource, which
+    cannot set headers, from the access_token query parameter.
+    """
+    token = access_token
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except Exception:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+
+
+@router.get("/stream")
+async def event_stream(request: Request, access_token: Optional[str] = None):
+    """
+    Server-Sent Events for the caller's facility (PHC) or LGA:
+    restock.created, restock.updated, issue.created, issue.updated and
+    report.submitted, each with the row's id and new status, and
+    restock.allocated with the ids of a facility's requests approved by a
+    bulk allocation, and stock.transferred when stock moves between two
+    facilities. On "resync",
+    reload the lists (or GET /sync/changes) and reconnect. On "expired",
+    reconnect with a fresh token. See push.py.
+    """
+    payload = get_stream_payload(request, access_token)
+    role = payload.get("role")
+    if role == "phc" and payload.get("phc_id"):
+        topics = push.topics_for(phc_id=payload["phc_id"])
+    elif role == "lga" and payload.get("lga_id"):
+        topics = push.topics_for(lga_id=payload["lga_id"])
+    else:
+        raise HTTPException(status_code=403, detail="Only PHC and LGA accounts can subscribe")
+
+    subscriber = push.hub.subscribe(topics)
+    if subscriber is None:
+        raise HTTPException(status_code=503, detail="Too many open event streams; poll instead",
+                            headers={"Retry-After": "30"})
+
+    hello = push.frame("ready", {"topics": list(topics), "retry_ms": 5000})
+    return StreamingResponse(
+        push.stream(subscriber, b"retry: 5000\n" + hello, expires_at=payload.get("exp")),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,78 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import List
+
+from database import get_db
+from models import Facility
+from schemas import FacilityRead, FacilityUpdate
+from .auth import oauth2_scheme
+from jose import jwt
+from jwt_handler import SECRET_KEY, ALGORITHM
+import registry
+import audit
+from profiling import ProfiledRoute
+
+router = APIRouter(prefix="/facilities", tags=["Facilities"], route_class=ProfiledRoute)
+
+
+def get_current_user_payload(token: str = Depends(oauth2_scheme)):
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        return payload
+    except:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+
+def _visible_facility(db: Session, phc_id: str, payload: dict):
+    """The facility, if the caller is that PHC or its LGA; 404 otherwise."""
+    facility = registry.registry.get(db, phc_id)
+    allowed = facility and (
+        (payload["role"] == "phc" and payload["phc_id"] == phc_id)
+        or (payload["role"] == "lga" and payload["lga_id"] == facility.lga_id)
+    )
+    if not allowed:
+        raise HTTPException(status_code=404, detail="Facility not found")
+    return facility
+
+
+@router.get("", response_model=List[FacilityRead])
+def list_facilities(db: Session = Depends(get_db), payload: dict = Depends(get_current_user_payload)):
+    """
+    LGAs get every facility in their LGA; a PHC gets its own.
+    Served from the in-process registry, not the database.
+    """
+    if payload["role"] == "lga":
+        return registry.registry.in_lga(db, payload["lga_id"])
+    facility = registry.registry.get(db, payload.get("phc_id"))
+    return [facility] if facility else []
+
+
+@router.get("/{phc_id}", response_model=FacilityRead)
+def get_facility(phc_id: str, db: Session = Depends(get_db), payload: dict = Depends(get_current_user_payload)):
+    return _visible_facility(db, phc_id, payload)
+
+
+@router.patch("/{phc_id}", response_model=FacilityRead)
+def update_facility(
+    phc_id: str,
+    data: FacilityUpdate,
+    db: Session = Depends(get_db),
+    payload: dict = Depends(get_current_user_payload)
+):
+    """
+    Update a facility's name, capacity or staffing.
+    Capacity decides when a day counts as overloaded, so only the LGA can change it.
+    """
+    _visible_facility(db, phc_id, payload)
+    fields = data.model_dump(exclude_unset=True)
+    if "capacity" in fields and payload["role"] != "lga":
+        raise HTTPException(status_code=403, detail="Only the LGA can change a facility's capacity.")
+
+    # From the row, not the registry, which can be a few seconds behind
+    current = db.query(Facility).filter(Facility.phc_id == phc_id).with_for_update().first()
+    before = audit.snapshot(current, *(f for f in fields if f in registry.EDITABLE_FIELDS))
+    facility = registry.update(db, phc_id, **fields)
+    audit.record(db, payload, "facility.updated", facility, entity_id=phc_id, changes=audit.diff(before, facility))
+    db.commit()
+    db.refresh(facility)
+    return facility
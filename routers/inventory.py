@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
@@ -6,13 +6,29 @@ from datetime import datetime
 from database import get_db
 from models import Inventory, RestockRequest, User
 from schemas import (RestockRequestCreate, RestockRequestRead,
-    RestockRequestUpdate, LowStockResponse, AutoRestockResponse, RestockRequestEdit
+    RestockRequestUpdate, LowStockResponse, AutoRestockResponse, RestockRequestEdit,
+    AllocationRequest, AllocationResponse, RestockRequestCreated, TransferSuggestion,
+    RequestTransferSuggestions, TransferCreate, TransferRead
 )
 from .auth import oauth2_scheme
 from jose import jwt
 from jwt_handler import SECRET_KEY, ALGORITHM
-
-router = APIRouter(prefix="/inventory", tags=["Inventory & Restock"])
+import rollups
+import versions
+import invalidation
+import push
+import jobs
+import audit
+import allocation
+import transfers
+import orjson
+from registry import registry
+from listing import RowList
+from profiling import ProfiledRoute
+
+router = APIRouter(prefix="/inventory", tags=["Inventory & Restock"], route_class=ProfiledRoute)
+
+restock_rows = RowList(RestockRequestRead, RestockRequest)
 
 # ---------------- GET CURRENT USER FROM JWT (NEW & CORRECT) ----------------
 def get_current_user_payload(token: str = Depends(oauth2_scheme)):
@@ -55,7 +71,7 @@ def get_low_stock_items(
 
 
 # ---------------- PHC: Create Restock Request ----------------
-@router.post("/restock-requests", response_model=RestockRequestRead, status_code=201)
+@router.post("/restock-requests", response_model=RestockRequestCreated, status_code=201)
 def create_restock_request(
     request: RestockRequestCreate,
     db: Session = Depends(get_db),
@@ -64,25 +80,43 @@ def create_restock_request(
     if payload["role"] != "phc":
         raise HTTPException(status_code=403, detail="Only PHCs can request restock")
 
+    facility = registry.for_token(db, payload)
     new_request = RestockRequest(
         item_name=request.item_name,
         quantity_needed=request.quantity_needed,
-        phc_id=payload["phc_id"],                    
-        phc_name=payload["name"],                   
+        phc_id=facility.phc_id,
+        phc_name=facility.name,
         requested_by=payload["operator_name"],
-        lga_id=payload["lga_id"],
+        lga_id=facility.lga_id,
         status="pending",
         request_date=datetime.utcnow()
     )
     db.add(new_request)
+    rollups.restock_created(db, new_request)
+    versions.bump(db, *versions.restock_scopes(new_request.phc_id, new_request.lga_id))
+    invalidation.publish(db, "lga_summary", new_request.lga_id)
+    db.flush()
+    push.publish(db, "restock.created", new_request.phc_id, new_request.lga_id, id=new_request.id,
+                 item_name=new_request.item_name, status=new_request.status)
+    audit.record(db, payload, "restock.created", new_request,
+                 changes={"item_name": new_request.item_name, "quantity_needed": new_request.quantity_needed})
     db.commit()
     db.refresh(new_request)
-    return new_request
+
+    # Neighbours that could send it sooner than central supply (see transfers.py)
+    created = RestockRequestCreated.model_validate(new_request)
+    created.transfer_suggestions = [
+        TransferSuggestion(**donor) for donor in transfers.suggest(
+            db, facility.lga_id, facility.phc_id, new_request.item_name, new_request.quantity_needed)
+    ]
+    return created
 
 
 # ---------------- LGA: View All Requests in Their LGA ----------------
 @router.get("/restock-requests", response_model=List[RestockRequestRead])
 def get_restock_requests(
+    request: Request,
+    response: Response,
     status_filter: str = "all",          # pending, approved, declined, all
     phc_id: Optional[str] = None,        # new
     phc_name: Optional[str] = None,      # new
@@ -91,13 +125,22 @@ def get_restock_requests(
 ):
     role = payload["role"]
 
+    # Dashboards poll this; answer 304 from the scope's version row when nothing changed
+    if role in ("phc", "lga"):
+        scope = f"restock:{role}:{payload['phc_id'] if role == 'phc' else payload['lga_id']}"
+        cached = versions.not_modified(request, response, db, scope)
+        if cached:
+            return cached
+
     if role == "phc":
-        # PHC only sees their own requests
-        query = db.query(RestockRequest).filter(RestockRequest.phc_id == payload["phc_id"])
+        # PHC only sees their own requests; the LGA narrows it to one partition
+        facility = registry.for_token(db, payload)
+        query = restock_rows.query(db).filter(RestockRequest.lga_id == facility.lga_id,
+                                              RestockRequest.phc_id == facility.phc_id)
 
     elif role == "lga":
         # LGA sees all requests inside their LGA
-        query = db.query(RestockRequest).filter(RestockRequest.lga_id == payload["lga_id"])
+        query = restock_rows.query(db).filter(RestockRequest.lga_id == payload["lga_id"])
 
         # Optional LGA filters
         if phc_id:
@@ -112,7 +155,8 @@ def get_restock_requests(
     if status_filter != "all":
         query = query.filter(RestockRequest.status == status_filter)
 
-    return query.order_by(RestockRequest.request_date.desc()).all()
+    # Column tuples serialized in bulk (see listing.py); lists run to thousands of rows
+    return restock_rows.response(query.order_by(RestockRequest.request_date.desc()).all(), response)
 
 
 
@@ -127,14 +171,25 @@ def update_restock_request(
     if payload["role"] != "lga":
         raise HTTPException(status_code=403, detail="Only LGA can approve/decline")
 
-    req = db.query(RestockRequest).filter(RestockRequest.id == request_id).first()
-    if not req or req.lga_id != payload["lga_id"]:
+    req = db.query(RestockRequest).filter(
+        RestockRequest.lga_id == payload["lga_id"],
+        RestockRequest.id == request_id
+    ).first()
+    if not req:
         raise HTTPException(status_code=404, detail="Request not found")
 
+    old_status = req.status
+    before = audit.snapshot(req, "status", "comments", "processed_by")
     req.status = update.status
     req.comments = update.comments or req.comments
     req.processed_by = payload["operator_name"]
     req.processed_at = datetime.utcnow()
+    rollups.restock_status_changed(db, req, old_status)
+    versions.bump(db, *versions.restock_scopes(req.phc_id, req.lga_id))
+    invalidation.publish(db, "lga_summary", req.lga_id)
+    push.publish(db, "restock.updated", req.phc_id, req.lga_id, id=req.id, status=req.status,
+                 previous_status=old_status)
+    audit.record(db, payload, f"restock.{req.status}", req, changes=audit.diff(before, req), critical=True)
 
     db.commit()
     db.refresh(req)
@@ -142,6 +197,43 @@ def update_restock_request(
 
 
 
+# ---------------- LGA: Allocate Short Supply Across Pending Requests ----------------
+@router.post("/restock-requests/allocate", response_model=AllocationResponse)
+def allocate_restock_requests(
+    body: AllocationRequest,
+    db: Session = Depends(get_db),
+    payload: dict = Depends(get_current_user_payload)
+):
+    """
+    Split the supplied quantity of each item over the LGA's pending requests so
+    that the facility with the fewest days of stock is raised first (see
+    allocation.py). With apply=true the allocated requests are approved in bulk.
+    """
+    if payload["role"] != "lga":
+        raise HTTPException(status_code=403, detail="Only LGA can allocate supply")
+    negative = sorted(name for name, qty in body.supply.items() if qty < 0)
+    if negative:
+        raise HTTPException(status_code=400, detail=f"Supply cannot be negative: {', '.join(negative)}")
+
+    lga_id = payload["lga_id"]
+    demand = allocation.load_demand(db, lga_id, body.supply, lock=body.apply)
+    plan = allocation.solve(demand)
+    approved = 0
+    if body.apply:
+        approved = allocation.apply(db, plan, lga_id, payload["operator_name"])
+        audit.record(db, payload, "restock.allocated", entity="allocation", entity_id=lga_id, lga_id=lga_id,
+                     changes={"supply": body.supply, "approved_requests": approved}, critical=True)
+        db.commit()
+
+    # 150k lines at full scale; orjson instead of per-line models, response_model kept for the docs
+    content = orjson.dumps({
+        "applied": body.apply, "approved_requests": approved, "solve_ms": round(plan.solve_ms, 1),
+        "items": allocation.summary(plan), "requests": allocation.lines(plan),
+    })
+    return Response(content=content, media_type="application/json")
+
+
+
 @router.post("/auto-restock-check", response_model=AutoRestockResponse)
 def auto_restock_check(
     threshold_days: int = 5,
@@ -151,15 +243,16 @@ def auto_restock_check(
     if payload["role"] != "phc":
         raise HTTPException(status_code=403, detail="Only PHCs can auto-generate restock checks")
 
-    phc_id = payload["phc_id"]
-    phc_name = payload["name"]
+    facility = registry.for_token(db, payload)
+    phc_id = facility.phc_id
+    phc_name = facility.name
     operator_name = payload["operator_name"]
-    lga_id = payload["lga_id"]
+    lga_id = facility.lga_id
 
     # Fetch all inventory items for this PHC
     items = db.query(Inventory).filter(Inventory.phc_id == phc_id).all()
 
-    created_count = 0
+    created = []
     skipped_items = []
 
     for item in items:
@@ -179,6 +272,7 @@ def auto_restock_check(
         pending_exists = (
             db.query(RestockRequest)
             .filter(
+                RestockRequest.lga_id == lga_id,
                 RestockRequest.phc_id == phc_id,
                 RestockRequest.item_name == item.item_name,
                 RestockRequest.status == "pending",
@@ -219,14 +313,95 @@ def auto_restock_check(
         )
 
         db.add(new_request)
-        created_count += 1
-
+        rollups.restock_created(db, new_request)
+        created.append(new_request)
+
+    if created:
+        versions.bump(db, *versions.restock_scopes(phc_id, lga_id))
+        invalidation.publish(db, "lga_summary", lga_id)
+        db.flush()
+        for new_request in created:
+            push.publish(db, "restock.created", phc_id, lga_id, id=new_request.id,
+                         item_name=new_request.item_name, status=new_request.status)
     db.commit()
 
+    suggestions = {}
+    for new_request in created:
+        donors = transfers.suggest(db, lga_id, phc_id, new_request.item_name, new_request.quantity_needed)
+        if donors:
+            suggestions[new_request.item_name] = donors
+
     return AutoRestockResponse(
-        created_requests=created_count,
-        skipped_items=skipped_items
+        created_requests=len(created),
+        skipped_items=skipped_items,
+        transfer_suggestions=suggestions
+    )
+
+
+
+# ---------------- LGA: Transfer Suggestions for Pending Requests ----------------
+@router.get("/transfer-suggestions", response_model=List[RequestTransferSuggestions])
+def get_transfer_suggestions(
+    item_name: Optional[str] = None,
+    phc_id: Optional[str] = None,
+    limit: int = transfers.MAX_SUGGESTIONS,
+    db: Session = Depends(get_db),
+    payload: dict = Depends(get_current_user_payload)
+):
+    """Pending requests that facilities in the LGA could cover with their surplus, best donors first."""
+    if payload["role"] != "lga":
+        raise HTTPException(status_code=403, detail="Only LGA can view transfer suggestions")
+    if not 1 <= limit < transfers.INDEX_DEPTH:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {transfers.INDEX_DEPTH - 1}")
+
+    lga_id = payload["lga_id"]
+    query = db.query(RestockRequest.id, RestockRequest.phc_id, RestockRequest.phc_name,
+                     RestockRequest.item_name, RestockRequest.quantity_needed).filter(
+        RestockRequest.lga_id == lga_id,
+        RestockRequest.status == "pending"
     )
+    if item_name:
+        query = query.filter(RestockRequest.item_name == item_name)
+    if phc_id:
+        query = query.filter(RestockRequest.phc_id == phc_id)
+
+    suggestions = []
+    for request_id, req_phc_id, phc_name, req_item, quantity in query.order_by(RestockRequest.request_date):
+        donors = transfers.suggest(db, lga_id, req_phc_id, req_item, quantity, limit=limit)
+        if donors:
+            suggestions.append(RequestTransferSuggestions(
+                request_id=request_id, phc_id=req_phc_id, phc_name=phc_name, item_name=req_item,
+                quantity_needed=quantity, donors=donors
+            ))
+    return suggestions
+
+
+
+# ---------------- LGA: Transfer Stock Between Facilities ----------------
+@router.post("/transfers", response_model=TransferRead, status_code=201)
+def create_transfer(
+    transfer: TransferCreate,
+    db: Session = Depends(get_db),
+    payload: dict = Depends(get_current_user_payload)
+):
+    """Move stock from one facility to another, optionally covering a pending restock request."""
+    if payload["role"] != "lga":
+        raise HTTPException(status_code=403, detail="Only LGA can transfer stock")
+
+    try:
+        record = transfers.execute(
+            db, payload["lga_id"], transfer.item_name, transfer.from_phc_id, transfer.to_phc_id,
+            transfer.quantity, payload["operator_name"], restock_request_id=transfer.restock_request_id
+        )
+    except transfers.TransferError as e:
+        db.rollback()
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    audit.record(db, payload, "stock.transferred", record, critical=True, changes={
+        "item_name": record.item_name, "quantity": record.quantity, "from_phc_id": record.from_phc_id,
+        "to_phc_id": record.to_phc_id, "restock_request_id": record.restock_request_id})
+    db.commit()
+    db.refresh(record)
+    return record
 
 
 
@@ -245,6 +420,7 @@ def edit_pending_request(
 
     # 2. Fetch the request ensuring it belongs to this PHC
     req = db.query(RestockRequest).filter(
+        RestockRequest.lga_id == registry.for_token(db, payload).lga_id,
         RestockRequest.id == request_id,
         RestockRequest.phc_id == payload["phc_id"]
     ).first()
@@ -260,13 +436,21 @@ def edit_pending_request(
         )
 
     # 4. Apply Updates
+    before = audit.snapshot(req, "item_name", "quantity_needed", "request_date")
     if update_data.item_name:
         req.item_name = update_data.item_name
     if update_data.quantity_needed:
         req.quantity_needed = update_data.quantity_needed
     
     # 5. Update timestamp so the LGA knows it was recently modified
+    old_request_date = req.request_date
     req.request_date = datetime.utcnow() 
+    rollups.restock_redated(db, req, old_request_date)
+    versions.bump(db, *versions.restock_scopes(req.phc_id, req.lga_id))
+    invalidation.publish(db, "lga_summary", req.lga_id)
+    push.publish(db, "restock.updated", req.phc_id, req.lga_id, id=req.id, status=req.status,
+                 item_name=req.item_name, quantity_needed=req.quantity_needed)
+    audit.record(db, payload, "restock.edited", req, changes=audit.diff(before, req))
 
     db.commit()
     db.refresh(req)
@@ -286,6 +470,7 @@ def cancel_pending_request(
 
     # 2. Fetch the request
     req = db.query(RestockRequest).filter(
+        RestockRequest.lga_id == registry.for_token(db, payload).lga_id,
         RestockRequest.id == request_id,
         RestockRequest.phc_id == payload["phc_id"]
     ).first()
@@ -303,10 +488,18 @@ def cancel_pending_request(
 
     # 4. Soft Cancel (Change status instead of deleting)
     #    Since your 'status' column is a String, we can safely set this to "cancelled"
+    before = audit.snapshot(req, "status", "comments")
     req.status = "cancelled"
     
     # Optional: Log who cancelled it in the comments
     req.comments = f"Cancelled by {payload.get('operator_name', 'user')}"
+    rollups.restock_status_changed(db, req, "pending")
+    versions.bump(db, *versions.restock_scopes(req.phc_id, req.lga_id))
+    invalidation.publish(db, "lga_summary", req.lga_id)
+    push.publish(db, "restock.updated", req.phc_id, req.lga_id, id=req.id, status=req.status,
+                 previous_status="pending")
+    # The old comments are kept here, not in the row
+    audit.record(db, payload, "restock.cancelled", req, changes=audit.diff(before, req))
 
     db.commit()
     db.refresh(req)
@@ -316,6 +509,23 @@ def cancel_pending_request(
 
 
 # ---------------- PHC: Confirm Receipt of Stock (The Logic that updates count) ----------------
+@jobs.handler("inventory.receive")
+def _add_received_stock(db: Session, payload: dict):
+    """Add a delivered request's quantity to the facility's stock; enqueued by receive_restock_items."""
+    inventory_item = db.query(Inventory).filter(
+        Inventory.phc_id == payload["phc_id"],
+        Inventory.item_name == payload["item_name"]
+    ).with_for_update().first()
+    if not inventory_item:
+        # Deleted since the request was received; retried, then left dead for someone to look at
+        raise LookupError(f"Item '{payload['item_name']}' not found in inventory of {payload['phc_id']}")
+
+    inventory_item.current_stock += payload["quantity"]
+    inventory_item.last_updated = datetime.utcnow()
+    transfers.stock_changed(db, payload["lga_id"], payload["item_name"])
+    invalidation.publish(db, "lga_summary", payload["lga_id"])
+
+
 @router.post("/restock-requests/{request_id}/receive", response_model=RestockRequestRead)
 def receive_restock_items(
     request_id: int,
@@ -326,11 +536,12 @@ def receive_restock_items(
     if payload["role"] != "phc":
         raise HTTPException(status_code=403, detail="Only PHCs can receive stock")
 
-    # 2. Fetch the request
+    # 2. Fetch the request, locked so two receipts cannot both add the stock
     req = db.query(RestockRequest).filter(
-        RestockRequest.id == request_id, 
+        RestockRequest.lga_id == registry.for_token(db, payload).lga_id,
+        RestockRequest.id == request_id,
         RestockRequest.phc_id == payload["phc_id"]
-    ).first()
+    ).with_for_update().first()
 
     if not req:
         raise HTTPException(status_code=404, detail="Request not found")
@@ -342,26 +553,34 @@ def receive_restock_items(
             detail=f"Cannot receive stock. Current status is '{req.status}', but must be 'approved'."
         )
 
-    # 4. FIND THE INVENTORY ITEM to update
-    inventory_item = db.query(Inventory).filter(
+    # 4. The item must still be in the inventory to update
+    in_inventory = db.query(Inventory.id).filter(
         Inventory.phc_id == payload["phc_id"],
         Inventory.item_name == req.item_name
     ).first()
 
-    if not inventory_item:
+    if not in_inventory:
         # Edge case: If item was deleted from inventory after request was made, create it or error out
         # Here we error out for safety
         raise HTTPException(status_code=404, detail=f"Item '{req.item_name}' not found in inventory to update.")
 
-    # 5. THE MAGIC: Increase the stock level
-    inventory_item.current_stock += req.quantity_needed
-    inventory_item.last_updated = datetime.utcnow()
+    # 5. THE MAGIC: a job increases the stock level once this commits (see jobs.py)
+    jobs.enqueue(db, "inventory.receive", {"phc_id": req.phc_id, "lga_id": req.lga_id,
+                                           "item_name": req.item_name, "quantity": req.quantity_needed,
+                                           "restock_request_id": req.id})
 
     # 6. Close the ticket
     req.status = "delivered"
     req.processed_at = datetime.utcnow() # Update timestamp to show when it arrived
+    rollups.restock_status_changed(db, req, "approved")
+    versions.bump(db, *versions.restock_scopes(req.phc_id, req.lga_id))
+    invalidation.publish(db, "lga_summary", req.lga_id)
+    push.publish(db, "restock.updated", req.phc_id, req.lga_id, id=req.id, status=req.status,
+                 previous_status="approved")
+    audit.record(db, payload, "restock.received", req, critical=True,
+                 changes={"status": ["approved", req.status], "stock_added": req.quantity_needed})
 
     db.commit()
     db.refresh(req)
     
-    return req
\ No newline at end of file
+    return req
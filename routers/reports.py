@@ -1,16 +1,40 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from datetime import datetime
+import json
+from contextlib import aclosing
 from typing import List
 
 from database import get_db
-from models import Issue, MonthlyReport, RestockRequest, Inventory, User
-from schemas import IssueCreate, IssueRead, ReportGenerate, ReportRead, ReportUpdate
+from models import Issue, MonthlyReport, User
+from schemas import IssueCreate, IssueRead, ReportGenerate, ReportRead, ReportUpdate, LgaSummaryResponse
 from .auth import oauth2_scheme
 from jose import jwt
 from jwt_handler import SECRET_KEY, ALGORITHM
+import rollups
+import versions
+import report_drafts
+import invalidation
+import push
+import audit
+from registry import registry
+from llm import get_narrative_model
+import cache
+from listing import RowList
+from profiling import ProfiledRoute
 
-router = APIRouter(prefix="/reports", tags=["Reports & Issues"])
+router = APIRouter(prefix="/reports", tags=["Reports & Issues"], route_class=ProfiledRoute)
+
+# (lga_id, month) -> consolidated LGA summary. Every write that changes a
+# facility's figures publishes an "lga_summary" invalidation for its LGA.
+lga_summary_cache = cache.named("lga_summary", maxsize=512, ttl=300)
+
+# Column tuples serialized in bulk for the list endpoints (see listing.py)
+issue_rows = RowList(IssueRead, Issue)
+report_rows = RowList(ReportRead, MonthlyReport)
 
 def get_current_user_payload(token: str = Depends(oauth2_scheme)):
     try:
@@ -28,115 +52,213 @@ def create_issue(issue: IssueCreate, db: Session = Depends(get_db), payload: dic
     if payload["role"] != "phc":
         raise HTTPException(status_code=403, detail="Only PHCs can report issues")
     
+    facility = registry.for_token(db, payload)
     new_issue = Issue(
-        phc_id=payload["phc_id"],
-        phc_name=payload.get("name"), # Link the PHC Name for the Admin to see
-        lga_id=payload["lga_id"],    # Link to the LGA jurisdiction
+        phc_id=facility.phc_id,
+        phc_name=facility.name,      # Link the PHC Name for the Admin to see
+        lga_id=facility.lga_id,      # Link to the LGA jurisdiction
         category=issue.category,
         priority=issue.priority,
         description=issue.description
     )
     db.add(new_issue)
+    rollups.issue_created(db, new_issue)
+    versions.bump(db, *versions.issue_scopes(new_issue.phc_id, new_issue.lga_id))
+    invalidation.publish(db, "lga_summary", new_issue.lga_id)
+    db.flush()
+    push.publish(db, "issue.created", new_issue.phc_id, new_issue.lga_id, id=new_issue.id,
+                 category=new_issue.category, priority=new_issue.priority, status=new_issue.status)
+    audit.record(db, payload, "issue.created", new_issue,
+                 changes={"category": new_issue.category, "priority": new_issue.priority})
     db.commit()
     db.refresh(new_issue)
     return new_issue
 
 
 @router.get("/issues", response_model=List[IssueRead])
-def get_issues(db: Session = Depends(get_db), payload: dict = Depends(get_current_user_payload)):
+def get_issues(request: Request, response: Response, db: Session = Depends(get_db), payload: dict = Depends(get_current_user_payload)):
+    if payload["role"] in ("phc", "lga"):
+        scope_id = payload["phc_id"] if payload["role"] == "phc" else payload["lga_id"]
+        cached = versions.not_modified(request, response, db, f"issues:{payload['role']}:{scope_id}")
+        if cached:
+            return cached
+
     if payload["role"] == "phc":
-        return db.query(Issue).filter(Issue.phc_id == payload["phc_id"]).order_by(Issue.created_at.desc()).all()
+        facility = registry.for_token(db, payload)
+        rows = issue_rows.query(db).filter(
+            Issue.lga_id == facility.lga_id,
+            Issue.phc_id == facility.phc_id
+        ).order_by(Issue.created_at.desc()).all()
+        return issue_rows.response(rows, response)
     
     # NEW: Allow LGAs to see issues for their specific area
     elif payload["role"] == "lga":
-        return db.query(Issue).filter(Issue.lga_id == payload["lga_id"]).order_by(Issue.created_at.desc()).all()
+        rows = issue_rows.query(db).filter(Issue.lga_id == payload["lga_id"]).order_by(Issue.created_at.desc()).all()
+        return issue_rows.response(rows, response)
     
     return []
 
 
 @router.post("/generate", response_model=ReportRead)
 def generate_monthly_report(data: ReportGenerate, db: Session = Depends(get_db), payload: dict = Depends(get_current_user_payload)):
-    phc_id = payload["phc_id"]
-    month_str = data.month_str
-
-    # 1. Check if report already exists
-    existing = db.query(MonthlyReport).filter(
-        MonthlyReport.phc_id == phc_id, 
-        MonthlyReport.month == month_str
-    ).first()
-    
-    if existing:
-        return existing # Return existing draft if clicked again
-
-    # 2. "AI" LOGIC: Gather Stats
-    # Count Restock Requests
-    restock_count = db.query(RestockRequest).filter(
-        RestockRequest.phc_id == phc_id,
-        # In real app, filter by date range of month_str
-    ).count()
-
-    # Count Issues
-    issue_count = db.query(Issue).filter(Issue.phc_id == phc_id).count()
-    
-    # Count Low Stock Items
-    low_stock = db.query(Inventory).filter(Inventory.phc_id == phc_id, Inventory.current_stock < 10).count()
-
-    # 3. Generate "AI" Narrative
-    ai_text = (
-        f"**Monthly Executive Summary - {month_str}**\n\n"
-        f"**Operational Overview:**\n"
-        f"The facility operated at standard capacity this month. We processed {restock_count} inventory restock requests to maintain supply levels. "
-        f"Currently, we have {low_stock} items flagged as low stock that require attention.\n\n"
-        f"**Infrastructure & Issues:**\n"
-        f"We logged {issue_count} facility issues this month. Key areas of concern include Water Supply and Power stability.\n\n"
-        f"**Recommendations:**\n"
-        f"We request the LGA to expedite the approval of pending drug orders to ensure continuous care."
+    # Drafts are pre-generated on the 1st (report_drafts.py), so this is normally a
+    # single lookup. Facilities the job has not reached yet get theirs generated now.
+    facility = registry.for_token(db, payload)
+    return report_drafts.get_or_create_draft(
+        db,
+        phc_id=facility.phc_id,
+        phc_name=facility.name,       # Store the Name for the Admin UI
+        lga_id=facility.lga_id,       # Store LGA ID so Admin can fetch it
+        month_str=data.month_str,
     )
 
-    report = MonthlyReport(
-        phc_id=phc_id,
-        phc_name=payload.get("name"), # Store the Name for the Admin UI
-        lga_id=payload["lga_id"],    # Store LGA ID so Admin can fetch it
-        month=month_str,
-        content=ai_text,
-        status="Draft"
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _narrative_events(model, prompt: str, report_id: int, lga_id: str, request: Request):
+    """
+    Relay the model's chunks as Server-Sent Events and store the full text once
+    the stream completes. If the client disconnects, the model's stream is
+    closed right away and nothing is saved.
+    """
+    yield _sse("start", {"report_id": report_id})
+    parts = []
+    try:
+        # aclosing() closes the model's stream (and its upstream HTTP stream) as soon
+        # as we stop reading, instead of whenever the abandoned generator is collected
+        async with aclosing(model.stream(prompt)) as pieces:
+            async for piece in pieces:
+                if await request.is_disconnected():
+                    return
+                parts.append(piece)
+                yield _sse("chunk", {"text": piece})
+    except Exception as e:
+        print(f"Narrative streaming error: {e}")
+        yield _sse("error", {"detail": "AI narrative generation failed. The existing draft was kept."})
+        return
+
+    content = "".join(parts).strip()
+    saved = await run_in_threadpool(report_drafts.save_narrative, report_id, lga_id, content)
+    yield _sse("done", {"report_id": report_id, "saved": saved})
+
+
+@router.post("/generate/stream")
+def stream_monthly_report(
+    data: ReportGenerate,
+    request: Request,
+    db: Session = Depends(get_db),
+    payload: dict = Depends(get_current_user_payload),
+    model = Depends(get_narrative_model)
+):
+    """
+    Streams an AI-written narrative for the month's report as Server-Sent Events
+    (start, chunk..., done) and saves it as the draft's content when complete.
+    """
+    if payload["role"] != "phc":
+        raise HTTPException(status_code=403, detail="Only PHCs can generate reports")
+    if model is None:
+        raise HTTPException(status_code=503, detail="AI narrative service is unavailable (API key not configured).")
+
+    facility = registry.for_token(db, payload)
+    report = report_drafts.get_or_create_draft(
+        db,
+        phc_id=facility.phc_id,
+        phc_name=facility.name,
+        lga_id=facility.lga_id,
+        month_str=data.month_str,
     )
-    db.add(report)
-    db.commit()
-    db.refresh(report)
-    return report
+    if report.status == "Submitted":
+        raise HTTPException(status_code=400, detail="Report already submitted")
+
+    stats = rollups.get_monthly_stats(db, report.phc_id, report.month)
+    low_stock = report_drafts.low_stock_counts(db, [report.phc_id]).get(report.phc_id, 0)
+    prompt = report_drafts.narrative_prompt(report.month, report.phc_name, stats, low_stock)
+
+    return StreamingResponse(
+        _narrative_events(model, prompt, report.id, report.lga_id, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
 @router.get("/", response_model=List[ReportRead])
-def get_reports(db: Session = Depends(get_db), payload: dict = Depends(get_current_user_payload)):
+def get_reports(request: Request, response: Response, db: Session = Depends(get_db), payload: dict = Depends(get_current_user_payload)):
+    if payload["role"] in ("phc", "lga"):
+        scope_id = payload["phc_id"] if payload["role"] == "phc" else payload["lga_id"]
+        cached = versions.not_modified(request, response, db, f"reports:{payload['role']}:{scope_id}")
+        if cached:
+            return cached
+
     # PHC: See their own drafts and submissions
     if payload["role"] == "phc":
-        return db.query(MonthlyReport).filter(MonthlyReport.phc_id == payload["phc_id"]).order_by(MonthlyReport.month.desc()).all()
+        facility = registry.for_token(db, payload)
+        rows = report_rows.query(db).filter(
+            MonthlyReport.lga_id == facility.lga_id,
+            MonthlyReport.phc_id == facility.phc_id
+        ).order_by(MonthlyReport.month.desc()).all()
+        return report_rows.response(rows, response)
     
     # LGA: See only SUBMITTED reports in their LGA
     elif payload["role"] == "lga":
-        return db.query(MonthlyReport).filter(
+        rows = report_rows.query(db).filter(
             MonthlyReport.lga_id == payload["lga_id"],
             MonthlyReport.status == "Submitted"
         ).order_by(MonthlyReport.created_at.desc()).all()
+        return report_rows.response(rows, response)
         
     return []
 
 
+@router.get("/lga-summary", response_model=LgaSummaryResponse)
+def get_lga_summary(month_str: str, db: Session = Depends(get_db), payload: dict = Depends(get_current_user_payload)):
+    if payload["role"] != "lga":
+        raise HTTPException(status_code=403, detail="Only LGAs can view the consolidated report")
+
+    return lga_summary_cache.get_or_load(
+        (payload["lga_id"], month_str),
+        lambda: rollups.lga_summary(db, payload["lga_id"], month_str),
+    )
+
+
+def caller_lga(db: Session, payload: dict) -> str:
+    # monthly_reports is partitioned by lga_id; a lookup by id alone would plan against every LGA's partition
+    return registry.for_token(db, payload).lga_id if payload["role"] == "phc" else payload.get("lga_id")
+
+
+def _report_for(db: Session, payload: dict, report_id: int):
+    """The report, if the caller may change it: any in the LGA's jurisdiction, or a PHC's own."""
+    query = db.query(MonthlyReport).filter(
+        MonthlyReport.lga_id == caller_lga(db, payload),
+        MonthlyReport.id == report_id
+    )
+    if payload["role"] == "phc":
+        query = query.filter(MonthlyReport.phc_id == payload["phc_id"])
+    return query.first()
+
+
 @router.put("/{report_id}", response_model=ReportRead)
-def update_report(report_id: int, update: ReportUpdate, db: Session = Depends(get_db)):
-    report = db.query(MonthlyReport).filter(MonthlyReport.id == report_id).first()
+def update_report(report_id: int, update: ReportUpdate, db: Session = Depends(get_db), payload: dict = Depends(get_current_user_payload)):
+    report = _report_for(db, payload, report_id)
     if not report or report.status == "Submitted":
         raise HTTPException(status_code=400, detail="Report not found or already submitted")
+    before = audit.snapshot(report, "content")
     report.content = update.content
+    versions.bump(db, *versions.report_scopes(report.phc_id))
+    audit.record(db, payload, "report.edited", report, changes=audit.diff(before, report))
     db.commit()
     return report
 
 @router.post("/{report_id}/submit", response_model=ReportRead)
-def submit_report(report_id: int, db: Session = Depends(get_db)):
-    report = db.query(MonthlyReport).filter(MonthlyReport.id == report_id).first()
+def submit_report(report_id: int, db: Session = Depends(get_db), payload: dict = Depends(get_current_user_payload)):
+    report = _report_for(db, payload, report_id)
     if not report:
         raise HTTPException(status_code=404, detail="Report not found")
     report.status = "Submitted"
+    versions.bump(db, *versions.report_scopes(report.phc_id, report.lga_id))
+    invalidation.publish(db, "lga_summary", report.lga_id, report.month)
+    push.publish(db, "report.submitted", report.phc_id, report.lga_id, id=report.id, month=report.month)
+    audit.record(db, payload, "report.submitted", report, changes={"month": report.month})
     db.commit()
     return report
 
@@ -148,6 +270,19 @@ def update_issue_status(issue_id: int, status: str, db: Session = Depends(get_db
     issue = db.query(Issue).filter(Issue.id == issue_id, Issue.lga_id == payload["lga_id"]).first()
     if not issue:
         raise HTTPException(status_code=404, detail="Issue not found")
+    old_status = issue.status
     issue.status = status
+    try:
+        db.flush()
+    except IntegrityError:
+        # Re-opening an automated alert while a newer one is open (uq_issues_open_staffing_shortage)
+        db.rollback()
+        raise HTTPException(status_code=409, detail="This facility already has an open automated staffing alert.")
+    rollups.issue_status_changed(db, issue, old_status)
+    versions.bump(db, *versions.issue_scopes(issue.phc_id, issue.lga_id))
+    invalidation.publish(db, "lga_summary", issue.lga_id)
+    push.publish(db, "issue.updated", issue.phc_id, issue.lga_id, id=issue.id, status=issue.status,
+                 previous_status=old_status)
+    audit.record(db, payload, "issue.updated", issue, changes={"status": [old_status, issue.status]})
     db.commit()
     return issue
\ No newline at end of file
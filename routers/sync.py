@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.orm import Session
+from typing import Optional
+
+from database import get_db
+from .auth import oauth2_scheme
+from jose import jwt
+from jwt_handler import SECRET_KEY, ALGORITHM
+import sync
+from registry import registry
+from profiling import ProfiledRoute
+
+router = APIRouter(prefix="/sync", tags=["Offline Sync"], route_class=ProfiledRoute)
+
+
+def get_current_user_payload(token: str = Depends(oauth2_scheme)):
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        return payload
+    except:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+
+@router.get("/changes")
+def get_changes(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(sync.DEFAULT_LIMIT, ge=1, le=sync.MAX_LIMIT),
+    db: Session = Depends(get_db),
+    payload: dict = Depends(get_current_user_payload),
+):
+    """
+    Inventory, restock requests, issues and monthly reports changed since `cursor`
+    (everything if omitted), for the caller's facility or LGA. See sync.py.
+
+    Each table comes back as {"columns": [...], "values": [[column values]...],
+    "deleted": [ids]}. Upsert the values by id, then drop the deleted ids. Keep
+    calling with the returned cursor while `more` is true, and store the last
+    cursor for the next reconnect. If `reset` is true, replace the local data
+    with what this round returns.
+    """
+    role = payload.get("role")
+    scope_id = payload.get("phc_id") if role == "phc" else payload.get("lga_id") if role == "lga" else None
+    if not scope_id:
+        raise HTTPException(status_code=403, detail="Only PHC and LGA accounts can sync")
+
+    try:
+        lga_id = registry.for_token(db, payload).lga_id if role == "phc" else None
+        page = sync.changes(db, role, scope_id, cursor=cursor, limit=limit, lga_id=lga_id)
+    except sync.CursorError as e:
+        # The client should drop the cursor and sync from scratch
+        raise HTTPException(status_code=400, detail=f"{e}; sync again without a cursor")
+
+    body, headers = sync.render(page, request.headers.get("accept-encoding", ""))
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,19 +1,32 @@
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
-from datetime import datetime
-from typing import List
+from datetime import datetime, timedelta, timezone
+from typing import List, Literal, Optional
 
 from database import get_db
-from models import DailyWorkload, Issue
-from schemas import DailyWorkloadCreate, ForecastResponse
+from models import DailyWorkload
+from schemas import (DailyWorkloadCreate, ForecastResponse, FacilityForecastRead, CheckInResponse,
+    WorkloadLogCreate, WorkloadLogResponse, QueueRollupRead
+)
 from .auth import oauth2_scheme
 from jose import jwt
 from jwt_handler import SECRET_KEY, ALGORITHM
+import rollups
+import forecasting
+import invalidation
+import jobs
+import checkins
+import overload
+import telemetry
+from registry import registry
+from profiling import ProfiledRoute
 
 
 router = APIRouter(
     prefix="/workload",
-    tags=["Workload & Forecast"]
+    tags=["Workload & Forecast"],
+    route_class=ProfiledRoute
 )
 
 def get_current_user_payload(token: str = Depends(oauth2_scheme)):
@@ -46,80 +59,136 @@ def submit_daily_workload(
             detail="Only PHCs are allowed to log daily workload."
         )
 
-    phc_id = payload["phc_id"]
+    facility = registry.for_token(db, payload)
+    phc_id = facility.phc_id
     today = datetime.utcnow().date()
-    phc_capacity = 50  # Can later be moved to a Facility model
-
-    # 1. Save or update today's workload
-    workload = (
-        db.query(DailyWorkload)
-        .filter(
-            DailyWorkload.phc_id == phc_id,
-            DailyWorkload.date == today
-        )
-        .first()
+    phc_capacity = facility.capacity
+
+    # 1. Save or update today's workload. The upsert against (phc_id, date) means
+    #    two concurrent submissions cannot both insert a row for the same day, and
+    #    the overload streak is carried forward from yesterday's row in the same statement.
+    stmt = insert(DailyWorkload).values(
+        phc_id=phc_id,
+        date=today,
+        patient_count=data.patient_count,
+        capacity=phc_capacity,
+        overload_streak=overload.streak_values(phc_id, today, data.patient_count, phc_capacity)
     )
-
-    if workload:
-        workload.patient_count = data.patient_count
-    else:
-        workload = DailyWorkload(
-            phc_id=phc_id,
-            date=today,
-            patient_count=data.patient_count,
-            capacity=phc_capacity
-        )
-        db.add(workload)
-
+    overload_streak = db.execute(
+        stmt.on_conflict_do_update(
+            constraint="uq_daily_workload_phc_date",
+            set_={
+                "patient_count": stmt.excluded.patient_count,
+                "capacity": stmt.excluded.capacity,
+                "overload_streak": overload.streak_on_conflict(stmt.excluded.patient_count, stmt.excluded.capacity),
+            }
+        ).returning(DailyWorkload.overload_streak)
+    ).scalar()
+    rollups.workload_changed(db, phc_id, facility.lga_id, today)
+
+    # 2. Over capacity for 3 consecutive days: a job opens the staffing alert,
+    #    unless one is open already, after this commits (see jobs.py)
+    if overload_streak >= overload.STREAK_DAYS:
+        jobs.enqueue(db, "overload.open_staffing_issues", {"phc_ids": [phc_id]})
+
+    # 3. Refit this facility's forecast (weekday profile + trend) and store the
+    #    next days so GET /workload/forecast can serve them without re-reading history.
+    #    The workload, the alert job and the forecast are committed together.
+    tomorrow = forecasting.run_forecasts(db, today=today, phc_ids=[phc_id])[phc_id]
+    forecasting.invalidate(db, phc_id, facility.lga_id)
+    invalidation.publish(db, "lga_summary", facility.lga_id)
     db.commit()
 
-    # 2. Check for 3-day overload streak
-    recent_history = (
-        db.query(DailyWorkload)
-        .filter(DailyWorkload.phc_id == phc_id)
-        .order_by(DailyWorkload.date.desc())
-        .limit(3)
-        .all()
+    return ForecastResponse(
+        tomorrow_load=tomorrow["forecast_load"],
+        status=tomorrow["status"],
+        message="Daily workload saved and forecast generated successfully.",
+        tomorrow_lower=tomorrow["forecast_lower"],
+        tomorrow_upper=tomorrow["forecast_upper"],
     )
 
-    if len(recent_history) == 3 and all(
-        day.patient_count > day.capacity for day in recent_history
-    ):
-        existing_issue = (
-            db.query(Issue)
-            .filter(
-                Issue.phc_id == phc_id,
-                Issue.category == "Staffing Shortage",
-                Issue.status == "Open"
-            )
-            .first()
-        )
 
-        if not existing_issue:
-            new_issue = Issue(
-                phc_id=phc_id,
-                phc_name=payload.get("name"),
-                lga_id=payload["lga_id"],
-                category="Staffing Shortage",
-                priority="High",
-                description=(
-                    "AUTOMATED ALERT: This PHC has exceeded its patient "
-                    "capacity for three consecutive days. Immediate staffing "
-                    "support is required."
-                )
+@router.post("/check-in", response_model=CheckInResponse, status_code=202)
+def check_in_patient(payload: dict = Depends(get_current_user_payload)):
+    """
+    Counts one arriving patient towards today's workload.
+    Arrivals are buffered in memory and added to daily_workload in batches
+    every few seconds (see checkins.py), so this never waits on the database.
+    """
+    if payload.get("role") != "phc":
+        raise HTTPException(status_code=403, detail="Only PHCs can check patients in.")
+
+    today = datetime.utcnow().date()
+    pending = checkins.buffer.add(payload["phc_id"], payload["lga_id"], today)
+    return CheckInResponse(phc_id=payload["phc_id"], date=today, pending=pending)
+
+
+# ---------------- INTRADAY QUEUE TELEMETRY ----------------
+MAX_SNAPSHOTS_PER_BATCH = 1440   # a day of per-minute snapshots from a device that was offline
+
+def _buffer_snapshots(snapshots: List[WorkloadLogCreate], payload: dict) -> WorkloadLogResponse:
+    if payload.get("role") != "phc":
+        raise HTTPException(status_code=403, detail="Only PHCs can send queue snapshots.")
+
+    now = datetime.now(timezone.utc)
+    rows = []
+    for s in snapshots:
+        recorded_at = telemetry.snapshot_time(s.recorded_at, now)
+        if recorded_at is None:
+            raise HTTPException(
+                status_code=422,
+                detail="recorded_at must be within the last 24 hours and not in the future."
             )
-            db.add(new_issue)
-            db.commit()
+        rows.append((payload["phc_id"], recorded_at, s.current_queue_count, s.avg_wait_time, s.completed_visits_today))
+    pending = telemetry.buffer.add(rows)
+    return WorkloadLogResponse(accepted=len(rows), pending=pending)
 
-    # 3. Generate simple next-day forecast (mean + 10% buffer)
-    avg_load = sum(day.patient_count for day in recent_history) / len(recent_history)
-    tomorrow_forecast = int(avg_load * 1.10)
 
-    return ForecastResponse(
-        tomorrow_load=tomorrow_forecast,
-        status="Overwhelmed" if tomorrow_forecast > phc_capacity else "Optimal",
-        message="Daily workload saved and forecast generated successfully."
-    )
+@router.post("/queue", response_model=WorkloadLogResponse, status_code=202)
+def log_queue_snapshot(data: WorkloadLogCreate, payload: dict = Depends(get_current_user_payload)):
+    """
+    Records one intraday queue snapshot (sent about once a minute).
+    Snapshots are buffered and written in batches; see telemetry.py.
+    """
+    return _buffer_snapshots([data], payload)
+
+
+@router.post("/queue/batch", response_model=WorkloadLogResponse, status_code=202)
+def log_queue_snapshots(data: List[WorkloadLogCreate], payload: dict = Depends(get_current_user_payload)):
+    """
+    Records several snapshots at once, e.g. from a device catching up after being offline.
+    """
+    if len(data) > MAX_SNAPSHOTS_PER_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_SNAPSHOTS_PER_BATCH} snapshots per batch.")
+    return _buffer_snapshots(data, payload)
+
+
+@router.get("/queue", response_model=List[QueueRollupRead])
+def get_queue_history(
+    resolution: Literal["15m", "1d"] = "15m",
+    hours: int = 24,
+    phc_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+    payload: dict = Depends(get_current_user_payload)
+):
+    """
+    Queue history from the downsampled rollups: 15-minute buckets for the last
+    `hours`, or daily buckets. PHCs see their own; LGAs see every facility in
+    the LGA, or one with `phc_id`.
+    """
+    if payload.get("role") == "phc":
+        phc_ids = [payload["phc_id"]]
+    elif payload.get("role") == "lga":
+        phc_ids = [f.phc_id for f in registry.in_lga(db, payload["lga_id"])]
+        if phc_id:
+            phc_ids = [p for p in phc_ids if p == phc_id]
+    else:
+        raise HTTPException(status_code=403, detail="Not allowed")
+
+    since = datetime.now(timezone.utc) - timedelta(hours=min(max(hours, 1), 24 * 90))
+    if resolution == "1d":
+        since = since.replace(hour=0, minute=0, second=0, microsecond=0)
+    return telemetry.get_rollups(db, phc_ids, resolution, since)
 
 
 @router.get("/forecast", response_model=ForecastResponse)
@@ -131,4 +200,31 @@ def get_current_forecast(
     Returns the most recent forecast for dashboard display
     without modifying stored data.
     """
-    pass
\ No newline at end of file
+    if payload.get("role") != "phc":
+        raise HTTPException(status_code=403, detail="Only PHCs have a facility forecast. LGAs use /workload/forecast/lga.")
+
+    forecast = forecasting.get_facility_forecast(db, payload["phc_id"], datetime.utcnow().date())
+    if not forecast:
+        raise HTTPException(status_code=404, detail="No forecast yet. Submit today's workload to generate one.")
+
+    return ForecastResponse(
+        tomorrow_load=forecast.forecast_load,
+        status=forecast.status,
+        message=f"Forecast for {forecast.target_date.isoformat()}.",
+        tomorrow_lower=forecast.forecast_lower,
+        tomorrow_upper=forecast.forecast_upper,
+    )
+
+
+@router.get("/forecast/lga", response_model=List[FacilityForecastRead])
+def get_lga_forecasts(
+    db: Session = Depends(get_db),
+    payload: dict = Depends(get_current_user_payload)
+):
+    """
+    Returns the upcoming forecast of every facility in the caller's LGA.
+    """
+    if payload.get("role") != "lga":
+        raise HTTPException(status_code=403, detail="Only LGAs can view facility forecasts across the LGA.")
+
+    return forecasting.get_lga_forecasts(db, payload["lga_id"], datetime.utcnow().date())
\ No newline at end of file
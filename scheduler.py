@@ -0,0 +1,124 @@
+"""
+Background jobs run inside the API process with APScheduler.
+
+Every app worker starts a scheduler; jobs that must only run once per
+deployment take a Postgres advisory lock (database.advisory_lock).
+Set SCHEDULER_ENABLED=0 to run workers without it, e.g. when a dedicated
+process owns the jobs.
+"""
+import os
+
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+
+import report_drafts
+import forecasting
+import overload
+import telemetry
+import sync
+import partitions
+import idempotency
+import jobs
+import audit
+
+scheduler = BackgroundScheduler(timezone="UTC")
+
+
+def start_scheduler():
+    if os.getenv("SCHEDULER_ENABLED", "1") == "0" or scheduler.running:
+        return
+
+    # 01:00 UTC on the 1st: drafts for the month that just ended
+    scheduler.add_job(
+        report_drafts.pregenerate_drafts,
+        CronTrigger(day=1, hour=1, minute=0),
+        id="pregenerate_report_drafts",
+        replace_existing=True,
+        coalesce=True,
+        max_instances=1,
+        misfire_grace_time=6 * 60 * 60,
+    )
+    # 02:00 UTC daily: refit every facility's workload forecast on the day's submissions
+    scheduler.add_job(
+        forecasting.run_nightly_forecasts,
+        CronTrigger(hour=2, minute=0),
+        id="nightly_workload_forecasts",
+        replace_existing=True,
+        coalesce=True,
+        max_instances=1,
+        misfire_grace_time=2 * 60 * 60,
+    )
+    # 23:30 UTC daily: open staffing alerts for every facility over capacity 3+ days running
+    scheduler.add_job(
+        overload.run_overload_detection,
+        CronTrigger(hour=23, minute=30),
+        id="overload_detection",
+        replace_existing=True,
+        coalesce=True,
+        max_instances=1,
+        misfire_grace_time=2 * 60 * 60,
+    )
+    # Every 5 minutes: roll raw queue snapshots into 15-minute/daily buckets and expire old ones
+    scheduler.add_job(
+        telemetry.run_downsampler,
+        IntervalTrigger(minutes=5),
+        id="downsample_queue_telemetry",
+        replace_existing=True,
+        coalesce=True,
+        max_instances=1,
+    )
+    # 03:30 UTC daily: drop delta-sync tombstones past their retention window
+    scheduler.add_job(
+        sync.run_tombstone_pruner,
+        CronTrigger(hour=3, minute=30),
+        id="prune_sync_tombstones",
+        replace_existing=True,
+        coalesce=True,
+        max_instances=1,
+        misfire_grace_time=2 * 60 * 60,
+    )
+    # Hourly: attach partitions for LGAs that signed up without getting one
+    scheduler.add_job(
+        partitions.run_partition_sweep,
+        IntervalTrigger(hours=1),
+        id="attach_lga_partitions",
+        replace_existing=True,
+        coalesce=True,
+        max_instances=1,
+    )
+    # Every 15 minutes: delete expired idempotency keys
+    scheduler.add_job(
+        idempotency.run_sweeper,
+        IntervalTrigger(minutes=15),
+        id="sweep_idempotency_keys",
+        replace_existing=True,
+        coalesce=True,
+        max_instances=1,
+    )
+    # 04:00 UTC daily: drop background jobs that ran out of attempts long ago
+    scheduler.add_job(
+        jobs.run_dead_job_pruner,
+        CronTrigger(hour=4, minute=0),
+        id="prune_dead_jobs",
+        replace_existing=True,
+        coalesce=True,
+        max_instances=1,
+        misfire_grace_time=2 * 60 * 60,
+    )
+    # 04:30 UTC daily: create the coming months' audit_log partitions, drop expired ones
+    scheduler.add_job(
+        audit.run_partition_maintenance,
+        CronTrigger(hour=4, minute=30),
+        id="audit_log_partitions",
+        replace_existing=True,
+        coalesce=True,
+        max_instances=1,
+        misfire_grace_time=12 * 60 * 60,
+    )
+    scheduler.start()
+
+
+def shutdown_scheduler():
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
@@ -1,7 +1,7 @@
-from pydantic import BaseModel, Field, EmailStr
-from typing import Optional, List, Literal
+from pydantic import BaseModel, Field, EmailStr, field_validator
+from typing import Optional, List, Literal, Dict
 import enum
-from datetime import datetime
+from datetime import datetime, date
 
 
 class Sex(str, enum.Enum):
@@ -153,14 +153,83 @@ class RestockRequestUpdate(BaseModel):
     status: Literal["approved", "declined"]
     comments: Optional[str] = None
 
+class TransferSuggestion(BaseModel):
+    phc_id: str
+    phc_name: str
+    quantity: int           # what it could send towards this need
+    available: int          # all it can spare
+    days_cover: float
+
+class RestockRequestCreated(RestockRequestRead):
+    transfer_suggestions: List[TransferSuggestion] = []
+
 class AutoRestockResponse(BaseModel):
     created_requests: int
     skipped_items: List[str] = []
+    transfer_suggestions: Dict[str, List[TransferSuggestion]] = {}     # item_name -> donors
+
+class RequestTransferSuggestions(BaseModel):
+    request_id: int
+    phc_id: str
+    phc_name: str
+    item_name: str
+    quantity_needed: int
+    donors: List[TransferSuggestion]
+
+class TransferCreate(BaseModel):
+    item_name: str
+    from_phc_id: str
+    to_phc_id: str
+    quantity: int = Field(..., gt=0)
+    restock_request_id: Optional[int] = None
+
+class TransferRead(BaseModel):
+    id: int
+    lga_id: str
+    item_name: str
+    from_phc_id: str
+    to_phc_id: str
+    quantity: int
+    restock_request_id: Optional[int] = None
+    created_by: str
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
 
 class RestockRequestEdit(BaseModel):
     item_name: Optional[str] = None
     quantity_needed: Optional[int] = Field(None, gt=0)
 
+class AllocationRequest(BaseModel):
+    supply: Dict[str, int]          # item_name -> units the LGA can send
+    apply: bool = False             # approve the allocated requests as well
+
+class AllocationItem(BaseModel):
+    item_name: str
+    available: int
+    requested: int
+    allocated: int
+    level_days: Optional[float] = None      # None when supply covers every request
+    min_days_before: Optional[float] = None
+    min_days_after: Optional[float] = None
+
+class AllocationLine(BaseModel):
+    id: int
+    phc_id: str
+    item_name: str
+    quantity_needed: int
+    allocated: int
+    days_before: float
+    days_after: float
+
+class AllocationResponse(BaseModel):
+    applied: bool
+    approved_requests: int
+    solve_ms: float
+    items: List[AllocationItem]
+    requests: List[AllocationLine]
+
 
 
 
@@ -194,6 +263,62 @@ class ReportRead(BaseModel):
     class Config:
         from_attributes = True
 
+# --- LGA CONSOLIDATED REPORT ---
+class MonthlyCounters(BaseModel):
+    restock_requests: int
+    restock_pending: int
+    restock_approved: int
+    restock_declined: int
+    restock_cancelled: int
+    restock_delivered: int
+    issues_logged: int
+    issues_open: int
+    issues_open_high: int
+    workload_days: int
+    patients_seen: int
+    overload_days: int
+    stock_outs: int
+
+class FacilitySummary(MonthlyCounters):
+    rank: int
+    phc_id: str
+    phc_name: Optional[str] = None
+    risk_score: int
+    report_status: Optional[str] = None # None if no report was generated
+
+class LgaTotals(MonthlyCounters):
+    reports_submitted: int
+
+class LgaSummaryResponse(BaseModel):
+    lga_id: str
+    month: str
+    facility_count: int
+    totals: LgaTotals
+    facilities: List[FacilitySummary] # Highest risk first
+
+class FacilityRead(BaseModel):
+    phc_id: str
+    name: str
+    lga_id: str
+    capacity: int # patients per day before the facility counts as overloaded
+    staff_count: Optional[int] = None
+
+    class Config:
+        orm_mode = True
+
+class FacilityUpdate(BaseModel):
+    name: Optional[str] = None
+    capacity: Optional[int] = Field(None, gt=0) # LGA only
+    staff_count: Optional[int] = Field(None, ge=0)
+
+    @field_validator("name", "capacity")
+    @classmethod
+    def not_null(cls, value):
+        # May be left out, but not cleared: both columns are NOT NULL (staff_count may be)
+        if value is None:
+            raise ValueError("may not be null")
+        return value
+
 
 
 
@@ -212,10 +337,10 @@ class ReportRead(BaseModel):
 
 # ---------- WORKLOAD MONITORING SCHEMAS ----------
 class WorkloadLogCreate(BaseModel):
-    phc_id: int
-    current_queue_count: int
-    avg_wait_time: float
-    completed_visits_today: int
+    current_queue_count: int = Field(..., ge=0, le=10_000)
+    avg_wait_time: float = Field(..., ge=0, le=1440) # minutes, at most a day
+    completed_visits_today: int = Field(..., ge=0, le=10_000)
+    recorded_at: Optional[datetime] = None # when the snapshot was taken; defaults to when it arrives
 
 class WorkloadForecastResponse(BaseModel):
     forecast_next_day: float
@@ -224,15 +349,19 @@ class WorkloadForecastResponse(BaseModel):
     message: str
 
 class WorkloadLogResponse(BaseModel):
-    id: int
-    phc_id: int
-    date: datetime
-    current_queue_count: int
-    avg_wait_time: float
-    completed_visits_today: int
+    accepted: int
+    pending: int # snapshots buffered in this worker, not yet written
 
-    class Config:
-        orm_mode = True
+class QueueRollupRead(BaseModel):
+    phc_id: str
+    resolution: str # "15m" or "1d"
+    bucket_start: datetime
+    samples: int
+    avg_queue: float
+    max_queue: int
+    avg_wait_time: float
+    max_wait_time: float
+    completed_visits: int
 
 
 
@@ -242,4 +371,25 @@ class DailyWorkloadCreate(BaseModel):
 class ForecastResponse(BaseModel):
     tomorrow_load: int
     status: str # "Optimal" or "Overwhelmed"
-    message: str
\ No newline at end of file
+    message: str
+    tomorrow_lower: Optional[int] = None # 80% prediction interval
+    tomorrow_upper: Optional[int] = None
+
+class CheckInResponse(BaseModel):
+    phc_id: str
+    date: date
+    pending: int # arrivals buffered in this worker, not yet written to daily_workload
+
+class FacilityForecastRead(BaseModel):
+    phc_id: str
+    phc_name: Optional[str] = None
+    target_date: date
+    forecast_load: int
+    forecast_lower: Optional[int] = None
+    forecast_upper: Optional[int] = None
+    capacity: int
+    status: str
+    generated_at: datetime
+
+    class Config:
+        from_attributes = True
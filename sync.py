@@ -0,0 +1,255 @@
+"""
+Delta sync for offline-first clients.
+
+PHC tablets keep a local copy of their inventory, restock requests, issues
+and monthly reports (an LGA client keeps its whole LGA's). Before this,
+every reconnect re-downloaded all of it. Now the client sends the cursor
+from its last sync and gets back only the rows inserted or changed since,
+plus the ids of rows deleted since.
+
+Every tracked row carries change_xid. A trigger sets it to the id of the
+transaction that last wrote the row, and deletes leave a sync_tombstones
+row (migration 0003). Transaction ids increase, but transactions commit out
+of order: after a row from transaction 105 is visible, transaction 103 can
+still commit. So a cursor cannot be "the highest change_xid seen". It is the
+xmin of the snapshot taken when the sync round started, the oldest
+transaction that was still running then. Every transaction below it has
+finished, so no row can appear later with a change_xid below the cursor.
+Rows from transactions at or above it may be sent again in the next round.
+Clients upsert by id, so repeats are harmless, and only a few are repeated.
+
+A round is paged: each page returns up to `limit` rows per table, ordered
+by (change_xid, id), and `more` is true until the round is complete. The
+cursor in the last page starts the next round. Tables are columnar (one
+list per column), which compresses far better than one object per row.
+The response is gzipped when the client accepts it.
+
+Tombstones are kept for TOMBSTONE_RETENTION_DAYS. A client whose cursor is
+older than the last pruned tombstone may have missed a delete. It gets
+`reset: true` and a full copy, and should replace its local data with it.
+"""
+import base64
+import gzip
+from datetime import datetime, timedelta, timezone
+
+import orjson
+from sqlalchemy import func, select, text, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from models import Facility, Inventory, Issue, JobWatermark, MonthlyReport, RestockRequest, SyncTombstone
+import partitions
+
+FORMAT = 1
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+TOMBSTONE_RETENTION_DAYS = 30
+PRUNED_WATERMARK = "sync_tombstones_pruned"     # highest change_xid of a pruned tombstone
+PRUNE_LOCK = "sync:prune-tombstones"
+GZIP_MIN_BYTES = 512
+
+
+class CursorError(ValueError):
+    pass
+
+
+class Stream:
+    """One synced table: the columns clients receive and the rows each role may see."""
+
+    def __init__(self, name: str, model, columns, phc_scope, lga_scope):
+        self.name = name
+        self.model = model
+        self.fields = columns
+        self.columns = [getattr(model, c) for c in columns]
+        self.phc_scope = phc_scope
+        self.lga_scope = lga_scope
+
+    def criteria(self, role: str, scope_id: str, lga_id: str = None) -> list:
+        if role != "phc":
+            return self.lga_scope(scope_id)
+        criteria = self.phc_scope(scope_id)
+        # The facility's LGA confines the query to one partition (partitions.py)
+        if lga_id and self.name in partitions.TABLES:
+            criteria.append(self.model.lga_id == lga_id)
+        return criteria
+
+
+STREAMS = [
+    Stream(
+        "inventory", Inventory,
+        ["id", "phc_id", "item_name", "item_type", "current_stock", "unit", "daily_consumption_rate", "last_updated"],
+        lambda phc_id: [Inventory.phc_id == phc_id],
+        lambda lga_id: [Inventory.phc_id.in_(select(Facility.phc_id).where(Facility.lga_id == lga_id))],
+    ),
+    Stream(
+        "restock_requests", RestockRequest,
+        ["id", "phc_id", "phc_name", "item_name", "quantity_needed", "requested_by", "request_date", "status",
+         "comments", "processed_by", "processed_at", "priority_level"],
+        lambda phc_id: [RestockRequest.phc_id == phc_id],
+        lambda lga_id: [RestockRequest.lga_id == lga_id],
+    ),
+    Stream(
+        "issues", Issue,
+        ["id", "phc_id", "phc_name", "category", "priority", "description", "status", "created_at"],
+        lambda phc_id: [Issue.phc_id == phc_id],
+        lambda lga_id: [Issue.lga_id == lga_id],
+    ),
+    Stream(
+        "monthly_reports", MonthlyReport,
+        ["id", "phc_id", "phc_name", "month", "content", "status", "created_at"],
+        lambda phc_id: [MonthlyReport.phc_id == phc_id],
+        # LGAs only see submitted reports, as in GET /reports/
+        lambda lga_id: [MonthlyReport.lga_id == lga_id, MonthlyReport.status == "Submitted"],
+    ),
+    Stream(
+        "deleted", SyncTombstone,
+        ["table_name", "row_id"],
+        lambda phc_id: [SyncTombstone.phc_id == phc_id],
+        lambda lga_id: [SyncTombstone.lga_id == lga_id],
+    ),
+]
+
+
+# ---------------- CURSORS ----------------
+# Opaque to clients: urlsafe base64 of
+#   {"v": FORMAT, "s": scope, "since": xid, "upto": xid, "after": {stream: [xid, id] or None}}
+# "upto" and "after" are only present mid-round; "after" lists the streams with
+# rows left, at the last row sent (None: not started).
+def encode_cursor(state: dict) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps(state)).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, scope: str) -> dict:
+    try:
+        state = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if state["v"] != FORMAT or not isinstance(state["since"], int):
+            raise CursorError("Unsupported cursor version")
+    except CursorError:
+        raise
+    except Exception:
+        raise CursorError("Malformed cursor")
+    if state.get("s") != scope:
+        raise CursorError("Cursor belongs to another account")
+    return state
+
+
+def snapshot_xmin(db: Session) -> int:
+    """Every transaction with a lower id has committed or aborted."""
+    return db.execute(text("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")).scalar()
+
+
+def pruned_watermark(db: Session) -> int:
+    return db.query(JobWatermark.value).filter(JobWatermark.name == PRUNED_WATERMARK).scalar() or 0
+
+
+# ---------------- CHANGES ----------------
+def changes(db: Session, role: str, scope_id: str, cursor: str = None, limit: int = DEFAULT_LIMIT,
+            lga_id: str = None) -> dict:
+    """One page of changes for the caller's scope since `cursor` (None: everything). PHCs pass their `lga_id`."""
+    scope = f"{role}:{scope_id}"
+    state = decode_cursor(cursor, scope) if cursor else {"since": 0}
+    reset = False
+    if "upto" not in state:
+        # A new round. Deletes older than the last pruned tombstone are gone,
+        # so a client that far behind starts again from a full copy.
+        if state["since"] and state["since"] <= pruned_watermark(db):
+            state["since"] = 0
+            reset = True
+        state["upto"] = snapshot_xmin(db)
+        state["after"] = {stream.name: None for stream in STREAMS}
+
+    tables = {}
+    after = {}
+    for stream in STREAMS:
+        if stream.name not in state["after"]:
+            continue
+        position = state["after"][stream.name]
+        model = stream.model
+        query = (
+            db.query(model.change_xid, model.id, *stream.columns)
+            .filter(*stream.criteria(role, scope_id, lga_id))
+            .filter(model.change_xid >= state["since"])
+        )
+        if position:
+            query = query.filter(tuple_(model.change_xid, model.id) > tuple_(*position))
+        rows = query.order_by(model.change_xid, model.id).limit(limit + 1).all()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            after[stream.name] = list(rows[-1][:2])
+        if not rows:
+            continue
+        if stream.name == "deleted":
+            for _, _, table_name, row_id in rows:
+                tables.setdefault(table_name, _empty(table_name))["deleted"].append(row_id)
+        else:
+            table = tables.setdefault(stream.name, _empty(stream.name))
+            table["values"] = [list(column) for column in zip(*(row[2:] for row in rows))]
+
+    more = bool(after)
+    if more:
+        next_state = {"v": FORMAT, "s": scope, "since": state["since"], "upto": state["upto"], "after": after}
+    else:
+        next_state = {"v": FORMAT, "s": scope, "since": state["upto"]}
+    return {
+        "format": FORMAT,
+        "cursor": encode_cursor(next_state),
+        "more": more,
+        "reset": reset,
+        "tables": tables,
+    }
+
+
+def _empty(name: str) -> dict:
+    stream = next((s for s in STREAMS if s.name == name), None)
+    return {"columns": stream.fields if stream else [], "values": [], "deleted": []}
+
+
+def render(page: dict, accept_encoding: str = "") -> tuple:
+    """The page as JSON bytes, gzipped if the client accepts it, and the headers to send with it."""
+    body = orjson.dumps(page, option=orjson.OPT_UTC_Z)
+    headers = {"Cache-Control": "private, no-store", "Vary": "Accept-Encoding"}
+    if len(body) >= GZIP_MIN_BYTES and "gzip" in accept_encoding.lower():
+        body = gzip.compress(body, compresslevel=6)
+        headers["Content-Encoding"] = "gzip"
+    return body, headers
+
+
+# ---------------- TOMBSTONE PRUNING ----------------
+def prune_tombstones(db: Session, retention_days: int = TOMBSTONE_RETENTION_DAYS) -> int:
+    """Delete tombstones older than the retention window and record how far pruning got."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    pruned = (
+        db.query(SyncTombstone.change_xid)
+        .filter(SyncTombstone.deleted_at < cutoff)
+        .order_by(SyncTombstone.change_xid.desc())
+        .limit(1)
+        .scalar()
+    )
+    if pruned is None:
+        return 0
+    # Record the watermark first: a client whose cursor is at or below it is reset
+    stmt = insert(JobWatermark).values(name=PRUNED_WATERMARK, value=pruned)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[JobWatermark.name],
+        set_={"value": func.greatest(JobWatermark.value, pruned), "updated_at": func.now()},
+    )
+    db.execute(stmt)
+    deleted = db.query(SyncTombstone).filter(SyncTombstone.deleted_at < cutoff).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+def run_tombstone_pruner():
+    """Scheduler entry point: one pruner per deployment."""
+    from database import SessionLocal, advisory_lock
+
+    with advisory_lock(PRUNE_LOCK) as locked:
+        if not locked:
+            return
+        db = SessionLocal()
+        try:
+            deleted = prune_tombstones(db)
+            if deleted:
+                print(f"Pruned {deleted} sync tombstones older than {TOMBSTONE_RETENTION_DAYS} days")
+        finally:
+            db.close()
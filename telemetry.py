@@ -0,0 +1,322 @@
+"""
+Intraday queue telemetry.
+
+Each PHC posts a queue snapshot (people waiting, average wait, visits
+completed so far today) about once a minute. Snapshots are buffered per
+worker and written every FLUSH_INTERVAL seconds, or as soon as MAX_BATCH are
+waiting, with a single COPY into queue_snapshots. If the database rejects
+the COPY because of a bad row, the batch is retried in halves and only the
+rows that still fail are discarded; if it is unreachable, the batch stays
+buffered (up to MAX_BUFFERED snapshots).
+
+A scheduled downsampler rolls the raw points into 15-minute and daily rows in
+queue_rollups, and deletes raw points older than RAW_RETENTION once they have
+been rolled up. Dashboards only read queue_rollups.
+
+The downsampler is incremental: it keeps the highest queue_snapshots.id it
+has processed in job_watermarks, and rebuilds just the buckets that new
+points fall into from all of their raw points, so re-running it is harmless.
+Snapshots older than MAX_SNAPSHOT_AGE are refused at ingest, so a rebuilt
+bucket always still has all of its raw points.
+
+    python telemetry.py downsample
+"""
+import io
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import psycopg2
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from buffers import PeriodicFlusher
+from database import engine
+from models import JobWatermark, QueueRollup, QueueSnapshot
+
+FLUSH_INTERVAL = float(os.getenv("TELEMETRY_FLUSH_SECONDS", "1"))
+MAX_BATCH = 10_000               # flush early once this many snapshots are waiting
+MAX_BUFFERED = 200_000           # past this (database down), the oldest snapshots are dropped
+MAX_SNAPSHOT_AGE = timedelta(hours=24)
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+RAW_RETENTION = timedelta(hours=48)
+ROLLUP_15M_RETENTION = timedelta(days=90)
+EXPIRY_CHUNK = 50_000
+DOWNSAMPLE_LOCK = "telemetry.downsample"
+WATERMARK = "queue_snapshots.downsampled"
+COPY_COLUMNS = ("phc_id", "recorded_at", "current_queue_count", "avg_wait_time", "completed_visits_today")
+REJECTED = (psycopg2.DataError, psycopg2.IntegrityError)     # the row is bad, not the connection
+
+
+# ---------------- INGEST ----------------
+def _copy_text(value) -> str:
+    if isinstance(value, str):
+        return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def copy_snapshots(rows: list):
+    """Write (phc_id, recorded_at, queue, wait, completed) tuples with one COPY."""
+    buffer = io.StringIO()
+    buffer.writelines("\t".join(map(_copy_text, row)) + "\n" for row in rows)
+    buffer.seek(0)
+    raw = engine.raw_connection()
+    try:
+        raw.cursor().copy_expert(
+            f"COPY queue_snapshots ({', '.join(COPY_COLUMNS)}) FROM STDIN", buffer
+        )
+        raw.commit()
+    finally:
+        raw.close()
+
+
+def snapshot_time(recorded_at, now: datetime) -> datetime:
+    """Normalise a client timestamp to UTC; None if it is too old or in the future to accept."""
+    if recorded_at is None:
+        return now
+    if recorded_at.tzinfo is None:
+        recorded_at = recorded_at.replace(tzinfo=timezone.utc)
+    recorded_at = recorded_at.astimezone(timezone.utc)
+    if not now - MAX_SNAPSHOT_AGE <= recorded_at <= now + MAX_CLOCK_SKEW:
+        return None
+    return recorded_at
+
+
+class SnapshotBuffer(PeriodicFlusher):
+    """Per-process queue snapshots waiting to be copied into queue_snapshots."""
+    name = "telemetry"
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL, writer=copy_snapshots):
+        super().__init__(flush_interval)
+        self.writer = writer
+        self.dropped = 0
+        self._rows = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def add(self, rows: list) -> int:
+        """Queue snapshot tuples; returns how many are waiting in this worker."""
+        with self._lock:
+            self._rows.extend(rows)
+            waiting = len(self._rows)
+        if waiting >= MAX_BATCH:
+            self.wake()
+        return waiting
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._rows)
+
+    def _requeue(self, rows: list):
+        with self._lock:
+            self._rows = rows + self._rows
+            overflow = len(self._rows) - MAX_BUFFERED
+            if overflow > 0:
+                del self._rows[:overflow]
+                self.dropped += overflow
+                print(f"Telemetry buffer full: dropped the {overflow} oldest snapshots")
+
+    def _write(self, batch: list) -> int:
+        """
+        Write `batch`. If the database rejects a row (a value that got past
+        validation), the failed part is retried in halves until the bad rows
+        are isolated, and those are discarded; returns how many. Any other
+        error re-queues what is not yet written and re-raises.
+        """
+        chunks, rejected = [batch], 0
+        while chunks:
+            rows = chunks.pop()
+            try:
+                self.writer(rows)
+            except REJECTED as e:
+                if len(rows) == 1:
+                    rejected += 1
+                    print(f"Telemetry snapshot discarded, rejected by the database: {rows[0]!r}: "
+                          f"{str(e).strip().splitlines()[0]}")
+                    continue
+                half = len(rows) // 2
+                chunks += [rows[half:], rows[:half]]
+            except Exception:
+                self._requeue(rows + [row for chunk in reversed(chunks) for row in chunk])
+                raise
+        return rejected
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                batch, self._rows = self._rows, []
+            if not batch:
+                return 0
+            rejected = self._write(batch)
+            self.dropped += rejected
+            return len(batch) - rejected
+
+
+buffer = SnapshotBuffer()
+
+
+# ---------------- DOWNSAMPLING ----------------
+# Rebuild every 15-minute bucket that has points with id in (low, high]
+ROLLUP_15M_SQL = text("""
+WITH touched AS (
+    SELECT DISTINCT phc_id, date_bin('15 minutes', recorded_at, TIMESTAMPTZ '2000-01-01 00:00+00') AS bucket_start
+    FROM queue_snapshots
+    WHERE id > :low AND id <= :high
+)
+INSERT INTO queue_rollups
+    (phc_id, resolution, bucket_start, samples, queue_sum, queue_max, wait_sum, wait_max, completed_visits)
+SELECT s.phc_id, '15m', t.bucket_start, count(*), sum(s.current_queue_count), max(s.current_queue_count),
+       sum(s.avg_wait_time), max(s.avg_wait_time), max(s.completed_visits_today)
+FROM touched t
+JOIN queue_snapshots s
+  ON s.phc_id = t.phc_id
+ AND s.recorded_at >= t.bucket_start
+ AND s.recorded_at < t.bucket_start + INTERVAL '15 minutes'
+GROUP BY s.phc_id, t.bucket_start
+ON CONFLICT ON CONSTRAINT uq_queue_rollups_phc_res_bucket DO UPDATE SET
+    samples = excluded.samples, queue_sum = excluded.queue_sum, queue_max = excluded.queue_max,
+    wait_sum = excluded.wait_sum, wait_max = excluded.wait_max, completed_visits = excluded.completed_visits
+""")
+
+# Rebuild every (UTC) day those points fall into from its 15-minute rows
+ROLLUP_1D_SQL = text("""
+WITH touched AS (
+    SELECT DISTINCT phc_id, date_trunc('day', recorded_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS day_start
+    FROM queue_snapshots
+    WHERE id > :low AND id <= :high
+)
+INSERT INTO queue_rollups
+    (phc_id, resolution, bucket_start, samples, queue_sum, queue_max, wait_sum, wait_max, completed_visits)
+SELECT r.phc_id, '1d', t.day_start, sum(r.samples), sum(r.queue_sum), max(r.queue_max),
+       sum(r.wait_sum), max(r.wait_max), max(r.completed_visits)
+FROM touched t
+JOIN queue_rollups r
+  ON r.phc_id = t.phc_id
+ AND r.resolution = '15m'
+ AND r.bucket_start >= t.day_start
+ AND r.bucket_start < t.day_start + INTERVAL '1 day'
+GROUP BY r.phc_id, t.day_start
+ON CONFLICT ON CONSTRAINT uq_queue_rollups_phc_res_bucket DO UPDATE SET
+    samples = excluded.samples, queue_sum = excluded.queue_sum, queue_max = excluded.queue_max,
+    wait_sum = excluded.wait_sum, wait_max = excluded.wait_max, completed_visits = excluded.completed_visits
+""")
+
+
+def _committed_high_water(db: Session) -> int:
+    """
+    The highest snapshot id such that every lower id is committed. The SHARE
+    lock waits for in-flight COPYs to finish and is released straight away;
+    anything inserted after it gets a higher id.
+    """
+    db.execute(text("LOCK TABLE queue_snapshots IN SHARE MODE"))
+    high = db.query(func.coalesce(func.max(QueueSnapshot.id), 0)).scalar()
+    db.commit()
+    return high
+
+
+def downsample(db: Session) -> dict:
+    started = time.perf_counter()
+    high = _committed_high_water(db)
+    low = db.query(JobWatermark.value).filter(JobWatermark.name == WATERMARK).scalar() or 0
+
+    buckets = 0
+    if high > low:
+        params = {"low": low, "high": high}
+        buckets = db.execute(ROLLUP_15M_SQL, params).rowcount
+        db.execute(ROLLUP_1D_SQL, params)
+        stmt = insert(JobWatermark).values(name=WATERMARK, value=high)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[JobWatermark.name],
+            set_={"value": stmt.excluded.value, "updated_at": func.now()},
+        ))
+        db.commit()
+
+    # Raw points past retention have been rolled up (id <= high); delete in chunks
+    # so a large backlog never holds one long transaction
+    cutoff = datetime.now(timezone.utc) - RAW_RETENTION
+    expired = 0
+    while True:
+        doomed = (
+            select(QueueSnapshot.id)
+            .where(QueueSnapshot.recorded_at < cutoff, QueueSnapshot.id <= high)
+            .limit(EXPIRY_CHUNK)
+        )
+        deleted = db.query(QueueSnapshot).filter(QueueSnapshot.id.in_(doomed)).delete(synchronize_session=False)
+        db.commit()
+        expired += deleted
+        if deleted < EXPIRY_CHUNK:
+            break
+
+    db.query(QueueRollup).filter(
+        QueueRollup.resolution == "15m",
+        QueueRollup.bucket_start < datetime.now(timezone.utc) - ROLLUP_15M_RETENTION,
+    ).delete(synchronize_session=False)
+    db.commit()
+    return {
+        "new_points": high - low if high > low else 0,
+        "buckets_15m": buckets,
+        "expired": expired,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def run_downsampler():
+    """Scheduler entry point: one downsampler per deployment."""
+    from database import SessionLocal, advisory_lock
+
+    with advisory_lock(DOWNSAMPLE_LOCK) as locked:
+        if not locked:
+            return
+        db = SessionLocal()
+        try:
+            result = downsample(db)
+            if result["new_points"] or result["expired"]:
+                print(f"Queue telemetry downsampled: {result}")
+        finally:
+            db.close()
+
+
+# ---------------- READS ----------------
+def get_rollups(db: Session, phc_ids, resolution: str, since: datetime) -> list:
+    rows = (
+        db.query(QueueRollup)
+        .filter(
+            QueueRollup.phc_id.in_(phc_ids),
+            QueueRollup.resolution == resolution,
+            QueueRollup.bucket_start >= since,
+        )
+        .order_by(QueueRollup.phc_id, QueueRollup.bucket_start)
+    )
+    return [
+        {
+            "phc_id": r.phc_id,
+            "resolution": r.resolution,
+            "bucket_start": r.bucket_start,
+            "samples": r.samples,
+            "avg_queue": round(r.queue_sum / r.samples, 1),
+            "max_queue": r.queue_max,
+            "avg_wait_time": round(r.wait_sum / r.samples, 1),
+            "max_wait_time": r.wait_max,
+            "completed_visits": r.completed_visits,
+        }
+        for r in rows
+    ]
+
+
+if __name__ == "__main__":
+    import argparse
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Queue telemetry maintenance.")
+    parser.add_argument("command", choices=["downsample"])
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        print(downsample(db))
+    finally:
+        db.close()
@@ -0,0 +1,286 @@
+"""
+Stock transfers between facilities of an LGA, suggested from a surplus index.
+
+One PHC may hold 90 days of a drug that a neighbour has run out of. The
+neighbour's restock request still goes to the LGA and waits for central
+supply. This module finds the neighbours that can spare the item and moves
+the stock between them.
+
+Surplus index. Every worker keeps, per LGA and item, the facilities holding
+more than RESERVE_DAYS of their own consumption:
+- each donor has the units it can give while keeping RESERVE_DAYS, and its
+  days of cover;
+- donors are sorted by days of cover, most first, and the best
+  INDEX_DEPTH are kept;
+- facilities with no consumption rate are left out, since their cover is
+  unknown.
+A lookup is a dict access and a slice, a few microseconds, rather than a
+scan of the LGA's inventory. An LGA is loaded in one query the first time
+it is asked for, and again after INDEX_TTL.
+
+Keeping it current: every write that changes a facility's stock of an item
+calls stock_changed(db, lga_id, item_name). That publishes a
+"surplus_index" invalidation (invalidation.py), and once the write commits
+every worker marks that one item stale. The next lookup of a stale item
+reloads only that item's rows for the LGA. A load that raced an
+invalidation is not stored, so stale donors cannot come back. The TTL
+covers stock changed outside the app.
+
+Suggestions are returned:
+- when a PHC creates a restock request or auto-restock creates them;
+- from GET /inventory/transfer-suggestions, for the LGA's pending requests.
+
+POST /inventory/transfers (execute()) moves stock as one paired movement:
+- both facilities' inventory rows are locked in phc_id order, so two
+  opposite transfers cannot deadlock;
+- the donor's stock goes down and the recipient's goes up by the same
+  quantity;
+- a stock_transfers row records the movement;
+- if a pending restock request is given, it is delivered, or reduced by
+  what the transfer covered.
+All of this happens in the caller's transaction.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import groupby, islice
+from operator import itemgetter
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+import invalidation
+import metrics
+import push
+import rollups
+import versions
+from models import Inventory, RestockRequest, StockTransfer
+from registry import registry
+
+TARGET = "surplus_index"
+RESERVE_DAYS = 30           # a donor keeps this many days of its own consumption
+MAX_SUGGESTIONS = 3
+INDEX_DEPTH = 20            # donors kept per item; a lookup can ask for one fewer
+INDEX_TTL = 300.0           # backstop for stock changed outside the app
+
+# The INDEX_DEPTH best donors per item, already in index order
+_LOAD = """
+SELECT item_name, phc_id, available, days_cover
+FROM (
+    SELECT item_name, phc_id,
+           CAST(floor(sum(current_stock) - :reserve * max(daily_consumption_rate)) AS integer) AS available,
+           sum(current_stock) / max(daily_consumption_rate) AS days_cover,
+           row_number() OVER (PARTITION BY item_name
+                              ORDER BY sum(current_stock) / max(daily_consumption_rate) DESC, phc_id) AS rank
+    FROM inventory
+    WHERE phc_id = ANY(:phc_ids) {items}
+    GROUP BY item_name, phc_id
+    HAVING max(daily_consumption_rate) > 0 AND sum(current_stock) - :reserve * max(daily_consumption_rate) >= 1
+) donors
+WHERE rank <= :depth
+ORDER BY item_name, rank
+"""
+
+
+class TransferError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass(frozen=True)
+class Donor:
+    phc_id: str
+    phc_name: str
+    available: int          # units it can give and still keep RESERVE_DAYS
+    days_cover: float
+
+
+# ---------------- SURPLUS INDEX ----------------
+@dataclass(frozen=True)
+class _Entry:
+    items: dict             # item_name -> tuple of Donor, most days of cover first
+    stale: frozenset        # items invalidated since the load
+    expires_at: float
+
+
+class SurplusIndex:
+    """Per-worker index of facilities with surplus stock, by LGA and item."""
+
+    def __init__(self, ttl: float = INDEX_TTL):
+        self.ttl = ttl
+        self._lgas = {}                     # lga_id -> _Entry, replaced whole, never mutated
+        self._generations = {}              # lga_id -> invalidations seen, see _store()
+        self._epoch = 0                     # bumped when everything is dropped
+        self._lock = threading.Lock()
+        self._hits = metrics.CACHE_LOOKUPS.labels(TARGET, "hit")
+        self._misses = metrics.CACHE_LOOKUPS.labels(TARGET, "miss")
+
+    def donors(self, db: Session, lga_id: str, item_name: str, exclude: str = None,
+               limit: int = MAX_SUGGESTIONS) -> list:
+        """The best `limit` donors of the item in the LGA, other than `exclude`."""
+        donors = self._items(db, lga_id, item_name).get(item_name, ())
+        return list(islice((d for d in donors if d.phc_id != exclude), limit))
+
+    def _items(self, db: Session, lga_id: str, item_name: str) -> dict:
+        entry = self._lgas.get(lga_id)
+        if entry is not None and entry.expires_at > time.monotonic() and item_name not in entry.stale:
+            self._hits.inc()
+            return entry.items
+        self._misses.inc()
+        with self._lock:
+            entry, generation = self._lgas.get(lga_id), self._generation(lga_id)
+        if entry is None or entry.expires_at <= time.monotonic():
+            items = _load(db, lga_id)
+        else:
+            items = {**entry.items, **dict.fromkeys(entry.stale, ())}
+            items.update(_load(db, lga_id, entry.stale))
+        self._store(lga_id, items, generation)
+        return items
+
+    def _generation(self, lga_id: str) -> tuple:
+        # Caller holds self._lock
+        return self._epoch, self._generations.get(lga_id, 0)
+
+    def _store(self, lga_id: str, items: dict, generation: tuple):
+        # Only if no invalidation for the LGA arrived while loading; otherwise
+        # the next lookup loads again
+        with self._lock:
+            if self._generation(lga_id) == generation:
+                self._lgas[lga_id] = _Entry(items, frozenset(), time.monotonic() + self.ttl)
+
+    def invalidate(self, lga_id: str = None, item_name: str = None):
+        """Mark one item stale, drop one LGA, or (no arguments) drop everything."""
+        with self._lock:
+            if lga_id is None:
+                self._epoch += 1
+                self._lgas = {}
+                return
+            self._generations[lga_id] = self._generations.get(lga_id, 0) + 1
+            entry = self._lgas.get(lga_id)
+            if entry is None:
+                return
+            if item_name is None:
+                del self._lgas[lga_id]
+            else:
+                self._lgas[lga_id] = _Entry(entry.items, entry.stale | {item_name}, entry.expires_at)
+
+    def __len__(self):
+        return len(self._lgas)
+
+
+def _load(db: Session, lga_id: str, items=None) -> dict:
+    """Donors per item for the LGA's facilities (only `items`, if given)."""
+    names = {f.phc_id: f.name for f in registry.in_lga(db, lga_id)}
+    if not names:
+        return {}
+    params = {"phc_ids": list(names), "reserve": RESERVE_DAYS, "depth": INDEX_DEPTH}
+    if items is not None:
+        params["items"] = list(items)
+    rows = db.execute(text(_LOAD.format(items="AND item_name = ANY(:items)" if items is not None else "")),
+                      params)
+    return {
+        item: tuple(Donor(phc_id, names[phc_id], available, days) for _, phc_id, available, days in group)
+        for item, group in groupby(rows, key=itemgetter(0))
+    }
+
+
+index = SurplusIndex()
+invalidation.subscribe(TARGET, index.invalidate)
+
+
+def stock_changed(db: Session, lga_id: str, item_name: str):
+    """Call in any transaction that changes a facility's stock of an item."""
+    invalidation.publish(db, TARGET, lga_id, item_name)
+
+
+def suggest(db: Session, lga_id: str, phc_id: str, item_name: str, quantity: int,
+            limit: int = MAX_SUGGESTIONS) -> list:
+    """Donors for a facility's need, with the quantity each could send."""
+    return [
+        {"phc_id": d.phc_id, "phc_name": d.phc_name, "quantity": min(quantity, d.available),
+         "available": d.available, "days_cover": round(d.days_cover, 1)}
+        for d in index.donors(db, lga_id, item_name, exclude=phc_id, limit=limit)
+    ]
+
+
+# ---------------- TRANSFERS ----------------
+def execute(db: Session, lga_id: str, item_name: str, from_phc_id: str, to_phc_id: str, quantity: int,
+            operator: str, restock_request_id: int = None) -> StockTransfer:
+    """Move `quantity` of an item from one facility to another, in the caller's transaction."""
+    if from_phc_id == to_phc_id:
+        raise TransferError(400, "A facility cannot transfer stock to itself")
+    donor, recipient = registry.get(db, from_phc_id), registry.get(db, to_phc_id)
+    if not donor or donor.lga_id != lga_id or not recipient or recipient.lga_id != lga_id:
+        raise TransferError(404, "Both facilities must belong to your LGA")
+
+    request = None
+    if restock_request_id is not None:
+        request = db.query(RestockRequest).filter(
+            RestockRequest.lga_id == lga_id,
+            RestockRequest.id == restock_request_id,
+        ).with_for_update().first()
+        if not request or request.phc_id != to_phc_id or request.item_name != item_name:
+            raise TransferError(404, "Restock request not found for this facility and item")
+        if request.status != "pending":
+            raise TransferError(400, f"Request is '{request.status}'; only pending requests can be covered")
+
+    # Locked in phc_id order, so two transfers in opposite directions cannot deadlock
+    rows = (
+        db.query(Inventory)
+        .filter(Inventory.phc_id.in_([from_phc_id, to_phc_id]), Inventory.item_name == item_name)
+        .order_by(Inventory.phc_id, Inventory.id)
+        .with_for_update()
+        .all()
+    )
+    source = next((row for row in rows if row.phc_id == from_phc_id), None)
+    target = next((row for row in rows if row.phc_id == to_phc_id), None)
+    if source is None or source.current_stock < quantity:
+        held = source.current_stock if source else 0
+        raise TransferError(400, f"{donor.name} has only {held} of '{item_name}' in stock")
+    if target is None:
+        target = Inventory(phc_id=to_phc_id, phc_name=recipient.name, item_name=item_name,
+                           item_type=source.item_type, unit=source.unit, current_stock=0,
+                           daily_consumption_rate=0.0)
+        db.add(target)
+
+    now = datetime.utcnow()
+    source.current_stock -= quantity
+    target.current_stock += quantity
+    source.last_updated = target.last_updated = now
+    transfer = StockTransfer(lga_id=lga_id, item_name=item_name, from_phc_id=from_phc_id,
+                             to_phc_id=to_phc_id, quantity=quantity, restock_request_id=restock_request_id,
+                             created_by=operator)
+    db.add(transfer)
+
+    if request is not None:
+        _cover(db, request, quantity, donor.name, operator, now)
+    stock_changed(db, lga_id, item_name)
+    invalidation.publish(db, "lga_summary", lga_id)
+    db.flush()
+    data = {"id": transfer.id, "item_name": item_name, "quantity": quantity,
+            "from_phc_id": from_phc_id, "to_phc_id": to_phc_id}
+    # The LGA topic gets the event once, with the donor's
+    push.publish_many(db, [("stock.transferred", from_phc_id, lga_id, data),
+                           ("stock.transferred", to_phc_id, None, data)])
+    return transfer
+
+
+def _cover(db: Session, request: RestockRequest, quantity: int, donor_name: str, operator: str, now: datetime):
+    """Deliver the request, or reduce it by what the transfer covered."""
+    old_status = request.status
+    if quantity >= request.quantity_needed:
+        request.status = "delivered"
+        request.comments = f"Covered by a transfer from {donor_name}"
+        request.processed_by = operator
+        request.processed_at = now
+        rollups.restock_status_changed(db, request, old_status)
+    else:
+        request.quantity_needed -= quantity
+        request.comments = (f"{quantity} received by transfer from {donor_name}; "
+                            f"{request.quantity_needed} still needed")
+    versions.bump(db, *versions.restock_scopes(request.phc_id, request.lga_id))
+    push.publish(db, "restock.updated", request.phc_id, request.lga_id, id=request.id, status=request.status,
+                 previous_status=old_status)
@@ -0,0 +1,82 @@
+"""
+Cheap version tokens for list endpoints that dashboards poll.
+
+Each list scope ("restock:lga:<lga_id>", "issues:phc:<phc_id>", ...) has a
+counter in scope_versions that writers bump in their own transaction. A GET
+reads that one row by primary key and, if the client's ETag or
+Last-Modified still matches, answers 304 without loading the list.
+"""
+import hashlib
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request, Response
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from models import ScopeVersion
+
+# Bump when a list response changes shape, so clients cannot keep an old body
+RESPONSE_FORMAT = "1"
+
+
+def restock_scopes(phc_id: str, lga_id: str):
+    return (f"restock:phc:{phc_id}", f"restock:lga:{lga_id}")
+
+
+def issue_scopes(phc_id: str, lga_id: str):
+    return (f"issues:phc:{phc_id}", f"issues:lga:{lga_id}")
+
+
+def report_scopes(phc_id: str, lga_id: str = None):
+    """PHCs see all their reports; the LGA list only changes when one is submitted."""
+    return (f"reports:phc:{phc_id}",) + ((f"reports:lga:{lga_id}",) if lga_id else ())
+
+
+def bump(db: Session, *scopes: str):
+    """Advance the version of every scope (sorted, so concurrent writers lock rows in the same order)."""
+    scopes = sorted(set(scopes))
+    if not scopes:
+        return
+    stmt = insert(ScopeVersion).values([{"scope": s, "version": 1} for s in scopes])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ScopeVersion.scope],
+        set_={"version": ScopeVersion.version + 1, "updated_at": func.now()},
+    )
+    db.execute(stmt)
+
+
+def not_modified(request: Request, response: Response, db: Session, scope: str):
+    """
+    Set ETag/Last-Modified for the scope on `response`. Returns a 304 Response
+    if the client's copy is current, otherwise None and the caller builds the list.
+    """
+    row = db.query(ScopeVersion.version, ScopeVersion.updated_at).filter(ScopeVersion.scope == scope).first()
+    version, updated_at = row if row else (0, None)
+
+    # Filters change the body, so they are part of the tag
+    variant = hashlib.sha1(f"{RESPONSE_FORMAT}|{scope}|{request.url.query}".encode()).hexdigest()[:12]
+    etag = f'W/"{version}-{variant}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if updated_at:
+        headers["Last-Modified"] = format_datetime(updated_at.astimezone(timezone.utc), usegmt=True)
+    response.headers.update(headers)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if etag in (tag.strip() for tag in if_none_match.split(",")) or if_none_match.strip() == "*":
+            return Response(status_code=304, headers=headers)
+        return None
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and updated_at:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return None
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)      # "-0000" or no zone: HTTP dates are GMT
+        if updated_at.replace(microsecond=0) <= since:
+            return Response(status_code=304, headers=headers)
+    return None
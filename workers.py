@@ -0,0 +1,37 @@
+"""
+Background job workers in a process of their own (see jobs.py).
+
+Run alongside the app, with JOB_WORKERS=0 set for the app's workers:
+
+    JOB_WORKERS=4 python workers.py
+
+Importing main registers every job handler, from the routers and the
+modules they use, on the same jobs module that the pool runs. Stops on
+SIGTERM or Ctrl-C, letting running jobs finish.
+"""
+import signal
+import threading
+
+import main  # noqa: F401  (registers the job handlers)
+import invalidation
+import jobs
+
+
+def run():
+    jobs.pool.workers = max(jobs.WORKERS, 1)
+    invalidation.listener.start()
+    jobs.pool.start()
+    print(f"Running {jobs.pool.workers} job workers for: {', '.join(sorted(jobs._handlers))}")
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    try:
+        while not stopping.wait(1.0):
+            pass
+    except KeyboardInterrupt:
+        pass
+    jobs.pool.stop()
+    invalidation.listener.stop()
+
+
+if __name__ == "__main__":
+    run()